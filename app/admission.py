@@ -0,0 +1,291 @@
+"""
+Admission Control for PaySwiftly
+
+Every /api/pay that gets through sends an STK push to somebody's phone and
+costs IntaSend quota and database writes. A misbehaving client or a bot can
+use it to flood a victim's phone with prompts. AdmissionController caps how
+many payments may start per passenger phone, per driver and per client IP
+within ADMISSION_WINDOW_SECONDS and rejects the rest before any other work
+(the API answers 429 with Retry-After).
+
+Counting uses sliding-window counters: per key, the counts of the current
+and the previous fixed window, with the previous one weighted by how much
+of it still overlaps the sliding window. That is two integers per key and a
+few arithmetic operations per check, so admission costs microseconds and no
+I/O. Rejected requests are not counted, so a client that keeps hammering
+gets in again as soon as its earlier payments age out. Keys not seen for two
+windows are dropped once more than ADMISSION_MAX_KEYS are tracked.
+
+Counts are per worker process. With ADMISSION_REDIS_URL set (needs the
+redis package), each worker also adds its counts to Redis and reads back
+every worker's combined counts every ADMISSION_SYNC_SECONDS, in the
+background. Checks still never wait for Redis. The combined limit can be
+overshot by what the other workers admit between two syncs. If Redis is
+unreachable, each worker keeps enforcing the limit on its own counts.
+
+Client IPs come from the ASGI server, or behind ADMISSION_TRUSTED_PROXY_HOPS
+proxies (1 on Render) from X-Forwarded-For: each proxy appends the address
+it was connected from, so the client is that many entries from the right.
+Entries further left are whatever the client sent and are never used, so
+they cannot be spoofed to dodge the per-IP limit. Without this setting
+behind a proxy, every passenger shares the proxy's IP. Mobile carriers put
+many passengers behind one address too, so keep the per-IP limit generous.
+
+Metrics: admission_rejected_<kind> counters, admission_sync_errors.
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_WINDOW_SECONDS = float(os.getenv('ADMISSION_WINDOW_SECONDS', '60'))
+# Payments per window; 0 disables that limit
+ADMISSION_LIMIT_PER_PHONE = int(os.getenv('ADMISSION_LIMIT_PER_PHONE', '5'))
+ADMISSION_LIMIT_PER_DRIVER = int(os.getenv('ADMISSION_LIMIT_PER_DRIVER', '60'))
+ADMISSION_LIMIT_PER_IP = int(os.getenv('ADMISSION_LIMIT_PER_IP', '60'))
+ADMISSION_MAX_KEYS = int(os.getenv('ADMISSION_MAX_KEYS', '100000'))
+ADMISSION_REDIS_URL = os.getenv('ADMISSION_REDIS_URL')
+ADMISSION_SYNC_SECONDS = float(os.getenv('ADMISSION_SYNC_SECONDS', '1'))
+# Proxies in front of the app that append to X-Forwarded-For; 0 ignores the header
+ADMISSION_TRUSTED_PROXY_HOPS = int(os.getenv('ADMISSION_TRUSTED_PROXY_HOPS', '0'))
+
+REDIS_KEY_PREFIX = 'payswiftly:admission'
+
+# Per-key state: [window index, own count in it, own count in the previous
+# window, other workers' count in it, other workers' count in the previous window]
+_INDEX, _OWN, _OWN_PREVIOUS, _SHARED, _SHARED_PREVIOUS = range(5)
+
+
+def client_ip(
+    peer: Optional[str],
+    forwarded_for: Optional[str],
+    trusted_hops: int = ADMISSION_TRUSTED_PROXY_HOPS
+) -> Optional[str]:
+    """
+    The client address for the per-IP limit: the entry trusted_hops from the
+    right of X-Forwarded-For (the one our outermost proxy appended), else the
+    connecting peer.
+    """
+    if trusted_hops <= 0 or not forwarded_for:
+        return peer
+    hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+    if not hops:
+        return peer
+    # Fewer entries than proxies: the leftmost was still added by one of them
+    return hops[-min(trusted_hops, len(hops))]
+
+
+class SlidingWindowCounter:
+    """Admitted events per key over the last window_seconds, against one limit."""
+
+    def __init__(self, kind: str, limit: int, window_seconds: float, max_keys: int = ADMISSION_MAX_KEYS):
+        self.kind = kind
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._windows: Dict[str, List[int]] = {}
+
+    def _current(self, key: str, index: int) -> Optional[List[int]]:
+        """The key's state rolled forward to window index (None if it has no recent events)."""
+        state = self._windows.get(key)
+        if state is None:
+            return None
+        if state[_INDEX] != index:
+            if state[_INDEX] == index - 1:
+                state[_OWN_PREVIOUS], state[_SHARED_PREVIOUS] = state[_OWN], state[_SHARED]
+            else:
+                state[_OWN_PREVIOUS] = state[_SHARED_PREVIOUS] = 0
+            state[_INDEX], state[_OWN], state[_SHARED] = index, 0, 0
+        return state
+
+    def retry_after(self, key: str, now: float) -> Optional[float]:
+        """None if one more event is within the limit, else seconds until it would be."""
+        position = now / self.window_seconds
+        index = int(position)
+        state = self._current(key, index)
+        if state is None:
+            return None
+
+        current = state[_OWN] + state[_SHARED]
+        previous = state[_OWN_PREVIOUS] + state[_SHARED_PREVIOUS]
+        elapsed = position - index
+        if previous * (1 - elapsed) + current < self.limit:
+            return None
+
+        # When the weighted count falls below the limit, assuming no more events
+        if current < self.limit:
+            wait = (1 - (self.limit - current) / previous) - elapsed
+        else:
+            wait = (1 - elapsed) + (1 - self.limit / current)
+        return max(wait, 0.0) * self.window_seconds
+
+    def add(self, key: str, now: float) -> int:
+        """Count one event for key; returns its window index."""
+        index = int(now / self.window_seconds)
+        state = self._current(key, index)
+        if state is None:
+            if len(self._windows) >= self.max_keys:
+                self._evict(index)
+            state = self._windows[key] = [index, 0, 0, 0, 0]
+        state[_OWN] += 1
+        return index
+
+    def _evict(self, index: int) -> None:
+        stale = [key for key, state in self._windows.items() if state[_INDEX] < index - 1]
+        for key in stale:
+            del self._windows[key]
+        if len(self._windows) >= self.max_keys:
+            # All recent (a key flood): forget the oldest half rather than grow
+            for key in list(self._windows)[:len(self._windows) // 2]:
+                del self._windows[key]
+
+    def own_count(self, key: str, index: int) -> int:
+        """This worker's count for key in window index."""
+        state = self._windows.get(key)
+        if state is None:
+            return 0
+        if state[_INDEX] == index:
+            return state[_OWN]
+        if state[_INDEX] == index + 1:
+            return state[_OWN_PREVIOUS]
+        return 0
+
+    def set_shared(self, key: str, index: int, count: int) -> None:
+        """Record other workers' count for key in window index."""
+        state = self._windows.get(key)
+        if state is None:
+            return
+        if state[_INDEX] == index:
+            state[_SHARED] = count
+        elif state[_INDEX] == index + 1:
+            state[_SHARED_PREVIOUS] = count
+
+    def recent_keys(self, index: int) -> List[str]:
+        return [key for key, state in self._windows.items() if state[_INDEX] >= index - 1]
+
+
+class AdmissionController:
+    """Per-phone, per-driver and per-IP payment limits (see module docstring)."""
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, int]] = None,
+        window_seconds: float = ADMISSION_WINDOW_SECONDS,
+        redis_url: Optional[str] = ADMISSION_REDIS_URL
+    ):
+        if limits is None:
+            limits = {
+                'phone': ADMISSION_LIMIT_PER_PHONE,
+                'driver': ADMISSION_LIMIT_PER_DRIVER,
+                'ip': ADMISSION_LIMIT_PER_IP
+            }
+        self.window_seconds = window_seconds
+        self.counters = {
+            kind: SlidingWindowCounter(kind, limit, window_seconds)
+            for kind, limit in limits.items() if limit > 0
+        }
+        self.redis_url = redis_url
+        self._redis = None
+        self._sync_task: Optional[asyncio.Task] = None
+        # (kind, key, window index) -> events admitted here since the last sync
+        self._unsynced: Dict[Tuple[str, str, int], int] = {}
+
+    def admit(self, **keys: Optional[str]) -> Optional[Tuple[str, float]]:
+        """
+        Admit one payment for the given keys (e.g. phone=..., driver=..., ip=...)
+        and count it against each limit. Returns None if admitted, otherwise
+        (kind of the limit hit, seconds to wait) and nothing is counted.
+        Keys that are None or have no limit are ignored.
+        """
+        now = time.time()
+        checked = []
+        for kind, key in keys.items():
+            counter = self.counters.get(kind)
+            if counter is None or key is None:
+                continue
+            wait = counter.retry_after(key, now)
+            if wait is not None:
+                metrics.inc(f'admission_rejected_{kind}')
+                return kind, wait
+            checked.append((counter, key))
+
+        for counter, key in checked:
+            index = counter.add(key, now)
+            if self.redis_url:
+                unsynced_key = (counter.kind, key, index)
+                self._unsynced[unsynced_key] = self._unsynced.get(unsynced_key, 0) + 1
+        return None
+
+    @staticmethod
+    def retry_after_header(wait: float) -> str:
+        return str(max(1, math.ceil(wait)))
+
+    # === Shared counts (ADMISSION_REDIS_URL) ===
+
+    async def start(self) -> None:
+        """Start syncing counts with Redis, when configured."""
+        if not self.redis_url or self._sync_task is not None:
+            return
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self.redis_url)
+        self._sync_task = asyncio.create_task(self._sync_forever())
+        logger.info(f"Admission limits shared through Redis (synced every {ADMISSION_SYNC_SECONDS}s)")
+
+    async def stop(self) -> None:
+        if self._sync_task is None:
+            return
+        self._sync_task.cancel()
+        await asyncio.gather(self._sync_task, return_exceptions=True)
+        self._sync_task = None
+        await self._redis.aclose()
+
+    async def _sync_forever(self) -> None:
+        while True:
+            await asyncio.sleep(ADMISSION_SYNC_SECONDS)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"Admission sync failed, enforcing local counts only: {str(e)}")
+                metrics.inc('admission_sync_errors')
+
+    def _redis_key(self, kind: str, key: str, index: int) -> str:
+        return f"{REDIS_KEY_PREFIX}:{kind}:{key}:{index}"
+
+    async def sync(self) -> None:
+        """Push this worker's new counts to Redis and read back every worker's."""
+        unsynced, self._unsynced = self._unsynced, {}
+        index = int(time.time() / self.window_seconds)
+        # Combined counts for every tracked key, current and previous window;
+        # others = combined - ours (as of this snapshot, which Redis includes)
+        reads = [
+            (counter, key, window, counter.own_count(key, window))
+            for counter in self.counters.values()
+            for key in counter.recent_keys(index)
+            for window in (index, index - 1)
+        ]
+        expire = int(self.window_seconds * 2) + 1
+
+        pipe = self._redis.pipeline(transaction=False)
+        for (kind, key, window), count in unsynced.items():
+            pipe.incrby(self._redis_key(kind, key, window), count)
+            pipe.expire(self._redis_key(kind, key, window), expire)
+        for counter, key, window, _ in reads:
+            pipe.get(self._redis_key(counter.kind, key, window))
+        try:
+            results = await pipe.execute()
+        except Exception:
+            # Push these counts again next time
+            for unsynced_key, count in unsynced.items():
+                self._unsynced[unsynced_key] = self._unsynced.get(unsynced_key, 0) + count
+            raise
+
+        for (counter, key, window, own), total in zip(reads, results[2 * len(unsynced):]):
+            counter.set_shared(key, window, max(int(total or 0) - own, 0))
@@ -0,0 +1,362 @@
+"""
+Transaction Archival for PaySwiftly
+
+Moves transactions, payouts and platform fees older than ARCHIVE_AFTER_DAYS
+out of the database into zstd-compressed Parquet files in Supabase Storage,
+one file per table per month:
+
+    archives/transactions/month=2025-01/transactions.parquet
+
+Each month is keyset-paged out of the database and written to a local file
+one Parquet row group per page, so memory stays bounded by the page size
+rather than the month. The file is fully written and read back before any
+row it contains is deleted from the hot table in batches, and re-running
+merges into the existing file, so an interrupted run is safe to repeat.
+
+query_transactions() pages newest first through a date range, reading the
+database and, for months older than the archive horizon, the archive files.
+"""
+
+import io
+import os
+import json
+import asyncio
+import logging
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .models import Transaction, PayoutStatus
+
+logger = logging.getLogger(__name__)
+
+# Archive dependent tables before transactions
+ARCHIVE_TABLES = ['platform_fees', 'payouts', 'transactions']
+
+# Payouts still in flight stay in the database until they settle
+UNSETTLED_PAYOUT_STATUSES = [PayoutStatus.PENDING.value, PayoutStatus.PROCESSING.value]
+
+# JSONB columns are stored as JSON strings
+JSON_COLUMNS = {'collection_response', 'payout_response', 'intasend_response'}
+
+# Legacy DECIMAL columns; every other column is typed by its name (see _arrow_type)
+DECIMAL_COLUMNS = {
+    'amount', 'amount_paid', 'platform_fee', 'driver_amount', 'fee_percentage',
+    'fee_fixed', 'percentage_applied', 'fixed_amount_applied'
+}
+
+# Rows per database page, and so per Parquet row group
+ARCHIVE_PAGE_SIZE = int(os.getenv('ARCHIVE_PAGE_SIZE', '1000'))
+
+
+def archive_path(table: str, month: datetime) -> str:
+    return f"{table}/month={month:%Y-%m}/{table}.parquet"
+
+
+def _month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def _utc(moment: datetime) -> datetime:
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def _arrow_type(column: str):
+    """Fixed column types, so every page (and every older file) fits one file schema."""
+    import pyarrow as pa
+
+    if column.endswith('_at') or column == 'last_payout_date':
+        return pa.timestamp('us', tz='UTC')
+    if column.endswith('_cents'):
+        return pa.int64()
+    if column in DECIMAL_COLUMNS:
+        return pa.float64()
+    return pa.string()
+
+
+def _to_arrow(rows: List[Dict[str, Any]], schema):
+    """Convert API rows to an Arrow table (timestamps parsed, JSON columns serialized)."""
+    import pyarrow as pa
+
+    prepared = []
+    for row in rows:
+        row = dict(row)
+        for column, value in row.items():
+            if value is None:
+                continue
+            if column in JSON_COLUMNS:
+                row[column] = json.dumps(value)
+            elif column.endswith('_at') or column == 'last_payout_date':
+                row[column] = datetime.fromisoformat(value)
+        prepared.append(row)
+
+    return pa.Table.from_pylist(prepared, schema=schema)
+
+
+def _write_page(writer, rows: List[Dict[str, Any]]) -> None:
+    """Write one page of API rows as a row group."""
+    writer.write_table(_to_arrow(rows, writer.schema))
+
+
+def _conform(table, schema):
+    """Cast an archived table to the file schema, filling columns it predates with nulls."""
+    import pyarrow as pa
+
+    columns = [
+        table[field.name].cast(field.type) if field.name in table.column_names
+        else pa.nulls(table.num_rows, field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _open_writer(path: str, first_page: List[Dict[str, Any]], existing: Optional[bytes]):
+    """Open a zstd Parquet writer whose schema covers the table's columns and the existing file's."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    names = list(first_page[0].keys())
+    if existing:
+        names += [name for name in pq.read_schema(io.BytesIO(existing)).names if name not in names]
+
+    schema = pa.schema([(name, _arrow_type(name)) for name in names])
+    return pq.ParquetWriter(path, schema, compression='zstd')
+
+
+def _append_existing(writer, existing: bytes, archived_ids: Set[str]) -> int:
+    """Copy rows of the existing file that were not re-archived (new rows win on id), one row group at a time."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    previous = pq.ParquetFile(io.BytesIO(existing))
+    value_set = pa.array(list(archived_ids), pa.string())
+    kept = 0
+
+    for i in range(previous.num_row_groups):
+        table = _conform(previous.read_row_group(i), writer.schema)
+        table = table.filter(pc.invert(pc.is_in(table['id'], value_set=value_set)))
+        if table.num_rows:
+            writer.write_table(table)
+            kept += table.num_rows
+
+    return kept
+
+
+def _verify(path: str, expected: int) -> None:
+    """Read the written file back before anything is deleted."""
+    import pyarrow.parquet as pq
+
+    written = sum(batch.num_rows for batch in pq.ParquetFile(path).iter_batches(columns=['id']))
+    if written != expected:
+        raise Exception(f"Archive verification failed: wrote {written} of {expected} rows")
+
+
+def _read_archived_transactions(
+    data: bytes,
+    start: datetime,
+    end: datetime,
+    driver_id: Optional[str],
+    cursor: Optional[Tuple[datetime, str]],
+    limit: int
+) -> List[Dict[str, Any]]:
+    """The newest `limit` archived transactions with start <= created_at < end, before the cursor."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    timestamp = pa.timestamp('us', tz='UTC')
+    table = pq.read_table(io.BytesIO(data))
+    created_at = table['created_at'].cast(timestamp)
+    ids = table['id'].cast(pa.string())
+
+    mask = pc.and_(
+        pc.greater_equal(created_at, pa.scalar(start, timestamp)),
+        pc.less(created_at, pa.scalar(end, timestamp))
+    )
+    if driver_id:
+        mask = pc.and_(mask, pc.equal(table['driver_id'].cast(pa.string()), driver_id))
+    if cursor:
+        # (created_at, id) < cursor
+        at_cursor = pc.and_(pc.equal(created_at, pa.scalar(cursor[0], timestamp)), pc.greater_equal(ids, cursor[1]))
+        mask = pc.and_(mask, pc.invert(at_cursor))
+
+    table = (table.filter(mask)
+             .sort_by([('created_at', 'descending'), ('id', 'descending')])
+             .slice(0, limit))
+
+    rows = table.to_pylist()
+    for row in rows:
+        for column in JSON_COLUMNS & row.keys():
+            if row[column] is not None:
+                row[column] = json.loads(row[column])
+    return rows
+
+
+class Archiver:
+    """Moves aged rows from the hot tables into monthly Parquet archives."""
+
+    def __init__(
+        self,
+        supabase_manager,
+        archive_after_days: Optional[int] = None,
+        delete_batch_size: Optional[int] = None,
+        page_size: Optional[int] = None
+    ):
+        self.supabase_manager = supabase_manager
+        self.archive_after_days = archive_after_days or int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+        self.delete_batch_size = delete_batch_size or int(os.getenv('ARCHIVE_DELETE_BATCH_SIZE', '200'))
+        self.page_size = page_size or ARCHIVE_PAGE_SIZE
+
+    def cutoff(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(days=self.archive_after_days)
+
+    async def run(self, dry_run: bool = False) -> Dict[str, Any]:
+        """Archive every table. Returns per-table row counts."""
+        cutoff = self.cutoff()
+        summary = {"cutoff": cutoff.isoformat(), "dry_run": dry_run, "tables": {}}
+
+        for table in ARCHIVE_TABLES:
+            summary["tables"][table] = await self.archive_table(table, cutoff, dry_run)
+
+        logger.info(f"Archival finished: {summary}")
+        return summary
+
+    async def archive_table(self, table: str, cutoff: datetime, dry_run: bool = False) -> Dict[str, int]:
+        """Archive all rows of a table created before the cutoff, oldest month first."""
+        counts = {"months": 0, "archived": 0, "deleted": 0}
+
+        oldest = await self.supabase_manager.get_oldest_created_at(table)
+        if not oldest or _utc(oldest) >= cutoff:
+            return counts
+
+        month = _month_start(_utc(oldest))
+        while month < cutoff:
+            end = min(_next_month(month), cutoff)
+            archived, deleted = await self.archive_month(table, month, end, dry_run)
+            if archived:
+                counts["months"] += 1
+                counts["archived"] += archived
+                counts["deleted"] += deleted
+            month = _next_month(month)
+
+        return counts
+
+    async def archive_month(self, table: str, month: datetime, end: datetime, dry_run: bool = False):
+        """
+        Archive rows of one month created before `end`.
+
+        Returns:
+            (rows archived, rows deleted)
+        """
+        pages = self.supabase_manager.iter_rows_in_range(
+            table,
+            month,
+            end,
+            exclude_statuses=UNSETTLED_PAYOUT_STATUSES if table == 'payouts' else None,
+            page_size=self.page_size
+        )
+        if dry_run:
+            return sum([len(page) async for page in pages]), 0
+
+        path = archive_path(table, month)
+        existing = await self.supabase_manager.download_archive(path)
+        ids: List[str] = []
+
+        with tempfile.TemporaryDirectory(prefix='archive-') as directory:
+            local_path = os.path.join(directory, f"{table}.parquet")
+            writer = None
+            try:
+                async for page in pages:
+                    if writer is None:
+                        writer = await asyncio.to_thread(_open_writer, local_path, page, existing)
+                    await asyncio.to_thread(_write_page, writer, page)
+                    ids.extend(row['id'] for row in page)
+
+                if writer is None:
+                    return 0, 0
+
+                kept = await asyncio.to_thread(_append_existing, writer, existing, set(ids)) if existing else 0
+            finally:
+                if writer is not None:
+                    await asyncio.to_thread(writer.close)
+
+            await asyncio.to_thread(_verify, local_path, len(ids) + kept)
+            size = os.path.getsize(local_path)
+            await self.supabase_manager.upload_archive(path, local_path)
+
+        deleted = 0
+        for i in range(0, len(ids), self.delete_batch_size):
+            deleted += await self.supabase_manager.delete_rows(
+                table, ids[i:i + self.delete_batch_size], month, _next_month(month)
+            )
+
+        logger.info(f"Archived {len(ids)} {table} rows for {month:%Y-%m} ({size} bytes), deleted {deleted}")
+        return len(ids), deleted
+
+
+async def _first_page(pages) -> List[Dict[str, Any]]:
+    async for page in pages:
+        await pages.aclose()
+        return page
+    return []
+
+
+async def query_transactions(
+    supabase_manager,
+    start: datetime,
+    end: datetime,
+    driver_id: Optional[str] = None,
+    limit: int = 500,
+    before_id: Optional[str] = None,
+    archive_after_days: Optional[int] = None
+) -> List[Transaction]:
+    """
+    Get up to `limit` transactions with start <= created_at < end, newest first.
+
+    For the next page, pass the created_at and id of the last transaction
+    returned as `end` and `before_id`. Months are read newest first, from the
+    database plus the archive file for months older than the archive horizon,
+    and reading stops as soon as `limit` transactions are found.
+    """
+    start, end = _utc(start), _utc(end)
+    archive_after_days = archive_after_days or int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+    horizon = datetime.now(timezone.utc) - timedelta(days=archive_after_days)
+    filters = {'driver_id': driver_id} if driver_id else None
+
+    # With a cursor, rows at exactly `end` with a smaller id are still due
+    cursor = (end, before_id) if before_id else None
+    stop = end + timedelta(microseconds=1) if cursor else end
+
+    transactions: List[Transaction] = []
+    month = _month_start(stop - timedelta(microseconds=1))
+    while month >= _month_start(start) and len(transactions) < limit:
+        lower, upper = max(start, month), min(stop, _next_month(month))
+        remaining = limit - len(transactions)
+
+        rows = {row['id']: row for row in await _first_page(supabase_manager.iter_rows_in_range(
+            'transactions', lower, upper, filters,
+            page_size=remaining,
+            descending=True,
+            after=(end.isoformat(), before_id) if cursor else None
+        ))}
+
+        if month < horizon:
+            data = await supabase_manager.download_archive(archive_path('transactions', month))
+            if data:
+                archived = await asyncio.to_thread(
+                    _read_archived_transactions, data, lower, upper, driver_id, cursor, remaining
+                )
+                for row in archived:
+                    # Rows still in the database are newer than their archived copy
+                    rows.setdefault(str(row['id']), row)
+
+        found = sorted((Transaction(**row) for row in rows.values()), key=lambda tx: (tx.created_at, tx.id), reverse=True)
+        transactions.extend(found[:remaining])
+        month = _month_start(month - timedelta(days=1))
+
+    return transactions
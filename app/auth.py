@@ -1,6 +1,8 @@
 import os
+import hmac
 from datetime import datetime, timedelta
 from typing import Optional
+from fastapi import Header, HTTPException
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 
@@ -12,6 +14,9 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Shared secret for admin endpoints (sent as X-Admin-Key); unset disables them
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
+
 
 def _truncate_password(password: str) -> str:
     """
@@ -101,3 +106,15 @@ def verify_token(token: str) -> Optional[str]:
         return driver_id
     except JWTError:
         return None
+
+
+def require_admin(x_admin_key: Optional[str] = Header(None)) -> None:
+    """
+    FastAPI dependency for admin endpoints: the X-Admin-Key header must match
+    ADMIN_API_KEY. While ADMIN_API_KEY is unset, every request is refused.
+    
+    Raises:
+        HTTPException: 401 if the key is missing or wrong
+    """
+    if not ADMIN_API_KEY or not x_admin_key or not hmac.compare_digest(x_admin_key.encode(), ADMIN_API_KEY.encode()):
+        raise HTTPException(status_code=401, detail="Admin key required")
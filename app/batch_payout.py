@@ -9,6 +9,9 @@ from fastapi import HTTPException
 from datetime import datetime
 import logging
 
+from .money import from_cents, to_shillings
+from .phone import normalize_phone
+
 logger = logging.getLogger(__name__)
 
 
@@ -25,31 +28,51 @@ async def trigger_batch_payout(intasend_api, supabase_manager):
     """
     try:
         # Get minimum threshold from IntaSend API config
-        minimum_threshold = intasend_api.minimum_payout
+        minimum_threshold_cents = intasend_api.minimum_payout_cents
         
         #Get all eligible drivers
-        drivers = await supabase_manager.get_drivers_for_payout(minimum_threshold)
+        drivers = await supabase_manager.get_drivers_for_payout(minimum_threshold_cents)
         
         if not drivers:
             return {
                 "status": "success",
                 "message": "No drivers eligible for payout",
                 "processed": 0,
+                "total_amount_cents": 0,
                 "total_amount": 0
             }
         
         results = []
-        total_amount = 0
+        total_amount_cents = 0
         success_count = 0
         
         for driver in drivers:
+            # phone_normalized is NULL for numbers the backfill could not
+            # normalize and for drivers created before it; try the raw number
+            payout_phone = driver.get('phone_normalized')
+            if not payout_phone:
+                try:
+                    payout_phone = normalize_phone(driver.get('phone'))
+                except ValueError:
+                    logger.warning(f"Skipping batch payout for driver {driver['id']}: invalid phone {driver.get('phone')!r}")
+                    results.append({
+                        "driver_id": driver['id'],
+                        "driver_name": driver.get('name', 'Unknown'),
+                        "amount_cents": driver['pending_balance_cents'],
+                        "amount": to_shillings(driver['pending_balance_cents']),
+                        "status": "skipped",
+                        "error": "invalid phone"
+                    })
+                    continue
+            
             try:
-                logger.info(f"Processing batch payout for driver {driver['id']}: KES {driver['pending_balance']}")
+                amount_cents = driver['pending_balance_cents']
+                logger.info(f"Processing batch payout for driver {driver['id']}: KES {from_cents(amount_cents)}")
                 
                 # Initiate payout via IntaSend
                 payout_response = await intasend_api.initiate_batch_payout(
-                    phone_number=driver['phone'],
-                    amount=driver['pending_balance'],
+                    phone_number=payout_phone,
+                    amount_cents=amount_cents,
                     reference=f"batch_{driver['id']}_{datetime.now().strftime('%Y%m%d')}",
                     name=driver['name']
                 )
@@ -60,19 +83,20 @@ async def trigger_batch_payout(intasend_api, supabase_manager):
                     # Update driver balances (move pending to paid)
                     await supabase_manager.process_batch_payout_completion(
                         driver_id=driver['id'],
-                        amount=driver['pending_balance'],
+                        amount_cents=amount_cents,
                         tracking_id=tracking_id
                     )
                     
                     results.append({
                         "driver_id": driver['id'],
                         "driver_name": driver['name'],
-                        "amount": driver['pending_balance'],
+                        "amount_cents": amount_cents,
+                        "amount": to_shillings(amount_cents),
                         "tracking_id": tracking_id,
                         "status": "success"
                     })
                     
-                    total_amount += driver['pending_balance']
+                    total_amount_cents += amount_cents
                     success_count += 1
                     logger.info(f"Batch payout successful for driver {driver['id']}")
                 else:
@@ -83,7 +107,8 @@ async def trigger_batch_payout(intasend_api, supabase_manager):
                 results.append({
                     "driver_id": driver['id'],
                     "driver_name": driver.get('name', 'Unknown'),
-                    "amount": driver['pending_balance'],
+                    "amount_cents": driver['pending_balance_cents'],
+                    "amount": to_shillings(driver['pending_balance_cents']),
                     "status": "failed",
                     "error": str(e)
                 })
@@ -92,7 +117,8 @@ async def trigger_batch_payout(intasend_api, supabase_manager):
             "status": "success",
             "message": f"Processed {success_count} of {len(drivers)} payouts",
             "processed": success_count,
-            "total_amount": round(total_amount, 2),
+            "total_amount_cents": total_amount_cents,
+            "total_amount": to_shillings(total_amount_cents),
             "details": results
         }
         
@@ -0,0 +1,227 @@
+"""
+Bulk Driver Onboarding for PaySwiftly
+
+Registers a whole fleet or SACCO from one CSV file with the columns name,
+phone, email, vehicle_type, vehicle_number and password. Used by
+POST /api/admin/drivers/import and scripts/import_drivers.py. Every row
+gets a result: created, invalid, duplicate (of an earlier row or an
+existing driver) or failed.
+
+Unlike calling /api/register_driver once per driver:
+- Rows are inserted BULK_IMPORT_BATCH_SIZE at a time, with the password
+  hash and QR code URL already set. That is one write per batch instead
+  of three per driver.
+- Passwords are hashed in a thread pool (bcrypt releases the GIL while
+  hashing).
+- Driver IDs are generated here, so QR code URLs are known before the
+  insert. QR codes are rendered and uploaded BULK_QR_CONCURRENCY at a
+  time while later batches are hashed and inserted.
+"""
+
+import io
+import os
+import csv
+import uuid
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from pydantic import ValidationError
+
+from .auth import hash_password
+from .models import Driver, DriverRegistration, DriverImportRow, DriverImportReport
+from .phone import normalize_phone
+from .qr_utils import store_payment_qr, qr_image_url, QR_STORAGE_UPLOAD
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+BULK_IMPORT_BATCH_SIZE = int(os.getenv('BULK_IMPORT_BATCH_SIZE', '200'))
+BULK_IMPORT_MAX_ROWS = int(os.getenv('BULK_IMPORT_MAX_ROWS', '5000'))
+BULK_HASH_WORKERS = int(os.getenv('BULK_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+BULK_QR_CONCURRENCY = int(os.getenv('BULK_QR_CONCURRENCY', '8'))
+
+CSV_COLUMNS = ('name', 'phone', 'email', 'vehicle_type', 'vehicle_number', 'password')
+
+# A row that passed validation: (CSV line number, registration)
+ValidRow = Tuple[int, DriverRegistration]
+
+
+def normalize_email(email: str) -> str:
+    """Comparison key for an email: duplicates are found case-insensitively."""
+    return email.strip().lower()
+
+
+def _describe(error: ValidationError) -> str:
+    """One line per failed field, without echoing the input (it may be a password)."""
+    return '; '.join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors())
+
+
+def parse_csv(text: str) -> Tuple[List[ValidRow], List[DriverImportRow]]:
+    """
+    Validate every row of a driver CSV. Returns the valid rows and the
+    results for rejected ones. Blank lines are skipped.
+
+    Raises:
+        ValueError: if a column is missing or there are more than BULK_IMPORT_MAX_ROWS rows
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames:
+        raise ValueError("CSV file is empty")
+    reader.fieldnames = [column.strip().lower() for column in reader.fieldnames]
+    missing = [column for column in CSV_COLUMNS if column not in reader.fieldnames]
+    if missing:
+        raise ValueError(f"CSV is missing column(s): {', '.join(missing)}")
+
+    valid: List[ValidRow] = []
+    rejected: List[DriverImportRow] = []
+    first_seen = {}  # Normalized phone or lowercased email -> line it first appeared on
+
+    for fields in reader:
+        line = reader.line_num
+        values = {column: (fields.get(column) or '').strip() for column in CSV_COLUMNS}
+        if not any(values.values()):
+            continue
+        if len(valid) + len(rejected) >= BULK_IMPORT_MAX_ROWS:
+            raise ValueError(f"CSV has more than {BULK_IMPORT_MAX_ROWS} rows")
+
+        values['vehicle_type'] = values['vehicle_type'].lower()
+        phone = values['phone'] or None
+        try:
+            registration = DriverRegistration(**values)
+            phone_normalized = normalize_phone(registration.phone)
+        except ValidationError as e:
+            rejected.append(DriverImportRow(row=line, status='invalid', phone=phone, error=_describe(e)))
+            continue
+        except ValueError as e:
+            rejected.append(DriverImportRow(row=line, status='invalid', phone=phone, error=str(e)))
+            continue
+
+        keys = (phone_normalized, normalize_email(registration.email))
+        earlier = next((first_seen[key] for key in keys if key in first_seen), None)
+        if earlier is not None:
+            rejected.append(DriverImportRow(
+                row=line, status='duplicate', phone=phone, error=f"Same phone or email as row {earlier}"
+            ))
+            continue
+        for key in keys:
+            first_seen[key] = line
+        valid.append((line, registration))
+
+    return valid, rejected
+
+
+async def _drop_registered(supabase_manager, batch: List[ValidRow]) -> Tuple[List[ValidRow], List[DriverImportRow]]:
+    """Split off rows whose phone or email already belongs to a driver."""
+    phones, emails = await supabase_manager.find_registered(
+        [normalize_phone(registration.phone) for _, registration in batch],
+        [normalize_email(registration.email) for _, registration in batch]
+    )
+    new_rows, rejected = [], []
+    for line, registration in batch:
+        if normalize_phone(registration.phone) in phones:
+            rejected.append(DriverImportRow(
+                row=line, status='duplicate', phone=registration.phone, error="Phone number already registered"
+            ))
+        elif normalize_email(registration.email) in emails:
+            rejected.append(DriverImportRow(
+                row=line, status='duplicate', phone=registration.phone, error="Email already registered"
+            ))
+        else:
+            new_rows.append((line, registration))
+    return new_rows, rejected
+
+
+def _new_driver(supabase_manager, registration: DriverRegistration) -> Driver:
+    driver_id = str(uuid.uuid4())
+    return Driver(
+        id=driver_id,
+        name=registration.name,
+        phone=registration.phone,
+        email=registration.email,
+        vehicle_type=registration.vehicle_type,
+        vehicle_number=registration.vehicle_number,
+        qr_code_url=supabase_manager.qr_code_public_url(driver_id) if QR_STORAGE_UPLOAD else qr_image_url(driver_id)
+    )
+
+
+async def _insert(supabase_manager, lines: List[int], drivers: List[Driver], password_hashes: List[str]) -> List[DriverImportRow]:
+    """Insert a batch; if the database rejects it, insert its rows one by one to find the bad ones."""
+    try:
+        await supabase_manager.create_drivers(drivers, password_hashes)
+        return [
+            DriverImportRow(row=line, status='created', phone=driver.phone, driver_id=driver.id, qr_code_url=driver.qr_code_url)
+            for line, driver in zip(lines, drivers)
+        ]
+    except Exception as e:
+        if len(drivers) == 1:
+            return [DriverImportRow(row=lines[0], status='failed', phone=drivers[0].phone, error=str(e))]
+        logger.warning(f"Driver import: batch of {len(drivers)} rejected ({str(e)}), inserting rows one by one")
+
+    results = []
+    for line, driver, password_hash in zip(lines, drivers, password_hashes):
+        results.extend(await _insert(supabase_manager, [line], [driver], [password_hash]))
+    return results
+
+
+async def _store_qr(supabase_manager, driver: Driver, result: DriverImportRow, slots: asyncio.Semaphore) -> None:
+    """Render and upload a new driver's QR code to the URL already saved with them."""
+    async with slots:
+        try:
+            await store_payment_qr(supabase_manager, driver.id, driver.phone)
+        except Exception as e:
+            logger.error(f"Driver import: QR code for {driver.id} not stored: {str(e)}")
+            # The driver exists; point them at the QR code rendered on request instead
+            result.qr_code_url = qr_image_url(driver.id)
+            result.error = f"QR code not stored ({str(e)}); using {result.qr_code_url}"
+            try:
+                await supabase_manager.update_driver(driver.id, {"qr_code_url": result.qr_code_url})
+            except Exception as update_error:
+                logger.error(f"Driver import: could not update qr_code_url for {driver.id}: {str(update_error)}")
+
+
+async def import_drivers(supabase_manager, text: str) -> DriverImportReport:
+    """
+    Register every valid, new driver in a CSV file and report on each row.
+
+    Raises:
+        ValueError: if the file itself is unusable (see parse_csv)
+    """
+    valid, results = parse_csv(text)
+    loop = asyncio.get_running_loop()
+    qr_slots = asyncio.Semaphore(BULK_QR_CONCURRENCY)
+    qr_uploads = []
+
+    with ThreadPoolExecutor(max_workers=BULK_HASH_WORKERS) as hash_pool:
+        for start in range(0, len(valid), BULK_IMPORT_BATCH_SIZE):
+            batch, rejected = await _drop_registered(supabase_manager, valid[start:start + BULK_IMPORT_BATCH_SIZE])
+            results.extend(rejected)
+            if not batch:
+                continue
+
+            password_hashes = await asyncio.gather(*(
+                loop.run_in_executor(hash_pool, hash_password, registration.password) for _, registration in batch
+            ))
+            drivers = {line: _new_driver(supabase_manager, registration) for line, registration in batch}
+
+            inserted = await _insert(supabase_manager, list(drivers), list(drivers.values()), list(password_hashes))
+            results.extend(inserted)
+
+            if QR_STORAGE_UPLOAD:
+                for result in inserted:
+                    if result.status == 'created':
+                        qr_uploads.append(asyncio.ensure_future(
+                            _store_qr(supabase_manager, drivers[result.row], result, qr_slots)
+                        ))
+
+    await asyncio.gather(*qr_uploads)
+
+    results.sort(key=lambda result: result.row)
+    counts = {status: 0 for status in ('created', 'invalid', 'duplicate', 'failed')}
+    for result in results:
+        counts[result.status] += 1
+    metrics.inc('drivers_imported', counts['created'])
+    logger.info(f"Driver import: {len(results)} rows, " + ', '.join(f"{count} {status}" for status, count in counts.items()))
+
+    return DriverImportReport(total=len(results), rows=results, **counts)
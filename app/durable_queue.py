@@ -0,0 +1,276 @@
+"""
+Durable Background Jobs for PaySwiftly
+
+For work that must happen but cannot be finished in the request, such as
+recording an IntaSend collection ID whose inline write failed. submit() writes
+the job to a journal file and syncs it to disk before returning. A worker
+then runs the job, retrying failures with exponential backoff, and marks
+it done in the journal.
+
+A job is not lost when:
+- it fails: it is retried up to BACKGROUND_JOB_MAX_ATTEMPTS times with
+  backoff, then parked and tried again every BACKGROUND_JOB_PARKED_RETRY_SECONDS
+  until it succeeds (it stays in the journal meanwhile);
+- the app shuts down: stop() waits (up to a timeout) for queued jobs;
+- the process crashes or restarts: each process journals to its own file
+  in BACKGROUND_JOB_DIR. On start, journals of processes that are no
+  longer running are claimed and their unfinished jobs run again.
+
+Handlers must be idempotent, since a job that was running when its process
+died runs again. Journals are per host; a lost host loses its queued jobs.
+"""
+
+import os
+import re
+import json
+import time
+import glob
+import uuid
+import random
+import asyncio
+import logging
+import tempfile
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_JOB_DIR = os.getenv('BACKGROUND_JOB_DIR', os.path.join(tempfile.gettempdir(), 'payswiftly-jobs'))
+BACKGROUND_JOB_WORKERS = int(os.getenv('BACKGROUND_JOB_WORKERS', '4'))
+BACKGROUND_JOB_MAX_ATTEMPTS = int(os.getenv('BACKGROUND_JOB_MAX_ATTEMPTS', '8'))
+BACKGROUND_JOB_BASE_DELAY_SECONDS = float(os.getenv('BACKGROUND_JOB_BASE_DELAY_SECONDS', '1'))
+BACKGROUND_JOB_MAX_DELAY_SECONDS = float(os.getenv('BACKGROUND_JOB_MAX_DELAY_SECONDS', '60'))
+BACKGROUND_JOB_PARKED_RETRY_SECONDS = float(os.getenv('BACKGROUND_JOB_PARKED_RETRY_SECONDS', '600'))
+BACKGROUND_JOB_FSYNC = os.getenv('BACKGROUND_JOB_FSYNC', 'true').lower() in ('1', 'true', 'yes')
+
+Job = Dict[str, Any]
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, under another user
+        return True
+    return True
+
+
+def _unfinished(path: str) -> List[Job]:
+    """Jobs in a journal that were never marked done, in submission order."""
+    jobs: Dict[str, Job] = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn last line from a crash mid-write (its job was never acknowledged)
+                continue
+            if 'job' in record:
+                jobs[record['job']['id']] = record['job']
+            else:
+                jobs.pop(record.get('done'), None)
+    return list(jobs.values())
+
+
+class DurableQueue:
+    """Journaled job queue with retries; one per kind of job (see module docstring)."""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Dict[str, Any]], Awaitable[Any]],
+        journal_dir: str = BACKGROUND_JOB_DIR,
+        workers: int = BACKGROUND_JOB_WORKERS,
+        max_attempts: int = BACKGROUND_JOB_MAX_ATTEMPTS,
+        parked_retry_seconds: float = BACKGROUND_JOB_PARKED_RETRY_SECONDS
+    ):
+        self.name = name
+        self.handler = handler
+        self.journal_dir = journal_dir
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.parked_retry_seconds = parked_retry_seconds
+
+        self._queue: Optional["asyncio.Queue[Tuple[Job, int]]"] = None
+        # Every journaled job not yet done; the parked ones wait for their slow retry
+        self._pending: Dict[str, Job] = {}
+        self._parked: Set[str] = set()
+        # Records in the journal file, to tell when compacting it pays off
+        self._journal_records = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._journal = None
+        self._tasks: List[asyncio.Task] = []
+        self._retries: List[asyncio.TimerHandle] = []
+        # Journal file names: {name}-{owner pid}[.{earlier owner pid}...].jsonl
+        self._journal_pattern = re.compile(rf'{re.escape(name)}-(\d+)(\.\d+)*\.jsonl')
+
+    def _journal_path(self, pid: int) -> str:
+        return os.path.join(self.journal_dir, f"{self.name}-{pid}.jsonl")
+
+    def _write(self, record: Dict[str, Any], sync: bool = False) -> None:
+        self._journal.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._journal.flush()
+        self._journal_records += 1
+        if sync and BACKGROUND_JOB_FSYNC:
+            os.fsync(self._journal.fileno())
+
+    def _compact(self) -> None:
+        """Rewrite the journal with only the unfinished jobs, so it does not grow without bound."""
+        if self._journal_records == len(self._pending):
+            return
+        path = self._journal_path(os.getpid())
+        if not self._pending:
+            self._journal.seek(0)
+            self._journal.truncate()
+            self._journal_records = 0
+            return
+        # Parked jobs remain: replace the file atomically, so a crash leaves the old or the new one
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            for job in self._pending.values():
+                f.write(json.dumps({'job': job}, separators=(',', ':')) + '\n')
+            f.flush()
+            if BACKGROUND_JOB_FSYNC:
+                os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        self._journal.close()
+        self._journal = open(path, 'a', encoding='utf-8')
+        self._journal_records = len(self._pending)
+
+    def _claim_orphans(self) -> List[str]:
+        """Take over journals whose processes are gone. Renaming is atomic, so only one process gets each."""
+        claimed = []
+        pid = os.getpid()
+        for path in glob.glob(os.path.join(self.journal_dir, f"{self.name}-*.jsonl")):
+            match = self._journal_pattern.fullmatch(os.path.basename(path))
+            if not match:
+                continue
+            owner = int(match.group(1))
+            # Our own PID on an existing file means a previous process had it
+            if owner != pid and _process_alive(owner):
+                continue
+            target = os.path.join(self.journal_dir, f"{self.name}-{pid}.{os.path.basename(path)[len(self.name) + 1:]}")
+            try:
+                os.rename(path, target)
+            except FileNotFoundError:
+                continue
+            claimed.append(target)
+        return claimed
+
+    async def start(self) -> int:
+        """Recover orphaned jobs and start the workers. Returns the number of jobs recovered."""
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._queue = asyncio.Queue()
+        claimed = self._claim_orphans()
+        self._journal = open(self._journal_path(os.getpid()), 'a', encoding='utf-8')
+        self._journal_records = 0
+
+        recovered = 0
+        for path in claimed:
+            for job in _unfinished(path):
+                self._enqueue(job)
+                recovered += 1
+            # Safe to drop: its unfinished jobs are in our journal now
+            os.fsync(self._journal.fileno())
+            os.remove(path)
+
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        if recovered:
+            logger.warning(f"{self.name}: recovered {recovered} unfinished job(s) from earlier processes")
+            metrics.inc(f'{self.name}_jobs_recovered', recovered)
+        return recovered
+
+    def _enqueue(self, job: Job) -> None:
+        self._write({'job': job}, sync=True)
+        self._pending[job['id']] = job
+        self._idle.clear()
+        self._queue.put_nowait((job, 1))
+        metrics.set_gauge(f'{self.name}_jobs_pending', len(self._pending))
+
+    def submit(self, payload: Dict[str, Any]) -> str:
+        """Journal a job (synced to disk when this returns) and queue it. Returns the job ID."""
+        if self._queue is None:
+            raise RuntimeError(f"{self.name} queue is not started")
+        job = {'id': uuid.uuid4().hex, 'submitted_at': time.time(), 'payload': payload}
+        self._enqueue(job)
+        metrics.inc(f'{self.name}_jobs_submitted')
+        return job['id']
+
+    def _settle(self, job: Job) -> None:
+        """Mark a job done."""
+        self._pending.pop(job['id'], None)
+        self._parked.discard(job['id'])
+        self._update_state()
+
+    def _park(self, job: Job) -> None:
+        """Set a job that used up its attempts aside, to be tried again after parked_retry_seconds."""
+        self._parked.add(job['id'])
+        self._retries.append(asyncio.get_running_loop().call_later(
+            self.parked_retry_seconds, self._unpark, job
+        ))
+        self._update_state()
+
+    def _unpark(self, job: Job) -> None:
+        if job['id'] not in self._parked or self._queue is None:
+            return
+        self._parked.discard(job['id'])
+        self._idle.clear()
+        # One attempt per slow retry; it is parked again if that fails
+        self._queue.put_nowait((job, self.max_attempts))
+        self._update_state()
+
+    def _update_state(self) -> None:
+        metrics.set_gauge(f'{self.name}_jobs_pending', len(self._pending))
+        metrics.set_gauge(f'{self.name}_jobs_parked', len(self._parked))
+        if len(self._pending) == len(self._parked):
+            # Nothing running or waiting for a backoff retry
+            self._idle.set()
+            self._compact()
+
+    async def _work(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job, attempt = await self._queue.get()
+            try:
+                await self.handler(job['payload'])
+            except Exception as e:
+                if attempt >= self.max_attempts:
+                    # Not marked done, so it also runs again after a restart
+                    logger.error(
+                        f"{self.name}: job {job['id']} failed {attempt} times, "
+                        f"retrying every {self.parked_retry_seconds:g}s: {str(e)}"
+                    )
+                    metrics.inc(f'{self.name}_jobs_parked_total')
+                    self._park(job)
+                else:
+                    delay = min(BACKGROUND_JOB_BASE_DELAY_SECONDS * (2 ** (attempt - 1)), BACKGROUND_JOB_MAX_DELAY_SECONDS)
+                    logger.warning(f"{self.name}: job {job['id']} attempt {attempt} failed, retrying in {delay:.1f}s: {str(e)}")
+                    metrics.inc(f'{self.name}_jobs_retried')
+                    self._retries = [handle for handle in self._retries if handle.when() > loop.time()]
+                    self._retries.append(loop.call_later(
+                        delay * random.uniform(0.8, 1.2), self._queue.put_nowait, (job, attempt + 1)
+                    ))
+            else:
+                self._write({'done': job['id']})
+                metrics.inc(f'{self.name}_jobs_done')
+                metrics.observe(f'{self.name}_job_delay_ms', (time.time() - job['submitted_at']) * 1000)
+                self._settle(job)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Give queued jobs up to timeout seconds to finish, then stop. Unfinished (and parked) jobs stay journaled."""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.name}: stopping with {len(self._pending)} job(s) unfinished (journaled)")
+        for handle in self._retries:
+            handle.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._journal.close()
+        self._queue = None
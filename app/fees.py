@@ -0,0 +1,238 @@
+"""
+Fee Engine for PaySwiftly
+
+Rule-based platform fees: per-vehicle-type amount bands, each with a
+percentage, a fixed amount, and an optional floor and cap.
+
+Rules are compiled once into sorted band tables per vehicle type, so pricing
+one payment is a binary search (O(log n)). price_batch() applies the same
+tables to whole NumPy arrays for repricing and simulating fee changes over
+historical transactions; both paths use the same integer-cent arithmetic and
+always agree.
+
+Rules come from FEE_RULES (JSON) or FEE_RULES_FILE (path to JSON), e.g.:
+
+    [
+      {"vehicle_type": "boda", "min_amount": 0,   "percentage": 2.5, "min_fee": 1},
+      {"vehicle_type": "boda", "min_amount": 500, "percentage": 2.0, "max_fee": 50},
+      {"vehicle_type": "taxi", "min_amount": 0,   "percentage": 3.0, "fixed": 5},
+      {"min_amount": 0, "percentage": 3.0}
+    ]
+
+Amounts in the config are KES. A rule without vehicle_type applies to every
+vehicle type that has no rules of its own. Without any config a single rule
+is built from PLATFORM_FEE_PERCENTAGE and PLATFORM_FEE_FIXED.
+"""
+
+import os
+import json
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .money import to_cents, percent_to_basis_points, apply_basis_points
+
+ANY_VEHICLE = "*"
+NO_CAP = 2 ** 62
+
+
+@dataclass(frozen=True)
+class FeeRule:
+    """One fee band. Amounts are in cents, the rate in basis points."""
+    basis_points: int
+    vehicle_type: str = ANY_VEHICLE
+    min_amount_cents: int = 0
+    fixed_cents: int = 0
+    min_fee_cents: int = 0
+    max_fee_cents: Optional[int] = None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "FeeRule":
+        """Build a rule from a KES-denominated config entry."""
+        max_fee = config.get('max_fee')
+        return cls(
+            basis_points=percent_to_basis_points(config.get('percentage', 0)),
+            vehicle_type=config.get('vehicle_type') or ANY_VEHICLE,
+            min_amount_cents=to_cents(config.get('min_amount', 0)),
+            fixed_cents=to_cents(config.get('fixed', 0)),
+            min_fee_cents=to_cents(config.get('min_fee', 0)),
+            max_fee_cents=to_cents(max_fee) if max_fee is not None else None
+        )
+
+
+class _BandTable:
+    """Compiled bands for one vehicle type, as parallel lists sorted by lower bound."""
+
+    def __init__(self, rules: List[FeeRule]):
+        rules = sorted(rules, key=lambda r: r.min_amount_cents)
+        bounds = [r.min_amount_cents for r in rules]
+
+        if bounds[0] != 0:
+            raise ValueError(f"Fee bands for '{rules[0].vehicle_type}' must start at 0")
+        if len(set(bounds)) != len(bounds):
+            raise ValueError(f"Duplicate fee band lower bounds for '{rules[0].vehicle_type}'")
+
+        self.bounds = bounds
+        self.basis_points = [r.basis_points for r in rules]
+        self.fixed = [r.fixed_cents for r in rules]
+        self.floor = [r.min_fee_cents for r in rules]
+        self.cap = [r.max_fee_cents if r.max_fee_cents is not None else NO_CAP for r in rules]
+        self._arrays = None
+
+    def arrays(self):
+        """The band table as NumPy int64 arrays (built on first batch use)."""
+        if self._arrays is None:
+            import numpy as np
+            self._arrays = tuple(
+                np.asarray(column, dtype=np.int64)
+                for column in (self.bounds, self.basis_points, self.fixed, self.floor, self.cap)
+            )
+        return self._arrays
+
+    def band(self, amount_cents: int) -> int:
+        return bisect_right(self.bounds, amount_cents) - 1
+
+    def fee(self, amount_cents: int, band: int) -> int:
+        fee = apply_basis_points(amount_cents, self.basis_points[band]) + self.fixed[band]
+        fee = min(max(fee, self.floor[band]), self.cap[band])
+        # The fee can never exceed the payment
+        return min(fee, amount_cents)
+
+
+class FeeEngine:
+    """Compiled fee rule set."""
+
+    def __init__(self, rules: Iterable[FeeRule]):
+        grouped: Dict[str, List[FeeRule]] = {}
+        for rule in rules:
+            grouped.setdefault(rule.vehicle_type, []).append(rule)
+
+        if ANY_VEHICLE not in grouped:
+            raise ValueError("Fee rules need a default band set (a rule without vehicle_type)")
+
+        self.rules = [rule for group in grouped.values() for rule in group]
+        self._tables = {vehicle: _BandTable(group) for vehicle, group in grouped.items()}
+
+        # Headline rate shown on the payment page (lowest band), computed once
+        self._display_percentage = {
+            vehicle: table.basis_points[0] / 100 for vehicle, table in self._tables.items()
+        }
+
+    @classmethod
+    def from_config(cls, config: Sequence[Dict[str, Any]]) -> "FeeEngine":
+        return cls(FeeRule.from_config(entry) for entry in config)
+
+    @classmethod
+    def from_env(cls) -> "FeeEngine":
+        """Load rules from FEE_RULES / FEE_RULES_FILE, falling back to the flat platform fee."""
+        raw = os.getenv('FEE_RULES')
+        path = os.getenv('FEE_RULES_FILE')
+
+        if raw:
+            return cls.from_config(json.loads(raw))
+        if path:
+            with open(path) as f:
+                return cls.from_config(json.load(f))
+
+        return cls.from_config([{
+            "percentage": os.getenv('PLATFORM_FEE_PERCENTAGE', '3.0'),
+            "fixed": os.getenv('PLATFORM_FEE_FIXED', '0')
+        }])
+
+    def _table(self, vehicle_type: Optional[str]) -> _BandTable:
+        return self._tables.get(vehicle_type or ANY_VEHICLE) or self._tables[ANY_VEHICLE]
+
+    def calculate(self, amount_cents: int, vehicle_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Price one payment.
+
+        Returns:
+            Dict with total_amount_cents, platform_fee_cents, driver_amount_cents
+            and the fee_percentage / fee_fixed_cents of the band applied
+        """
+        table = self._table(vehicle_type)
+        band = table.band(amount_cents)
+        platform_fee_cents = table.fee(amount_cents, band)
+
+        return {
+            "total_amount_cents": amount_cents,
+            "platform_fee_cents": platform_fee_cents,
+            "driver_amount_cents": amount_cents - platform_fee_cents,
+            "fee_percentage": table.basis_points[band] / 100,
+            "fee_fixed_cents": table.fixed[band]
+        }
+
+    def display_percentage(self, vehicle_type: Optional[str] = None) -> float:
+        """Headline fee percentage for a vehicle type (no per-call computation)."""
+        return self._display_percentage.get(vehicle_type or ANY_VEHICLE, self._display_percentage[ANY_VEHICLE])
+
+    def price_batch(self, amounts_cents, vehicle_types=None):
+        """
+        Vectorized fee calculation.
+
+        Args:
+            amounts_cents: Array-like of int amounts in cents
+            vehicle_types: Optional array-like of vehicle type strings (same length)
+
+        Returns:
+            numpy int64 array of platform fees in cents
+        """
+        import numpy as np
+
+        amounts = np.asarray(amounts_cents, dtype=np.int64)
+        fees = np.empty_like(amounts)
+
+        if vehicle_types is None:
+            groups = {ANY_VEHICLE: np.ones(amounts.shape, dtype=bool)}
+        else:
+            vehicles = np.asarray(vehicle_types, dtype=object)
+            specific = [v for v in self._tables if v != ANY_VEHICLE]
+            groups = {v: vehicles == v for v in specific}
+            groups[ANY_VEHICLE] = ~np.isin(vehicles, specific) if specific else np.ones(amounts.shape, dtype=bool)
+
+        for vehicle, mask in groups.items():
+            if not mask.any():
+                continue
+            bounds, basis_points, fixed, floor, cap = self._tables[vehicle].arrays()
+            selected = amounts[mask]
+            band = np.searchsorted(bounds, selected, side='right') - 1
+
+            fee = (selected * basis_points[band] + 5000) // 10000 + fixed[band]
+            fee = np.minimum(np.maximum(fee, floor[band]), cap[band])
+            fees[mask] = np.minimum(fee, selected)
+
+        return fees
+
+    def simulate(self, candidate: "FeeEngine", amounts_cents, vehicle_types=None) -> Dict[str, Any]:
+        """
+        Compare this rule set with a candidate over the same payments.
+
+        Returns:
+            dict: Fee totals (cents) under both rule sets and per-vehicle-type deltas
+        """
+        import numpy as np
+
+        current = self.price_batch(amounts_cents, vehicle_types)
+        proposed = candidate.price_batch(amounts_cents, vehicle_types)
+
+        summary = {
+            "transactions": int(current.size),
+            "current_fees_cents": int(current.sum()),
+            "candidate_fees_cents": int(proposed.sum()),
+            "delta_cents": int(proposed.sum() - current.sum()),
+            "changed": int((current != proposed).sum()),
+            "by_vehicle_type": {}
+        }
+
+        if vehicle_types is not None:
+            vehicles = np.asarray(vehicle_types, dtype=object)
+            for vehicle in np.unique(vehicles):
+                mask = vehicles == vehicle
+                summary["by_vehicle_type"][str(vehicle)] = {
+                    "transactions": int(mask.sum()),
+                    "current_fees_cents": int(current[mask].sum()),
+                    "candidate_fees_cents": int(proposed[mask].sum()),
+                    "delta_cents": int(proposed[mask].sum() - current[mask].sum())
+                }
+
+        return summary
@@ -0,0 +1,257 @@
+"""
+Idempotent Payment Requests for PaySwiftly
+
+On flaky mobile data the pay page often sends /api/pay again while the
+first attempt is still running or already answered. Without protection
+each attempt inserts a transaction and sends the passenger another STK
+push. IdempotentRequests runs each distinct payment request once and
+answers repeats with the original response:
+
+- A request with an Idempotency-Key header is identified by that key for
+  IDEMPOTENCY_TTL_SECONDS.
+- A request without one is identified by a hash of driver, passenger phone
+  and amount for IDEMPOTENCY_WINDOW_SECONDS (0 disables this fallback). A
+  passenger paying the same driver the same amount again inside the window
+  gets the first payment's response.
+- Repeats that arrive while the first request is running wait for it
+  instead of running again (one in-flight execution per key).
+- Reusing a key for a different payment is an IdempotencyConflict.
+
+Only successful responses are kept. A failed request (unknown driver,
+IntaSend error, ...) can be retried with the same key.
+
+Completed responses are kept in memory, per worker process. With
+IDEMPOTENCY_SHARED=true (needs database/idempotency_migration.sql) keys are
+also claimed in the idempotency_keys table, so a retry that lands on
+another worker is answered too. It waits up to IDEMPOTENCY_WAIT_SECONDS
+for a request still running elsewhere, then gets IdempotencyInProgress.
+While a request runs, its claim is renewed every third of
+IDEMPOTENCY_LOCK_SECONDS, so a slow STK push is never run a second time by
+another worker; a claim whose worker died is taken over once it lapses.
+
+Metrics: idempotency_executed, idempotency_replayed (answered from a
+stored response), idempotency_coalesced (waited for an in-flight request),
+idempotency_waits (polls for another worker's request), idempotency_conflicts.
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import functools
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_WINDOW_SECONDS = int(os.getenv('IDEMPOTENCY_WINDOW_SECONDS', '60'))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+IDEMPOTENCY_SHARED = os.getenv('IDEMPOTENCY_SHARED', 'false').lower() in ('1', 'true', 'yes')
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '15'))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '60'))
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+Response = Dict[str, Any]
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request."""
+
+
+class IdempotencyInProgress(Exception):
+    """Another worker is still running the request for this key."""
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Hash identifying what a request does (e.g. driver, phone and amount)."""
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def resolve_key(header_key: Optional[str], fingerprint: str) -> Tuple[Optional[str], int]:
+    """
+    Key and TTL for a request: the client's Idempotency-Key if sent, otherwise
+    the fingerprint for the short window. (None, 0) when neither applies.
+
+    Raises:
+        ValueError: if the client's key is empty or too long
+    """
+    if header_key is not None:
+        header_key = header_key.strip()
+        if not header_key or len(header_key) > MAX_KEY_LENGTH:
+            raise ValueError(f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters")
+        return f"key:{header_key}", IDEMPOTENCY_TTL_SECONDS
+    if IDEMPOTENCY_WINDOW_SECONDS > 0:
+        return f"auto:{fingerprint}", IDEMPOTENCY_WINDOW_SECONDS
+    return None, 0
+
+
+class _Completed:
+    """A stored response and when it stops being replayed."""
+
+    __slots__ = ('fingerprint', 'response', 'expires')
+
+    def __init__(self, fingerprint: str, response: Response, ttl_seconds: float):
+        self.fingerprint = fingerprint
+        self.response = response
+        self.expires = time.monotonic() + ttl_seconds
+
+
+class _Flight:
+    """The one running execution for a key."""
+
+    __slots__ = ('fingerprint', 'task')
+
+    def __init__(self, fingerprint: str, task: asyncio.Task):
+        self.fingerprint = fingerprint
+        self.task = task
+
+
+class IdempotentRequests:
+    """Runs each keyed request once and replays its response (see module docstring)."""
+
+    def __init__(self, store=None, max_size: int = IDEMPOTENCY_CACHE_SIZE):
+        # store: a SupabaseManager when keys are shared between workers
+        self.store = store
+        self.max_size = max_size
+        self._completed: "OrderedDict[str, _Completed]" = OrderedDict()
+        self._in_flight: Dict[str, _Flight] = {}
+
+    def _remember(self, key: str, fingerprint: str, response: Response, ttl_seconds: float) -> None:
+        self._completed[key] = _Completed(fingerprint, response, ttl_seconds)
+        self._completed.move_to_end(key)
+        while len(self._completed) > self.max_size:
+            self._completed.popitem(last=False)
+
+    def _lookup(self, key: str) -> Optional[_Completed]:
+        completed = self._completed.get(key)
+        if completed is not None and completed.expires < time.monotonic():
+            del self._completed[key]
+            return None
+        return completed
+
+    @staticmethod
+    def _check(key: str, stored_fingerprint: str, fingerprint: str) -> None:
+        if stored_fingerprint != fingerprint:
+            metrics.inc('idempotency_conflicts')
+            raise IdempotencyConflict(f"{key.partition(':')[2]!r} was already used for a different payment")
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        ttl_seconds: float,
+        execute: Callable[[], Awaitable[Response]]
+    ) -> Tuple[Response, bool]:
+        """
+        The response for key: execute()'s, or the stored/in-flight one for a
+        repeat. Returns (response, replayed). The response must be JSON-serializable.
+
+        Raises:
+            IdempotencyConflict: if key was used with another fingerprint
+            IdempotencyInProgress: if another worker holds the key too long
+        """
+        completed = self._lookup(key)
+        if completed is not None:
+            self._check(key, completed.fingerprint, fingerprint)
+            metrics.inc('idempotency_replayed')
+            return completed.response, True
+
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            self._check(key, flight.fingerprint, fingerprint)
+            metrics.inc('idempotency_coalesced')
+            response, _ = await asyncio.shield(flight.task)
+            return response, True
+
+        # Its own task, so a client that disconnects does not abort a payment
+        # that repeats are waiting on
+        flight = _Flight(fingerprint, asyncio.ensure_future(self._execute(key, fingerprint, ttl_seconds, execute)))
+        self._in_flight[key] = flight
+        flight.task.add_done_callback(functools.partial(self._land, key, flight))
+        return await asyncio.shield(flight.task)
+
+    def _land(self, key: str, flight: _Flight, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller went away
+            task.exception()
+
+    async def _execute(
+        self,
+        key: str,
+        fingerprint: str,
+        ttl_seconds: float,
+        execute: Callable[[], Awaitable[Response]]
+    ) -> Tuple[Response, bool]:
+        if self.store is not None:
+            stored = await self._claim(key, fingerprint, ttl_seconds)
+            if stored is not None:
+                self._remember(key, fingerprint, stored, ttl_seconds)
+                metrics.inc('idempotency_replayed')
+                return stored, True
+
+        try:
+            response = await (self._execute_holding_claim(key, execute) if self.store is not None else execute())
+        except BaseException:
+            if self.store is not None:
+                try:
+                    await self.store.release_idempotency_key(key)
+                except Exception as e:
+                    # The claim lapses after IDEMPOTENCY_LOCK_SECONDS anyway
+                    logger.warning(f"Failed to release idempotency key: {str(e)}")
+            raise
+
+        metrics.inc('idempotency_executed')
+        self._remember(key, fingerprint, response, ttl_seconds)
+        if self.store is not None:
+            try:
+                await self.store.complete_idempotency_key(key, response)
+            except Exception as e:
+                # Repeats on this worker are still answered; others get
+                # IdempotencyInProgress until the claim lapses
+                logger.error(f"Failed to store idempotent response: {str(e)}")
+        return response, False
+
+    async def _execute_holding_claim(self, key: str, execute: Callable[[], Awaitable[Response]]) -> Response:
+        """Run execute() while renewing the shared claim on key in the background."""
+        renewal = asyncio.ensure_future(self._renew(key))
+        try:
+            return await execute()
+        finally:
+            renewal.cancel()
+
+    async def _renew(self, key: str) -> None:
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_LOCK_SECONDS / 3)
+            try:
+                await self.store.renew_idempotency_key(key, IDEMPOTENCY_LOCK_SECONDS)
+            except Exception as e:
+                # Retried on the next tick; the claim has two more before it lapses
+                logger.warning(f"Failed to renew idempotency key: {str(e)}")
+
+    async def _claim(self, key: str, fingerprint: str, ttl_seconds: float) -> Optional[Response]:
+        """Claim key in the shared table, or return the response another worker stored for it."""
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        delay = 0.1
+        while True:
+            claim = await self.store.claim_idempotency_key(key, fingerprint, ttl_seconds, IDEMPOTENCY_LOCK_SECONDS)
+            if claim['claimed']:
+                return None
+            self._check(key, claim['request_hash'], fingerprint)
+            if claim['response'] is not None:
+                return claim['response']
+
+            # Still running on another worker
+            if time.monotonic() + delay > deadline:
+                raise IdempotencyInProgress(f"A payment for this {IDEMPOTENCY_HEADER} is still in progress")
+            metrics.inc('idempotency_waits')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
@@ -1,13 +1,27 @@
 import os
+import asyncio
 import base64
+import functools
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict, Any, Optional
 import logging
 
+from .money import CENTS_PER_SHILLING, to_cents, from_cents
+from .fees import FeeEngine
+from .phone import to_mpesa_number
+
 logger = logging.getLogger(__name__)
 
+# Calls run in a thread pool of this size over a shared keep-alive connection pool,
+# so concurrent STK pushes overlap without blocking the event loop or paying a TLS
+# handshake each
+INTASEND_MAX_CONNECTIONS = int(os.getenv('INTASEND_MAX_CONNECTIONS', '64'))
+INTASEND_TIMEOUT_SECONDS = float(os.getenv('INTASEND_TIMEOUT_SECONDS', '30'))
+
 
 class IntaSendAPI:
     """IntaSend API integration for payment collection and disbursements."""
@@ -22,14 +36,19 @@ class IntaSendAPI:
         self.base_url = "https://api.intasend.com/api/v1"
         
         # Platform configuration - UPDATED FOR PROFITABILITY
-        self.platform_fee_percentage = float(os.getenv('PLATFORM_FEE_PERCENTAGE', '3.0'))  # Changed from 0.5% to 3%
-        self.platform_fee_fixed = float(os.getenv('PLATFORM_FEE_FIXED', '0'))
-        self.minimum_payout = float(os.getenv('MINIMUM_PAYOUT_THRESHOLD', '100'))  # NEW: Minimum KES 100
+        # Fee rules are compiled once (see app/fees.py); PLATFORM_FEE_PERCENTAGE (default 3%)
+        # and PLATFORM_FEE_FIXED are used when no FEE_RULES are configured
+        self.fee_engine = FeeEngine.from_env()
+        self.minimum_payout_cents = to_cents(os.getenv('MINIMUM_PAYOUT_THRESHOLD', '100'))  # NEW: Minimum KES 100
         
         self._headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"  # Fixed typo: was "Authorizations"
         }
+        
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=INTASEND_MAX_CONNECTIONS))
+        self._executor = ThreadPoolExecutor(max_workers=INTASEND_MAX_CONNECTIONS, thread_name_prefix='intasend')
     
     def _make_request(
         self, 
@@ -42,9 +61,9 @@ class IntaSendAPI:
         
         try:
             if method.upper() == "GET":
-                response = requests.get(url, headers=self._headers, params=data)
+                response = self.session.get(url, headers=self._headers, params=data, timeout=INTASEND_TIMEOUT_SECONDS)
             elif method.upper() == "POST":
-                response = requests.post(url, headers=self._headers, json=data)
+                response = self.session.post(url, headers=self._headers, json=data, timeout=INTASEND_TIMEOUT_SECONDS)
             else:
                 raise ValueError(f"Unsupported HTTP method: {method}")
             
@@ -60,37 +79,28 @@ class IntaSendAPI:
                     logger.error(f"Response text: {e.response.text}")
             raise Exception(f"IntaSend API error: {str(e)}")
     
-    def calculate_fees(self, amount: float) -> Dict[str, float]:
+    async def _request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict[str, Any]:
+        """_make_request in the IntaSend thread pool, off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._make_request, method, endpoint, data))
+    
+    def calculate_fees(self, amount_cents: int, vehicle_type: Optional[str] = None) -> Dict[str, Any]:
         """
-        Calculate platform fee and driver payout amount.
+        Calculate platform fee and driver payout amount in integer cents.
         
         Args:
-            amount: Total amount paid by passenger
+            amount_cents: Total amount paid by passenger, in cents
+            vehicle_type: Driver's vehicle type, for per-vehicle fee bands
             
         Returns:
-            Dict with platform_fee, driver_amount, and percentage_used
+            Dict with platform_fee_cents, driver_amount_cents, and the fee settings used
         """
-        # Calculate percentage-based fee
-        percentage_fee = amount * (self.platform_fee_percentage / 100)
-        
-        # Add fixed fee if configured
-        total_platform_fee = percentage_fee + self.platform_fee_fixed
-        
-        # Calculate driver's share
-        driver_amount = amount - total_platform_fee
-        
-        return {
-            "total_amount": round(amount, 2),
-            "platform_fee": round(total_platform_fee, 2),
-            "driver_amount": round(driver_amount, 2),
-            "fee_percentage": self.platform_fee_percentage,
-            "fee_fixed": self.platform_fee_fixed
-        }
+        return self.fee_engine.calculate(amount_cents, vehicle_type)
     
     async def initiate_collection(
         self,
         phone_number: str,
-        amount: float,
+        amount_cents: int,
         reference: str,
         email: Optional[str] = None,
         name: Optional[str] = None
@@ -99,8 +109,8 @@ class IntaSendAPI:
         Initiate M-Pesa STK Push payment collection.
         
         Args:
-            phone_number: Customer's M-Pesa number (format: 254XXXXXXXXX)
-            amount: Amount to collect
+            phone_number: Customer's M-Pesa number (any Kenyan format, see app/phone.py)
+            amount_cents: Amount to collect, in cents
             reference: Unique reference for the transaction
             email: Customer's email (optional)
             name: Customer's name (optional)
@@ -109,14 +119,15 @@ class IntaSendAPI:
             Dict containing the collection response
         """
         # Ensure phone number is in correct format
-        if phone_number.startswith('+'):
-            phone_number = phone_number[1:]
-        elif phone_number.startswith('0'):
-            phone_number = f"254{phone_number[1:]}"
+        phone_number = to_mpesa_number(phone_number)
+        
+        # IntaSend expects an integer KES amount; never charge less than was booked
+        if amount_cents % CENTS_PER_SHILLING:
+            raise ValueError(f"M-Pesa collects whole shillings, got {from_cents(amount_cents)} KES")
         
         payload = {
             "method": "M-PESA",
-            "amount": int(amount),  # IntaSend expects integer amount
+            "amount": amount_cents // CENTS_PER_SHILLING,
             "currency": "KES",
             "phone_number": phone_number,
             "api_ref": reference,
@@ -128,10 +139,10 @@ class IntaSendAPI:
         if name:
             payload["name"] = name
         
-        logger.info(f"Initiating collection: {reference} for KES {amount} from {phone_number}")
+        logger.info(f"Initiating collection: {reference} for KES {from_cents(amount_cents)} from {phone_number}")
         
         try:
-            response = self._make_request("POST", "payment/mpesa-stk-push/", payload)
+            response = await self._request("POST", "payment/mpesa-stk-push/", payload)
             logger.info(f"Collection initiated successfully: {response.get('id')}")
             return response
         except Exception as e:
@@ -149,7 +160,8 @@ class IntaSendAPI:
             Dict containing the collection status
         """
         try:
-            response = self._make_request("GET", f"payment/status/", {"id": collection_id})
+            # Off the event loop, so status checks can overlap
+            response = await self._request("GET", "payment/status/", {"id": collection_id})
             return response
         except Exception as e:
             logger.error(f"Status check failed: {str(e)}")
@@ -158,7 +170,7 @@ class IntaSendAPI:
     async def initiate_batch_payout(
         self,
         phone_number: str,
-        amount: float,
+        amount_cents: int,
         reference: str,
         name: Optional[str] = None,
         account: Optional[str] = None
@@ -168,8 +180,8 @@ class IntaSendAPI:
         This is used for weekly batch payouts when balance >= minimum threshold.
         
         Args:
-            phone_number: Driver's M-Pesa number (format: 254XXXXXXXXX)
-            amount: Amount to send to driver
+            phone_number: Driver's M-Pesa number (any Kenyan format, see app/phone.py)
+            amount_cents: Amount to send to driver, in cents
             reference: Unique reference for the payout
             name: Driver's name (optional)
             account: Driver's account identifier (optional)
@@ -178,14 +190,12 @@ class IntaSendAPI:
             Dict containing the payout response
         """
         # Ensure phone number is in correct format
-        if phone_number.startswith('+'):
-            phone_number = phone_number[1:]
-        elif phone_number.startswith('0'):
-            phone_number = f"254{phone_number[1:]}"
+        phone_number = to_mpesa_number(phone_number)
         
         # Check minimum payout threshold
-        if amount < self.minimum_payout:
-            error_msg = f"Amount KES {amount} is below minimum payout of KES {self.minimum_payout}"
+        if amount_cents < self.minimum_payout_cents:
+            error_msg = (f"Amount KES {from_cents(amount_cents)} is below minimum payout "
+                         f"of KES {from_cents(self.minimum_payout_cents)}")
             logger.warning(f"Batch payout skipped: {error_msg}")
             raise ValueError(error_msg)
         
@@ -197,17 +207,17 @@ class IntaSendAPI:
                 {
                     "name": name if name else "Driver",
                     "account": phone_number,  # IntaSend uses 'account' not 'device'
-                    "amount": str(amount),  # Amount must be string format
+                    "amount": str(from_cents(amount_cents)),  # Amount must be string format
                     "narrative": f"Weekly payout - Ref: {reference[:20]}"
                 }
             ]
         }
         
-        logger.info(f"Initiating batch payout: {reference} for KES {amount} to {phone_number}")
+        logger.info(f"Initiating batch payout: {reference} for KES {from_cents(amount_cents)} to {phone_number}")
         
         try:
             # Correct endpoint is /send-money/initiate/ (not just /send-money/)
-            response = self._make_request("POST", "send-money/initiate/", payload)
+            response = await self._request("POST", "send-money/initiate/", payload)
             
             file_id = response.get('file_id')
             if file_id:
@@ -236,7 +246,7 @@ class IntaSendAPI:
         payload = {"file_id": file_id}
         
         try:
-            response = self._make_request("POST", "send-money/approve/", payload)
+            response = await self._request("POST", "send-money/approve/", payload)
             logger.info(f"Payout approved successfully: {file_id}")
             return response
         except Exception as e:
@@ -254,7 +264,7 @@ class IntaSendAPI:
             Dict containing the payout status
         """
         try:
-            response = self._make_request("GET", f"payouts/status/", {"tracking_id": tracking_id})
+            response = await self._request("GET", "payouts/status/", {"tracking_id": tracking_id})
             return response
         except Exception as e:
             logger.error(f"Payout status check failed: {str(e)}")
@@ -268,7 +278,7 @@ class IntaSendAPI:
             Dict containing wallet balance information
         """
         try:
-            response = self._make_request("GET", "wallets/")
+            response = await self._request("GET", "wallets/")
             return response
         except Exception as e:
             logger.error(f"Wallet balance check failed: {str(e)}")
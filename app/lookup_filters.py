@@ -0,0 +1,87 @@
+"""
+Lookup Filters for PaySwiftly
+
+Scanners, bots and stale QR stickers ask for driver and transaction IDs that
+do not exist. SupabaseManager uses these structures to answer such lookups
+without a database round trip:
+
+- NegativeCache remembers recent misses for NEGATIVE_CACHE_TTL_SECONDS.
+- BloomFilter holds every known driver ID (DRIVER_ID_FILTER=true). It is
+  loaded at startup and updated by create_driver(). A miss means the driver
+  certainly did not exist when the filter was last refreshed.
+
+Both can only say "missing". A possible hit always goes to the database.
+"""
+
+import time
+import math
+import hashlib
+from collections import OrderedDict
+from typing import Hashable, Optional
+from uuid import UUID
+
+
+def canonical_uuid(value: str) -> Optional[str]:
+    """Lowercase hyphenated form of a UUID string, or None if it is not one (every driver and transaction ID is)."""
+    try:
+        return str(UUID(value))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+class NegativeCache:
+    """Keys recently looked up and not found, each kept for ttl_seconds (LRU-bounded)."""
+
+    def __init__(self, ttl_seconds: float, max_size: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._expires: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def add(self, key: Hashable) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        self._expires[key] = time.monotonic() + self.ttl_seconds
+        self._expires.move_to_end(key)
+        while len(self._expires) > self.max_size:
+            self._expires.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        expires = self._expires.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del self._expires[key]
+            return False
+        return True
+
+    def discard(self, key: Hashable) -> None:
+        self._expires.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, sized for capacity items at error_rate."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing: two 64-bit halves of one digest give every probe
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
@@ -0,0 +1,195 @@
+"""
+Event Loop Monitor for PaySwiftly
+
+Some calls still run synchronously on the event loop: supabase-py queries
+outside the hot paths, requests calls, CPU work. While one runs, every other
+request on the worker waits. LoopMonitor measures this and finds the culprits:
+
+- Lag: a task asks to wake up every LOOP_LAG_SAMPLE_SECONDS and records how
+  late it actually wakes up. Exported as the event_loop_lag_ms timing and
+  gauge in /api/admin/metrics, and as percentiles at /api/admin/event-loop.
+- Stalls: a watchdog thread notices when the loop has not run for
+  LOOP_BLOCK_THRESHOLD_MS. It logs the loop thread's stack at that moment,
+  which shows the blocking call. Once the loop runs again, the stall
+  is logged with its duration and kept (with the stack) for
+  /api/admin/event-loop, which needs the admin key. Counted in
+  event_loop_stalls.
+
+  A stall is only seen if the blocking code lets the watchdog thread run.
+  Blocking I/O and pure-Python code do; a single long C call holding the
+  GIL is reported only after it returns.
+- Load shedding (LOAD_SHED_LAG_MS > 0): while recent lag is above the
+  limit, requests to non-critical routes (LOAD_SHED_ROUTES: dashboards and
+  reports by default) get an immediate 503 with Retry-After. This leaves
+  the loop to payments, webhooks and status checks. Counted in load_shed.
+
+LOOP_LAG_SAMPLE_SECONDS=0 disables the monitor.
+"""
+
+import os
+import re
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Optional
+
+from fastapi.responses import JSONResponse
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_SAMPLE_SECONDS = float(os.getenv('LOOP_LAG_SAMPLE_SECONDS', '0.1'))
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv('LOOP_BLOCK_THRESHOLD_MS', '100'))
+LOOP_STALL_HISTORY = int(os.getenv('LOOP_STALL_HISTORY', '20'))
+# 0 disables load shedding
+LOAD_SHED_LAG_MS = float(os.getenv('LOAD_SHED_LAG_MS', '0'))
+LOAD_SHED_ROUTES = os.getenv(
+    'LOAD_SHED_ROUTES',
+    r'^/api/admin/(stats|transactions|qr-sheet)|^/api/driver/[^/]+/(transactions|payouts|summary)$'
+)
+
+# Lag samples kept for percentiles (about a minute at the default rate)
+LAG_SAMPLES_KEPT = 600
+
+
+class LoopMonitor:
+    """Event loop lag sampler, stall watchdog and load shedder (see module docstring)."""
+
+    def __init__(
+        self,
+        sample_seconds: float = LOOP_LAG_SAMPLE_SECONDS,
+        block_threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS,
+        shed_lag_ms: float = LOAD_SHED_LAG_MS,
+        shed_routes: str = LOAD_SHED_ROUTES
+    ):
+        self.sample_seconds = sample_seconds
+        self.block_threshold_ms = block_threshold_ms
+        self.shed_lag_ms = shed_lag_ms
+        self.shed_routes = re.compile(shed_routes)
+
+        # Rises to each higher sample at once, decays over a few samples
+        self.lag_ms = 0.0
+        self.samples: Deque[float] = deque(maxlen=LAG_SAMPLES_KEPT)
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=LOOP_STALL_HISTORY)
+
+        self._heartbeat = time.monotonic()
+        self._stall: Optional[Dict[str, Any]] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_seconds > 0
+
+    def start(self) -> None:
+        """Start sampling and the watchdog; call from the event loop."""
+        if not self.enabled or self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._sample_forever())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+        logger.info(
+            f"Event loop monitor started (sampling every {self.sample_seconds}s, "
+            f"stalls over {self.block_threshold_ms:g} ms)"
+        )
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _sample_forever(self) -> None:
+        while True:
+            expected = time.monotonic() + self.sample_seconds
+            await asyncio.sleep(self.sample_seconds)
+            now = time.monotonic()
+            self._heartbeat = now
+            self._record((now - expected) * 1000)
+
+    def _record(self, lag_ms: float) -> None:
+        lag_ms = max(lag_ms, 0.0)
+        self.samples.append(lag_ms)
+        self.lag_ms = lag_ms if lag_ms > self.lag_ms else self.lag_ms * 0.7 + lag_ms * 0.3
+        metrics.observe('event_loop_lag_ms', lag_ms)
+        metrics.set_gauge('event_loop_lag_ms', round(self.lag_ms, 2))
+
+        stall, self._stall = self._stall, None
+        if stall is not None:
+            stall['blocked_ms'] = round(lag_ms, 1)
+            self.stalls.append(stall)
+            logger.warning(f"Event loop was blocked for at least {stall['blocked_ms']:.0f} ms")
+
+    def _watch(self) -> None:
+        """Watchdog thread: capture the loop thread's stack while it is blocked."""
+        poll = max(self.block_threshold_ms / 2000, 0.01)
+        while not self._stopped.wait(poll):
+            overdue_ms = (time.monotonic() - self._heartbeat - self.sample_seconds) * 1000
+            if overdue_ms < self.block_threshold_ms or self._stall is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+            self._stall = {'detected_at': datetime.utcnow().isoformat(), 'stack': stack}
+            metrics.inc('event_loop_stalls')
+            logger.warning(f"Event loop blocked for over {overdue_ms:.0f} ms, in:\n{stack}")
+
+    def overloaded(self) -> bool:
+        """Whether non-critical requests should be shed now."""
+        return 0 < self.shed_lag_ms < self.lag_ms
+
+    def status(self) -> Dict[str, Any]:
+        """Recent lag percentiles and stalls, for /api/admin/event-loop."""
+        ordered = sorted(self.samples)
+
+        def percentile(p: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 2)
+
+        return {
+            "enabled": self.enabled,
+            "lag_ms": round(self.lag_ms, 2),
+            "lag_p50_ms": percentile(50),
+            "lag_p99_ms": percentile(99),
+            "lag_max_ms": round(ordered[-1], 2) if ordered else None,
+            "samples": len(ordered),
+            "shedding": self.overloaded(),
+            "stalls": list(self.stalls)
+        }
+
+
+class LoadShedMiddleware:
+    """
+    ASGI middleware answering non-critical routes with 503 while the loop is
+    overloaded. Plain ASGI, so the check adds no per-request task or wrapping.
+    """
+
+    def __init__(self, app, monitor: LoopMonitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] == 'http' and self.monitor.overloaded()
+                and self.monitor.shed_routes.search(scope['path'])):
+            metrics.inc('load_shed')
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Server busy, please retry shortly"},
+                headers={"Retry-After": "1"}
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -1,26 +1,53 @@
 import os
+import uuid
+import asyncio
 import logging
-from typing import List
+from typing import List, Optional
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Header
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Header, Query, UploadFile, File, Depends
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from .models import (
     Driver, Transaction, AdminStats, 
     DriverRegistration, PaymentRequest, PaymentInitiateResponse,
     IntaSendWebhook, TransactionStatusResponse, TransactionStatus,
-    Payout, PayoutStatus, PlatformFee, DriverLogin, LoginResponse
+    Payout, DriverLogin, LoginResponse,
+    StatsGranularity, StatsTimeseriesResponse, DriverSummary, QRSheetRequest,
+    DriverImportReport
 )
-from .supabase_util import SupabaseManager
+from .pg_fast import create_supabase_manager
+from .supabase_util import DRIVER_ID_FILTER
 from .intasend import IntaSendAPI
-from .qr_utils import generate_payment_qr
-from .auth import hash_password, verify_password, create_access_token
+from .qr_utils import (
+    store_payment_qr, payment_url, qr_image_url, qr_matrix, driver_qr_etag, render_png, render_svg,
+    QR_STORAGE_UPLOAD
+)
+from .qr_signing import payment_link_allowed
+from .short_codes import QR_SHORT_LINKS
+from .money import to_cents, from_cents
+from .phone import normalize_phone
+from .read_routing import FRESHNESS_HEADER, freshness_middleware
+from .auth import hash_password, verify_password, create_access_token, require_admin
 from .batch_payout import trigger_batch_payout as process_batch_payout
+from .reconciler import CollectionReconciler, PayoutReconciler
+from . import metrics
+from .settlement import settle_collection, settle_payout
+from .archive import query_transactions
+from . import print_sheets
+from .bulk_onboarding import import_drivers
+from .durable_queue import DurableQueue
+from .idempotency import (
+    IdempotentRequests, IdempotencyConflict, IdempotencyInProgress,
+    request_fingerprint, resolve_key, IDEMPOTENCY_SHARED, REPLAYED_HEADER
+)
+from .admission import AdmissionController, client_ip as admission_client_ip
+from .loop_monitor import LoopMonitor, LoadShedMiddleware
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -33,6 +60,11 @@ app = FastAPI(
     version="2.0.0"
 )
 
+# Event loop lag, stall stacks, and 503s for dashboards while the loop is
+# overloaded (see app/loop_monitor.py). Added before CORS so CORS wraps the 503s.
+loop_monitor = LoopMonitor()
+app.add_middleware(LoadShedMiddleware, monitor=loop_monitor)
+
 # Setup CORS
 app.add_middleware(
     CORSMiddleware,
@@ -40,8 +72,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[FRESHNESS_HEADER, "Server-Timing", REPLAYED_HEADER],
 )
 
+# Read-your-writes: pin reads after a write to the primary (see app/read_routing.py)
+app.middleware("http")(freshness_middleware)
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     logger.error(f"Global exception: {str(exc)}", exc_info=True)
@@ -52,11 +88,108 @@ async def global_exception_handler(request: Request, exc: Exception):
 
 # Initialize IntaSend API and Supabase
 intasend_api = IntaSendAPI()
-supabase_manager = SupabaseManager()
+supabase_manager = create_supabase_manager()
+
+# On-request QR images (/api/driver/{id}/qr.{png,svg}) are cacheable by a CDN
+QR_CACHE_CONTROL = f"public, max-age={int(os.getenv('QR_CACHE_MAX_AGE_SECONDS', '86400'))}"
+QR_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
 
 
 # === Background Tasks ===
 
+async def record_collection(job: dict) -> None:
+    """Save the collection ID an STK push returned (idempotent; a no-op once the webhook has settled it)."""
+    await supabase_manager.record_collection_started(
+        transaction_id=job['transaction_id'],
+        collection_id=job['collection_id'],
+        collection_response=job['collection_response'],
+        # Absent in jobs journaled before it was added
+        created_at=datetime.fromisoformat(job['created_at']) if job.get('created_at') else None
+    )
+
+# Retries recording collection IDs that could not be written inline (see app/durable_queue.py)
+collection_bookkeeping = DurableQueue('collection_bookkeeping', record_collection)
+
+# Repeated /api/pay submissions get the original response (see app/idempotency.py)
+idempotent_payments = IdempotentRequests(supabase_manager if IDEMPOTENCY_SHARED else None)
+
+# Per-phone/driver/IP limits on payments started (see app/admission.py)
+payment_admission = AdmissionController()
+
+collection_reconciler = CollectionReconciler(intasend_api, supabase_manager)
+payout_reconciler = PayoutReconciler(intasend_api, supabase_manager)
+_background_workers: List[asyncio.Task] = []
+
+
+@app.on_event("startup")
+async def start_background_workers():
+    """Start periodic reconciliation of collections and payouts whose webhook was lost."""
+    loop_monitor.start()
+    await collection_bookkeeping.start()
+    await payment_admission.start()
+    
+    interval = float(os.getenv('RECONCILE_INTERVAL_SECONDS', '120'))
+    if interval > 0:
+        _background_workers.append(asyncio.create_task(collection_reconciler.run_forever(interval)))
+        logger.info(f"Collection reconciler started (every {interval}s)")
+    
+    payout_interval = float(os.getenv('PAYOUT_RECONCILE_INTERVAL_SECONDS', '300'))
+    if payout_interval > 0:
+        _background_workers.append(asyncio.create_task(payout_reconciler.run_forever(payout_interval)))
+        logger.info(f"Payout reconciler started (every {payout_interval}s)")
+    
+    partition_interval = float(os.getenv('PARTITION_MAINTENANCE_INTERVAL_SECONDS', '86400'))
+    if partition_interval > 0:
+        _background_workers.append(asyncio.create_task(maintain_transaction_partitions(partition_interval)))
+    
+    if supabase_manager.replica is not None:
+        lag_interval = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL_SECONDS', '15'))
+        _background_workers.append(asyncio.create_task(monitor_replica_lag(lag_interval)))
+        logger.info(f"Read replica enabled (lag checked every {lag_interval}s)")
+    
+    if DRIVER_ID_FILTER:
+        try:
+            count = await supabase_manager.load_driver_filter()
+            logger.info(f"Driver ID filter loaded ({count} drivers)")
+        except Exception as e:
+            # Without the filter, lookups for unknown IDs just go to the database
+            logger.error(f"Failed to load driver ID filter: {str(e)}")
+
+
+async def maintain_transaction_partitions(interval: float):
+    """Keep monthly transactions partitions created ahead of time (pg_cron does the same when enabled)."""
+    months_ahead = int(os.getenv('PARTITION_MONTHS_AHEAD', '3'))
+    while True:
+        try:
+            created = await supabase_manager.ensure_transaction_partitions(months_ahead)
+            if created:
+                logger.info(f"Created {created} transactions partition(s)")
+        except Exception as e:
+            logger.error(f"Partition maintenance error: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+async def monitor_replica_lag(interval: float):
+    """Measure read replica lag; reads fall back to the primary while it is too far behind."""
+    while True:
+        try:
+            await supabase_manager.check_replica_lag()
+        except Exception as e:
+            logger.error(f"Replica lag check error: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    for task in _background_workers:
+        task.cancel()
+    await collection_bookkeeping.stop()
+    await payment_admission.stop()
+    await loop_monitor.stop()
+    print_sheets.shutdown_pool()
+    await supabase_manager.close()
+
+
 # process_payout function removed - replaced with batch payout system
 # Payments now accumulate in driver.pending_balance
 # Batch payouts triggered via /api/admin/trigger-batch-payout endpoint
@@ -87,34 +220,49 @@ async def register_driver(driver_data: DriverRegistration) -> dict:
     Passengers scan this QR code to pay the driver.
     """
     try:
-        # Create driver object
+        try:
+            normalize_phone(driver_data.phone)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # bcrypt takes a few hundred ms of CPU: hash in a thread during the duplicate check
+        existing, password_hash = await asyncio.gather(
+            supabase_manager.get_driver_by_phone(driver_data.phone),
+            asyncio.to_thread(hash_password, driver_data.password)
+        )
+        if existing:
+            raise HTTPException(status_code=400, detail="Phone number already registered")
+        
+        # The ID is generated here so the QR code URL is known before the insert,
+        # and the driver is written once, complete
+        driver_id = str(uuid.uuid4())
+        qr_url = supabase_manager.qr_code_public_url(driver_id) if QR_STORAGE_UPLOAD else qr_image_url(driver_id)
         driver = Driver(
-            id="",  # Will be set by Supabase
+            id=driver_id,
             name=driver_data.name,
             phone=driver_data.phone,
             email=driver_data.email,
             vehicle_type=driver_data.vehicle_type,
-            vehicle_number=driver_data.vehicle_number
+            vehicle_number=driver_data.vehicle_number,
+            qr_code_url=qr_url
         )
         
-        # Hash the password
-        password_hash = hash_password(driver_data.password)
-        
-        # Save driver to Supabase
-        driver_id = await supabase_manager.create_driver(driver)
+        if QR_STORAGE_UPLOAD and not QR_SHORT_LINKS:
+            # The QR code does not depend on the driver row: render and upload it during the insert
+            _, qr_stored = await asyncio.gather(
+                supabase_manager.create_driver(driver, password_hash),
+                store_driver_qr(driver_id, driver_data.phone)
+            )
+        else:
+            await supabase_manager.create_driver(driver, password_hash)
+            # A short code references the driver row, so its QR code has to wait for the insert
+            qr_stored = await store_driver_qr(driver_id, driver_data.phone) if QR_STORAGE_UPLOAD else True
         logger.info(f"Driver registered: {driver_id}")
         
-        # Update driver with password hash
-        await supabase_manager.update_driver(driver_id, {"password_hash": password_hash})
-        
-        # Generate QR code with driver's phone pre-filled
-        qr_bytes = generate_payment_qr(driver_id, driver_data.phone)
-        
-        # Upload QR code to Supabase Storage
-        qr_url = await supabase_manager.upload_qr_code(driver_id, qr_bytes)
-        
-        # Update driver with QR code URL
-        await supabase_manager.update_driver(driver_id, {"qr_code_url": qr_url})
+        if not qr_stored:
+            # Still scannable: the QR code is rendered on request instead
+            qr_url = qr_image_url(driver_id)
+            await supabase_manager.update_driver(driver_id, {"qr_code_url": qr_url})
         
         return {
             "status": "success",
@@ -122,11 +270,23 @@ async def register_driver(driver_data: DriverRegistration) -> dict:
             "qr_code_url": qr_url,
             "message": "Driver registered successfully"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Driver registration failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def store_driver_qr(driver_id: str, phone: str) -> bool:
+    """Render and upload a new driver's QR code (phone pre-filled). False if that failed."""
+    try:
+        await store_payment_qr(supabase_manager, driver_id, phone)
+        return True
+    except Exception as e:
+        logger.error(f"QR code upload failed for driver {driver_id}: {str(e)}")
+        return False
+
+
 @app.post("/api/login", response_model=LoginResponse)
 async def login_driver(login_data: DriverLogin) -> LoginResponse:
     """
@@ -166,14 +326,73 @@ async def login_driver(login_data: DriverLogin) -> LoginResponse:
 
 
 @app.get("/api/driver/{driver_id}", response_model=Driver)
-async def get_driver(driver_id: str) -> Driver:
-    """Get driver details by ID."""
+async def get_driver(driver_id: str, t: Optional[str] = None) -> Driver:
+    """Get driver details by ID. t is the signature from a scanned QR link, checked when present."""
+    if t is not None and not payment_link_allowed(driver_id, t):
+        raise HTTPException(status_code=403, detail="Invalid payment link")
+    
     driver = await supabase_manager.get_driver(driver_id)
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
     return driver
 
 
+@app.get("/api/driver/{driver_id}/qr.{fmt}")
+async def get_driver_qr(
+    request: Request,
+    driver_id: str,
+    fmt: str,
+    size: int = Query(400, ge=64, le=2048, description="Image width in pixels"),
+    border: int = Query(4, ge=0, le=16, description="Quiet zone in modules")
+):
+    """
+    Render a driver's payment QR code as PNG or SVG.
+    
+    Encodes the same link as the registration QR code. The ETag is derived
+    from the driver ID, the link settings and the parameters, so revalidation
+    (If-None-Match) answers 304 before any database lookup or rendering.
+    """
+    if fmt not in QR_MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="Unsupported QR format (use .png or .svg)")
+    
+    etag = driver_qr_etag(driver_id, fmt, size, border)
+    headers = {"ETag": etag, "Cache-Control": QR_CACHE_CONTROL}
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    driver = await supabase_manager.get_driver(driver_id)
+    if not driver:
+        raise HTTPException(status_code=404, detail="Driver not found")
+    
+    short_code = await supabase_manager.assign_short_code(driver.id) if QR_SHORT_LINKS else None
+    data = payment_url(driver.id, driver.phone, short_code)
+    
+    # Encoding (memoized per link) and PNG compression are CPU-bound
+    matrix = await asyncio.to_thread(qr_matrix, data)
+    if fmt == "svg":
+        # Streamed row by row
+        return StreamingResponse(render_svg(matrix, size, border), media_type=QR_MEDIA_TYPES[fmt], headers=headers)
+    png = await asyncio.to_thread(render_png, matrix, size, border)
+    return Response(png, media_type=QR_MEDIA_TYPES[fmt], headers=headers)
+
+
+@app.get("/p/{code}")
+async def short_payment_link(code: str):
+    """Redirect a short QR link to the driver's (signed) payment page."""
+    driver_id = await supabase_manager.resolve_short_code(code)
+    if not driver_id:
+        raise HTTPException(status_code=404, detail="Payment link not found")
+    
+    # Codes never change; let browsers and CDNs reuse the redirect for a while
+    return RedirectResponse(
+        payment_url(driver_id),
+        status_code=302,
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
+
+
 @app.post("/api/admin/trigger-batch-payout")
 async def trigger_batch_payout_endpoint():
     """
@@ -183,86 +402,261 @@ async def trigger_batch_payout_endpoint():
     return await process_batch_payout(intasend_api, supabase_manager)
 
 
+@app.post("/api/admin/reconcile-collections")
+async def reconcile_collections_endpoint():
+    """
+    Run one reconciliation sweep over stale pending collections.
+    Returns how many transactions the sweep recovered.
+    """
+    try:
+        return await collection_reconciler.sweep()
+    except Exception as e:
+        logger.error(f"Collection reconciliation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/admin/reconcile-payouts")
+async def reconcile_payouts_endpoint():
+    """Run one reconciliation sweep over in-flight batch payouts."""
+    try:
+        return await payout_reconciler.sweep()
+    except Exception as e:
+        logger.error(f"Payout reconciliation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/admin/qr-sheet", dependencies=[Depends(require_admin)])
+async def print_qr_sheet(sheet: QRSheetRequest):
+    """
+    Printable A4 PDF of QR stickers (QR code, name, vehicle number) for a list of drivers.
+    
+    Pages are rendered in a worker pool and streamed as they complete.
+    Unknown driver IDs are skipped.
+    """
+    return StreamingResponse(
+        print_sheets.stream_pdf(print_sheets.driver_stickers(supabase_manager, sheet.driver_ids)),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="qr-stickers.pdf"'}
+    )
+
+
+@app.post("/api/admin/drivers/import", response_model=DriverImportReport, dependencies=[Depends(require_admin)])
+async def import_drivers_csv(file: UploadFile = File(...)) -> DriverImportReport:
+    """
+    Register many drivers from a CSV upload (columns: name, phone, email,
+    vehicle_type, vehicle_number, password).
+    
+    Rows are validated, inserted in batches and get their QR codes like
+    /api/register_driver. Returns a result for every row; a bad row does
+    not stop the others.
+    """
+    try:
+        try:
+            report = await import_drivers(supabase_manager, (await file.read()).decode('utf-8-sig'))
+        except ValueError as e:
+            # Includes UnicodeDecodeError
+            raise HTTPException(status_code=400, detail=str(e))
+        return report
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Driver import failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/admin/metrics")
+async def get_metrics():
+    """Get in-process counters and gauges for this worker."""
+    return metrics.snapshot()
+
+
+@app.get("/api/admin/event-loop", dependencies=[Depends(require_admin)])
+async def get_event_loop_status():
+    """Event loop lag percentiles, load shedding state and recent stalls (with stacks) for this worker."""
+    return loop_monitor.status()
 
 
 @app.post("/api/pay", response_model=PaymentInitiateResponse)
-async def initiate_payment(payment: PaymentRequest, background_tasks: BackgroundTasks) -> PaymentInitiateResponse:
+async def initiate_payment(
+    payment: PaymentRequest,
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None)
+) -> PaymentInitiateResponse:
     """
     Initiate payment collection via IntaSend STK Push.
     
+    Resubmissions are idempotent (see app/idempotency.py): a repeat with the
+    same Idempotency-Key header, or without one the same driver, phone and
+    amount within IDEMPOTENCY_WINDOW_SECONDS, gets the original response
+    (marked with an Idempotent-Replayed header) and no new STK push. A
+    repeat that arrives while the original is running waits for it.
+    
+    Payments started per passenger phone, driver and client IP are limited
+    (see app/admission.py); over a limit the answer is 429 with Retry-After.
+    Repeats do not count against the limits.
+    """
+    # Reject forged/truncated QR links before any other work (and before
+    # replaying a response to them)
+    if not payment_link_allowed(payment.driver_id, payment.qr_token):
+        raise HTTPException(status_code=403, detail="Invalid payment link")
+    
+    amount_cents = to_cents(payment.amount)
+    try:
+        phone = normalize_phone(payment.passenger_phone)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    fingerprint = request_fingerprint(payment.driver_id, phone, amount_cents)
+    
+    try:
+        key, ttl_seconds = resolve_key(idempotency_key, fingerprint)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    client_ip = admission_client_ip(
+        request.client.host if request.client else None,
+        request.headers.get('x-forwarded-for')
+    )
+    if key is None:
+        return await _initiate_payment(payment, response, phone, client_ip)
+    
+    async def execute() -> dict:
+        return (await _initiate_payment(payment, response, phone, client_ip)).model_dump(mode='json')
+    
+    try:
+        result, replayed = await idempotent_payments.run(key, fingerprint, ttl_seconds, execute)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IdempotencyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return PaymentInitiateResponse.model_validate(result)
+
+
+async def _initiate_payment(
+    payment: PaymentRequest,
+    response: Response,
+    phone: str,
+    client_ip: Optional[str]
+) -> PaymentInitiateResponse:
+    """
+    Run one payment (a request that is not a repeat), if admitted. phone is the
+    passenger's normalized number: it is what admission counts, what the
+    transaction stores and where the STK push goes.
+    
     Workflow:
     1. Verify driver exists
     2. Calculate platform fee and driver amount
     3. Create transaction record
     4. Initiate IntaSend collection
-    5. Return response to frontend
+    5. Record the collection ID, and return response to frontend
     6. Wait for webhook to confirm payment
-    7. Automatically initiate payout to driver (background task)
+    
+    Each step waits for the one before: fees depend on the driver's vehicle
+    type, and the transaction must exist before IntaSend can send its webhook.
+    The insert and the STK push run off the event loop, so concurrent payments
+    overlap. Stage durations are returned in a Server-Timing header and kept
+    as pay_*_ms timings in /api/admin/metrics.
     """
+    rejected = payment_admission.admit(phone=phone, driver=payment.driver_id, ip=client_ip)
+    if rejected:
+        kind, wait = rejected
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many payment requests for this {kind}. Please try again later.",
+            headers={"Retry-After": AdmissionController.retry_after_header(wait)}
+        )
+    
+    timer = metrics.StageTimer('pay')
     try:
         # Verify driver exists
-        driver = await supabase_manager.get_driver(payment.driver_id)
+        with timer.stage('driver'):
+            driver = await supabase_manager.get_driver(payment.driver_id)
         if not driver:
             raise HTTPException(status_code=404, detail="Driver not found")
         
-        # Calculate fees
-        fee_breakdown = intasend_api.calculate_fees(payment.amount)
-        platform_fee = fee_breakdown['platform_fee']
-        driver_amount = fee_breakdown['driver_amount']
+        # Calculate fees (integer cents)
+        amount_cents = to_cents(payment.amount)
+        fee_breakdown = intasend_api.calculate_fees(amount_cents, driver.vehicle_type.value)
+        platform_fee_cents = fee_breakdown['platform_fee_cents']
+        driver_amount_cents = fee_breakdown['driver_amount_cents']
         
-        logger.info(f"Payment initiated: {payment.amount} KES - Fee: {platform_fee} - Driver: {driver_amount}")
+        logger.info(
+            f"Payment initiated: {from_cents(amount_cents)} KES - Fee: {from_cents(platform_fee_cents)} "
+            f"- Driver: {from_cents(driver_amount_cents)}"
+        )
         
         # Create pending transaction
         transaction = Transaction(
             id="",  # Will be set by Supabase
             driver_id=payment.driver_id,
-            passenger_phone=payment.passenger_phone,
-            amount_paid=payment.amount,
-            platform_fee=platform_fee,
-            driver_amount=driver_amount,
+            passenger_phone=phone,
+            amount_paid_cents=amount_cents,
+            platform_fee_cents=platform_fee_cents,
+            driver_amount_cents=driver_amount_cents,
             status=TransactionStatus.PENDING,
             fee_percentage=fee_breakdown['fee_percentage'],
-            fee_fixed=fee_breakdown['fee_fixed']
+            fee_fixed_cents=fee_breakdown['fee_fixed_cents'],
+            created_at=datetime.utcnow()
         )
         
         # Save transaction
-        transaction_id = await supabase_manager.create_transaction_with_intasend(transaction)
+        with timer.stage('insert'):
+            transaction_id = await supabase_manager.create_transaction_with_intasend(transaction)
         logger.info(f"Transaction created: {transaction_id}")
         
         # Initiate IntaSend collection (STK Push)
-        collection_response = await intasend_api.initiate_collection(
-            phone_number=payment.passenger_phone,
-            amount=payment.amount,
-            reference=transaction_id,
-            email=payment.passenger_email,
-            name=payment.passenger_name
-        )
+        with timer.stage('stk'):
+            collection_response = await intasend_api.initiate_collection(
+                phone_number=phone,
+                amount_cents=amount_cents,
+                reference=transaction_id,
+                email=payment.passenger_email,
+                name=payment.passenger_name
+            )
         
         collection_id = collection_response.get('id')
         
         if collection_id:
-            # Update transaction with collection ID
-            await supabase_manager.update_transaction_collection(
-                transaction_id=transaction_id,
-                collection_id=collection_id,
-                collection_status='pending',
-                collection_response=collection_response
-            )
+            # The reconciler can only check collections whose ID is recorded, so
+            # write it before answering. The passenger already has the prompt:
+            # if the write fails, retry it in the background rather than fail
+            # the request.
+            with timer.stage('record'):
+                try:
+                    await supabase_manager.record_collection_started(
+                        transaction_id=transaction_id,
+                        collection_id=collection_id,
+                        collection_response=collection_response,
+                        created_at=transaction.created_at
+                    )
+                except Exception as e:
+                    logger.warning(f"Recording collection {collection_id} failed, retrying in the background: {str(e)}")
+                    collection_bookkeeping.submit({
+                        'transaction_id': transaction_id,
+                        'collection_id': collection_id,
+                        'collection_response': collection_response,
+                        'created_at': transaction.created_at.isoformat()
+                    })
             
             logger.info(f"Collection initiated. ID: {collection_id}")
+            response.headers["Server-Timing"] = timer.finish()
             
             return PaymentInitiateResponse(
                 status="success",
                 transaction_id=transaction_id,
                 collection_id=collection_id,
                 message="Payment request sent. Please check your phone for M-Pesa prompt.",
-                amount=payment.amount,
-                platform_fee=platform_fee,
-                driver_amount=driver_amount
+                amount_cents=amount_cents,
+                platform_fee_cents=platform_fee_cents,
+                driver_amount_cents=driver_amount_cents
             )
         else:
             raise Exception("Failed to initiate collection")
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Payment initiation failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -338,57 +732,20 @@ async def handle_collection_webhook(webhook: IntaSendWebhook, background_tasks:
         logger.error(f"Transaction not found: {transaction_id}")
         return
     
-    # Update transaction based on state
-    if state == "COMPLETE":
-        # Payment collected successfully
-        await supabase_manager.update_transaction_collection(
-            transaction_id=transaction_id,
-            collection_id=webhook.id or webhook.invoice_id,
-            collection_status='completed',
-            collection_response=webhook.model_dump()
-        )
-        
-        # Record platform fee
-        platform_fee = PlatformFee(
-            transaction_id=transaction_id,
-            amount=transaction.platform_fee,
-            fee_type="percentage",
-            percentage_applied=transaction.fee_percentage,
-            fixed_amount_applied=transaction.fee_fixed
-        )
-        await supabase_manager.create_platform_fee(platform_fee)
-        
-        # ADD TO DRIVER'S PENDING BALANCE (instead of immediate payout)
-        await supabase_manager.add_to_pending_balance(
-            driver_id=transaction.driver_id,
-            amount=transaction.driver_amount
-        )
-        
-        # Update transaction to show balance accumulated
-        await supabase_manager.update_transaction_payout(
-            transaction_id=transaction_id,
-            tracking_id='',  # No tracking ID yet - will get one on batch payout
-            payout_status='pending_batch',  # New status for batch payout system
-            payout_response={'note': 'Added to pending balance for weekly payout'}
-        )
-        
-        logger.info(f"Payment collected. Added {transaction.driver_amount} KES to driver pending balance")
-        
-    elif state == "FAILED":
-        # Payment failed
-        await supabase_manager.update_transaction_collection(
-            transaction_id=transaction_id,
-            collection_id=webhook.id or webhook.invoice_id,
-            collection_status='failed',
-            collection_response=webhook.model_dump()
-        )
-        logger.info(f"Payment failed for transaction {transaction_id}")
+    # Apply the result through the shared settlement path
+    await settle_collection(
+        supabase_manager,
+        transaction,
+        state,
+        collection_id=webhook.id or webhook.invoice_id,
+        collection_response=webhook.model_dump()
+    )
 
 
 async def handle_payout_webhook(webhook: IntaSendWebhook):
     """Handle payout webhook."""
     tracking_id = webhook.tracking_id
-    state = webhook.state.upper()
+    state = webhook.state or webhook.status
     
     # Get payout record
     payout = await supabase_manager.get_payout_by_tracking_id(tracking_id)
@@ -396,40 +753,8 @@ async def handle_payout_webhook(webhook: IntaSendWebhook):
         logger.error(f"Payout not found: {tracking_id}")
         return
     
-    # Update payout based on state
-    if state == "COMPLETE":
-        await supabase_manager.update_payout_status(
-            payout_id=payout.id,
-            status=PayoutStatus.COMPLETED,
-            intasend_response=webhook.model_dump()
-        )
-        
-        await supabase_manager.update_transaction_payout(
-            transaction_id=payout.transaction_id,
-            tracking_id=tracking_id,
-            payout_status='completed',
-            payout_response=webhook.model_dump()
-        )
-        
-        logger.info(f"Payout completed: {payout.amount} KES to driver {payout.driver_id}")
-        
-    elif state == "FAILED":
-        await supabase_manager.update_payout_status(
-            payout_id=payout.id,
-            status=PayoutStatus.FAILED,
-            intasend_response=webhook.model_dump(),
-            failure_reason=f"IntaSend payout failed: {state}"
-        )
-        
-        await supabase_manager.update_transaction_payout(
-            transaction_id=payout.transaction_id,
-            tracking_id=tracking_id,
-            payout_status='failed',
-            payout_response=webhook.model_dump()
-        )
-        
-        logger.error(f"Payout failed for driver {payout.driver_id}")
-
+    # Apply the result through the shared settlement path (as the payout reconciler does)
+    await settle_payout(supabase_manager, payout, state, response=webhook.model_dump())
 
 
 @app.get("/api/transaction/{transaction_id}/status", response_model=TransactionStatusResponse)
@@ -438,8 +763,9 @@ async def get_transaction_status(transaction_id: str) -> TransactionStatusRespon
     Get current status of a transaction.
     
     Returns detailed information about payment collection and payout status.
+    Served from the read replica unless the client sends a recent freshness token.
     """
-    transaction = await supabase_manager.get_transaction(transaction_id)
+    transaction = await supabase_manager.get_transaction(transaction_id, allow_replica=True)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
@@ -448,9 +774,9 @@ async def get_transaction_status(transaction_id: str) -> TransactionStatusRespon
         status=transaction.status,
         collection_status=transaction.collection_status,
         payout_status=transaction.payout_status,
-        amount_paid=transaction.amount_paid,
-        platform_fee=transaction.platform_fee,
-        driver_amount=transaction.driver_amount,
+        amount_paid_cents=transaction.amount_paid_cents,
+        platform_fee_cents=transaction.platform_fee_cents,
+        driver_amount_cents=transaction.driver_amount_cents,
         created_at=transaction.created_at,
         collection_completed_at=transaction.collection_completed_at,
         payout_completed_at=transaction.payout_completed_at
@@ -463,6 +789,89 @@ async def get_admin_stats() -> AdminStats:
     return await supabase_manager.get_admin_stats()
 
 
+# Default and maximum range per granularity, so reads stay within a few thousand rollup rows
+STATS_DEFAULT_RANGE = {StatsGranularity.HOUR: timedelta(hours=24), StatsGranularity.DAY: timedelta(days=30)}
+STATS_MAX_RANGE = {StatsGranularity.HOUR: timedelta(days=93), StatsGranularity.DAY: timedelta(days=3 * 366)}
+
+
+@app.get("/api/admin/stats/timeseries", response_model=StatsTimeseriesResponse)
+async def get_admin_stats_timeseries(
+    granularity: StatsGranularity = StatsGranularity.HOUR,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> StatsTimeseriesResponse:
+    """
+    Completed transactions per hour or day (UTC buckets) from the rollup tables.
+    Defaults to the last 24 hours (hour) or the last 30 days (day).
+    """
+    # Naive query times are taken as UTC
+    end = end or datetime.now(timezone.utc)
+    end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    start = start or end - STATS_DEFAULT_RANGE[granularity]
+    start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end - start > STATS_MAX_RANGE[granularity]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range too large for granularity '{granularity.value}' "
+                   f"(max {STATS_MAX_RANGE[granularity].days} days)"
+        )
+    
+    try:
+        buckets = await supabase_manager.get_stats_timeseries(granularity.value, start, end)
+    except Exception as e:
+        logger.error(f"Stats timeseries error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return StatsTimeseriesResponse(
+        granularity=granularity,
+        start=start,
+        end=end,
+        buckets=buckets,
+        total_transactions=sum(b.transactions for b in buckets),
+        total_revenue_cents=sum(b.revenue_cents for b in buckets),
+        total_platform_fees_cents=sum(b.platform_fees_cents for b in buckets)
+    )
+
+
+# Ranges can reach into archived months, which are read from Parquet files
+ARCHIVE_QUERY_MAX_RANGE = timedelta(days=366)
+ARCHIVE_QUERY_MAX_ROWS = int(os.getenv('ARCHIVE_QUERY_MAX_ROWS', '1000'))
+
+
+@app.get("/api/admin/transactions", response_model=List[Transaction])
+async def get_transactions_in_range(
+    start: datetime,
+    end: Optional[datetime] = None,
+    driver_id: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=ARCHIVE_QUERY_MAX_ROWS, description="Transactions per page"),
+    before_id: Optional[str] = Query(None, description="Id of the last transaction of the previous page")
+) -> List[Transaction]:
+    """
+    Get up to `limit` transactions created in [start, end), newest first.
+    For the next page, pass the last transaction's created_at as `end` and its id as `before_id`.
+    Months older than ARCHIVE_AFTER_DAYS are read from the archive files.
+    """
+    end = end or datetime.now(timezone.utc)
+    start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end - start > ARCHIVE_QUERY_MAX_RANGE:
+        raise HTTPException(status_code=400, detail=f"Range too large (max {ARCHIVE_QUERY_MAX_RANGE.days} days)")
+    
+    try:
+        return await query_transactions(
+            supabase_manager, start, end, driver_id=driver_id, limit=limit, before_id=before_id
+        )
+    except Exception as e:
+        logger.error(f"Transaction range query error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/api/driver/{driver_id}/transactions", response_model=List[Transaction])
 async def get_driver_transactions(driver_id: str) -> List[Transaction]:
     """Get transactions for a specific driver."""
@@ -475,6 +884,15 @@ async def get_driver_payouts(driver_id: str) -> List[Payout]:
     return await supabase_manager.get_driver_payouts(driver_id)
 
 
+@app.get("/api/driver/{driver_id}/summary", response_model=DriverSummary)
+async def get_driver_summary(driver_id: str) -> DriverSummary:
+    """Get driver earnings and trip counts for today, this week, this month and lifetime."""
+    summary = await supabase_manager.get_driver_summary(driver_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Driver not found")
+    return summary
+
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
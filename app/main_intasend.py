@@ -1,13 +1,14 @@
 import os
+import asyncio
 import logging
-from typing import List
+from typing import List, Optional
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
 from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Header
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
@@ -16,11 +17,18 @@ from .models import (
     Driver, Transaction, AdminStats, 
     DriverRegistration, PaymentRequest, PaymentInitiateResponse,
     IntaSendWebhook, TransactionStatusResponse, TransactionStatus,
-    Payout, PayoutStatus, PlatformFee
+    Payout, DriverSummary
 )
-from .supabase_util import SupabaseManager
+from .pg_fast import create_supabase_manager
+from .supabase_util import DRIVER_ID_FILTER
 from .intasend import IntaSendAPI
-from .qr_utils import generate_payment_qr
+from .qr_utils import generate_payment_qr, payment_url
+from .qr_signing import payment_link_allowed
+from .short_codes import QR_SHORT_LINKS
+from .money import to_cents, from_cents
+from .phone import normalize_phone
+from .read_routing import FRESHNESS_HEADER, freshness_middleware
+from .settlement import settle_collection, settle_payout
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -40,8 +48,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[FRESHNESS_HEADER],
 )
 
+# Read-your-writes: pin reads after a write to the primary (see app/read_routing.py)
+app.middleware("http")(freshness_middleware)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -50,76 +62,22 @@ templates = Jinja2Templates(directory="app/templates")
 
 # Initialize IntaSend API and Supabase
 intasend_api = IntaSendAPI()
-supabase_manager = SupabaseManager()
-
+supabase_manager = create_supabase_manager()
 
-# === Background Tasks ===
 
-async def process_payout(transaction_id: str, driver_id: str, driver_phone: str, amount: float, driver_name: str):
-    """
-    Background task to process driver payout after successful collection.
-    This runs asynchronously after payment collection is confirmed.
-    """
-    try:
-        logger.info(f"Processing payout for transaction {transaction_id}")
-        
-        # Create payout record
-        payout = Payout(
-            transaction_id=transaction_id,
-            driver_id=driver_id,
-            amount=amount,
-            status=PayoutStatus.PENDING
-        )
-        payout_id = await supabase_manager.create_payout(payout)
-        logger.info(f"Payout record created: {payout_id}")
-        
-        # Initiate payout via IntaSend
-        payout_response = await intasend_api.initiate_payout(
-            phone_number=driver_phone,
-            amount=amount,
-            reference=transaction_id,
-            name=driver_name
-        )
-        
-        tracking_id = payout_response.get('tracking_id')
-        
-        if tracking_id:
-            # Update payout record with tracking ID
-            await supabase_manager.update_payout_status(
-                payout_id=payout_id,
-                status=PayoutStatus.PROCESSING,
-                tracking_id=tracking_id,
-                intasend_response=payout_response
-            )
-            
-            # Update transaction with payout details
-            await supabase_manager.update_transaction_payout(
-                transaction_id=transaction_id,
-                tracking_id=tracking_id,
-                payout_status='processing',
-                payout_response=payout_response
-            )
-            
-            logger.info(f"Payout initiated successfully. Tracking ID: {tracking_id}")
-        else:
-            raise Exception("No tracking ID in payout response")
-            
-    except Exception as e:
-        logger.error(f"Payout processing failed: {str(e)}")
-        # Update payout status to failed
+@app.on_event("startup")
+async def load_driver_filter():
+    if DRIVER_ID_FILTER:
         try:
-            await supabase_manager.update_payout_status(
-                payout_id=payout_id,
-                status=PayoutStatus.FAILED,
-                failure_reason=str(e)
-            )
-            await supabase_manager.update_transaction_payout(
-                transaction_id=transaction_id,
-                tracking_id='',
-                payout_status='failed'
-            )
-        except:
-            pass
+            count = await supabase_manager.load_driver_filter()
+            logger.info(f"Driver ID filter loaded ({count} drivers)")
+        except Exception as e:
+            logger.error(f"Failed to load driver ID filter: {str(e)}")
+
+
+@app.on_event("shutdown")
+async def close_database():
+    await supabase_manager.close()
 
 
 # === API Routes ===
@@ -159,6 +117,14 @@ async def register_driver(driver_data: DriverRegistration) -> dict:
     Passengers scan this QR code to pay the driver.
     """
     try:
+        try:
+            normalize_phone(driver_data.phone)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if await supabase_manager.get_driver_by_phone(driver_data.phone):
+            raise HTTPException(status_code=400, detail="Phone number already registered")
+        
         # Create driver object
         driver = Driver(
             id="",  # Will be set by Supabase
@@ -173,8 +139,9 @@ async def register_driver(driver_data: DriverRegistration) -> dict:
         driver_id = await supabase_manager.create_driver(driver)
         logger.info(f"Driver registered: {driver_id}")
         
-        # Generate QR code with driver's phone pre-filled
-        qr_bytes = generate_payment_qr(driver_id, driver_data.phone)
+        # Generate QR code with driver's phone pre-filled, or the short /p/{code} link
+        short_code = await supabase_manager.assign_short_code(driver_id) if QR_SHORT_LINKS else None
+        qr_bytes = generate_payment_qr(driver_id, driver_data.phone, short_code)
         
         # Upload QR code to Supabase Storage
         qr_url = await supabase_manager.upload_qr_code(driver_id, qr_bytes)
@@ -188,14 +155,19 @@ async def register_driver(driver_data: DriverRegistration) -> dict:
             "qr_code_url": qr_url,
             "message": "Driver registered successfully"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Driver registration failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/driver/{driver_id}", response_model=Driver)
-async def get_driver(driver_id: str) -> Driver:
-    """Get driver details by ID."""
+async def get_driver(driver_id: str, t: Optional[str] = None) -> Driver:
+    """Get driver details by ID. t is the signature from a scanned QR link, checked when present."""
+    if t is not None and not payment_link_allowed(driver_id, t):
+        raise HTTPException(status_code=403, detail="Invalid payment link")
+    
     driver = await supabase_manager.get_driver(driver_id)
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
@@ -203,7 +175,7 @@ async def get_driver(driver_id: str) -> Driver:
 
 
 @app.get("/pay", response_class=HTMLResponse)
-async def payment_page(request: Request, driver_id: str, phone: str = None, mode: str = "backend"):
+async def payment_page(request: Request, driver_id: str, phone: str = None, mode: str = "backend", t: str = None):
     """
     Render payment page for a driver.
     
@@ -212,13 +184,17 @@ async def payment_page(request: Request, driver_id: str, phone: str = None, mode
     
     Args:
         mode: "backend" for server-side STK push, "inline" for IntaSend SDK
+        t: Signature from the QR link (see app/qr_signing.py)
     """
+    if not payment_link_allowed(driver_id, t):
+        raise HTTPException(status_code=403, detail="Invalid payment link")
+    
     driver = await supabase_manager.get_driver(driver_id)
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
     
-    # Calculate fee information for display
-    fee_info = intasend_api.calculate_fees(100)  # Example for 100 KES
+    # Fee percentage for display (precomputed when the fee rules are compiled)
+    fee_percentage = intasend_api.fee_engine.display_percentage(driver.vehicle_type.value)
     
     # Choose template based on mode
     template_name = "pay_inline.html" if mode == "inline" else "pay.html"
@@ -229,13 +205,29 @@ async def payment_page(request: Request, driver_id: str, phone: str = None, mode
             "request": request, 
             "driver": driver,
             "passenger_phone": phone,
-            "platform_fee_percentage": fee_info['fee_percentage'],
+            "qr_token": t,
+            "platform_fee_percentage": fee_percentage,
             "publishable_key": intasend_api.publishable_key,
             "is_test_mode": intasend_api.is_test
         }
     )
 
 
+@app.get("/p/{code}")
+async def short_payment_link(code: str):
+    """Redirect a short QR link to the driver's (signed) payment page."""
+    driver_id = await supabase_manager.resolve_short_code(code)
+    if not driver_id:
+        raise HTTPException(status_code=404, detail="Payment link not found")
+    
+    # Codes never change; let browsers and CDNs reuse the redirect for a while
+    return RedirectResponse(
+        payment_url(driver_id),
+        status_code=302,
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
+
+
 @app.post("/api/pay", response_model=PaymentInitiateResponse)
 async def initiate_payment(payment: PaymentRequest, background_tasks: BackgroundTasks) -> PaymentInitiateResponse:
     """
@@ -248,32 +240,45 @@ async def initiate_payment(payment: PaymentRequest, background_tasks: Background
     4. Initiate IntaSend collection
     5. Return response to frontend
     6. Wait for webhook to confirm payment
-    7. Automatically initiate payout to driver (background task)
+    7. Credit the driver's pending balance for the batch payout
     """
     try:
+        # Reject forged/truncated QR links before any database work
+        if not payment_link_allowed(payment.driver_id, payment.qr_token):
+            raise HTTPException(status_code=403, detail="Invalid payment link")
+        
+        try:
+            phone = normalize_phone(payment.passenger_phone)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
         # Verify driver exists
         driver = await supabase_manager.get_driver(payment.driver_id)
         if not driver:
             raise HTTPException(status_code=404, detail="Driver not found")
         
-        # Calculate fees
-        fee_breakdown = intasend_api.calculate_fees(payment.amount)
-        platform_fee = fee_breakdown['platform_fee']
-        driver_amount = fee_breakdown['driver_amount']
+        # Calculate fees (integer cents)
+        amount_cents = to_cents(payment.amount)
+        fee_breakdown = intasend_api.calculate_fees(amount_cents, driver.vehicle_type.value)
+        platform_fee_cents = fee_breakdown['platform_fee_cents']
+        driver_amount_cents = fee_breakdown['driver_amount_cents']
         
-        logger.info(f"Payment initiated: {payment.amount} KES - Fee: {platform_fee} - Driver: {driver_amount}")
+        logger.info(
+            f"Payment initiated: {from_cents(amount_cents)} KES - Fee: {from_cents(platform_fee_cents)} "
+            f"- Driver: {from_cents(driver_amount_cents)}"
+        )
         
         # Create pending transaction
         transaction = Transaction(
             id="",  # Will be set by Supabase
             driver_id=payment.driver_id,
-            passenger_phone=payment.passenger_phone,
-            amount_paid=payment.amount,
-            platform_fee=platform_fee,
-            driver_amount=driver_amount,
+            passenger_phone=phone,
+            amount_paid_cents=amount_cents,
+            platform_fee_cents=platform_fee_cents,
+            driver_amount_cents=driver_amount_cents,
             status=TransactionStatus.PENDING,
             fee_percentage=fee_breakdown['fee_percentage'],
-            fee_fixed=fee_breakdown['fee_fixed']
+            fee_fixed_cents=fee_breakdown['fee_fixed_cents']
         )
         
         # Save transaction
@@ -282,8 +287,8 @@ async def initiate_payment(payment: PaymentRequest, background_tasks: Background
         
         # Initiate IntaSend collection (STK Push)
         collection_response = await intasend_api.initiate_collection(
-            phone_number=payment.passenger_phone,
-            amount=payment.amount,
+            phone_number=phone,
+            amount_cents=amount_cents,
             reference=transaction_id,
             email=payment.passenger_email,
             name=payment.passenger_name
@@ -307,13 +312,15 @@ async def initiate_payment(payment: PaymentRequest, background_tasks: Background
                 transaction_id=transaction_id,
                 collection_id=collection_id,
                 message="Payment request sent. Please check your phone for M-Pesa prompt.",
-                amount=payment.amount,
-                platform_fee=platform_fee,
-                driver_amount=driver_amount
+                amount_cents=amount_cents,
+                platform_fee_cents=platform_fee_cents,
+                driver_amount_cents=driver_amount_cents
             )
         else:
             raise Exception("Failed to initiate collection")
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Payment initiation failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -371,7 +378,11 @@ async def intasend_webhook(
 async def handle_collection_webhook(webhook: IntaSendWebhook, background_tasks: BackgroundTasks):
     """Handle payment collection webhook."""
     transaction_id = webhook.api_ref
-    state = webhook.state.upper()
+    state = (webhook.state or webhook.status or "").upper()
+    
+    if not state:
+        logger.error("Webhook has no state or status field")
+        return
     
     # Get transaction
     transaction = await supabase_manager.get_transaction(transaction_id)
@@ -379,56 +390,21 @@ async def handle_collection_webhook(webhook: IntaSendWebhook, background_tasks:
         logger.error(f"Transaction not found: {transaction_id}")
         return
     
-    # Update transaction based on state
-    if state == "COMPLETE":
-        # Payment collected successfully
-        await supabase_manager.update_transaction_collection(
-            transaction_id=transaction_id,
-            collection_id=webhook.id or webhook.invoice_id,
-            collection_status='completed',
-            collection_response=webhook.model_dump()
-        )
-        
-        # Record platform fee
-        platform_fee = PlatformFee(
-            transaction_id=transaction_id,
-            amount=transaction.platform_fee,
-            fee_type="percentage",
-            percentage_applied=transaction.fee_percentage,
-            fixed_amount_applied=transaction.fee_fixed
-        )
-        await supabase_manager.create_platform_fee(platform_fee)
-        
-        # Get driver details for payout
-        driver = await supabase_manager.get_driver(transaction.driver_id)
-        
-        # Schedule automatic payout in background
-        background_tasks.add_task(
-            process_payout,
-            transaction_id=transaction_id,
-            driver_id=transaction.driver_id,
-            driver_phone=driver.phone,
-            amount=transaction.driver_amount,
-            driver_name=driver.name
-        )
-        
-        logger.info(f"Payment collected. Payout scheduled for {transaction.driver_amount} KES")
-        
-    elif state == "FAILED":
-        # Payment failed
-        await supabase_manager.update_transaction_collection(
-            transaction_id=transaction_id,
-            collection_id=webhook.id or webhook.invoice_id,
-            collection_status='failed',
-            collection_response=webhook.model_dump()
-        )
-        logger.info(f"Payment failed for transaction {transaction_id}")
+    # Apply the result through the shared settlement path (credits the
+    # driver's pending balance for the batch payout)
+    await settle_collection(
+        supabase_manager,
+        transaction,
+        state,
+        collection_id=webhook.id or webhook.invoice_id,
+        collection_response=webhook.model_dump()
+    )
 
 
 async def handle_payout_webhook(webhook: IntaSendWebhook):
     """Handle payout webhook."""
     tracking_id = webhook.tracking_id
-    state = webhook.state.upper()
+    state = webhook.state or webhook.status
     
     # Get payout record
     payout = await supabase_manager.get_payout_by_tracking_id(tracking_id)
@@ -436,39 +412,8 @@ async def handle_payout_webhook(webhook: IntaSendWebhook):
         logger.error(f"Payout not found: {tracking_id}")
         return
     
-    # Update payout based on state
-    if state == "COMPLETE":
-        await supabase_manager.update_payout_status(
-            payout_id=payout.id,
-            status=PayoutStatus.COMPLETED,
-            intasend_response=webhook.model_dump()
-        )
-        
-        await supabase_manager.update_transaction_payout(
-            transaction_id=payout.transaction_id,
-            tracking_id=tracking_id,
-            payout_status='completed',
-            payout_response=webhook.model_dump()
-        )
-        
-        logger.info(f"Payout completed: {payout.amount} KES to driver {payout.driver_id}")
-        
-    elif state == "FAILED":
-        await supabase_manager.update_payout_status(
-            payout_id=payout.id,
-            status=PayoutStatus.FAILED,
-            intasend_response=webhook.model_dump(),
-            failure_reason=f"IntaSend payout failed: {state}"
-        )
-        
-        await supabase_manager.update_transaction_payout(
-            transaction_id=payout.transaction_id,
-            tracking_id=tracking_id,
-            payout_status='failed',
-            payout_response=webhook.model_dump()
-        )
-        
-        logger.error(f"Payout failed for driver {payout.driver_id}")
+    # Apply the result through the shared settlement path (as the payout reconciler does)
+    await settle_payout(supabase_manager, payout, state, response=webhook.model_dump())
 
 
 @app.get("/api/transaction/{transaction_id}/status", response_model=TransactionStatusResponse)
@@ -477,8 +422,9 @@ async def get_transaction_status(transaction_id: str) -> TransactionStatusRespon
     Get current status of a transaction.
     
     Returns detailed information about payment collection and payout status.
+    Served from the read replica unless the client sends a recent freshness token.
     """
-    transaction = await supabase_manager.get_transaction(transaction_id)
+    transaction = await supabase_manager.get_transaction(transaction_id, allow_replica=True)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
@@ -487,9 +433,9 @@ async def get_transaction_status(transaction_id: str) -> TransactionStatusRespon
         status=transaction.status,
         collection_status=transaction.collection_status,
         payout_status=transaction.payout_status,
-        amount_paid=transaction.amount_paid,
-        platform_fee=transaction.platform_fee,
-        driver_amount=transaction.driver_amount,
+        amount_paid_cents=transaction.amount_paid_cents,
+        platform_fee_cents=transaction.platform_fee_cents,
+        driver_amount_cents=transaction.driver_amount_cents,
         created_at=transaction.created_at,
         collection_completed_at=transaction.collection_completed_at,
         payout_completed_at=transaction.payout_completed_at
@@ -503,14 +449,19 @@ async def driver_dashboard(request: Request, driver_id: str):
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
     
-    transactions = await supabase_manager.get_driver_transactions(driver_id)
-    payouts = await supabase_manager.get_driver_payouts(driver_id)
+    # Totals come from the earnings rollups; transactions are only the recent list
+    summary, transactions, payouts = await asyncio.gather(
+        supabase_manager.get_driver_summary(driver_id),
+        supabase_manager.get_driver_transactions(driver_id),
+        supabase_manager.get_driver_payouts(driver_id)
+    )
     
     return templates.TemplateResponse(
         "driver_dashboard.html",
         {
             "request": request,
             "driver": driver,
+            "summary": summary,
             "transactions": transactions,
             "payouts": payouts
         }
@@ -551,6 +502,15 @@ async def get_driver_payouts(driver_id: str) -> List[Payout]:
     return await supabase_manager.get_driver_payouts(driver_id)
 
 
+@app.get("/api/driver/{driver_id}/summary", response_model=DriverSummary)
+async def get_driver_summary(driver_id: str) -> DriverSummary:
+    """Get driver earnings and trip counts for today, this week, this month and lifetime."""
+    summary = await supabase_manager.get_driver_summary(driver_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Driver not found")
+    return summary
+
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
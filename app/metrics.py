@@ -0,0 +1,79 @@
+"""
+In-process Metrics for PaySwiftly
+
+Minimal counters, gauges and timings for background workers and hot paths.
+Values are per worker process and exposed as JSON at /api/admin/metrics.
+StageTimer times the stages of one request and reports them both here and
+in a Server-Timing response header (shown in browser dev tools).
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Tuple
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_timings: Dict[str, List[float]] = {}  # name -> [count, total ms, max ms]
+
+
+def inc(name: str, value: float = 1) -> None:
+    """Increment a counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    """Set a gauge to its current value."""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, milliseconds: float) -> None:
+    """Record one duration."""
+    with _lock:
+        timing = _timings.setdefault(name, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += milliseconds
+        timing[2] = max(timing[2], milliseconds)
+
+
+def snapshot() -> Dict[str, Any]:
+    """Return a copy of all counters, gauges and timings."""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": {
+                name: {"count": count, "mean_ms": round(total / count, 2), "max_ms": round(longest, 2)}
+                for name, (count, total, longest) in _timings.items()
+            },
+            "collected_at": datetime.utcnow().isoformat()
+        }
+
+
+class StageTimer:
+    """Durations of one request's stages, recorded as timings named {prefix}_{stage}_ms."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.stages: List[Tuple[str, float]] = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            milliseconds = (time.perf_counter() - started) * 1000
+            self.stages.append((name, milliseconds))
+            observe(f"{self.prefix}_{name}_ms", milliseconds)
+
+    def finish(self) -> str:
+        """Record the total and return the Server-Timing header value, e.g. 'driver;dur=1.2, total;dur=20.5'."""
+        total = (time.perf_counter() - self.started) * 1000
+        observe(f"{self.prefix}_total_ms", total)
+        return ', '.join(f"{name};dur={milliseconds:.1f}" for name, milliseconds in self.stages + [('total', total)])
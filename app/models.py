@@ -1,8 +1,11 @@
-from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, Dict, Any
-from datetime import datetime
+from pydantic import BaseModel, Field, EmailStr, computed_field, field_validator
+from typing import Optional, Dict, Any, List
+from datetime import date, datetime
+from decimal import Decimal
 from enum import Enum
 
+from .money import Cents, to_shillings
+
 class VehicleType(str, Enum):
     BODA = "boda"
     TAXI = "taxi"
@@ -29,22 +32,46 @@ class Driver(BaseModel):
     id: Optional[str] = None
     name: str
     phone: str
+    phone_normalized: Optional[str] = None  # E.164, see app/phone.py
     email: str
     vehicle_type: VehicleType
     vehicle_number: str
     qr_code_url: Optional[str] = None
-    balance: float = 0.0
-    total_earnings: float = 0.0
+    balance_cents: Cents = 0
+    total_earnings_cents: Cents = 0
+    pending_balance_cents: Cents = 0
+    paid_balance_cents: Cents = 0
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
+    # Shilling values for display, derived from the exact cent amounts
+    @computed_field
+    @property
+    def balance(self) -> float:
+        return to_shillings(self.balance_cents)
+
+    @computed_field
+    @property
+    def total_earnings(self) -> float:
+        return to_shillings(self.total_earnings_cents)
+
+    @computed_field
+    @property
+    def pending_balance(self) -> float:
+        return to_shillings(self.pending_balance_cents)
+
+    @computed_field
+    @property
+    def paid_balance(self) -> float:
+        return to_shillings(self.paid_balance_cents)
+
 class Transaction(BaseModel):
     id: Optional[str] = None
     driver_id: str
     passenger_phone: str
-    amount_paid: float
-    platform_fee: float
-    driver_amount: float
+    amount_paid_cents: Cents
+    platform_fee_cents: Cents
+    driver_amount_cents: Cents
     status: TransactionStatus = TransactionStatus.PENDING
     mpesa_receipt: Optional[str] = None
     checkout_request_id: Optional[str] = None
@@ -57,18 +84,33 @@ class Transaction(BaseModel):
     collection_response: Optional[Dict[str, Any]] = None
     payout_response: Optional[Dict[str, Any]] = None
     fee_percentage: float = 0.5
-    fee_fixed: float = 0.0
+    fee_fixed_cents: Cents = 0
     collection_completed_at: Optional[datetime] = None
     payout_completed_at: Optional[datetime] = None
     
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
+    @computed_field
+    @property
+    def amount_paid(self) -> float:
+        return to_shillings(self.amount_paid_cents)
+
+    @computed_field
+    @property
+    def platform_fee(self) -> float:
+        return to_shillings(self.platform_fee_cents)
+
+    @computed_field
+    @property
+    def driver_amount(self) -> float:
+        return to_shillings(self.driver_amount_cents)
+
 class Payout(BaseModel):
     id: Optional[str] = None
-    transaction_id: str
+    transaction_id: Optional[str] = None  # None for batch payouts
     driver_id: str
-    amount: float
+    amount_cents: Cents
     tracking_id: Optional[str] = None
     status: PayoutStatus = PayoutStatus.PENDING
     intasend_response: Optional[Dict[str, Any]] = None
@@ -78,26 +120,116 @@ class Payout(BaseModel):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
+    @computed_field
+    @property
+    def amount(self) -> float:
+        return to_shillings(self.amount_cents)
+
 class PlatformFee(BaseModel):
     id: Optional[str] = None
     transaction_id: str
-    amount: float
+    amount_cents: Cents
     fee_type: str = "percentage"  # 'percentage' or 'fixed'
     percentage_applied: Optional[float] = None
-    fixed_amount_applied: Optional[float] = None
+    fixed_amount_applied_cents: Optional[Cents] = None
     collected_at: Optional[datetime] = None
     created_at: Optional[datetime] = None
 
+    @computed_field
+    @property
+    def amount(self) -> float:
+        return to_shillings(self.amount_cents)
+
 class AdminStats(BaseModel):
     total_transactions: int = 0
-    total_revenue: float = 0.0
-    total_platform_fees: float = 0.0
+    total_revenue_cents: Cents = 0
+    total_platform_fees_cents: Cents = 0
     active_drivers: int = 0
-    total_payouts: float = 0.0
-    pending_payouts: float = 0.0
+    total_payouts_cents: Cents = 0
+    pending_payouts_cents: Cents = 0
     failed_payouts: int = 0
     updated_at: Optional[datetime] = None
 
+    @computed_field
+    @property
+    def total_revenue(self) -> float:
+        return to_shillings(self.total_revenue_cents)
+
+    @computed_field
+    @property
+    def total_platform_fees(self) -> float:
+        return to_shillings(self.total_platform_fees_cents)
+
+    @computed_field
+    @property
+    def total_payouts(self) -> float:
+        return to_shillings(self.total_payouts_cents)
+
+    @computed_field
+    @property
+    def pending_payouts(self) -> float:
+        return to_shillings(self.pending_payouts_cents)
+
+class StatsGranularity(str, Enum):
+    HOUR = "hour"
+    DAY = "day"
+
+class StatsBucket(BaseModel):
+    """Completed transactions in one hourly/daily rollup bucket (UTC)."""
+    bucket: datetime
+    transactions: int = 0
+    revenue_cents: Cents = 0
+    platform_fees_cents: Cents = 0
+    drivers: int = 0  # Distinct drivers within this bucket
+
+    @computed_field
+    @property
+    def revenue(self) -> float:
+        return to_shillings(self.revenue_cents)
+
+    @computed_field
+    @property
+    def platform_fees(self) -> float:
+        return to_shillings(self.platform_fees_cents)
+
+class StatsTimeseriesResponse(BaseModel):
+    granularity: StatsGranularity
+    start: datetime
+    end: datetime
+    buckets: List[StatsBucket]
+    total_transactions: int = 0
+    total_revenue_cents: Cents = 0
+    total_platform_fees_cents: Cents = 0
+
+    @computed_field
+    @property
+    def total_revenue(self) -> float:
+        return to_shillings(self.total_revenue_cents)
+
+    @computed_field
+    @property
+    def total_platform_fees(self) -> float:
+        return to_shillings(self.total_platform_fees_cents)
+
+class EarningsPeriod(BaseModel):
+    trips: int = 0
+    earnings_cents: Cents = 0
+
+    @computed_field
+    @property
+    def earnings(self) -> float:
+        return to_shillings(self.earnings_cents)
+
+class DriverSummary(BaseModel):
+    """Driver earnings from the daily rollups (days are Africa/Nairobi, weeks start Monday)."""
+    driver_id: str
+    as_of: date
+    today: EarningsPeriod
+    this_week: EarningsPeriod
+    this_month: EarningsPeriod
+    lifetime: EarningsPeriod
+    last_trip_at: Optional[datetime] = None
+
 # Request/Response models
 class DriverRegistration(BaseModel):
     name: str
@@ -107,6 +239,25 @@ class DriverRegistration(BaseModel):
     vehicle_number: str
     password: str = Field(..., min_length=8, description="Password must be at least 8 characters")
 
+class QRSheetRequest(BaseModel):
+    driver_ids: List[str] = Field(..., min_length=1, max_length=5000, description="Drivers to print, in sticker order")
+
+class DriverImportRow(BaseModel):
+    row: int  # Line number in the CSV (the header is line 1)
+    status: str  # created, invalid, duplicate or failed
+    phone: Optional[str] = None
+    driver_id: Optional[str] = None
+    qr_code_url: Optional[str] = None
+    error: Optional[str] = None
+
+class DriverImportReport(BaseModel):
+    total: int
+    created: int
+    invalid: int
+    duplicate: int
+    failed: int
+    rows: List[DriverImportRow]
+
 class DriverLogin(BaseModel):
     phone: str
     password: str
@@ -120,23 +271,48 @@ class LoginResponse(BaseModel):
 class PaymentRequest(BaseModel):
     driver_id: str
     passenger_phone: str
-    amount: float
+    amount: Decimal = Field(..., gt=0, decimal_places=2, description="Amount in KES, converted to cents on entry")
     passenger_email: Optional[str] = None
     passenger_name: Optional[str] = None
+    qr_token: Optional[str] = Field(None, description="Signature from the scanned QR link (see app/qr_signing.py)")
+
+    @field_validator('amount')
+    @classmethod
+    def whole_shillings(cls, amount: Decimal) -> Decimal:
+        # M-Pesa collects whole shillings; booking cents it never charged would
+        # credit the driver money that was not collected
+        if amount != amount.to_integral_value():
+            raise ValueError("Amount must be a whole number of shillings")
+        return amount
 
 class PaymentInitiateResponse(BaseModel):
     status: str
     transaction_id: str
     collection_id: Optional[str] = None
     message: str
-    amount: float
-    platform_fee: float
-    driver_amount: float
+    amount_cents: Cents
+    platform_fee_cents: Cents
+    driver_amount_cents: Cents
+
+    @computed_field
+    @property
+    def amount(self) -> float:
+        return to_shillings(self.amount_cents)
+
+    @computed_field
+    @property
+    def platform_fee(self) -> float:
+        return to_shillings(self.platform_fee_cents)
+
+    @computed_field
+    @property
+    def driver_amount(self) -> float:
+        return to_shillings(self.driver_amount_cents)
 
 class PayoutRequest(BaseModel):
     transaction_id: str
     driver_id: str
-    amount: float
+    amount_cents: Cents
 
 class IntaSendWebhook(BaseModel):
     """IntaSend webhook payload model."""
@@ -166,9 +342,24 @@ class TransactionStatusResponse(BaseModel):
     status: TransactionStatus
     collection_status: Optional[str] = None
     payout_status: Optional[str] = None
-    amount_paid: float
-    platform_fee: float
-    driver_amount: float
+    amount_paid_cents: Cents
+    platform_fee_cents: Cents
+    driver_amount_cents: Cents
     created_at: datetime
     collection_completed_at: Optional[datetime] = None
     payout_completed_at: Optional[datetime] = None
+
+    @computed_field
+    @property
+    def amount_paid(self) -> float:
+        return to_shillings(self.amount_paid_cents)
+
+    @computed_field
+    @property
+    def platform_fee(self) -> float:
+        return to_shillings(self.platform_fee_cents)
+
+    @computed_field
+    @property
+    def driver_amount(self) -> float:
+        return to_shillings(self.driver_amount_cents)
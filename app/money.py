@@ -0,0 +1,54 @@
+"""
+Money Helpers for PaySwiftly
+
+All amounts are held as integer minor units (cents) in models, fee math,
+SQL functions and API payloads, so sums are exact and never need rounding.
+Shilling values only exist at the edges: parsing user input and display.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Annotated, Union
+
+from pydantic import Field
+
+CENTS_PER_SHILLING = 100
+
+# Integer minor units. Strict so a float can never slip into a money field.
+Cents = Annotated[int, Field(strict=True)]
+
+
+def to_cents(amount: Union[Decimal, str, int, float]) -> int:
+    """
+    Convert a shilling amount to integer cents (half-up rounding).
+
+    Floats are converted through their shortest repr, so 0.1 becomes 10 cents.
+    """
+    if isinstance(amount, float):
+        amount = repr(amount)
+    cents = Decimal(amount) * CENTS_PER_SHILLING
+    return int(cents.quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents: int) -> Decimal:
+    """Convert integer cents to an exact shilling Decimal (2 decimal places)."""
+    return Decimal(cents).scaleb(-2)
+
+
+def to_shillings(cents: int) -> float:
+    """Convert integer cents to shillings for display/JSON."""
+    return cents / CENTS_PER_SHILLING
+
+
+def percent_to_basis_points(percentage: Union[Decimal, str, int, float]) -> int:
+    """Convert a percentage (e.g. 2.75) to integer basis points (275)."""
+    if isinstance(percentage, float):
+        percentage = repr(percentage)
+    basis_points = Decimal(percentage) * 100
+    if basis_points != basis_points.to_integral_value():
+        raise ValueError(f"Fee percentage {percentage} is finer than one basis point")
+    return int(basis_points)
+
+
+def apply_basis_points(cents: int, basis_points: int) -> int:
+    """Return basis_points/10000 of a non-negative cent amount, rounded half-up."""
+    return (cents * basis_points + 5000) // 10000
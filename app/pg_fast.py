@@ -0,0 +1,249 @@
+"""
+Direct Postgres Fast Path for PaySwiftly
+
+SupabaseManager talks to the database through PostgREST over HTTPS, which
+adds an HTTP round trip and JSON encoding to every call. PgFastSupabaseManager
+overrides the hottest methods (driver and transaction lookups, and the
+settlement call settle_collection() makes) to run over a direct asyncpg connection
+pool instead. asyncpg prepares each statement once per connection and
+reuses it.
+Everything else still goes through PostgREST.
+
+Select with DB_BACKEND=asyncpg (default: postgrest). Needs DATABASE_URL.
+Prepared statements need a direct connection (port 5432) or Supavisor in
+session mode. The transaction-mode pooler (port 6543) cannot keep them.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from .models import Driver, Transaction, PlatformFee
+from .phone import normalize_phone
+from .read_routing import writes
+from .supabase_util import SupabaseManager, RECENT_TRANSACTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Columns _find_transaction may look up by
+_LOOKUP_COLUMNS = {'id', 'intasend_collection_id', 'checkout_request_id'}
+
+# Columns _update_transaction may set
+_UPDATE_COLUMNS = {
+    'status', 'mpesa_receipt', 'checkout_request_id', 'intasend_collection_id',
+    'intasend_tracking_id', 'collection_status', 'payout_status', 'collection_response',
+    'payout_response', 'collection_completed_at', 'payout_completed_at', 'updated_at'
+}
+
+_SELECT_DRIVER = "SELECT * FROM drivers WHERE id = $1"
+_SELECT_DRIVER_BY_PHONE = "SELECT * FROM drivers WHERE phone_normalized = $1"
+_INSERT_PLATFORM_FEE = """
+    INSERT INTO platform_fees (transaction_id, amount_cents, fee_type, percentage_applied,
+                               fixed_amount_applied_cents, collected_at, created_at)
+    VALUES ($1, $2, $3, $4, $5, NOW(), NOW())
+    RETURNING id
+"""
+_ADD_TO_PENDING_BALANCE = "SELECT add_to_pending_balance($1, $2)"
+_SETTLE_COLLECTION = "SELECT settle_collection($1, $2, $3, $4, $5)"
+
+
+def _record(row) -> Dict[str, Any]:
+    """asyncpg Record -> dict shaped like a PostgREST row (UUIDs as strings)."""
+    return {key: str(value) if isinstance(value, UUID) else value for key, value in row.items()}
+
+
+def _param(column: str, value: Any) -> Any:
+    """Convert a PostgREST-style update value (ISO timestamps) for asyncpg."""
+    if isinstance(value, str) and column.endswith('_at'):
+        moment = datetime.fromisoformat(value)
+        return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    return value
+
+
+async def _init_connection(conn):
+    # Match PostgREST: json/jsonb columns come back as dicts
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+class PgFastSupabaseManager(SupabaseManager):
+    """SupabaseManager with hot reads and settlement writes over a direct asyncpg pool."""
+
+    def __init__(self, dsn: Optional[str] = None):
+        super().__init__()
+        self.dsn = dsn or os.getenv('DATABASE_URL')
+        if not self.dsn:
+            raise ValueError("DATABASE_URL must be set when DB_BACKEND=asyncpg")
+
+        self.pool_min_size = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+        self.pool_max_size = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+        self.statement_cache_size = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def pool(self):
+        """Create the connection pool on first use (it must be created inside the event loop)."""
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    import asyncpg
+
+                    self._pool = await asyncpg.create_pool(
+                        self.dsn,
+                        min_size=self.pool_min_size,
+                        max_size=self.pool_max_size,
+                        statement_cache_size=self.statement_cache_size,
+                        init=_init_connection
+                    )
+                    logger.info(f"asyncpg pool ready ({self.pool_min_size}-{self.pool_max_size} connections)")
+        return self._pool
+
+    async def close(self) -> None:
+        """Close the connection pool and the Supabase thread pool."""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+        await super().close()
+
+    # === Reads ===
+
+    async def _fetch_driver(self, driver_id: str) -> Optional[Driver]:
+        """Query one driver by ID."""
+        pool = await self.pool()
+        row = await pool.fetchrow(_SELECT_DRIVER, driver_id)
+        return Driver(**_record(row)) if row else None
+
+    async def get_driver_by_phone(self, phone: str) -> Optional[Dict[str, Any]]:
+        """Get driver by phone number in any format (for login). Returns raw dict including password_hash."""
+        try:
+            phone_normalized = normalize_phone(phone)
+        except ValueError:
+            return None
+
+        pool = await self.pool()
+        row = await pool.fetchrow(_SELECT_DRIVER_BY_PHONE, phone_normalized)
+        return _record(row) if row else None
+
+    async def _find_transaction(self, column: str, value: str, client=None) -> Optional[Transaction]:
+        """Look a transaction up in recent partitions first, then in all of them."""
+        if client is not None:
+            # Replica reads stay on PostgREST
+            return await super()._find_transaction(column, value, client)
+
+        if column not in _LOOKUP_COLUMNS:
+            raise ValueError(f"Unsupported transaction lookup column: {column}")
+
+        pool = await self.pool()
+        row = await pool.fetchrow(
+            f"SELECT * FROM transactions WHERE {column} = $1 "
+            f"AND created_at >= NOW() - make_interval(days => $2) LIMIT 1",
+            value, RECENT_TRANSACTION_DAYS
+        )
+        if row is None:
+            row = await pool.fetchrow(f"SELECT * FROM transactions WHERE {column} = $1 LIMIT 1", value)
+
+        return Transaction(**_record(row)) if row else None
+
+    # === Settlement writes ===
+
+    @writes
+    async def _update_transaction(
+        self,
+        transaction_id: str,
+        update_data: Dict[str, Any],
+        created_at: Optional[datetime] = None
+    ) -> bool:
+        """Update one transaction, pinned to its partition when created_at is known."""
+        unknown = set(update_data) - _UPDATE_COLUMNS
+        if unknown:
+            raise ValueError(f"Unsupported transaction update columns: {sorted(unknown)}")
+
+        # Sorted so each combination of columns maps to one prepared statement
+        columns = sorted(update_data)
+        values = [_param(column, update_data[column]) for column in columns]
+
+        def assignments(first: int) -> str:
+            return ', '.join(f"{column} = ${i}" for i, column in enumerate(columns, start=first))
+
+        pool = await self.pool()
+        if created_at:
+            status = await pool.execute(
+                f"UPDATE transactions SET {assignments(3)} WHERE id = $1 AND created_at = $2",
+                transaction_id, created_at, *values
+            )
+            if status != 'UPDATE 0':
+                return True
+
+        status = await pool.execute(
+            f"UPDATE transactions SET {assignments(2)} WHERE id = $1",
+            transaction_id, *values
+        )
+        return status != 'UPDATE 0'
+
+    @writes
+    async def create_platform_fee(self, platform_fee: PlatformFee) -> str:
+        """Record platform fee collection."""
+        pool = await self.pool()
+        try:
+            fee_id = await pool.fetchval(
+                _INSERT_PLATFORM_FEE,
+                platform_fee.transaction_id,
+                platform_fee.amount_cents,
+                platform_fee.fee_type,
+                platform_fee.percentage_applied,
+                platform_fee.fixed_amount_applied_cents
+            )
+        except Exception as e:
+            raise Exception(f"Failed to record platform fee: {str(e)}")
+        return str(fee_id)
+
+    @writes
+    async def apply_collection_result(
+        self,
+        transaction_id: str,
+        completed: bool,
+        collection_id: Optional[str],
+        collection_response: Optional[Dict[str, Any]] = None,
+        created_at: Optional[datetime] = None
+    ) -> bool:
+        """Settle a pending transaction's collection in one database transaction (see SupabaseManager)."""
+        pool = await self.pool()
+        try:
+            return await pool.fetchval(
+                _SETTLE_COLLECTION,
+                transaction_id,
+                created_at,
+                completed,
+                collection_id,
+                collection_response
+            )
+        except Exception as e:
+            raise Exception(f"Failed to settle collection: {str(e)}")
+
+    @writes
+    async def add_to_pending_balance(self, driver_id: str, amount_cents: int):
+        """
+        Add amount (in cents) to driver's pending balance (accumulate earnings).
+        Uses database function for atomic update.
+        """
+        pool = await self.pool()
+        try:
+            await pool.execute(_ADD_TO_PENDING_BALANCE, driver_id, amount_cents)
+        except Exception as e:
+            raise Exception(f"Failed to add to pending balance: {str(e)}")
+
+
+def create_supabase_manager() -> SupabaseManager:
+    """Build the database manager selected by DB_BACKEND ('postgrest' or 'asyncpg')."""
+    backend = os.getenv('DB_BACKEND', 'postgrest').lower()
+
+    if backend == 'asyncpg':
+        logger.info("Using asyncpg fast path for hot queries")
+        return PgFastSupabaseManager()
+    if backend != 'postgrest':
+        raise ValueError(f"Unknown DB_BACKEND: {backend} (expected 'postgrest' or 'asyncpg')")
+    return SupabaseManager()
@@ -0,0 +1,56 @@
+"""
+Phone Number Helpers for PaySwiftly
+
+Drivers and passengers type Kenyan numbers as 07XX..., 7XX..., 2547XX... or
++254 7XX ... with spaces or dashes. normalize_phone() maps all of these to
+one E.164 form (+254XXXXXXXXX), which is what drivers.phone_normalized
+stores and indexes, so login, driver lookup and payouts share one key.
+to_mpesa_number() gives the 254XXXXXXXXX form M-Pesa and IntaSend expect.
+
+Normalization is memoized: the same few numbers are normalized on every
+payment, webhook and payout.
+"""
+
+import re
+from functools import lru_cache
+
+COUNTRY_CODE = '254'
+
+# Kenyan subscriber numbers: 9 digits starting with 7 (mobile) or 1 (newer mobile ranges)
+_SUBSCRIBER = re.compile(r'[17]\d{8}')
+
+# Separators people type between digit groups
+_SEPARATORS = re.compile(r'[\s\-().]')
+
+
+@lru_cache(maxsize=4096)
+def normalize_phone(phone: str) -> str:
+    """
+    Normalize a Kenyan mobile number to E.164 (+254XXXXXXXXX).
+
+    Raises:
+        ValueError: if the input is not a Kenyan mobile number
+    """
+    digits = _SEPARATORS.sub('', phone or '')
+
+    if digits.startswith('+'):
+        digits = digits[1:]
+    elif digits.startswith('00'):
+        digits = digits[2:]
+
+    if digits.startswith(COUNTRY_CODE) and len(digits) == 12:
+        subscriber = digits[3:]
+    elif digits.startswith('0') and len(digits) == 10:
+        subscriber = digits[1:]
+    else:
+        subscriber = digits
+
+    if not _SUBSCRIBER.fullmatch(subscriber):
+        raise ValueError(f"Invalid Kenyan mobile number: {phone!r}")
+
+    return f"+{COUNTRY_CODE}{subscriber}"
+
+
+def to_mpesa_number(phone: str) -> str:
+    """Format a phone number as M-Pesa/IntaSend expect it (254XXXXXXXXX)."""
+    return normalize_phone(phone)[1:]
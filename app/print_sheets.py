@@ -0,0 +1,276 @@
+"""
+Printable QR Sheets for PaySwiftly
+
+Builds A4 PDF sheets of driver QR stickers (QR code, name, vehicle number)
+for fleet onboarding, 12 per page. Used by POST /api/admin/qr-sheet and
+scripts/print_qr_sheet.py.
+
+Sheets stream:
+- Pages are rendered (QR encoding is the slow part) in a process pool,
+  at most 2 pages per worker at a time.
+- Each page is written out as soon as it and the pages before it are done.
+- Drivers are fetched PRINT_SHEET_FETCH_SIZE at a time.
+So memory stays flat however large the fleet.
+
+The PDF is written directly (no PDF library needed). Each QR code is a
+1-bit image with one pixel per module, scaled up by the viewer without
+smoothing. Text uses the standard Helvetica fonts. Characters outside
+Latin-1 print as '?'.
+"""
+
+import os
+import zlib
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .lookup_filters import canonical_uuid
+from .qr_utils import build_qr, payment_url
+from .short_codes import QR_SHORT_LINKS
+
+logger = logging.getLogger(__name__)
+
+PRINT_SHEET_WORKERS = int(os.getenv('PRINT_SHEET_WORKERS', str(min(4, os.cpu_count() or 1))))
+PRINT_SHEET_FETCH_SIZE = 120
+
+# A4 portrait in points, 3 x 4 stickers
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+COLUMNS, ROWS = 3, 4
+PER_PAGE = COLUMNS * ROWS
+MARGIN = 24
+QR_SIZE = 132
+QUIET_ZONE = 4
+
+
+@dataclass
+class Sticker:
+    """One driver's sticker: the link its QR code encodes and the text under it."""
+    url: str
+    name: str
+    vehicle_number: str
+    caption: str = "Scan to pay with M-Pesa"
+
+
+@dataclass
+class RenderedPage:
+    """A page's content stream and its QR images (side, packed 1-bit rows), in /Q0, /Q1, ... order."""
+    content: bytes
+    images: List[Tuple[int, bytes]]
+
+
+def _pdf_text(value: str) -> str:
+    """PDF string literal body: Latin-1 with (, ) and \\ escaped."""
+    value = value.encode('latin-1', 'replace').decode('latin-1')
+    return value.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _pack_matrix(matrix) -> bytes:
+    """QR matrix -> 1-bit DeviceGray rows (0 = black), each padded to a whole byte."""
+    rows = bytearray()
+    for row in matrix:
+        bits = 0
+        for dark in row:
+            bits = (bits << 1) | (0 if dark else 1)
+        padding = -len(row) % 8
+        rows += ((bits << padding) | ((1 << padding) - 1)).to_bytes((len(row) + padding) // 8, 'big')
+    return bytes(rows)
+
+
+def render_page(stickers: List[Sticker]) -> RenderedPage:
+    """Lay out up to PER_PAGE stickers. Runs in a worker process."""
+    cell_width = (PAGE_WIDTH - 2 * MARGIN) / COLUMNS
+    cell_height = (PAGE_HEIGHT - 2 * MARGIN) / ROWS
+    ops = []
+    images = []
+
+    for index, sticker in enumerate(stickers):
+        column, row = index % COLUMNS, index // COLUMNS
+        left = MARGIN + column * cell_width
+        bottom = PAGE_HEIGHT - MARGIN - (row + 1) * cell_height
+
+        # Dashed cut lines
+        ops.append(f"q 0.75 G 0.5 w [3 3] 0 d {left:.2f} {bottom:.2f} {cell_width:.2f} {cell_height:.2f} re S Q")
+
+        matrix = build_qr(sticker.url, border=0).get_matrix()
+        side = len(matrix)
+        images.append((side, _pack_matrix(matrix)))
+
+        # The image covers QR_SIZE points including the quiet zone, which is left blank
+        module = QR_SIZE / (side + 2 * QUIET_ZONE)
+        qr_left = left + (cell_width - QR_SIZE) / 2 + QUIET_ZONE * module
+        qr_bottom = bottom + cell_height - 8 - QR_SIZE + QUIET_ZONE * module
+        ops.append(f"q {side * module:.2f} 0 0 {side * module:.2f} {qr_left:.2f} {qr_bottom:.2f} cm /Q{index} Do Q")
+
+        text_left = left + (cell_width - QR_SIZE) / 2 + QUIET_ZONE * module
+        text_top = qr_bottom - 16
+        ops.append(
+            f"BT /F2 11 Tf {text_left:.2f} {text_top:.2f} Td ({_pdf_text(sticker.name[:28])}) Tj "
+            f"/F1 10 Tf 0 -14 Td ({_pdf_text(sticker.vehicle_number[:28])}) Tj "
+            f"/F1 8 Tf 0 -13 Td ({_pdf_text(sticker.caption[:40])}) Tj ET"
+        )
+
+    return RenderedPage(content='\n'.join(ops).encode('latin-1'), images=images)
+
+
+class PdfWriter:
+    """
+    Writes a PDF one page at a time. Objects are numbered as they are
+    written; the page tree (object 2) goes last, once every page is known.
+    """
+
+    CATALOG, PAGES, FONT_REGULAR, FONT_BOLD = 1, 2, 3, 4
+
+    def __init__(self):
+        self.offset = 0
+        self.object_offsets: Dict[int, int] = {}
+        self.page_ids: List[int] = []
+        self.next_id = 5
+
+    def _emit(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def _object(self, object_id: int, body: bytes, stream: Optional[bytes] = None) -> bytes:
+        self.object_offsets[object_id] = self.offset
+        data = f"{object_id} 0 obj\n".encode() + body
+        if stream is not None:
+            data += b"\nstream\n" + stream + b"\nendstream"
+        return self._emit(data + b"\nendobj\n")
+
+    def _new_id(self) -> int:
+        self.next_id += 1
+        return self.next_id - 1
+
+    def begin(self) -> bytes:
+        return (
+            self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+            + self._object(self.CATALOG, f"<< /Type /Catalog /Pages {self.PAGES} 0 R >>".encode())
+            + self._object(self.FONT_REGULAR, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+            + self._object(self.FONT_BOLD, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+        )
+
+    def add_page(self, page: RenderedPage) -> bytes:
+        chunks = []
+        image_refs = []
+        for index, (side, bits) in enumerate(page.images):
+            image_id = self._new_id()
+            data = zlib.compress(bits)
+            chunks.append(self._object(image_id, (
+                f"<< /Type /XObject /Subtype /Image /Width {side} /Height {side} /ColorSpace /DeviceGray "
+                f"/BitsPerComponent 1 /Interpolate false /Filter /FlateDecode /Length {len(data)} >>"
+            ).encode(), data))
+            image_refs.append(f"/Q{index} {image_id} 0 R")
+
+        content_id = self._new_id()
+        content = zlib.compress(page.content)
+        chunks.append(self._object(content_id, f"<< /Filter /FlateDecode /Length {len(content)} >>".encode(), content))
+
+        page_id = self._new_id()
+        chunks.append(self._object(page_id, (
+            f"<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 {self.FONT_REGULAR} 0 R /F2 {self.FONT_BOLD} 0 R >> "
+            f"/XObject << {' '.join(image_refs)} >> >> /Contents {content_id} 0 R >>"
+        ).encode()))
+        self.page_ids.append(page_id)
+        return b"".join(chunks)
+
+    def finish(self) -> bytes:
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self.page_ids)
+        data = self._object(self.PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode())
+
+        xref_offset = self.offset
+        size = self.next_id
+        xref = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for object_id in range(1, size):
+            xref.append(f"{self.object_offsets[object_id]:010d} 00000 n \n")
+        xref.append(f"trailer\n<< /Size {size} /Root {self.CATALOG} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        return data + self._emit(''.join(xref).encode())
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PRINT_SHEET_WORKERS)
+        logger.info(f"QR sheet worker pool started ({PRINT_SHEET_WORKERS} processes)")
+    return _pool
+
+
+def shutdown_pool() -> None:
+    """Stop the worker processes (call on app shutdown)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def _pages(stickers: AsyncIterator[Sticker]) -> AsyncIterator[List[Sticker]]:
+    page = []
+    async for sticker in stickers:
+        page.append(sticker)
+        if len(page) == PER_PAGE:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+async def stream_pdf(stickers: AsyncIterator[Sticker]) -> AsyncIterator[bytes]:
+    """Yield a PDF of the stickers in chunks, rendering pages in the worker pool."""
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    writer = PdfWriter()
+    in_flight: "asyncio.Queue[asyncio.Future]" = asyncio.Queue(maxsize=2 * PRINT_SHEET_WORKERS)
+
+    async def submit():
+        try:
+            async for page in _pages(stickers):
+                # Blocks while the window is full, which keeps memory bounded
+                await in_flight.put(loop.run_in_executor(pool, render_page, page))
+        finally:
+            await in_flight.put(None)
+
+    producer = asyncio.ensure_future(submit())
+    try:
+        yield writer.begin()
+        while True:
+            rendered = await in_flight.get()
+            if rendered is None:
+                break
+            yield writer.add_page(await rendered)
+        # Surface errors from fetching drivers
+        await producer
+        yield writer.finish()
+    finally:
+        producer.cancel()
+
+
+async def driver_stickers(supabase_manager, driver_ids: List[str]) -> AsyncIterator[Sticker]:
+    """
+    Stickers for driver_ids, in order, encoding the same link as each
+    driver's registration QR code. Drivers are fetched
+    PRINT_SHEET_FETCH_SIZE at a time. Unknown IDs are skipped.
+    """
+    for start in range(0, len(driver_ids), PRINT_SHEET_FETCH_SIZE):
+        chunk = [canonical_uuid(driver_id) or driver_id for driver_id in driver_ids[start:start + PRINT_SHEET_FETCH_SIZE]]
+        drivers = await supabase_manager.get_drivers_by_ids(chunk)
+        short_codes = await supabase_manager.get_short_codes(list(drivers)) if QR_SHORT_LINKS else {}
+
+        for driver_id in chunk:
+            driver = drivers.get(driver_id)
+            if driver is None:
+                logger.warning(f"QR sheet: driver {driver_id} not found, skipped")
+                continue
+
+            short_code = None
+            if QR_SHORT_LINKS:
+                short_code = short_codes.get(driver_id) or await supabase_manager.assign_short_code(driver_id)
+            yield Sticker(
+                url=payment_url(driver_id, driver.phone, short_code),
+                name=driver.name,
+                vehicle_number=driver.vehicle_number
+            )
@@ -0,0 +1,109 @@
+"""
+Signed QR Links for PaySwiftly
+
+Payment QR codes carry a short token next to the driver ID:
+
+    /pay/{driver_id}?phone=...&t=v2.Xk3b9QdP0aLm7RwE
+
+The token is "<key version>.<HMAC-SHA256(key, version:driver_id)>", with
+the MAC truncated to 96 bits and base64url encoded. /pay, /api/pay and
+/api/driver/{id} check it before touching the database, so forged or
+truncated links are rejected in microseconds.
+
+Keys come from QR_SIGNING_KEYS, a comma-separated list of version:secret
+pairs, newest first:
+
+    QR_SIGNING_KEYS=v2:new-secret,v1:old-secret
+
+New QR codes are signed with the first key. Every listed key still
+verifies, so rotating means adding a new key in front and dropping the
+old one once its stickers have been reprinted.
+
+Stickers printed before signing have no token. They keep working until
+QR_SIGNATURE_REQUIRED=true. A token that is present but invalid is
+always rejected.
+"""
+
+import os
+import hmac
+import base64
+import hashlib
+from typing import Dict, Optional, Tuple
+
+from .lookup_filters import canonical_uuid
+from . import metrics
+
+# Query parameter carrying the token
+TOKEN_PARAM = 't'
+
+# 96-bit MAC: 16 base64url characters
+MAC_BYTES = 12
+
+QR_SIGNATURE_REQUIRED = os.getenv('QR_SIGNATURE_REQUIRED', 'false').lower() in ('1', 'true', 'yes')
+
+
+def _load_keys(spec: str) -> Tuple[Optional[str], Dict[str, "hmac.HMAC"]]:
+    """Parse QR_SIGNING_KEYS into (signing version, {version: keyed HMAC})."""
+    keys = {}
+    current = None
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        version, sep, secret = entry.partition(':')
+        if not sep or not version or not secret or '.' in version:
+            raise ValueError("QR_SIGNING_KEYS entries must look like version:secret (no '.' in the version)")
+        # Keyed once here; each signature copies it instead of re-deriving the key pads
+        keys[version] = hmac.new(secret.encode(), digestmod=hashlib.sha256)
+        current = current or version
+    return current, keys
+
+
+_current_version, _keys = _load_keys(os.getenv('QR_SIGNING_KEYS', ''))
+
+
+def signing_enabled() -> bool:
+    return _current_version is not None
+
+
+def _mac(version: str, driver_id: str) -> str:
+    mac = _keys[version].copy()
+    mac.update(f"{version}:{driver_id}".encode())
+    return base64.urlsafe_b64encode(mac.digest()[:MAC_BYTES]).decode()
+
+
+def sign_driver_id(driver_id: str) -> Optional[str]:
+    """Token for a driver's QR link, or None when no signing key is configured."""
+    if _current_version is None:
+        return None
+    return f"{_current_version}.{_mac(_current_version, canonical_uuid(driver_id) or driver_id)}"
+
+
+def signing_key_id() -> str:
+    """Fingerprint of the key new links are signed with ('' when unsigned); changes when the key rotates."""
+    if _current_version is None:
+        return ''
+    return f"{_current_version}.{_mac(_current_version, 'key-id')}"
+
+
+def verify_driver_token(driver_id: str, token: str) -> bool:
+    """True if token was issued for driver_id by any configured key."""
+    version, _, mac = token.partition('.')
+    driver_id = canonical_uuid(driver_id)
+    if version not in _keys or driver_id is None or len(mac) != 16:
+        return False
+    return hmac.compare_digest(mac, _mac(version, driver_id))
+
+
+def payment_link_allowed(driver_id: str, token: Optional[str]) -> bool:
+    """
+    Edge check for payment links: a present token must verify, and a missing
+    one is only accepted while QR_SIGNATURE_REQUIRED is off.
+    """
+    if not token:
+        if signing_enabled() and QR_SIGNATURE_REQUIRED:
+            metrics.inc('qr_links_rejected_unsigned')
+            return False
+        return True
+
+    if not verify_driver_token(driver_id, token):
+        metrics.inc('qr_links_rejected_invalid')
+        return False
+    return True
@@ -1,55 +1,183 @@
 import os
+import asyncio
+import hashlib
+import functools
 import qrcode
 from io import BytesIO
+from typing import Iterator, Tuple
+from urllib.parse import urlencode
+from PIL import Image
 
-def generate_payment_qr(driver_id: str, passenger_phone: str = None) -> bytes:
+from .qr_signing import sign_driver_id, signing_key_id, TOKEN_PARAM
+from .short_codes import QR_SHORT_LINKS
+
+# QR images: stored in Supabase Storage at registration, or only rendered
+# on request by /api/driver/{id}/qr.{png,svg}
+QR_STORAGE_UPLOAD = os.getenv('QR_STORAGE_UPLOAD', 'true').lower() in ('1', 'true', 'yes')
+
+# Strongest first: a QR code gets the best error correction that still fits
+# in the smallest version its data needs at level L
+_ERROR_CORRECTION_LEVELS = (
+    qrcode.constants.ERROR_CORRECT_H,
+    qrcode.constants.ERROR_CORRECT_Q,
+    qrcode.constants.ERROR_CORRECT_M,
+)
+
+
+def public_base_url() -> str:
+    """BASE_PUBLIC_URL without trailing slashes (localhost when unset)."""
+    # Fallback to localhost if BASE_PUBLIC_URL not set
+    return (os.getenv('BASE_PUBLIC_URL') or "http://localhost:8000").rstrip('/')
+
+
+def payment_url(driver_id: str, passenger_phone: str = None, short_code: str = None) -> str:
     """
-    Generate QR code for driver payment URL.
-    
-    Args:
-        driver_id: The unique identifier for the driver
-        passenger_phone: Optional phone number to pre-fill in payment form
-        
-    Returns:
-        Bytes of the QR code image in PNG format
+    URL a driver's QR code points at.
+
+    With a short code: {base}/p/{code}, which redirects to the signed payment
+    page. Otherwise the Next.js route /pay/[driver_id], signed when
+    QR_SIGNING_KEYS is set so forged links are rejected without a DB lookup.
     """
-    # Get base URL from environment
-    base_url = os.getenv('BASE_PUBLIC_URL')
-    if not base_url:
-        # Fallback to localhost if BASE_PUBLIC_URL not set
-        base_url = "http://localhost:8000"
-    
-    # Remove any trailing slashes
-    base_url = base_url.rstrip('/')
-    
-    # Generate payment URL (Next.js route: /pay/[driver_id])
-    payment_url = f"{base_url}/pay/{driver_id}"
+    base_url = public_base_url()
+    if short_code:
+        return f"{base_url}/p/{short_code}"
+
+    url = f"{base_url}/pay/{driver_id}"
+    params = {}
     if passenger_phone:
-        payment_url += f"?phone={passenger_phone}"
-    
-    # Create QR code instance
+        params['phone'] = passenger_phone
+    token = sign_driver_id(driver_id)
+    if token:
+        params[TOKEN_PARAM] = token
+    if params:
+        url += f"?{urlencode(params)}"
+    return url
+
+
+def qr_image_url(driver_id: str) -> str:
+    """URL of the driver's QR code rendered on request (/api/driver/{id}/qr.png, cacheable by a CDN)."""
+    return f"{public_base_url()}/api/driver/{driver_id}/qr.png"
+
+
+def build_qr(data: str, box_size: int = 10, border: int = 4) -> qrcode.QRCode:
+    """Encode data in the lowest QR version it fits, at the strongest error correction that version allows."""
     qr = qrcode.QRCode(
-        version=1,
+        version=None,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        box_size=box_size,
+        border=border,
     )
-    
-    # Add data
-    qr.add_data(payment_url)
+    qr.add_data(data)
     qr.make(fit=True)
-    
-    # Create image
-    qr_image = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to bytes
-    img_buffer = BytesIO()
-    qr_image.save(img_buffer, format='PNG')
-    return img_buffer.getvalue()
+
+    for level in _ERROR_CORRECTION_LEVELS:
+        stronger = qrcode.QRCode(version=qr.version, error_correction=level, box_size=box_size, border=border)
+        stronger.add_data(data)
+        try:
+            stronger.make(fit=False)
+        except qrcode.exceptions.DataOverflowError:
+            continue
+        return stronger
+
+    return qr
+
+
+# Bump when rendering output changes, so cached ETags stop matching
+QR_RENDER_VERSION = 1
+
+QR_MATRIX_CACHE_SIZE = int(os.getenv('QR_MATRIX_CACHE_SIZE', '4096'))
+
+Matrix = Tuple[Tuple[bool, ...], ...]
 
 
+@functools.lru_cache(maxsize=QR_MATRIX_CACHE_SIZE)
+def qr_matrix(data: str) -> Matrix:
+    """Module matrix for data (True = dark), without the quiet zone. Memoized: encoding is the slow part."""
+    return tuple(tuple(row) for row in build_qr(data, border=0).get_matrix())
 
 
+def qr_etag(data: str, fmt: str, size: int, border: int) -> str:
+    """Strong ETag for a rendering, computed from its inputs (no rendering needed)."""
+    key = f"{QR_RENDER_VERSION}|{fmt}|{size}|{border}|{data}"
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
 
 
+def driver_qr_etag(driver_id: str, fmt: str, size: int, border: int) -> str:
+    """
+    ETag for a driver's QR rendering, without looking the driver up. The
+    link only depends on the driver ID (short codes and phones never change
+    once assigned), the base URL, the short-link setting and the signing key.
+    """
+    link_inputs = f"{driver_id}|{public_base_url()}|{QR_SHORT_LINKS}|{signing_key_id()}"
+    return qr_etag(link_inputs, fmt, size, border)
+
+
+def render_png(matrix: Matrix, size: int = 400, border: int = 4) -> bytes:
+    """PNG at most size pixels wide, each module a whole number of pixels."""
+    modules = len(matrix) + 2 * border
+    box_size = max(1, size // modules)
+
+    # One pixel per module, then scaled up without smoothing
+    image = Image.new('1', (modules, modules), 1)
+    image.putdata([
+        0 if border <= x < modules - border and border <= y < modules - border and matrix[y - border][x - border] else 1
+        for y in range(modules) for x in range(modules)
+    ])
+    image = image.resize((modules * box_size, modules * box_size), Image.NEAREST)
+
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def render_svg(matrix: Matrix, size: int = 400, border: int = 4) -> Iterator[str]:
+    """SVG as a stream of chunks, one path segment per row (dark runs merged)."""
+    modules = len(matrix) + 2 * border
+    yield (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {modules} {modules}" shape-rendering="crispEdges">'
+        f'<rect width="100%" height="100%" fill="#fff"/><path fill="#000" d="'
+    )
+    for y, row in enumerate(matrix):
+        segments = []
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                segments.append(f"M{start + border} {y + border}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+        if segments:
+            yield ''.join(segments)
+    yield '"/></svg>'
+
+
+def generate_payment_qr(driver_id: str, passenger_phone: str = None, short_code: str = None) -> bytes:
+    """
+    Generate QR code for driver payment URL.
+
+    Args:
+        driver_id: The unique identifier for the driver
+        passenger_phone: Optional phone number to pre-fill in payment form
+        short_code: Optional short code (app/short_codes.py); encodes the
+            much shorter /p/{code} URL instead
+
+    Returns:
+        Bytes of the QR code image in PNG format
+    """
+    # Same rendering as /api/driver/{id}/qr.png (box size 10, border 4)
+    matrix = qr_matrix(payment_url(driver_id, passenger_phone, short_code))
+    return render_png(matrix, size=(len(matrix) + 8) * 10, border=4)
 
+
+async def store_payment_qr(supabase_manager, driver_id: str, passenger_phone: str = None) -> str:
+    """
+    Render a driver's payment QR code (in a thread) and upload it to
+    Supabase Storage. Returns its public URL. With QR_SHORT_LINKS the
+    driver row must exist already, since the short code references it.
+    """
+    short_code = await supabase_manager.assign_short_code(driver_id) if QR_SHORT_LINKS else None
+    qr_bytes = await asyncio.to_thread(generate_payment_qr, driver_id, passenger_phone, short_code)
+    return await supabase_manager.upload_qr_code(driver_id, qr_bytes)
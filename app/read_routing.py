@@ -0,0 +1,105 @@
+"""
+Read/Write Routing for PaySwiftly
+
+With SUPABASE_REPLICA_URL set, SupabaseManager sends dashboard and status
+reads to a read replica, and sends all writes plus consistency-sensitive
+reads (webhooks, settlement, payouts) to the primary.
+
+Replicas lag, so a client that just wrote must not read from one:
+- Every response to a request that wrote carries a freshness token
+  (X-Freshness-Token, the write time).
+- A request that sends the token back, or that wrote earlier in the same
+  request, has its reads pinned to the primary for READ_YOUR_WRITES_SECONDS.
+- Anonymous reads go to the replica, unless the replica's measured lag is
+  above REPLICA_MAX_LAG_SECONDS.
+
+Tokens are not secret. A forged one can at most pin its own reads to the
+primary for one window.
+"""
+
+import os
+import time
+import functools
+from contextvars import ContextVar
+from typing import Optional
+
+FRESHNESS_HEADER = 'X-Freshness-Token'
+
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', '10'))
+
+
+class RequestFreshness:
+    """Per-request write state, shared by the middleware and the handler it wraps."""
+
+    def __init__(self, client_token: Optional[float] = None):
+        self.client_token = client_token
+        self.last_write: Optional[float] = None
+
+    def latest_write(self) -> Optional[float]:
+        writes = [t for t in (self.client_token, self.last_write) if t is not None]
+        return max(writes) if writes else None
+
+
+_request: ContextVar[Optional[RequestFreshness]] = ContextVar('request_freshness', default=None)
+
+
+def parse_token(token: Optional[str]) -> Optional[float]:
+    """Token -> write time, or None if missing or malformed. Future times are clamped to now."""
+    try:
+        return min(float(token), time.time()) if token else None
+    except ValueError:
+        return None
+
+
+def format_token(write_time: float) -> str:
+    return f"{write_time:.3f}"
+
+
+def begin_request(token: Optional[str] = None) -> RequestFreshness:
+    """Start tracking a request (call from middleware, before the handler runs)."""
+    state = RequestFreshness(parse_token(token))
+    _request.set(state)
+    return state
+
+
+def note_write() -> None:
+    """Record that the current request wrote to the primary."""
+    state = _request.get()
+    if state is not None:
+        state.last_write = time.time()
+
+
+def writes(method):
+    """Decorator for SupabaseManager methods that write to the primary."""
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            # Even a failed call may have written
+            note_write()
+    return wrapper
+
+
+def last_write_time() -> Optional[float]:
+    """Latest write the current request knows of (its own or its client's), or None."""
+    state = _request.get()
+    return state.latest_write() if state else None
+
+
+def pinned_to_primary(window_seconds: float = READ_YOUR_WRITES_SECONDS) -> bool:
+    """True if the current request wrote, or carries a token, within the last window_seconds."""
+    latest = last_write_time()
+    return latest is not None and time.time() - latest < window_seconds
+
+
+async def freshness_middleware(request, call_next):
+    """
+    HTTP middleware: read the client's freshness token, and return a new one
+    when the request wrote. Register with app.middleware("http").
+    """
+    state = begin_request(request.headers.get(FRESHNESS_HEADER))
+    response = await call_next(request)
+    if state.last_write is not None:
+        response.headers[FRESHNESS_HEADER] = format_token(state.last_write)
+    return response
@@ -0,0 +1,307 @@
+"""
+Reconciliation Workers for PaySwiftly
+
+Recover state changes whose IntaSend webhook never arrived.
+- CollectionReconciler: finds pending transactions older than a cutoff, asks
+  IntaSend for their collection status and settles final results through the
+  same path as the webhook handler. IntaSend status checks need the
+  collection ID, so pending transactions without one are only counted
+  (collections_without_id gauge) for manual follow-up.
+- PayoutReconciler: polls in-flight batch payouts and applies final states to
+  payouts and driver balances in bulk.
+"""
+
+import os
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import logging
+
+from . import metrics
+from .models import Transaction, Payout
+from .settlement import settle_collection
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Backoff:
+    """Per-transaction retry state."""
+    attempts: int = 0
+    next_check_at: float = 0.0
+
+
+class CollectionReconciler:
+    """Periodically reconcile stale pending collections with IntaSend."""
+
+    def __init__(
+        self,
+        intasend_api,
+        supabase_manager,
+        older_than_seconds: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        base_delay: Optional[float] = None,
+        max_delay: Optional[float] = None
+    ):
+        """Initialize reconciler with configuration from environment variables."""
+        self.intasend_api = intasend_api
+        self.supabase_manager = supabase_manager
+
+        self.older_than_seconds = older_than_seconds or int(os.getenv('RECONCILE_PENDING_AFTER_SECONDS', '300'))
+        self.concurrency = concurrency or int(os.getenv('RECONCILE_CONCURRENCY', '5'))
+        self.batch_size = batch_size or int(os.getenv('RECONCILE_BATCH_SIZE', '100'))
+        self.base_delay = base_delay or float(os.getenv('RECONCILE_BASE_DELAY_SECONDS', '60'))
+        self.max_delay = max_delay or float(os.getenv('RECONCILE_MAX_DELAY_SECONDS', '3600'))
+
+        self._backoff: Dict[str, _Backoff] = {}
+
+    def _schedule_retry(self, transaction_id: str) -> None:
+        """Push the next check for a transaction out exponentially, with jitter."""
+        backoff = self._backoff.setdefault(transaction_id, _Backoff())
+        backoff.attempts += 1
+        delay = min(self.base_delay * (2 ** (backoff.attempts - 1)), self.max_delay)
+        backoff.next_check_at = time.monotonic() + delay * random.uniform(0.8, 1.2)
+
+    def _is_due(self, transaction_id: str) -> bool:
+        backoff = self._backoff.get(transaction_id)
+        return backoff is None or backoff.next_check_at <= time.monotonic()
+
+    async def _reconcile_one(self, transaction: Transaction, semaphore: asyncio.Semaphore) -> str:
+        """
+        Check one transaction with IntaSend and settle it if final.
+
+        Returns:
+            'recovered', 'pending' or 'error'
+        """
+        async with semaphore:
+            try:
+                response = await self.intasend_api.check_collection_status(transaction.intasend_collection_id)
+            except Exception as e:
+                logger.warning(f"Reconcile status check failed for {transaction.id}: {str(e)}")
+                self._schedule_retry(transaction.id)
+                return 'error'
+
+        invoice: Dict[str, Any] = response.get('invoice') or response
+        state = invoice.get('state') or invoice.get('status') or ''
+
+        try:
+            settled = await settle_collection(
+                self.supabase_manager,
+                transaction,
+                state,
+                collection_id=invoice.get('invoice_id') or transaction.intasend_collection_id,
+                collection_response=response
+            )
+        except Exception as e:
+            logger.error(f"Reconcile settlement failed for {transaction.id}: {str(e)}")
+            self._schedule_retry(transaction.id)
+            return 'error'
+
+        if settled:
+            self._backoff.pop(transaction.id, None)
+            return 'recovered'
+
+        self._schedule_retry(transaction.id)
+        return 'pending'
+
+    async def sweep(self) -> Dict[str, Any]:
+        """
+        Run one reconciliation sweep.
+
+        Returns:
+            dict: Summary of the sweep, including how many transactions were recovered
+        """
+        started = time.monotonic()
+
+        stale = await self.supabase_manager.get_stale_pending_transactions(
+            older_than_seconds=self.older_than_seconds,
+            limit=self.batch_size
+        )
+
+        # Forget back-off state for transactions that are no longer pending
+        stale_ids = {tx.id for tx in stale}
+        for transaction_id in list(self._backoff):
+            if transaction_id not in stale_ids:
+                del self._backoff[transaction_id]
+
+        due = [tx for tx in stale if self._is_due(tx.id)]
+
+        try:
+            without_id = await self.supabase_manager.count_stale_pending_without_collection(self.older_than_seconds)
+        except Exception as e:
+            logger.warning(f"Counting pending transactions without a collection ID failed: {str(e)}")
+            without_id = None
+        if without_id is not None:
+            metrics.set_gauge('collections_without_id', without_id)
+            if without_id:
+                logger.warning(f"{without_id} stale pending transaction(s) have no collection ID to reconcile")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        outcomes = await asyncio.gather(*(self._reconcile_one(tx, semaphore) for tx in due))
+
+        summary = {
+            "status": "success",
+            "found": len(stale),
+            "checked": len(due),
+            "recovered": outcomes.count('recovered'),
+            "still_pending": outcomes.count('pending'),
+            "errors": outcomes.count('error'),
+            "without_collection_id": without_id,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1)
+        }
+
+        logger.info(
+            f"Collection reconcile sweep: recovered {summary['recovered']} of {summary['checked']} checked "
+            f"({summary['found']} stale, {summary['errors']} errors)"
+        )
+        return summary
+
+    async def run_forever(self, interval_seconds: float) -> None:
+        """Run sweeps every interval_seconds until cancelled."""
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Collection reconcile sweep failed: {str(e)}")
+            await asyncio.sleep(interval_seconds)
+
+
+def _payout_state(response: Dict[str, Any]) -> Optional[str]:
+    """
+    Map an IntaSend payout status response to 'completed', 'failed' or None (still processing).
+    """
+    entries = response.get('transactions') or [response]
+    statuses = [str(entry.get('status') or '').lower() for entry in entries]
+
+    if statuses and all(s in ('completed', 'complete', 'successful', 'success') for s in statuses):
+        return 'completed'
+    if any(s in ('failed', 'rejected', 'cancelled', 'canceled', 'reversed') for s in statuses):
+        return 'failed'
+
+    file_status = str(response.get('status') or '').lower()
+    if file_status in ('completed', 'complete', 'successful'):
+        return 'completed'
+    if file_status in ('failed', 'rejected', 'cancelled', 'canceled'):
+        return 'failed'
+    return None
+
+
+class PayoutReconciler:
+    """Periodically reconcile in-flight batch payouts with IntaSend."""
+
+    def __init__(
+        self,
+        intasend_api,
+        supabase_manager,
+        concurrency: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        stuck_after_seconds: Optional[int] = None
+    ):
+        """Initialize reconciler with configuration from environment variables."""
+        self.intasend_api = intasend_api
+        self.supabase_manager = supabase_manager
+
+        self.concurrency = concurrency or int(os.getenv('RECONCILE_CONCURRENCY', '5'))
+        self.batch_size = batch_size or int(os.getenv('PAYOUT_RECONCILE_BATCH_SIZE', '500'))
+        self.stuck_after_seconds = stuck_after_seconds or int(os.getenv('PAYOUT_STUCK_AFTER_SECONDS', '3600'))
+
+    def _record_stuck(self, payouts: List[Payout]) -> int:
+        """Publish in-flight and stuck payout gauges."""
+        now = datetime.now(timezone.utc)
+        stuck = 0
+        for payout in payouts:
+            started = payout.initiated_at or payout.created_at
+            if started is None:
+                continue
+            if started.tzinfo is None:
+                started = started.replace(tzinfo=timezone.utc)
+            if (now - started).total_seconds() > self.stuck_after_seconds:
+                stuck += 1
+
+        metrics.set_gauge('payouts_in_flight', len(payouts))
+        metrics.set_gauge('payouts_stuck_processing', stuck)
+        return stuck
+
+    async def _check(self, tracking_id: str, semaphore: asyncio.Semaphore) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            try:
+                return await self.intasend_api.check_payout_status(tracking_id)
+            except Exception as e:
+                logger.warning(f"Payout status check failed for {tracking_id}: {str(e)}")
+                return None
+
+    async def sweep(self) -> Dict[str, Any]:
+        """
+        Run one payout reconciliation sweep.
+
+        Returns:
+            dict: Summary of the sweep
+        """
+        started = time.monotonic()
+
+        payouts = await self.supabase_manager.get_processing_payouts(limit=self.batch_size)
+        stuck = self._record_stuck(payouts)
+
+        # Group by tracking ID so each IntaSend payout is queried once
+        groups: Dict[str, List[Payout]] = {}
+        for payout in payouts:
+            groups.setdefault(payout.tracking_id, []).append(payout)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tracking_ids = list(groups)
+        responses = await asyncio.gather(*(self._check(tid, semaphore) for tid in tracking_ids))
+
+        results = []
+        errors = 0
+        for tracking_id, response in zip(tracking_ids, responses):
+            if response is None:
+                errors += 1
+                continue
+            state = _payout_state(response)
+            if state is None:
+                continue
+            results.append({
+                "tracking_id": tracking_id,
+                "status": state,
+                "failure_reason": f"IntaSend payout failed: {response.get('status')}" if state == 'failed' else None,
+                "response": response
+            })
+
+        applied = await self.supabase_manager.apply_payout_results(results)
+
+        metrics.inc('payouts_reconciled_completed_total', applied['completed'])
+        metrics.inc('payouts_reconciled_failed_total', applied['failed'])
+
+        summary = {
+            "status": "success",
+            "in_flight": len(payouts),
+            "stuck": stuck,
+            "checked": len(tracking_ids),
+            "completed": applied['completed'],
+            "failed": applied['failed'],
+            "errors": errors,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1)
+        }
+
+        logger.info(
+            f"Payout reconcile sweep: {summary['completed']} completed, {summary['failed']} failed, "
+            f"{summary['in_flight']} in flight ({summary['stuck']} stuck)"
+        )
+        return summary
+
+    async def run_forever(self, interval_seconds: float) -> None:
+        """Run sweeps every interval_seconds until cancelled."""
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Payout reconcile sweep failed: {str(e)}")
+            await asyncio.sleep(interval_seconds)
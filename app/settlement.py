@@ -0,0 +1,133 @@
+"""
+Collection and Payout Settlement for PaySwiftly
+
+Apply the final state of an IntaSend collection to a transaction, or of an
+IntaSend payout to its payout rows. Used by the IntaSend webhook handlers
+and by the reconciliation workers, so a payment or payout is settled the
+same way no matter how its result arrived. Each runs as one database
+function (settle_collection in database/settlement_migration.sql,
+reconcile_payouts in database/payout_reconciliation_migration.sql).
+"""
+
+from typing import Any, Dict, Optional
+import logging
+
+from .models import Transaction, TransactionStatus, Payout
+
+logger = logging.getLogger(__name__)
+
+# IntaSend collection states that end a collection
+COMPLETED_STATES = {"COMPLETE", "COMPLETED"}
+FAILED_STATES = {"FAILED", "CANCELLED", "CANCELED"}
+
+# IntaSend payout states that end a payout
+PAYOUT_COMPLETED_STATES = {"COMPLETE", "COMPLETED", "SUCCESSFUL", "SUCCESS"}
+PAYOUT_FAILED_STATES = {"FAILED", "REJECTED", "CANCELLED", "CANCELED", "REVERSED"}
+
+
+async def settle_collection(
+    supabase_manager,
+    transaction: Transaction,
+    state: str,
+    collection_id: Optional[str],
+    collection_response: Optional[Dict[str, Any]] = None
+) -> bool:
+    """
+    Settle a collection for a pending transaction.
+
+    Args:
+        supabase_manager: Supabase manager instance
+        transaction: Transaction the collection belongs to
+        state: IntaSend collection state (e.g. COMPLETE, FAILED, PENDING)
+        collection_id: IntaSend collection/invoice ID
+        collection_response: Raw IntaSend payload to store with the transaction
+
+    Returns:
+        True if the transaction was settled, False if the state is not final
+        or the transaction was already settled (by this or a concurrent call).
+    """
+    state = (state or "").upper()
+
+    if state not in COMPLETED_STATES and state not in FAILED_STATES:
+        return False
+
+    # Webhooks and reconciliation can both report the same collection
+    if transaction.status != TransactionStatus.PENDING:
+        logger.info(f"Transaction {transaction.id} already settled ({transaction.status.value}), skipping")
+        return False
+
+    # The snapshot above can be stale (the reconciler awaits IntaSend after
+    # loading it). The database claims the transaction only while it is still
+    # pending and books the fee and the driver's credit in the same database
+    # transaction, so a concurrent caller or a crash cannot settle it twice
+    # or lose the credit.
+    completed = state in COMPLETED_STATES
+    settled = await supabase_manager.apply_collection_result(
+        transaction_id=transaction.id,
+        completed=completed,
+        collection_id=collection_id,
+        collection_response=collection_response,
+        created_at=transaction.created_at
+    )
+    if not settled:
+        logger.info(f"Transaction {transaction.id} was settled concurrently, skipping")
+        return False
+
+    if completed:
+        logger.info(f"Payment collected. Added {transaction.driver_amount} KES to driver pending balance")
+    else:
+        logger.info(f"Payment failed for transaction {transaction.id}")
+
+    return True
+
+
+async def settle_payout(
+    supabase_manager,
+    payout: Payout,
+    state: str,
+    response: Optional[Dict[str, Any]] = None
+) -> bool:
+    """
+    Settle an IntaSend payout (all payout rows sharing its tracking ID).
+
+    Goes through the same reconcile_payouts function as the payout reconciler:
+    only payouts still processing change, and a failed payout's amount goes
+    back to the driver's pending balance, whichever of the two gets there first.
+
+    Returns:
+        True if payout rows were settled by this call, False if the state is
+        not final or they were already settled.
+    """
+    state = (state or "").upper()
+
+    if state in PAYOUT_COMPLETED_STATES:
+        status = 'completed'
+    elif state in PAYOUT_FAILED_STATES:
+        status = 'failed'
+    else:
+        return False
+
+    applied = await supabase_manager.apply_payout_results([{
+        "tracking_id": payout.tracking_id,
+        "status": status,
+        "failure_reason": f"IntaSend payout failed: {state}" if status == 'failed' else None,
+        "response": response
+    }])
+    if not applied[status]:
+        logger.info(f"Payout {payout.tracking_id} already settled, skipping")
+        return False
+
+    # Batch payouts cover many transactions and carry no transaction_id
+    if payout.transaction_id:
+        await supabase_manager.update_transaction_payout(
+            transaction_id=payout.transaction_id,
+            tracking_id=payout.tracking_id,
+            payout_status=status,
+            payout_response=response
+        )
+
+    if status == 'completed':
+        logger.info(f"Payout completed: {payout.amount} KES to driver {payout.driver_id}")
+    else:
+        logger.error(f"Payout failed for driver {payout.driver_id}; amount returned to pending balance")
+    return True
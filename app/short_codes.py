@@ -0,0 +1,60 @@
+"""
+Short Payment Links for PaySwiftly
+
+A driver's QR code can point at {BASE_PUBLIC_URL}/p/{code}, where code is
+a random 7-character base62 string, instead of the full
+/pay/{uuid}?phone=...&t=... URL. The shorter payload fits a smaller QR
+version, which cheap phone cameras scan faster.
+
+Codes live in driver_short_codes (database/short_codes_migration.sql).
+They never change once assigned, so resolved codes are cached in memory
+with no expiry. Unknown codes go to SupabaseManager's negative cache.
+/p/{code} resolves the code and redirects to the signed payment page.
+"""
+
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, Optional
+
+BASE62_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+# Codes the migration can produce (7 characters by default)
+_CODE_PATTERN = re.compile(r'[0-9A-Za-z]{4,16}')
+
+QR_SHORT_LINKS = os.getenv('QR_SHORT_LINKS', 'false').lower() in ('1', 'true', 'yes')
+SHORT_CODE_CACHE_SIZE = int(os.getenv('SHORT_CODE_CACHE_SIZE', '50000'))
+
+
+def is_short_code(code: str) -> bool:
+    """True if code could be a short code (checked before any lookup)."""
+    return _CODE_PATTERN.fullmatch(code) is not None
+
+
+class ShortCodeCache:
+    """Code <-> driver ID in both directions, least recently used evicted first."""
+
+    def __init__(self, max_size: int = SHORT_CODE_CACHE_SIZE):
+        self.max_size = max_size
+        self._drivers: "OrderedDict[str, str]" = OrderedDict()
+        self._codes: Dict[str, str] = {}
+
+    def get(self, code: str) -> Optional[str]:
+        driver_id = self._drivers.get(code)
+        if driver_id is not None:
+            self._drivers.move_to_end(code)
+        return driver_id
+
+    def code_for(self, driver_id: str) -> Optional[str]:
+        return self._codes.get(driver_id)
+
+    def put(self, code: str, driver_id: str) -> None:
+        self._drivers[code] = driver_id
+        self._drivers.move_to_end(code)
+        self._codes[driver_id] = code
+        while len(self._drivers) > self.max_size:
+            _, evicted = self._drivers.popitem(last=False)
+            self._codes.pop(evicted, None)
+
+    def __len__(self) -> int:
+        return len(self._drivers)
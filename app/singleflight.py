@@ -0,0 +1,81 @@
+"""
+Single-Flight Reads for PaySwiftly
+
+When a group scans the same driver's QR code, or several tabs poll the same
+transaction, identical get_driver / get_transaction calls arrive together.
+@single_flight makes concurrent identical calls on one SupabaseManager share
+a single in-flight query: the first caller (the leader) runs it, and every
+caller that arrives before it finishes awaits the same result.
+
+A caller only joins a flight that cannot be staler than its own read would
+be:
+- The flight must have started after the caller's last known write (its own,
+  or the one in its X-Freshness-Token), so read-your-writes still holds.
+- Callers pinned to the primary and callers that may read the replica never
+  share a flight (see app/read_routing.py).
+
+Only calls that actually await (the asyncpg backend, or any async client)
+can overlap. With the synchronous PostgREST client each call completes
+before the next one starts, so nothing is coalesced there.
+
+Metrics: <method>_flights counts queries run, <method>_coalesced counts
+calls that were served by another caller's query.
+"""
+
+import time
+import asyncio
+import functools
+from typing import Any, Dict, Hashable, Tuple
+
+from .read_routing import last_write_time, pinned_to_primary
+from . import metrics
+
+
+class _Flight:
+    """One in-flight query and the time it started."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.started = time.time()
+
+
+def _flight_key(name: str, args: Tuple, kwargs: Dict[str, Any]) -> Hashable:
+    return (name, args, tuple(sorted(kwargs.items())), pinned_to_primary())
+
+
+def _land(flights: Dict[Hashable, _Flight], key: Hashable, flight: _Flight, task: asyncio.Task) -> None:
+    """Done callback: forget the flight, unless a fresher one has replaced it."""
+    if flights.get(key) is flight:
+        del flights[key]
+    if not task.cancelled():
+        # Mark the exception retrieved even if every caller went away
+        task.exception()
+
+
+def single_flight(method):
+    """
+    Decorator for read-only SupabaseManager methods with hashable arguments.
+    Callers share the returned object, so they must not modify it.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        flights: Dict[Hashable, _Flight] = self.__dict__.setdefault('_flights', {})
+        key = _flight_key(name, args, kwargs)
+
+        flight = flights.get(key)
+        written = last_write_time()
+        if flight is None or (written is not None and flight.started < written):
+            # Run the query in its own task so a cancelled leader (client
+            # disconnect) does not cancel the callers waiting on it
+            flight = _Flight(asyncio.ensure_future(method(self, *args, **kwargs)))
+            flights[key] = flight
+            flight.task.add_done_callback(functools.partial(_land, flights, key, flight))
+            metrics.inc(f'{name}_flights')
+        else:
+            metrics.inc(f'{name}_coalesced')
+
+        return await asyncio.shield(flight.task)
+
+    return wrapper
@@ -1,11 +1,60 @@
 import os
-from datetime import datetime
-from typing import Optional, Dict, Any, List
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Set, Tuple, Union, AsyncIterator
+from pydantic import BaseModel
 from supabase import create_client, Client
 from .models import (
     Driver, Transaction, AdminStats, TransactionStatus,
-    Payout, PayoutStatus, PlatformFee
+    Payout, PayoutStatus, PlatformFee, StatsBucket,
+    DriverSummary, EarningsPeriod
 )
+from .phone import normalize_phone
+from .read_routing import writes, pinned_to_primary, READ_YOUR_WRITES_SECONDS
+from .singleflight import single_flight
+from .lookup_filters import NegativeCache, BloomFilter, canonical_uuid
+from .short_codes import ShortCodeCache, is_short_code
+from . import metrics
+
+# transactions is partitioned by month on created_at. Queries carry a
+# created_at bound where they can so Postgres only touches recent partitions.
+# Lookups by ID try the recent window first and fall back to all partitions.
+RECENT_TRANSACTION_DAYS = int(os.getenv('RECENT_TRANSACTION_DAYS', '35'))
+TRANSACTION_LOOKBACK_DAYS = int(os.getenv('TRANSACTION_LOOKBACK_DAYS', '90'))
+
+# Private Storage bucket for archived (Parquet) rows
+ARCHIVE_BUCKET = os.getenv('ARCHIVE_BUCKET', 'archives')
+
+# Dashboard/status reads go to the read replica when SUPABASE_REPLICA_URL is
+# set (see app/read_routing.py), unless the request wrote within
+# READ_YOUR_WRITES_SECONDS or the replica lags by more than REPLICA_MAX_LAG_SECONDS
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '5'))
+
+# Lookups for driver/transaction IDs that do not exist are answered without a
+# query when possible (see app/lookup_filters.py). A driver ID the filter has
+# not seen triggers a refresh if the filter is older than DRIVER_ID_FILTER_MAX_AGE_SECONDS.
+NEGATIVE_CACHE_TTL_SECONDS = float(os.getenv('NEGATIVE_CACHE_TTL_SECONDS', '30'))
+DRIVER_ID_FILTER = os.getenv('DRIVER_ID_FILTER', 'false').lower() in ('1', 'true', 'yes')
+DRIVER_ID_FILTER_CAPACITY = int(os.getenv('DRIVER_ID_FILTER_CAPACITY', '100000'))
+DRIVER_ID_FILTER_MAX_AGE_SECONDS = float(os.getenv('DRIVER_ID_FILTER_MAX_AGE_SECONDS', '5'))
+DRIVER_ID_PAGE_SIZE = 1000
+
+# supabase-py is synchronous: hot-path queries run in this many threads, off the event loop
+SUPABASE_THREADS = int(os.getenv('SUPABASE_THREADS', '32'))
+
+
+def _days_ago(days: int) -> str:
+    return (datetime.utcnow() - timedelta(days=days)).isoformat()
+
+
+def _row(model: BaseModel, exclude: set, exclude_none: bool = False) -> Dict[str, Any]:
+    """Dump a model for insert, leaving out computed (display-only) fields."""
+    exclude = set(exclude) | set(type(model).model_computed_fields)
+    return model.model_dump(exclude=exclude, exclude_none=exclude_none)
+
 
 class SupabaseManager:
     def __init__(self):
@@ -17,55 +66,289 @@ class SupabaseManager:
             raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set in environment variables")
         
         self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+        
+        # The archives bucket is private; use the service role for it when available
+        service_role_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+        self.archive_client: Client = (
+            create_client(self.supabase_url, service_role_key) if service_role_key else self.supabase
+        )
+        
+        # Optional read replica (same anon key unless SUPABASE_REPLICA_ANON_KEY is set)
+        replica_url = os.getenv('SUPABASE_REPLICA_URL')
+        self.replica: Optional[Client] = (
+            create_client(replica_url, os.getenv('SUPABASE_REPLICA_ANON_KEY', self.supabase_key))
+            if replica_url else None
+        )
+        # Unknown until check_replica_lag() has run; the replica is unused until then
+        self.replica_lag_seconds: Optional[float] = None
+        
+        # Recent misses, and every known driver ID once load_driver_filter() has run
+        self.missing = NegativeCache(NEGATIVE_CACHE_TTL_SECONDS)
+        self.driver_filter: Optional[BloomFilter] = None
+        self._driver_filter_since: Optional[datetime] = None
+        self._driver_filter_refreshed = 0.0
+        self.short_codes = ShortCodeCache()
+        self._executor = ThreadPoolExecutor(max_workers=SUPABASE_THREADS, thread_name_prefix='supabase')
+
+    async def close(self) -> None:
+        """Release database connections (the PostgREST client keeps none open) and the thread pool."""
+        # Let queries already running finish, without blocking the event loop
+        await asyncio.to_thread(self._executor.shutdown)
+
+    async def _offload(self, call, *args, **kwargs):
+        """Run a blocking client call (e.g. query.execute) in the Supabase thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(call, *args, **kwargs))
 
-    async def create_driver(self, driver: Driver) -> str:
-        """Create a new driver in Supabase."""
-        driver_data = driver.model_dump(exclude={'id', 'created_at', 'updated_at'})
+    def _reader(self) -> Client:
+        """
+        Client for a dashboard/status read: the replica when one is configured,
+        caught up, and the request has not written recently; otherwise the primary.
+        """
+        if self.replica is None:
+            return self.supabase
+        
+        if pinned_to_primary(READ_YOUR_WRITES_SECONDS):
+            metrics.inc('db_reads_primary_pinned')
+            return self.supabase
+        
+        if self.replica_lag_seconds is None or self.replica_lag_seconds > REPLICA_MAX_LAG_SECONDS:
+            metrics.inc('db_reads_primary_replica_lagging')
+            return self.supabase
+        
+        metrics.inc('db_reads_replica')
+        return self.replica
+    
+    async def check_replica_lag(self) -> Optional[float]:
+        """Measure replica lag in seconds (None if no replica or the check failed)."""
+        if self.replica is None:
+            return None
+        
+        try:
+            result = await self._offload(self.replica.rpc('replica_lag_seconds').execute)
+            self.replica_lag_seconds = float(result.data)
+            metrics.set_gauge('replica_lag_seconds', self.replica_lag_seconds)
+        except Exception:
+            # Route everything to the primary until the replica answers again
+            self.replica_lag_seconds = None
+            metrics.inc('replica_lag_check_failures')
+            raise
+        
+        return self.replica_lag_seconds
+
+    async def load_driver_filter(self) -> int:
+        """Load every driver ID into a Bloom filter, so unknown IDs are rejected without a query. Returns the count."""
+        started = datetime.utcnow()
+        driver_ids = []
+        offset = 0
+        while True:
+            query = (self.supabase.table('drivers')
+                    .select('id')
+                    .order('id')
+                    .range(offset, offset + DRIVER_ID_PAGE_SIZE - 1))
+            result = await self._offload(query.execute)
+            driver_ids.extend(row['id'] for row in result.data)
+            if len(result.data) < DRIVER_ID_PAGE_SIZE:
+                break
+            offset += DRIVER_ID_PAGE_SIZE
+        
+        driver_filter = BloomFilter(max(DRIVER_ID_FILTER_CAPACITY, 2 * len(driver_ids)))
+        for driver_id in driver_ids:
+            driver_filter.add(driver_id)
+        
+        self.driver_filter = driver_filter
+        self._driver_filter_since = started
+        self._driver_filter_refreshed = time.monotonic()
+        metrics.set_gauge('driver_filter_size', len(driver_ids))
+        return len(driver_ids)
+    
+    async def _refresh_driver_filter(self) -> None:
+        """Add drivers registered since the last load/refresh (e.g. through another worker)."""
+        started = datetime.utcnow()
+        # Overlap by a minute to allow for clock skew between workers
+        since = self._driver_filter_since - timedelta(minutes=1)
+        query = (self.supabase.table('drivers')
+                .select('id')
+                .gte('created_at', since.isoformat()))
+        result = await self._offload(query.execute)
+        for row in result.data:
+            self.driver_filter.add(row['id'])
+        
+        self._driver_filter_since = started
+        self._driver_filter_refreshed = time.monotonic()
+        metrics.inc('driver_filter_refreshes')
+    
+    async def _known_missing(self, kind: str, key: Optional[str]) -> bool:
+        """True if a lookup for this ID can be answered "not found" without querying for it."""
+        if key is None:
+            metrics.inc(f'{kind}_lookups_invalid_id')
+            return True
+        
+        if pinned_to_primary():
+            # The client just wrote and may be looking up what it created
+            return False
+        
+        if (kind, key) in self.missing:
+            metrics.inc(f'{kind}_negative_cache_hits')
+            return True
+        
+        if kind == 'driver' and self.driver_filter is not None and key not in self.driver_filter:
+            if time.monotonic() - self._driver_filter_refreshed > DRIVER_ID_FILTER_MAX_AGE_SECONDS:
+                try:
+                    await self._refresh_driver_filter()
+                except Exception:
+                    metrics.inc('driver_filter_refresh_failures')
+                    return False
+            if key not in self.driver_filter:
+                metrics.inc('driver_filter_rejects')
+                return True
+        
+        return False
+
+    @writes
+    async def create_driver(self, driver: Driver, password_hash: Optional[str] = None) -> str:
+        """Create a new driver in Supabase (keeping driver.id when set), with their password hash."""
+        driver_data = _row(driver, exclude={'created_at', 'updated_at'} if driver.id else {'id', 'created_at', 'updated_at'})
+        driver_data['phone_normalized'] = normalize_phone(driver.phone)
+        if password_hash is not None:
+            driver_data['password_hash'] = password_hash
         driver_data['created_at'] = datetime.utcnow().isoformat()
         driver_data['updated_at'] = datetime.utcnow().isoformat()
         
-        result = self.supabase.table('drivers').insert(driver_data).execute()
+        # Off the event loop, so a QR upload can run alongside the insert
+        result = await self._offload(self.supabase.table('drivers').insert(driver_data).execute)
         
         if result.data:
-            return result.data[0]['id']
+            driver_id = result.data[0]['id']
+            self.missing.discard(('driver', driver_id))
+            if self.driver_filter is not None:
+                self.driver_filter.add(driver_id)
+            return driver_id
         else:
             raise Exception("Failed to create driver")
 
+    @writes
+    async def create_drivers(self, drivers: List[Driver], password_hashes: List[str]) -> List[str]:
+        """
+        Create several drivers in one insert (bulk onboarding), with their
+        password hashes. Drivers keep their id when set. Returns the new IDs
+        in order; if any row is rejected, none are inserted.
+        """
+        now = datetime.utcnow().isoformat()
+        rows = []
+        for driver, password_hash in zip(drivers, password_hashes):
+            driver_data = _row(driver, exclude={'created_at', 'updated_at'}, exclude_none=True)
+            driver_data['phone_normalized'] = normalize_phone(driver.phone)
+            driver_data['password_hash'] = password_hash
+            driver_data['created_at'] = now
+            driver_data['updated_at'] = now
+            rows.append(driver_data)
+        
+        result = await self._offload(self.supabase.table('drivers').insert(rows).execute)
+        
+        if len(result.data) != len(rows):
+            raise Exception("Failed to create drivers")
+        
+        # Rows come back in insert order
+        driver_ids = [row['id'] for row in result.data]
+        for driver_id in driver_ids:
+            self.missing.discard(('driver', driver_id))
+            if self.driver_filter is not None:
+                self.driver_filter.add(driver_id)
+        return driver_ids
+
+    @single_flight
     async def get_driver(self, driver_id: str) -> Optional[Driver]:
-        """Get driver details by ID."""
-        result = self.supabase.table('drivers').select('*').eq('id', driver_id).execute()
+        """Get driver details by ID (None without a query for IDs known not to exist)."""
+        key = canonical_uuid(driver_id)
+        if await self._known_missing('driver', key):
+            return None
+        
+        driver = await self._fetch_driver(key)
+        if driver is None:
+            self.missing.add(('driver', key))
+        return driver
+
+    async def _fetch_driver(self, driver_id: str) -> Optional[Driver]:
+        """Query one driver by ID (off the event loop: every payment looks up its driver)."""
+        result = await self._offload(self.supabase.table('drivers').select('*').eq('id', driver_id).execute)
         
         if result.data:
             driver_data = result.data[0]
             return Driver(**driver_data)
         return None
 
+    async def get_drivers_by_ids(self, driver_ids: List[str]) -> Dict[str, Driver]:
+        """Get several drivers in one query, keyed by ID (unknown and malformed IDs are left out)."""
+        ids = [key for key in map(canonical_uuid, driver_ids) if key]
+        if not ids:
+            return {}
+        
+        result = await self._offload(self.supabase.table('drivers').select('*').in_('id', ids).execute)
+        return {row['id']: Driver(**row) for row in result.data}
+
     async def get_driver_by_phone(self, phone: str) -> Optional[Dict[str, Any]]:
-        """Get driver by phone number (for login). Returns raw dict including password_hash."""
-        result = self.supabase.table('drivers').select('*').eq('phone', phone).execute()
+        """
+        Get driver by phone number in any format (for login).
+        Matches on the indexed phone_normalized column. Returns raw dict including password_hash.
+        """
+        try:
+            phone_normalized = normalize_phone(phone)
+        except ValueError:
+            return None
+        
+        result = await self._offload(self.supabase.table('drivers').select('*').eq('phone_normalized', phone_normalized).execute)
         
         if result.data:
             return result.data[0]
         return None
 
+    async def find_registered(self, phones_normalized: List[str], emails: List[str]) -> Tuple[Set[str], Set[str]]:
+        """
+        Which of these phones (E.164) and emails (lower-cased) already belong
+        to a driver. Emails match drivers.email_normalized, so case differences
+        do not hide a registered address.
+        """
+        phones: Set[str] = set()
+        if phones_normalized:
+            query = (self.supabase.table('drivers')
+                    .select('phone_normalized')
+                    .in_('phone_normalized', phones_normalized))
+            result = await self._offload(query.execute)
+            phones = {row['phone_normalized'] for row in result.data}
+        
+        found_emails: Set[str] = set()
+        if emails:
+            query = (self.supabase.table('drivers')
+                    .select('email_normalized')
+                    .in_('email_normalized', emails))
+            result = await self._offload(query.execute)
+            found_emails = {row['email_normalized'] for row in result.data}
+        
+        return phones, found_emails
+
+    @writes
     async def update_driver(self, driver_id: str, data: Dict[str, Any]) -> bool:
         """Update driver details."""
+        if 'phone' in data:
+            data['phone_normalized'] = normalize_phone(data['phone'])
         data['updated_at'] = datetime.utcnow().isoformat()
         
-        result = self.supabase.table('drivers').update(data).eq('id', driver_id).execute()
+        result = await self._offload(self.supabase.table('drivers').update(data).eq('id', driver_id).execute)
         
         return len(result.data) > 0
 
+    @writes
     async def create_transaction(self, transaction: Transaction) -> str:
         """Create a new transaction with atomic updates."""
-        transaction_data = transaction.model_dump(exclude={'id', 'created_at', 'updated_at'})
+        transaction_data = _row(transaction, exclude={'id', 'created_at', 'updated_at'})
         transaction_data['created_at'] = datetime.utcnow().isoformat()
         transaction_data['updated_at'] = datetime.utcnow().isoformat()
         
         # Start a transaction
         try:
             # Create the transaction
-            transaction_result = self.supabase.table('transactions').insert(transaction_data).execute()
+            transaction_result = await self._offload(self.supabase.table('transactions').insert(transaction_data).execute)
             
             if not transaction_result.data:
                 raise Exception("Failed to create transaction")
@@ -73,23 +356,23 @@ class SupabaseManager:
             transaction_id = transaction_result.data[0]['id']
             
             # Update driver balance and earnings using RPC function
-            balance_result = self.supabase.rpc(
+            balance_result = await self._offload(self.supabase.rpc(
                 'update_driver_balance',
                 {
                     'driver_id': transaction.driver_id,
-                    'amount': transaction.driver_amount
+                    'amount_cents': transaction.driver_amount_cents
                 }
-            ).execute()
+            ).execute)
             
             # Update admin stats using RPC function
-            stats_result = self.supabase.rpc(
+            stats_result = await self._offload(self.supabase.rpc(
                 'update_admin_stats',
                 {
                     'transaction_count': 1,
-                    'revenue': transaction.amount_paid,
-                    'platform_fee': transaction.platform_fee
+                    'revenue_cents': transaction.amount_paid_cents,
+                    'platform_fee_cents': transaction.platform_fee_cents
                 }
-            ).execute()
+            ).execute)
             
             return transaction_id
             
@@ -97,20 +380,48 @@ class SupabaseManager:
             # In a real implementation, you'd want to rollback here
             raise Exception(f"Transaction creation failed: {str(e)}")
 
-    async def get_driver_transactions(self, driver_id: str, limit: int = 50) -> List[Transaction]:
-        """Get transactions for a specific driver."""
-        result = (self.supabase.table('transactions')
-                 .select('*')
-                 .eq('driver_id', driver_id)
-                 .order('created_at', desc=True)
-                 .limit(limit)
-                 .execute())
+    async def get_driver_summary(self, driver_id: str) -> Optional[DriverSummary]:
+        """
+        Get driver earnings for today, this week, this month and lifetime.
+        Reads the per-driver rollups, so the cost does not grow with history.
+        """
+        result = await self._offload(self._reader().rpc('get_driver_summary', {'driver_id_param': driver_id}).execute)
+        
+        if not result.data:
+            return None
+        
+        row = result.data[0]
+        return DriverSummary(
+            driver_id=row['driver_id'],
+            as_of=row['as_of'],
+            today=EarningsPeriod(trips=row['today_trips'], earnings_cents=row['today_earnings_cents']),
+            this_week=EarningsPeriod(trips=row['week_trips'], earnings_cents=row['week_earnings_cents']),
+            this_month=EarningsPeriod(trips=row['month_trips'], earnings_cents=row['month_earnings_cents']),
+            lifetime=EarningsPeriod(trips=row['lifetime_trips'], earnings_cents=row['lifetime_earnings_cents']),
+            last_trip_at=row.get('last_trip_at')
+        )
+
+    async def get_driver_transactions(
+        self,
+        driver_id: str,
+        limit: int = 50,
+        since: Optional[datetime] = None
+    ) -> List[Transaction]:
+        """Get recent transactions for a specific driver (default: last TRANSACTION_LOOKBACK_DAYS)."""
+        since_iso = since.isoformat() if since else _days_ago(TRANSACTION_LOOKBACK_DAYS)
+        query = (self._reader().table('transactions')
+                .select('*')
+                .eq('driver_id', driver_id)
+                .gte('created_at', since_iso)
+                .order('created_at', desc=True)
+                .limit(limit))
+        result = await self._offload(query.execute)
         
         return [Transaction(**tx) for tx in result.data]
 
     async def get_admin_stats(self) -> AdminStats:
-        """Get admin statistics."""
-        result = self.supabase.table('admin_stats').select('*').eq('id', 'revenue').execute()
+        """Get admin statistics (counters summed across admin_stats_shards)."""
+        result = await self._offload(self._reader().rpc('get_admin_stats').execute)
         
         if result.data:
             stats_data = result.data[0]
@@ -119,13 +430,35 @@ class SupabaseManager:
         # Return default stats if none exist
         return AdminStats()
 
+    async def get_stats_timeseries(
+        self,
+        granularity: str,
+        start: datetime,
+        end: datetime
+    ) -> List[StatsBucket]:
+        """
+        Get hourly or daily rollups of completed transactions in [start, end).
+        Reads stats_hourly / stats_daily, never the transactions table.
+        """
+        try:
+            result = await self._offload(self._reader().rpc('get_stats_timeseries', {
+                'granularity': granularity,
+                'start_at': start.isoformat(),
+                'end_at': end.isoformat()
+            }).execute)
+        except Exception as e:
+            raise Exception(f"Failed to get stats timeseries: {str(e)}")
+        
+        return [StatsBucket(**row) for row in result.data]
+
     async def upload_qr_code(self, driver_id: str, qr_image_bytes: bytes) -> str:
         """Upload QR code image to Supabase Storage."""
         file_path = f'qr_codes/{driver_id}.png'
         
-        # Upload to Supabase Storage
+        # Upload to Supabase Storage (in a thread, so uploads can overlap)
         try:
-            storage_result = self.supabase.storage.from_('qr-codes').upload(
+            await self._offload(
+                self.supabase.storage.from_('qr-codes').upload,
                 file_path, 
                 qr_image_bytes,
                 file_options={"content-type": "image/png"}
@@ -133,20 +466,87 @@ class SupabaseManager:
         except Exception as e:
             raise Exception(f"Failed to upload QR code: {str(e)}")
         
-        # Get public URL
-        public_url = self.supabase.storage.from_('qr-codes').get_public_url(file_path)
-        return public_url
+        return self.qr_code_public_url(driver_id)
+
+    def qr_code_public_url(self, driver_id: str) -> str:
+        """Public URL of a driver's uploaded QR code (known before the upload; no request made)."""
+        return self.supabase.storage.from_('qr-codes').get_public_url(f'qr_codes/{driver_id}.png')
+
+    async def assign_short_code(self, driver_id: str) -> str:
+        """
+        Get the driver's short payment code, creating it on first call.
+        Idempotent, and codes are only read back from the primary, so this is
+        not tracked as a write for read routing.
+        """
+        code = self.short_codes.code_for(driver_id)
+        if code is not None:
+            return code
+        
+        try:
+            result = await self._offload(self.supabase.rpc('assign_driver_short_code', {'p_driver_id': driver_id}).execute)
+        except Exception as e:
+            raise Exception(f"Failed to assign short code: {str(e)}")
+        
+        code = result.data
+        self.short_codes.put(code, driver_id)
+        self.missing.discard(('short_code', code))
+        return code
+    
+    async def get_short_codes(self, driver_ids: List[str]) -> Dict[str, str]:
+        """Existing short codes for several drivers, keyed by driver ID (drivers without one are left out)."""
+        codes = {driver_id: self.short_codes.code_for(driver_id) for driver_id in driver_ids}
+        missing = [driver_id for driver_id, code in codes.items() if code is None]
+        
+        if missing:
+            query = (self.supabase.table('driver_short_codes')
+                    .select('code, driver_id')
+                    .in_('driver_id', missing))
+            result = await self._offload(query.execute)
+            for row in result.data:
+                self.short_codes.put(row['code'], row['driver_id'])
+                codes[row['driver_id']] = row['code']
+        
+        return {driver_id: code for driver_id, code in codes.items() if code is not None}
+    
+    async def resolve_short_code(self, code: str) -> Optional[str]:
+        """Driver ID for a short code, or None if there is no such code."""
+        if not is_short_code(code):
+            metrics.inc('short_code_lookups_invalid')
+            return None
+        
+        driver_id = self.short_codes.get(code)
+        if driver_id is not None:
+            metrics.inc('short_code_cache_hits')
+            return driver_id
+        
+        if await self._known_missing('short_code', code):
+            return None
+        
+        query = (self.supabase.table('driver_short_codes')
+                .select('driver_id')
+                .eq('code', code))
+        result = await self._offload(query.execute)
+        
+        if not result.data:
+            self.missing.add(('short_code', code))
+            return None
+        
+        driver_id = result.data[0]['driver_id']
+        self.short_codes.put(code, driver_id)
+        return driver_id
 
     async def get_all_transactions(self, limit: int = 100) -> List[Transaction]:
-        """Get all transactions for admin view."""
-        result = (self.supabase.table('transactions')
-                 .select('*')
-                 .order('created_at', desc=True)
-                 .limit(limit)
-                 .execute())
+        """Get recent transactions for admin view."""
+        query = (self._reader().table('transactions')
+                .select('*')
+                .gte('created_at', _days_ago(TRANSACTION_LOOKBACK_DAYS))
+                .order('created_at', desc=True)
+                .limit(limit))
+        result = await self._offload(query.execute)
         
         return [Transaction(**tx) for tx in result.data]
 
+    @writes
     async def update_transaction_status(self, checkout_request_id: str, status: TransactionStatus, mpesa_receipt: Optional[str] = None) -> bool:
         """Update transaction status based on M-Pesa callback."""
         update_data = {
@@ -157,64 +557,100 @@ class SupabaseManager:
         if mpesa_receipt:
             update_data['mpesa_receipt'] = mpesa_receipt
         
-        result = (self.supabase.table('transactions')
-                 .update(update_data)
-                 .eq('checkout_request_id', checkout_request_id)
-                 .execute())
+        query = (self.supabase.table('transactions')
+                .update(update_data)
+                .eq('checkout_request_id', checkout_request_id))
+        result = await self._offload(query.execute)
         
         return len(result.data) > 0
 
     async def get_transaction_by_checkout_id(self, checkout_request_id: str) -> Optional[Transaction]:
         """Get transaction by checkout request ID."""
-        result = (self.supabase.table('transactions')
-                 .select('*')
-                 .eq('checkout_request_id', checkout_request_id)
-                 .execute())
-        
-        if result.data:
-            return Transaction(**result.data[0])
-        return None
+        return await self._find_transaction('checkout_request_id', checkout_request_id)
 
-    async def update_transaction_checkout_id(self, transaction_id: str, checkout_request_id: str) -> bool:
+    async def update_transaction_checkout_id(
+        self,
+        transaction_id: str,
+        checkout_request_id: str,
+        created_at: Optional[datetime] = None
+    ) -> bool:
         """Update transaction with checkout request ID."""
         update_data = {
             'checkout_request_id': checkout_request_id,
             'updated_at': datetime.utcnow().isoformat()
         }
         
-        result = (self.supabase.table('transactions')
-                 .update(update_data)
-                 .eq('id', transaction_id)
-                 .execute())
-        
-        return len(result.data) > 0
+        return await self._update_transaction(transaction_id, update_data, created_at)
     
     # === IntaSend-specific methods ===
     
+    @writes
     async def create_transaction_with_intasend(self, transaction: Transaction) -> str:
-        """Create a new transaction for IntaSend workflow."""
-        transaction_data = transaction.model_dump(
+        """
+        Create a new transaction for IntaSend workflow. A created_at set on the
+        model is kept, so callers know the row's partition without reading it back.
+        """
+        transaction_data = _row(
+            transaction,
             exclude={'id', 'created_at', 'updated_at'},
             exclude_none=True
         )
-        transaction_data['created_at'] = datetime.utcnow().isoformat()
+        transaction_data['created_at'] = (transaction.created_at or datetime.utcnow()).isoformat()
         transaction_data['updated_at'] = datetime.utcnow().isoformat()
         
-        result = self.supabase.table('transactions').insert(transaction_data).execute()
+        # Off the event loop, so concurrent payments' inserts overlap
+        result = await self._offload(self.supabase.table('transactions').insert(transaction_data).execute)
         
         if result.data:
             return result.data[0]['id']
         else:
             raise Exception("Failed to create transaction")
     
+    @writes
+    async def record_collection_started(
+        self,
+        transaction_id: str,
+        collection_id: str,
+        collection_response: Optional[Dict[str, Any]] = None,
+        created_at: Optional[datetime] = None
+    ) -> bool:
+        """
+        Record the IntaSend collection an STK push started. This runs after the
+        response, so the webhook may have settled the transaction already; then
+        nothing is changed. Pass the transaction's created_at when known so only
+        its partition is touched. Returns True if the transaction was updated.
+        """
+        update_data = {
+            'intasend_collection_id': collection_id,
+            'collection_status': 'pending',
+            'updated_at': datetime.utcnow().isoformat()
+        }
+        if collection_response:
+            update_data['collection_response'] = collection_response
+        
+        query = (self.supabase.table('transactions')
+                .update(update_data)
+                .eq('id', transaction_id)
+                .eq('status', TransactionStatus.PENDING.value)
+                .is_('intasend_collection_id', 'null'))
+        if created_at:
+            query = query.eq('created_at', created_at.isoformat())
+        result = await self._offload(query.execute)
+        
+        return len(result.data) > 0
+    
     async def update_transaction_collection(
         self,
         transaction_id: str,
         collection_id: str,
         collection_status: str,
-        collection_response: Optional[Dict[str, Any]] = None
+        collection_response: Optional[Dict[str, Any]] = None,
+        created_at: Optional[datetime] = None
     ) -> bool:
-        """Update transaction with IntaSend collection details."""
+        """
+        Update transaction with IntaSend collection details.
+        Pass the transaction's created_at when known so only its partition is touched.
+        """
         update_data = {
             'intasend_collection_id': collection_id,
             'collection_status': collection_status,
@@ -230,38 +666,135 @@ class SupabaseManager:
         elif collection_status == 'failed':
             update_data['status'] = TransactionStatus.FAILED.value
         
-        result = (self.supabase.table('transactions')
-                 .update(update_data)
-                 .eq('id', transaction_id)
-                 .execute())
+        return await self._update_transaction(transaction_id, update_data, created_at)
+    
+    @writes
+    async def _update_transaction(
+        self,
+        transaction_id: str,
+        update_data: Dict[str, Any],
+        created_at: Optional[datetime] = None
+    ) -> bool:
+        """Update one transaction, pinned to its partition when created_at is known."""
+        if created_at:
+            query = (self.supabase.table('transactions')
+                    .update(update_data)
+                    .eq('id', transaction_id)
+                    .eq('created_at', created_at.isoformat()))
+            result = await self._offload(query.execute)
+            if result.data:
+                return True
+        
+        query = (self.supabase.table('transactions')
+                .update(update_data)
+                .eq('id', transaction_id))
+        result = await self._offload(query.execute)
         
         return len(result.data) > 0
     
-    async def get_transaction(self, transaction_id: str) -> Optional[Transaction]:
-        """Get transaction by ID."""
-        result = (self.supabase.table('transactions')
-                 .select('*')
-                 .eq('id', transaction_id)
-                 .execute())
+    async def _find_transaction(self, column: str, value: str, client: Optional[Client] = None) -> Optional[Transaction]:
+        """Look a transaction up in recent partitions first, then in all of them (on the primary by default)."""
+        client = client or self.supabase
+        query = (client.table('transactions')
+                .select('*')
+                .eq(column, value)
+                .gte('created_at', _days_ago(RECENT_TRANSACTION_DAYS))
+                .limit(1))
+        result = await self._offload(query.execute)
+        
+        if not result.data:
+            query = (client.table('transactions')
+                    .select('*')
+                    .eq(column, value)
+                    .limit(1))
+            result = await self._offload(query.execute)
         
         if result.data:
             return Transaction(**result.data[0])
         return None
     
+    @single_flight
+    async def get_transaction(self, transaction_id: str, allow_replica: bool = False) -> Optional[Transaction]:
+        """
+        Get transaction by ID.
+        allow_replica is for status/dashboard reads only; anything that acts on the
+        transaction's state (webhooks, settlement) must read the primary.
+        """
+        key = canonical_uuid(transaction_id)
+        if await self._known_missing('transaction', key):
+            return None
+        
+        if allow_replica:
+            reader = self._reader()
+            if reader is not self.supabase:
+                transaction = await self._find_transaction('id', key, client=reader)
+                if transaction:
+                    return transaction
+                # Not replicated yet
+                metrics.inc('db_reads_replica_miss')
+        
+        transaction = await self._find_transaction('id', key)
+        if transaction is None:
+            self.missing.add(('transaction', key))
+        return transaction
+    
     async def get_transaction_by_collection_id(self, collection_id: str) -> Optional[Transaction]:
         """Get transaction by IntaSend collection ID."""
-        result = (self.supabase.table('transactions')
-                 .select('*')
-                 .eq('intasend_collection_id', collection_id)
-                 .execute())
+        return await self._find_transaction('intasend_collection_id', collection_id)
+    
+    async def ensure_transaction_partitions(self, months_ahead: int = 3) -> int:
+        """Create missing monthly transactions partitions up to months_ahead. Returns how many were created."""
+        try:
+            result = await self._offload(self.supabase.rpc('create_transaction_partitions', {'months_ahead': months_ahead}).execute)
+        except Exception as e:
+            raise Exception(f"Failed to create transaction partitions: {str(e)}")
         
-        if result.data:
-            return Transaction(**result.data[0])
-        return None
+        return result.data or 0
     
+    async def get_stale_pending_transactions(self, older_than_seconds: int, limit: int = 100) -> List[Transaction]:
+        """
+        Get pending transactions with an IntaSend collection older than the cutoff
+        (and newer than TRANSACTION_LOOKBACK_DAYS).
+        Served by idx_transactions_status_created_at (status, created_at).
+        """
+        cutoff = (datetime.utcnow() - timedelta(seconds=older_than_seconds)).isoformat()
+        
+        query = (self.supabase.table('transactions')
+                .select('*')
+                .eq('status', TransactionStatus.PENDING.value)
+                .gte('created_at', _days_ago(TRANSACTION_LOOKBACK_DAYS))
+                .lt('created_at', cutoff)
+                .not_.is_('intasend_collection_id', 'null')
+                .order('created_at')
+                .limit(limit))
+        result = await self._offload(query.execute)
+        
+        return [Transaction(**tx) for tx in result.data]
+    
+    async def count_stale_pending_without_collection(self, older_than_seconds: int) -> int:
+        """
+        Count pending transactions older than the cutoff that have no IntaSend
+        collection ID: the STK push failed, or its ID was never recorded. The
+        reconciler cannot check these; only a webhook settles them.
+        """
+        cutoff = (datetime.utcnow() - timedelta(seconds=older_than_seconds)).isoformat()
+        
+        query = (self.supabase.table('transactions')
+                .select('id', count='exact')
+                .eq('status', TransactionStatus.PENDING.value)
+                .gte('created_at', _days_ago(TRANSACTION_LOOKBACK_DAYS))
+                .lt('created_at', cutoff)
+                .is_('intasend_collection_id', 'null')
+                .limit(1))
+        result = await self._offload(query.execute)
+        
+        return result.count or 0
+    
+    @writes
     async def create_payout(self, payout: Payout) -> str:
         """Create a new payout record."""
-        payout_data = payout.model_dump(
+        payout_data = _row(
+            payout,
             exclude={'id', 'created_at', 'updated_at'},
             exclude_none=True
         )
@@ -269,13 +802,14 @@ class SupabaseManager:
         payout_data['created_at'] = datetime.utcnow().isoformat()
         payout_data['updated_at'] = datetime.utcnow().isoformat()
         
-        result = self.supabase.table('payouts').insert(payout_data).execute()
+        result = await self._offload(self.supabase.table('payouts').insert(payout_data).execute)
         
         if result.data:
             return result.data[0]['id']
         else:
             raise Exception("Failed to create payout")
     
+    @writes
     async def update_payout_status(
         self,
         payout_id: str,
@@ -299,10 +833,10 @@ class SupabaseManager:
         if status == PayoutStatus.COMPLETED:
             update_data['completed_at'] = datetime.utcnow().isoformat()
         
-        result = (self.supabase.table('payouts')
-                 .update(update_data)
-                 .eq('id', payout_id)
-                 .execute())
+        query = (self.supabase.table('payouts')
+                .update(update_data)
+                .eq('id', payout_id))
+        result = await self._offload(query.execute)
         
         return len(result.data) > 0
     
@@ -311,7 +845,8 @@ class SupabaseManager:
         transaction_id: str,
         tracking_id: str,
         payout_status: str,
-        payout_response: Optional[Dict[str, Any]] = None
+        payout_response: Optional[Dict[str, Any]] = None,
+        created_at: Optional[datetime] = None
     ) -> bool:
         """Update transaction with payout details."""
         update_data = {
@@ -329,34 +864,31 @@ class SupabaseManager:
         elif payout_status == 'failed':
             update_data['status'] = TransactionStatus.PAYOUT_FAILED.value
         
-        result = (self.supabase.table('transactions')
-                 .update(update_data)
-                 .eq('id', transaction_id)
-                 .execute())
-        
-        return len(result.data) > 0
+        return await self._update_transaction(transaction_id, update_data, created_at)
     
     async def get_payout_by_tracking_id(self, tracking_id: str) -> Optional[Payout]:
         """Get payout by tracking ID."""
-        result = (self.supabase.table('payouts')
-                 .select('*')
-                 .eq('tracking_id', tracking_id)
-                 .execute())
+        query = (self.supabase.table('payouts')
+                .select('*')
+                .eq('tracking_id', tracking_id))
+        result = await self._offload(query.execute)
         
         if result.data:
             return Payout(**result.data[0])
         return None
     
+    @writes
     async def create_platform_fee(self, platform_fee: PlatformFee) -> str:
         """Record platform fee collection."""
-        fee_data = platform_fee.model_dump(
+        fee_data = _row(
+            platform_fee,
             exclude={'id', 'created_at'},
             exclude_none=True
         )
         fee_data['collected_at'] = datetime.utcnow().isoformat()
         fee_data['created_at'] = datetime.utcnow().isoformat()
         
-        result = self.supabase.table('platform_fees').insert(fee_data).execute()
+        result = await self._offload(self.supabase.table('platform_fees').insert(fee_data).execute)
         
         if result.data:
             return result.data[0]['id']
@@ -365,56 +897,118 @@ class SupabaseManager:
     
     async def get_driver_payouts(self, driver_id: str, limit: int = 50) -> List[Payout]:
         """Get payouts for a specific driver."""
-        result = (self.supabase.table('payouts')
-                 .select('*')
-                 .eq('driver_id', driver_id)
-                 .order('created_at', desc=True)
-                 .limit(limit)
-                 .execute())
+        query = (self._reader().table('payouts')
+                .select('*')
+                .eq('driver_id', driver_id)
+                .order('created_at', desc=True)
+                .limit(limit))
+        result = await self._offload(query.execute)
         
         return [Payout(**payout) for payout in result.data]
     
     async def get_pending_payouts(self, limit: int = 100):
         """Get all pending payouts."""
-        result = self.supabase.table('payouts')\
+        query = self.supabase.table('payouts')\
             .select('*')\
             .eq('status', 'pending')\
             .order('created_at', desc=True)\
-            .limit(limit)\
-            .execute()
+            .limit(limit)
+        result = await self._offload(query.execute)
         
         return result.data
     
-    async def add_to_pending_balance(self, driver_id: str, amount: float):
+    async def get_processing_payouts(self, limit: int = 500) -> List[Payout]:
+        """Get in-flight payouts (status 'processing' with a tracking ID), oldest first."""
+        query = (self.supabase.table('payouts')
+                .select('*')
+                .eq('status', PayoutStatus.PROCESSING.value)
+                .not_.is_('tracking_id', 'null')
+                .order('created_at')
+                .limit(limit))
+        result = await self._offload(query.execute)
+        
+        return [Payout(**payout) for payout in result.data]
+    
+    @writes
+    async def apply_payout_results(self, results: List[Dict[str, Any]]) -> Dict[str, int]:
         """
-        Add amount to driver's pending balance (accumulate earnings).
+        Apply final payout states in bulk.
+        Uses database function that updates payouts and driver balances set-wise.
+        
+        Args:
+            results: List of {tracking_id, status, failure_reason, response}
+        """
+        if not results:
+            return {"completed": 0, "failed": 0}
+        
+        try:
+            result = await self._offload(self.supabase.rpc('reconcile_payouts', {'results': results}).execute)
+        except Exception as e:
+            raise Exception(f"Failed to apply payout results: {str(e)}")
+        
+        row = result.data[0] if result.data else {}
+        return {"completed": row.get('completed', 0), "failed": row.get('failed', 0)}
+    
+    @writes
+    async def apply_collection_result(
+        self,
+        transaction_id: str,
+        completed: bool,
+        collection_id: Optional[str],
+        collection_response: Optional[Dict[str, Any]] = None,
+        created_at: Optional[datetime] = None
+    ) -> bool:
+        """
+        Settle a pending transaction's collection in one database transaction
+        (database/settlement_migration.sql): claim it, and on completion record
+        the platform fee and credit the driver. Returns False if it was no
+        longer pending (already settled by another caller).
+        """
+        try:
+            result = await self._offload(self.supabase.rpc('settle_collection', {
+                'p_transaction_id': transaction_id,
+                'p_created_at': created_at.isoformat() if created_at else None,
+                'p_completed': completed,
+                'p_collection_id': collection_id,
+                'p_collection_response': collection_response
+            }).execute)
+        except Exception as e:
+            raise Exception(f"Failed to settle collection: {str(e)}")
+        
+        return bool(result.data)
+    
+    @writes
+    async def add_to_pending_balance(self, driver_id: str, amount_cents: int):
+        """
+        Add amount (in cents) to driver's pending balance (accumulate earnings).
         Uses database function for atomic update.
         """
         try:
-            result = self.supabase.rpc('add_to_pending_balance', {
+            result = await self._offload(self.supabase.rpc('add_to_pending_balance', {
                 'driver_id_param': driver_id,
-                'amount_param': amount
-            }).execute()
+                'amount_cents_param': amount_cents
+            }).execute)
             return result
         except Exception as e:
             raise Exception(f"Failed to add to pending balance: {str(e)}")
     
-    async def get_drivers_for_payout(self, minimum_threshold: float = 100.0):
+    async def get_drivers_for_payout(self, minimum_threshold_cents: int = 10000):
         """
-        Get all drivers eligible for batch payout (pending_balance >= threshold).
+        Get all drivers eligible for batch payout (pending_balance_cents >= threshold).
         """
-        result = self.supabase.table('drivers')\
-            .select('id, name, phone, email, pending_balance, paid_balance, last_payout_date')\
-            .gte('pending_balance', minimum_threshold)\
-            .order('pending_balance', desc=True)\
-            .execute()
+        query = self.supabase.table('drivers')\
+            .select('id, name, phone, phone_normalized, email, pending_balance_cents, paid_balance_cents, last_payout_date')\
+            .gte('pending_balance_cents', minimum_threshold_cents)\
+            .order('pending_balance_cents', desc=True)
+        result = await self._offload(query.execute)
         
         return result.data
     
+    @writes
     async def process_batch_payout_completion(
         self,
         driver_id: str,
-        amount: float,
+        amount_cents: int,
         tracking_id: str
     ):
         """
@@ -422,11 +1016,155 @@ class SupabaseManager:
         Uses database function for atomic update.
         """
         try:
-            result = self.supabase.rpc('process_batch_payout', {
+            result = await self._offload(self.supabase.rpc('process_batch_payout', {
                 'driver_id_param': driver_id,
-                'amount_param': amount,
+                'amount_cents_param': amount_cents,
                 'tracking_id_param': tracking_id
-            }).execute()
+            }).execute)
             return result
         except Exception as e:
-            raise Exception(f"Failed to process batch payout: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Failed to process batch payout: {str(e)}")
+    
+    # === Idempotency keys (database/idempotency_migration.sql) ===
+    
+    async def claim_idempotency_key(
+        self,
+        key: str,
+        request_hash: str,
+        ttl_seconds: float,
+        lock_seconds: float
+    ) -> Dict[str, Any]:
+        """
+        Claim key for a request about to run (see app/idempotency.py). Returns
+        {'claimed': True}, or the existing claim's request_hash and response
+        (None while its request is still running).
+        """
+        try:
+            result = await self._offload(self.supabase.rpc('claim_idempotency_key', {
+                'p_key': key,
+                'p_request_hash': request_hash,
+                'p_ttl_seconds': int(ttl_seconds),
+                'p_lock_seconds': int(lock_seconds)
+            }).execute)
+        except Exception as e:
+            raise Exception(f"Failed to claim idempotency key: {str(e)}")
+        
+        return result.data
+    
+    async def renew_idempotency_key(self, key: str, lock_seconds: float) -> None:
+        """Extend the claim on key while its request is still running."""
+        locked_until = datetime.now(timezone.utc) + timedelta(seconds=lock_seconds)
+        query = (self.supabase.table('idempotency_keys')
+                .update({'locked_until': locked_until.isoformat()})
+                .eq('key', key)
+                .is_('response', 'null'))
+        await self._offload(query.execute)
+    
+    async def complete_idempotency_key(self, key: str, response: Dict[str, Any]) -> None:
+        """Store the response for a claimed key; repeats get it from now on."""
+        query = (self.supabase.table('idempotency_keys')
+                .update({'response': response})
+                .eq('key', key))
+        await self._offload(query.execute)
+    
+    async def release_idempotency_key(self, key: str) -> None:
+        """Drop the claim on key after its request failed, so a retry runs it again."""
+        query = (self.supabase.table('idempotency_keys')
+                .delete()
+                .eq('key', key)
+                .is_('response', 'null'))
+        await self._offload(query.execute)
+    
+    # === Archival ===
+    
+    async def get_oldest_created_at(self, table: str) -> Optional[datetime]:
+        """Get the created_at of the oldest row in a table."""
+        query = (self.supabase.table(table)
+                .select('created_at')
+                .order('created_at')
+                .limit(1))
+        result = await self._offload(query.execute)
+        
+        if result.data:
+            return datetime.fromisoformat(result.data[0]['created_at'])
+        return None
+    
+    async def iter_rows_in_range(
+        self,
+        table: str,
+        start: datetime,
+        end: datetime,
+        filters: Optional[Dict[str, Any]] = None,
+        exclude_statuses: Optional[List[str]] = None,
+        page_size: int = 1000,
+        descending: bool = False,
+        after: Optional[Tuple[str, str]] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield pages of raw rows with start <= created_at < end, ordered by (created_at, id).
+        
+        Pages are keyset-paged: each one starts after the (created_at, id) of
+        the last row of the previous page (or `after`), so rows deleted behind
+        the cursor, as archival does in batches, never shift the next page.
+        """
+        direction = 'lt' if descending else 'gt'
+        
+        while True:
+            query = (self.supabase.table(table)
+                    .select('*')
+                    .gte('created_at', start.isoformat())
+                    .lt('created_at', end.isoformat()))
+            for column, value in (filters or {}).items():
+                query = query.eq(column, value)
+            if exclude_statuses:
+                query = query.not_.in_('status', exclude_statuses)
+            if after:
+                created_at, row_id = after
+                query = query.or_(
+                    f'created_at.{direction}."{created_at}",'
+                    f'and(created_at.eq."{created_at}",id.{direction}.{row_id})'
+                )
+            
+            query = (query.order('created_at', desc=descending)
+                    .order('id', desc=descending)
+                    .limit(page_size))
+            result = await self._offload(query.execute)
+            
+            if result.data:
+                yield result.data
+            if len(result.data) < page_size:
+                return
+            after = (result.data[-1]['created_at'], result.data[-1]['id'])
+    
+    @writes
+    async def delete_rows(self, table: str, ids: List[str], start: datetime, end: datetime) -> int:
+        """Delete rows by ID within a created_at range (the range lets transactions prune partitions)."""
+        query = (self.supabase.table(table)
+                .delete()
+                .in_('id', ids)
+                .gte('created_at', start.isoformat())
+                .lt('created_at', end.isoformat()))
+        result = await self._offload(query.execute)
+        
+        return len(result.data)
+    
+    async def upload_archive(self, path: str, file: Union[bytes, str]) -> None:
+        """Upload (or replace) an archive file, given as bytes or a local path, in the private archives bucket."""
+        try:
+            await self._offload(
+                self.archive_client.storage.from_(ARCHIVE_BUCKET).upload,
+                path,
+                file,
+                file_options={"content-type": "application/vnd.apache.parquet", "upsert": "true"}
+            )
+        except Exception as e:
+            raise Exception(f"Failed to upload archive {path}: {str(e)}")
+    
+    async def download_archive(self, path: str) -> Optional[bytes]:
+        """Download an archive file; None if it does not exist."""
+        try:
+            return await self._offload(self.archive_client.storage.from_(ARCHIVE_BUCKET).download, path)
+        except Exception as e:
+            if 'not found' in str(e).lower() or '404' in str(e):
+                return None
+            raise Exception(f"Failed to download archive {path}: {str(e)}")
@@ -0,0 +1,134 @@
+-- ==============================================
+-- PaySwiftly Sharded Admin Stats Migration
+-- ==============================================
+-- Every completed payment used to increment the single admin_stats
+-- row 'revenue', so concurrent writers queued on one row lock.
+-- Counters now live in N shard rows:
+-- - Writers (update_admin_stats RPC and the transaction trigger)
+--   add to one randomly chosen shard
+-- - get_admin_stats() sums across shards
+-- - The 'revenue' row keeps the rarely-written fields
+--   (active drivers, payout totals)
+--
+-- Run after money_cents_migration.sql.
+-- ==============================================
+
+-- 1. Shard count (change together with the seed rows below)
+CREATE OR REPLACE FUNCTION admin_stats_shard_count()
+RETURNS INTEGER AS $$
+    SELECT 16;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- 2. Shard table
+CREATE TABLE IF NOT EXISTS admin_stats_shards (
+    shard SMALLINT PRIMARY KEY,
+    total_transactions BIGINT NOT NULL DEFAULT 0,
+    total_revenue_cents BIGINT NOT NULL DEFAULT 0,
+    total_platform_fees_cents BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+COMMENT ON TABLE admin_stats_shards IS 'Sharded lifetime counters; sum all rows for totals';
+
+INSERT INTO admin_stats_shards (shard)
+SELECT generate_series(0, admin_stats_shard_count() - 1)
+ON CONFLICT (shard) DO NOTHING;
+
+-- 3. Move existing totals into shard 0 (once)
+UPDATE admin_stats_shards s
+SET
+    total_transactions = s.total_transactions + a.total_transactions,
+    total_revenue_cents = s.total_revenue_cents + a.total_revenue_cents,
+    total_platform_fees_cents = s.total_platform_fees_cents + a.total_platform_fees_cents,
+    updated_at = NOW()
+FROM admin_stats a
+WHERE s.shard = 0
+  AND a.id = 'revenue'
+  AND a.total_transactions > 0;
+
+UPDATE admin_stats
+SET total_transactions = 0, total_revenue_cents = 0, total_platform_fees_cents = 0
+WHERE id = 'revenue';
+
+-- 4. Writers pick a random shard
+CREATE OR REPLACE FUNCTION update_admin_stats(
+    transaction_count INTEGER,
+    revenue_cents BIGINT,
+    platform_fee_cents BIGINT
+)
+RETURNS VOID AS $$
+DECLARE
+    -- Pick the shard once; random() in the WHERE clause would be re-evaluated per row
+    target_shard SMALLINT := floor(random() * admin_stats_shard_count())::SMALLINT;
+BEGIN
+    UPDATE admin_stats_shards
+    SET
+        total_transactions = total_transactions + transaction_count,
+        total_revenue_cents = total_revenue_cents + revenue_cents,
+        total_platform_fees_cents = total_platform_fees_cents + platform_fee_cents,
+        updated_at = NOW()
+    WHERE shard = target_shard;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION update_admin_stats_on_transaction()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status = 'completed' AND (OLD.status IS NULL OR OLD.status != 'completed') THEN
+        PERFORM update_admin_stats(1, NEW.amount_paid_cents, NEW.platform_fee_cents);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 5. Readers sum the shards
+CREATE OR REPLACE FUNCTION get_admin_stats()
+RETURNS TABLE(
+    total_transactions BIGINT,
+    total_revenue_cents BIGINT,
+    total_platform_fees_cents BIGINT,
+    active_drivers INTEGER,
+    total_payouts_cents BIGINT,
+    pending_payouts_cents BIGINT,
+    failed_payouts INTEGER,
+    updated_at TIMESTAMP WITH TIME ZONE
+) AS $$
+    SELECT
+        COALESCE(s.total_transactions, 0)::BIGINT,
+        COALESCE(s.total_revenue_cents, 0)::BIGINT,
+        COALESCE(s.total_platform_fees_cents, 0)::BIGINT,
+        COALESCE(a.active_drivers, 0),
+        COALESCE(a.total_payouts_cents, 0),
+        COALESCE(a.pending_payouts_cents, 0),
+        COALESCE(a.failed_payouts, 0),
+        GREATEST(s.updated_at, a.updated_at)
+    FROM (
+        SELECT
+            SUM(total_transactions) AS total_transactions,
+            SUM(total_revenue_cents) AS total_revenue_cents,
+            SUM(total_platform_fees_cents) AS total_platform_fees_cents,
+            MAX(updated_at) AS updated_at
+        FROM admin_stats_shards
+    ) s
+    LEFT JOIN admin_stats a ON a.id = 'revenue';
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION get_admin_stats IS 'Admin statistics summed across admin_stats_shards';
+
+-- 6. RLS and permissions
+ALTER TABLE admin_stats_shards ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow all operations on admin_stats_shards" ON admin_stats_shards FOR ALL USING (true);
+
+GRANT ALL ON admin_stats_shards TO postgres;
+GRANT EXECUTE ON FUNCTION update_admin_stats TO postgres;
+GRANT EXECUTE ON FUNCTION get_admin_stats TO postgres;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Per-shard spread (should be roughly even under load)
+-- SELECT shard, total_transactions FROM admin_stats_shards ORDER BY shard;
+
+-- Totals
+-- SELECT * FROM get_admin_stats();
@@ -0,0 +1,34 @@
+-- ==============================================
+-- PaySwiftly Archival Migration
+-- ==============================================
+-- Supports moving aged transactions, payouts and platform fees to
+-- Parquet files in Supabase Storage (app/archive.py):
+-- - Private 'archives' bucket
+-- - created_at indexes so the archival job can page payouts and
+--   platform fees by month (transactions already has one)
+--
+-- Run after transactions_partitioning_migration.sql.
+-- ==============================================
+
+-- 1. Private bucket for archive files
+INSERT INTO storage.buckets (id, name, public)
+VALUES ('archives', 'archives', false)
+ON CONFLICT (id) DO NOTHING;
+
+-- 2. Range indexes for archival
+CREATE INDEX IF NOT EXISTS idx_payouts_created_at ON payouts(created_at);
+CREATE INDEX IF NOT EXISTS idx_platform_fees_created_at ON platform_fees(created_at);
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Rows due for archival (default ARCHIVE_AFTER_DAYS=90)
+-- SELECT 'transactions', COUNT(*) FROM transactions WHERE created_at < NOW() - INTERVAL '90 days'
+-- UNION ALL
+-- SELECT 'payouts', COUNT(*) FROM payouts WHERE created_at < NOW() - INTERVAL '90 days'
+-- UNION ALL
+-- SELECT 'platform_fees', COUNT(*) FROM platform_fees WHERE created_at < NOW() - INTERVAL '90 days';
+
+-- Archive files
+-- SELECT name, metadata->>'size' AS bytes FROM storage.objects WHERE bucket_id = 'archives' ORDER BY name;
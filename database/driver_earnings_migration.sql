@@ -0,0 +1,189 @@
+-- ==============================================
+-- PaySwiftly Driver Earnings Rollups Migration
+-- ==============================================
+-- Per-driver earnings so dashboard totals are one indexed read
+-- however many transactions a driver has:
+-- - driver_earnings_daily: trips and earnings per driver per local day
+-- - driver_earnings_totals: lifetime trips and earnings per driver
+-- - Updated by the transaction trigger when a collection settles
+-- - get_driver_summary() returns today / this week / this month / lifetime
+--
+-- Days are Kenyan local days (Africa/Nairobi), weeks start on Monday.
+--
+-- Run after stats_rollups_migration.sql.
+-- ==============================================
+
+-- 1. Local day used for driver earnings
+CREATE OR REPLACE FUNCTION driver_local_date(ts TIMESTAMP WITH TIME ZONE)
+RETURNS DATE AS $$
+    SELECT (ts AT TIME ZONE 'Africa/Nairobi')::DATE;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- 2. Rollup tables
+CREATE TABLE IF NOT EXISTS driver_earnings_daily (
+    driver_id UUID NOT NULL REFERENCES drivers(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    trips INTEGER NOT NULL DEFAULT 0,
+    earnings_cents BIGINT NOT NULL DEFAULT 0,
+    revenue_cents BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (driver_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS driver_earnings_totals (
+    driver_id UUID PRIMARY KEY REFERENCES drivers(id) ON DELETE CASCADE,
+    trips BIGINT NOT NULL DEFAULT 0,
+    earnings_cents BIGINT NOT NULL DEFAULT 0,
+    revenue_cents BIGINT NOT NULL DEFAULT 0,
+    last_trip_at TIMESTAMP WITH TIME ZONE
+);
+
+COMMENT ON TABLE driver_earnings_daily IS 'Completed trips and driver earnings (cents) per driver per Nairobi day';
+COMMENT ON TABLE driver_earnings_totals IS 'Lifetime completed trips and driver earnings (cents) per driver';
+
+-- 3. Record one settled transaction
+CREATE OR REPLACE FUNCTION record_driver_earnings(
+    driver_id_param UUID,
+    earnings_cents BIGINT,
+    revenue_cents BIGINT,
+    completed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO driver_earnings_daily (driver_id, day, trips, earnings_cents, revenue_cents)
+    VALUES (driver_id_param, driver_local_date(completed_at), 1, earnings_cents, revenue_cents)
+    ON CONFLICT (driver_id, day) DO UPDATE SET
+        trips = driver_earnings_daily.trips + 1,
+        earnings_cents = driver_earnings_daily.earnings_cents + EXCLUDED.earnings_cents,
+        revenue_cents = driver_earnings_daily.revenue_cents + EXCLUDED.revenue_cents;
+
+    INSERT INTO driver_earnings_totals (driver_id, trips, earnings_cents, revenue_cents, last_trip_at)
+    VALUES (driver_id_param, 1, earnings_cents, revenue_cents, completed_at)
+    ON CONFLICT (driver_id) DO UPDATE SET
+        trips = driver_earnings_totals.trips + 1,
+        earnings_cents = driver_earnings_totals.earnings_cents + EXCLUDED.earnings_cents,
+        revenue_cents = driver_earnings_totals.revenue_cents + EXCLUDED.revenue_cents,
+        last_trip_at = GREATEST(driver_earnings_totals.last_trip_at, EXCLUDED.last_trip_at);
+END;
+$$ LANGUAGE plpgsql;
+
+-- 4. Transaction trigger: also record driver earnings on completion
+CREATE OR REPLACE FUNCTION update_admin_stats_on_transaction()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF transaction_is_completed(NEW.status::TEXT, NEW.collection_status)
+       AND (TG_OP = 'INSERT' OR NOT transaction_is_completed(OLD.status::TEXT, OLD.collection_status)) THEN
+        PERFORM update_admin_stats(1, NEW.amount_paid_cents, NEW.platform_fee_cents);
+        PERFORM record_stats_rollups(NEW.driver_id, NEW.amount_paid_cents, NEW.platform_fee_cents);
+        PERFORM record_driver_earnings(NEW.driver_id, NEW.driver_amount_cents, NEW.amount_paid_cents);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 5. Dashboard summary (at most ~37 daily rows plus one totals row)
+CREATE OR REPLACE FUNCTION get_driver_summary(driver_id_param UUID)
+RETURNS TABLE(
+    driver_id UUID,
+    as_of DATE,
+    today_trips BIGINT,
+    today_earnings_cents BIGINT,
+    week_trips BIGINT,
+    week_earnings_cents BIGINT,
+    month_trips BIGINT,
+    month_earnings_cents BIGINT,
+    lifetime_trips BIGINT,
+    lifetime_earnings_cents BIGINT,
+    last_trip_at TIMESTAMP WITH TIME ZONE
+) AS $$
+    WITH bounds AS (
+        SELECT
+            driver_local_date(NOW()) AS today,
+            date_trunc('week', driver_local_date(NOW()))::DATE AS week_start,
+            date_trunc('month', driver_local_date(NOW()))::DATE AS month_start
+    ),
+    recent AS (
+        SELECT
+            COALESCE(SUM(e.trips) FILTER (WHERE e.day = b.today), 0) AS today_trips,
+            COALESCE(SUM(e.earnings_cents) FILTER (WHERE e.day = b.today), 0) AS today_earnings_cents,
+            COALESCE(SUM(e.trips) FILTER (WHERE e.day >= b.week_start), 0) AS week_trips,
+            COALESCE(SUM(e.earnings_cents) FILTER (WHERE e.day >= b.week_start), 0) AS week_earnings_cents,
+            COALESCE(SUM(e.trips) FILTER (WHERE e.day >= b.month_start), 0) AS month_trips,
+            COALESCE(SUM(e.earnings_cents) FILTER (WHERE e.day >= b.month_start), 0) AS month_earnings_cents
+        FROM bounds b
+        LEFT JOIN driver_earnings_daily e
+            ON e.driver_id = driver_id_param
+           AND e.day >= LEAST(b.week_start, b.month_start)
+           AND e.day <= b.today
+    )
+    SELECT
+        d.id,
+        b.today,
+        r.today_trips::BIGINT,
+        r.today_earnings_cents::BIGINT,
+        r.week_trips::BIGINT,
+        r.week_earnings_cents::BIGINT,
+        r.month_trips::BIGINT,
+        r.month_earnings_cents::BIGINT,
+        COALESCE(t.trips, 0)::BIGINT,
+        COALESCE(t.earnings_cents, 0)::BIGINT,
+        t.last_trip_at
+    FROM drivers d
+    CROSS JOIN bounds b
+    CROSS JOIN recent r
+    LEFT JOIN driver_earnings_totals t ON t.driver_id = d.id
+    WHERE d.id = driver_id_param;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION get_driver_summary IS 'Driver earnings today / this week / this month / lifetime; no rows if the driver does not exist';
+
+-- 6. Backfill from existing completed transactions
+INSERT INTO driver_earnings_daily (driver_id, day, trips, earnings_cents, revenue_cents)
+SELECT
+    driver_id,
+    driver_local_date(COALESCE(collection_completed_at, updated_at, created_at)),
+    COUNT(*),
+    SUM(driver_amount_cents),
+    SUM(amount_paid_cents)
+FROM transactions
+WHERE transaction_is_completed(status::TEXT, collection_status)
+GROUP BY 1, 2
+ON CONFLICT (driver_id, day) DO NOTHING;
+
+INSERT INTO driver_earnings_totals (driver_id, trips, earnings_cents, revenue_cents, last_trip_at)
+SELECT
+    driver_id,
+    COUNT(*),
+    SUM(driver_amount_cents),
+    SUM(amount_paid_cents),
+    MAX(COALESCE(collection_completed_at, updated_at, created_at))
+FROM transactions
+WHERE transaction_is_completed(status::TEXT, collection_status)
+GROUP BY driver_id
+ON CONFLICT (driver_id) DO NOTHING;
+
+-- 7. RLS and permissions
+ALTER TABLE driver_earnings_daily ENABLE ROW LEVEL SECURITY;
+ALTER TABLE driver_earnings_totals ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow all operations on driver_earnings_daily" ON driver_earnings_daily FOR ALL USING (true);
+CREATE POLICY "Allow all operations on driver_earnings_totals" ON driver_earnings_totals FOR ALL USING (true);
+
+GRANT ALL ON driver_earnings_daily TO postgres;
+GRANT ALL ON driver_earnings_totals TO postgres;
+GRANT EXECUTE ON FUNCTION record_driver_earnings TO postgres;
+GRANT EXECUTE ON FUNCTION get_driver_summary TO postgres;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Summary for one driver
+-- SELECT * FROM get_driver_summary('driver-uuid-here');
+
+-- Totals agree with transactions
+-- SELECT t.driver_id, t.trips, COUNT(x.id)
+-- FROM driver_earnings_totals t
+-- JOIN transactions x ON x.driver_id = t.driver_id
+--     AND transaction_is_completed(x.status::TEXT, x.collection_status)
+-- GROUP BY t.driver_id, t.trips
+-- HAVING t.trips != COUNT(x.id);
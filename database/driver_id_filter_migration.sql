@@ -0,0 +1,31 @@
+-- ==============================================
+-- PaySwiftly Driver ID Filter Migration
+-- ==============================================
+-- With DRIVER_ID_FILTER=true each app worker keeps a Bloom filter of
+-- known driver IDs (app/lookup_filters.py), so lookups for IDs that do
+-- not exist are answered without a query. Workers top the filter up
+-- with drivers created since their last refresh:
+--   SELECT id FROM drivers WHERE created_at >= <last refresh>
+-- This index keeps that refresh from scanning the whole table.
+--
+-- Run after phone_normalized_migration.sql.
+-- ==============================================
+
+-- 1. Index for incremental filter refreshes
+CREATE INDEX IF NOT EXISTS idx_drivers_created_at
+    ON drivers(created_at);
+
+ANALYZE drivers;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Refreshes should use idx_drivers_created_at
+-- EXPLAIN SELECT id FROM drivers WHERE created_at >= NOW() - INTERVAL '2 minutes';
+
+-- ==============================================
+-- Rollback (if needed)
+-- ==============================================
+
+-- DROP INDEX IF EXISTS idx_drivers_created_at;
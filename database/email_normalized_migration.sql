@@ -0,0 +1,42 @@
+-- ==============================================
+-- PaySwiftly Normalized Email Migration
+-- ==============================================
+-- Adds drivers.email_normalized: the driver's email trimmed and
+-- lower-cased, kept up to date by Postgres (generated column), with an
+-- index. Bulk onboarding (app/bulk_onboarding.py) looks registered emails
+-- up by this column, so "Jane@Fleet.co.ke" in a CSV matches an existing
+-- "jane@fleet.co.ke".
+--
+-- Existing rows are filled when the column is added; no backfill needed.
+-- Run before deploying the app.
+--
+-- Run after settlement_migration.sql.
+-- ==============================================
+
+-- 1. Column
+ALTER TABLE drivers
+    ADD COLUMN IF NOT EXISTS email_normalized VARCHAR(255)
+    GENERATED ALWAYS AS (lower(btrim(email))) STORED;
+
+COMMENT ON COLUMN drivers.email_normalized IS 'Email trimmed and lower-cased; duplicate check for bulk onboarding';
+
+-- 2. Lookup index
+CREATE INDEX IF NOT EXISTS idx_drivers_email_normalized
+    ON drivers(email_normalized);
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Emails that only differ in case (should be merged by hand)
+-- SELECT email_normalized, array_agg(email) FROM drivers GROUP BY email_normalized HAVING COUNT(*) > 1;
+
+-- Bulk onboarding lookups should use idx_drivers_email_normalized
+-- EXPLAIN SELECT email_normalized FROM drivers WHERE email_normalized IN ('jane@fleet.co.ke');
+
+-- ==============================================
+-- Rollback (if needed)
+-- ==============================================
+
+-- DROP INDEX IF EXISTS idx_drivers_email_normalized;
+-- ALTER TABLE drivers DROP COLUMN IF EXISTS email_normalized;
@@ -0,0 +1,127 @@
+-- ==============================================
+-- PaySwiftly Idempotency Keys Migration
+-- ==============================================
+-- Shared idempotency keys for /api/pay (IDEMPOTENCY_SHARED=true, see
+-- app/idempotency.py), so a retried payment that lands on another worker
+-- gets the original response instead of a second STK push:
+-- - idempotency_keys holds one row per key: the hash of the request that
+--   claimed it and, once that request succeeded, its response
+-- - claim_idempotency_key() atomically claims a key, or returns the
+--   existing claim. Expired keys, and claims whose worker stopped before
+--   finishing (locked_until passed, no response), can be claimed again
+-- - purge_idempotency_keys() deletes expired keys; the app never reads
+--   them, so this only bounds the table size
+--
+-- Run after short_codes_migration.sql.
+-- ==============================================
+
+-- 1. Keys (the primary key is the only lookup)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(300) PRIMARY KEY,
+    request_hash CHAR(64) NOT NULL,
+    response JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_until TIMESTAMPTZ NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys (expires_at);
+
+COMMENT ON TABLE idempotency_keys IS 'Idempotency-Key claims and stored responses for /api/pay';
+
+-- 2. Claiming
+CREATE OR REPLACE FUNCTION claim_idempotency_key(
+    p_key TEXT,
+    p_request_hash TEXT,
+    p_ttl_seconds INT,
+    p_lock_seconds INT DEFAULT 60
+)
+RETURNS JSONB AS $$
+DECLARE
+    existing idempotency_keys%ROWTYPE;
+BEGIN
+    LOOP
+        INSERT INTO idempotency_keys (key, request_hash, locked_until, expires_at)
+        VALUES (
+            p_key,
+            p_request_hash,
+            NOW() + make_interval(secs => p_lock_seconds),
+            NOW() + make_interval(secs => p_ttl_seconds)
+        )
+        ON CONFLICT (key) DO UPDATE
+            SET request_hash = EXCLUDED.request_hash,
+                response = NULL,
+                created_at = NOW(),
+                locked_until = EXCLUDED.locked_until,
+                expires_at = EXCLUDED.expires_at
+            WHERE idempotency_keys.expires_at < NOW()
+               OR (idempotency_keys.response IS NULL AND idempotency_keys.locked_until < NOW());
+
+        IF FOUND THEN
+            RETURN jsonb_build_object('claimed', true);
+        END IF;
+
+        SELECT * INTO existing FROM idempotency_keys WHERE key = p_key;
+        IF FOUND THEN
+            RETURN jsonb_build_object(
+                'claimed', false,
+                'request_hash', existing.request_hash,
+                'response', existing.response
+            );
+        END IF;
+        -- Released (deleted) between the two statements: try again
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION claim_idempotency_key IS 'Claim an idempotency key, or return the existing claim';
+
+-- 3. Cleanup
+CREATE OR REPLACE FUNCTION purge_idempotency_keys()
+RETURNS INT AS $$
+DECLARE
+    deleted INT;
+BEGIN
+    DELETE FROM idempotency_keys WHERE expires_at < NOW();
+    GET DIAGNOSTICS deleted = ROW_COUNT;
+    RETURN deleted;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Hourly via pg_cron, when the extension is enabled
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule(
+            'purge-idempotency-keys',
+            '17 * * * *',
+            'SELECT purge_idempotency_keys()'
+        );
+    END IF;
+END $$;
+
+-- 4. RLS and permissions
+ALTER TABLE idempotency_keys ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow all operations on idempotency_keys" ON idempotency_keys FOR ALL USING (true);
+
+GRANT ALL ON idempotency_keys TO postgres;
+GRANT EXECUTE ON FUNCTION claim_idempotency_key TO postgres;
+GRANT EXECUTE ON FUNCTION purge_idempotency_keys TO postgres;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- First call claims, second returns the claim (response null until stored)
+-- SELECT claim_idempotency_key('key:test', repeat('a', 64), 60);
+-- SELECT claim_idempotency_key('key:test', repeat('a', 64), 60);
+-- DELETE FROM idempotency_keys WHERE key = 'key:test';
+
+-- ==============================================
+-- Rollback (if needed)
+-- ==============================================
+
+-- SELECT cron.unschedule('purge-idempotency-keys');
+-- DROP FUNCTION IF EXISTS purge_idempotency_keys();
+-- DROP FUNCTION IF EXISTS claim_idempotency_key(TEXT, TEXT, INT, INT);
+-- DROP TABLE IF EXISTS idempotency_keys;
@@ -10,6 +10,7 @@ from datetime import datetime
 from typing import List, Dict, Any
 from supabase import create_client, Client
 import json
+from decimal import Decimal, ROUND_HALF_UP
 
 # You'll need to install firebase-admin for this migration
 try:
@@ -20,6 +21,11 @@ except ImportError:
     FIREBASE_AVAILABLE = False
     print("Firebase admin not available. Install with: pip install firebase-admin")
 
+def _cents(value) -> int:
+    """Convert a Firebase shilling amount to integer cents (money columns are stored in cents)."""
+    return int((Decimal(str(value or 0)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
 class DatabaseMigrator:
     def __init__(self, supabase_url: str, supabase_key: str, firebase_credentials_path: str = None):
         self.supabase: Client = create_client(supabase_url, supabase_key)
@@ -54,8 +60,8 @@ class DatabaseMigrator:
                 'vehicle_type': driver_data.get('vehicle_type', 'boda'),
                 'vehicle_number': driver_data.get('vehicle_number', ''),
                 'qr_code_url': driver_data.get('qr_code_url'),
-                'balance': float(driver_data.get('balance', 0)),
-                'total_earnings': float(driver_data.get('total_earnings', 0)),
+                'balance_cents': _cents(driver_data.get('balance', 0)),
+                'total_earnings_cents': _cents(driver_data.get('total_earnings', 0)),
                 'created_at': driver_data.get('created_at').isoformat() if driver_data.get('created_at') else datetime.utcnow().isoformat(),
                 'updated_at': driver_data.get('updated_at').isoformat() if driver_data.get('updated_at') else datetime.utcnow().isoformat()
             }
@@ -91,9 +97,9 @@ class DatabaseMigrator:
                 'id': doc.id,
                 'driver_id': transaction_data.get('driver_id', ''),
                 'passenger_phone': transaction_data.get('passenger_phone', ''),
-                'amount_paid': float(transaction_data.get('amount_paid', 0)),
-                'platform_fee': float(transaction_data.get('platform_fee', 0)),
-                'driver_amount': float(transaction_data.get('driver_amount', 0)),
+                'amount_paid_cents': _cents(transaction_data.get('amount_paid', 0)),
+                'platform_fee_cents': _cents(transaction_data.get('platform_fee', 0)),
+                'driver_amount_cents': _cents(transaction_data.get('driver_amount', 0)),
                 'status': transaction_data.get('status', 'pending'),
                 'mpesa_receipt': transaction_data.get('mpesa_receipt'),
                 'checkout_request_id': transaction_data.get('checkout_request_id'),
@@ -129,8 +135,8 @@ class DatabaseMigrator:
             supabase_stats = {
                 'id': 'revenue',
                 'total_transactions': stats_data.get('total_transactions', 0),
-                'total_revenue': float(stats_data.get('total_revenue', 0)),
-                'total_platform_fees': float(stats_data.get('total_platform_fees', 0)),
+                'total_revenue_cents': _cents(stats_data.get('total_revenue', 0)),
+                'total_platform_fees_cents': _cents(stats_data.get('total_platform_fees', 0)),
                 'active_drivers': stats_data.get('active_drivers', 0),
                 'updated_at': stats_data.get('updated_at').isoformat() if stats_data.get('updated_at') else datetime.utcnow().isoformat()
             }
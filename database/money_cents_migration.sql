@@ -0,0 +1,310 @@
+-- ==============================================
+-- PaySwiftly Integer-Cents Money Migration
+-- ==============================================
+-- Money is stored as BIGINT minor units (cents) everywhere:
+-- - Each DECIMAL money column gets a <name>_cents BIGINT column
+-- - The old DECIMAL column becomes a read-only generated column
+--   (<name>_cents / 100) so reports and SQL reads keep working
+-- - RPC functions and triggers take and add cents, so totals are exact
+--
+-- Run after batch_payout_migration.sql and payout_reconciliation_migration.sql.
+-- The application writes *_cents columns only.
+-- ==============================================
+
+-- 1. Drop objects that depend on the columns being replaced
+DROP VIEW IF EXISTS transaction_summary;
+DROP VIEW IF EXISTS drivers_for_payout;
+DROP INDEX IF EXISTS idx_drivers_pending_balance;
+
+-- 2. Convert money columns to cents
+-- Helper: add <col>_cents, backfill it, and turn <col> into a generated mirror
+CREATE OR REPLACE FUNCTION _money_column_to_cents(
+    table_name_param TEXT,
+    column_name_param TEXT,
+    not_null_param BOOLEAN
+)
+RETURNS void AS $$
+DECLARE
+    cents_column TEXT := column_name_param || '_cents';
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'public'
+          AND table_name = table_name_param
+          AND column_name = cents_column
+    ) THEN
+        RETURN;  -- already migrated
+    END IF;
+
+    EXECUTE format('ALTER TABLE %I ADD COLUMN %I BIGINT', table_name_param, cents_column);
+    EXECUTE format('UPDATE %I SET %I = ROUND(%I * 100)::BIGINT',
+                   table_name_param, cents_column, column_name_param);
+
+    IF not_null_param THEN
+        EXECUTE format('UPDATE %I SET %I = 0 WHERE %I IS NULL',
+                       table_name_param, cents_column, cents_column);
+        EXECUTE format('ALTER TABLE %I ALTER COLUMN %I SET DEFAULT 0, ALTER COLUMN %I SET NOT NULL',
+                       table_name_param, cents_column, cents_column);
+    END IF;
+
+    EXECUTE format('ALTER TABLE %I DROP COLUMN %I', table_name_param, column_name_param);
+    EXECUTE format(
+        'ALTER TABLE %I ADD COLUMN %I DECIMAL(15,2) GENERATED ALWAYS AS ((%I::DECIMAL / 100)::DECIMAL(15,2)) STORED',
+        table_name_param, column_name_param, cents_column
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT _money_column_to_cents('drivers', 'balance', true);
+SELECT _money_column_to_cents('drivers', 'total_earnings', true);
+SELECT _money_column_to_cents('drivers', 'pending_balance', true);
+SELECT _money_column_to_cents('drivers', 'paid_balance', true);
+
+SELECT _money_column_to_cents('transactions', 'amount_paid', true);
+SELECT _money_column_to_cents('transactions', 'platform_fee', true);
+SELECT _money_column_to_cents('transactions', 'driver_amount', true);
+SELECT _money_column_to_cents('transactions', 'fee_fixed', true);
+
+SELECT _money_column_to_cents('payouts', 'amount', true);
+
+SELECT _money_column_to_cents('platform_fees', 'amount', true);
+SELECT _money_column_to_cents('platform_fees', 'fixed_amount_applied', false);
+
+SELECT _money_column_to_cents('admin_stats', 'total_revenue', true);
+SELECT _money_column_to_cents('admin_stats', 'total_platform_fees', true);
+SELECT _money_column_to_cents('admin_stats', 'total_payouts', true);
+SELECT _money_column_to_cents('admin_stats', 'pending_payouts', true);
+
+DROP FUNCTION _money_column_to_cents(TEXT, TEXT, BOOLEAN);
+
+-- Batch payouts are not tied to a single transaction
+ALTER TABLE payouts ALTER COLUMN transaction_id DROP NOT NULL;
+
+-- 3. Replace RPC functions with cent-based versions
+DROP FUNCTION IF EXISTS update_driver_balance(UUID, DECIMAL);
+DROP FUNCTION IF EXISTS update_admin_stats(INTEGER, DECIMAL, DECIMAL);
+DROP FUNCTION IF EXISTS add_to_pending_balance(UUID, DECIMAL);
+DROP FUNCTION IF EXISTS process_batch_payout(UUID, DECIMAL, VARCHAR);
+
+CREATE OR REPLACE FUNCTION update_driver_balance(driver_id UUID, amount_cents BIGINT)
+RETURNS VOID AS $$
+BEGIN
+    UPDATE drivers
+    SET
+        balance_cents = balance_cents + amount_cents,
+        total_earnings_cents = total_earnings_cents + amount_cents,
+        updated_at = NOW()
+    WHERE id = driver_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION update_admin_stats(
+    transaction_count INTEGER,
+    revenue_cents BIGINT,
+    platform_fee_cents BIGINT
+)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO admin_stats (id, total_transactions, total_revenue_cents, total_platform_fees_cents, updated_at)
+    VALUES ('revenue', transaction_count, revenue_cents, platform_fee_cents, NOW())
+    ON CONFLICT (id) DO UPDATE SET
+        total_transactions = admin_stats.total_transactions + transaction_count,
+        total_revenue_cents = admin_stats.total_revenue_cents + revenue_cents,
+        total_platform_fees_cents = admin_stats.total_platform_fees_cents + platform_fee_cents,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION add_to_pending_balance(
+    driver_id_param UUID,
+    amount_cents_param BIGINT
+)
+RETURNS void AS $$
+BEGIN
+    UPDATE drivers
+    SET pending_balance_cents = pending_balance_cents + amount_cents_param,
+        updated_at = NOW()
+    WHERE id = driver_id_param;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION add_to_pending_balance IS 'Atomically add amount (cents) to driver pending balance';
+
+CREATE OR REPLACE FUNCTION process_batch_payout(
+    driver_id_param UUID,
+    amount_cents_param BIGINT,
+    tracking_id_param VARCHAR
+)
+RETURNS void AS $$
+BEGIN
+    -- Move the paid amount from pending to paid balance
+    UPDATE drivers
+    SET
+        pending_balance_cents = pending_balance_cents - amount_cents_param,
+        paid_balance_cents = paid_balance_cents + amount_cents_param,
+        last_payout_date = NOW(),
+        updated_at = NOW()
+    WHERE id = driver_id_param;
+
+    -- Create payout record
+    INSERT INTO payouts (
+        driver_id,
+        transaction_id,
+        amount_cents,
+        tracking_id,
+        status,
+        created_at
+    ) VALUES (
+        driver_id_param,
+        NULL,  -- Batch payout, not tied to single transaction
+        amount_cents_param,
+        tracking_id_param,
+        'processing',
+        NOW()
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION process_batch_payout IS 'Process batch payout for driver (amount in cents)';
+
+CREATE OR REPLACE FUNCTION reconcile_payouts(results JSONB)
+RETURNS TABLE(completed INTEGER, failed INTEGER) AS $$
+BEGIN
+    RETURN QUERY
+    WITH r AS (
+        SELECT *
+        FROM jsonb_to_recordset(results)
+            AS x(tracking_id VARCHAR, status VARCHAR, failure_reason TEXT, response JSONB)
+        WHERE x.status IN ('completed', 'failed')
+    ),
+    updated AS (
+        UPDATE payouts p
+        SET
+            status = r.status,
+            intasend_response = COALESCE(r.response, p.intasend_response),
+            failure_reason = COALESCE(r.failure_reason, p.failure_reason),
+            completed_at = CASE WHEN r.status = 'completed' THEN NOW() ELSE p.completed_at END,
+            updated_at = NOW()
+        FROM r
+        WHERE p.tracking_id = r.tracking_id
+          AND p.status = 'processing'
+        RETURNING p.driver_id, p.amount_cents, p.status
+    ),
+    -- Failed payouts never reached the driver: move the amount back to pending
+    restored AS (
+        UPDATE drivers d
+        SET
+            pending_balance_cents = d.pending_balance_cents + f.amount_cents,
+            paid_balance_cents = d.paid_balance_cents - f.amount_cents,
+            updated_at = NOW()
+        FROM (
+            SELECT driver_id, SUM(amount_cents) AS amount_cents
+            FROM updated
+            WHERE status = 'failed'
+            GROUP BY driver_id
+        ) f
+        WHERE d.id = f.driver_id
+        RETURNING d.id
+    )
+    SELECT
+        COUNT(*) FILTER (WHERE u.status = 'completed')::INTEGER,
+        COUNT(*) FILTER (WHERE u.status = 'failed')::INTEGER
+    FROM updated u;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 4. Replace trigger functions
+CREATE OR REPLACE FUNCTION update_driver_earnings_on_payout()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status = 'completed' AND (OLD.status IS NULL OR OLD.status != 'completed') THEN
+        UPDATE drivers
+        SET
+            total_earnings_cents = total_earnings_cents + NEW.amount_cents,
+            balance_cents = balance_cents + NEW.amount_cents,
+            updated_at = NOW()
+        WHERE id = NEW.driver_id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION update_admin_stats_on_transaction()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status = 'completed' AND (OLD.status IS NULL OR OLD.status != 'completed') THEN
+        UPDATE admin_stats
+        SET
+            total_transactions = total_transactions + 1,
+            total_revenue_cents = total_revenue_cents + NEW.amount_paid_cents,
+            total_platform_fees_cents = total_platform_fees_cents + NEW.platform_fee_cents,
+            updated_at = NOW()
+        WHERE id = 'revenue';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 5. Recreate views and indexes
+CREATE OR REPLACE VIEW transaction_summary AS
+SELECT
+    t.id,
+    t.driver_id,
+    d.name as driver_name,
+    d.phone as driver_phone,
+    t.passenger_phone,
+    t.amount_paid_cents,
+    t.platform_fee_cents,
+    t.driver_amount_cents,
+    t.amount_paid,
+    t.platform_fee,
+    t.driver_amount,
+    t.status,
+    t.collection_status,
+    t.payout_status,
+    p.tracking_id as payout_tracking_id,
+    p.status as payout_detail_status,
+    t.created_at,
+    t.collection_completed_at,
+    t.payout_completed_at
+FROM transactions t
+LEFT JOIN drivers d ON t.driver_id = d.id
+LEFT JOIN payouts p ON t.id = p.transaction_id
+ORDER BY t.created_at DESC;
+
+CREATE OR REPLACE VIEW drivers_for_payout AS
+SELECT
+    id,
+    name,
+    phone,
+    pending_balance_cents,
+    paid_balance_cents,
+    last_payout_date,
+    payout_schedule
+FROM drivers
+WHERE pending_balance_cents >= 10000  -- Minimum threshold (KES 100)
+ORDER BY pending_balance_cents DESC;
+
+COMMENT ON VIEW drivers_for_payout IS 'Drivers eligible for batch payout (balance >= KES 100)';
+
+CREATE INDEX IF NOT EXISTS idx_drivers_pending_balance_cents
+    ON drivers(pending_balance_cents) WHERE pending_balance_cents >= 10000;
+
+-- 6. Grant permissions
+GRANT SELECT ON transaction_summary TO postgres;
+GRANT SELECT ON drivers_for_payout TO postgres;
+GRANT EXECUTE ON FUNCTION update_driver_balance TO postgres;
+GRANT EXECUTE ON FUNCTION update_admin_stats TO postgres;
+GRANT EXECUTE ON FUNCTION add_to_pending_balance TO postgres;
+GRANT EXECUTE ON FUNCTION process_batch_payout TO postgres;
+GRANT EXECUTE ON FUNCTION reconcile_payouts TO postgres;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Cent totals match the shilling mirrors exactly
+-- SELECT SUM(amount_paid_cents), SUM(amount_paid) FROM transactions;
+
+-- Check drivers with pending balance
+-- SELECT id, name, pending_balance_cents, pending_balance FROM drivers WHERE pending_balance_cents > 0;
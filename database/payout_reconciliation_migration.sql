@@ -0,0 +1,82 @@
+-- ==============================================
+-- PaySwiftly Payout Reconciliation Migration
+-- ==============================================
+-- Supports the payout reconciler (app/reconciler.py), which polls
+-- IntaSend for payouts left in 'processing' and applies the final
+-- states in one call:
+-- - Marks payouts completed/failed in a single set-based UPDATE
+-- - Returns failed payout amounts to driver pending balances
+-- ==============================================
+
+-- 1. Index for in-flight payout scans (status = 'processing' ORDER BY created_at)
+CREATE INDEX IF NOT EXISTS idx_payouts_status_created_at
+    ON payouts(status, created_at);
+
+-- 2. Bulk-apply payout results
+-- results: [{"tracking_id": "...", "status": "completed"|"failed",
+--            "failure_reason": "...", "response": {...}}, ...]
+CREATE OR REPLACE FUNCTION reconcile_payouts(results JSONB)
+RETURNS TABLE(completed INTEGER, failed INTEGER) AS $$
+BEGIN
+    RETURN QUERY
+    WITH r AS (
+        SELECT *
+        FROM jsonb_to_recordset(results)
+            AS x(tracking_id VARCHAR, status VARCHAR, failure_reason TEXT, response JSONB)
+        WHERE x.status IN ('completed', 'failed')
+    ),
+    updated AS (
+        UPDATE payouts p
+        SET
+            status = r.status,
+            intasend_response = COALESCE(r.response, p.intasend_response),
+            failure_reason = COALESCE(r.failure_reason, p.failure_reason),
+            completed_at = CASE WHEN r.status = 'completed' THEN NOW() ELSE p.completed_at END,
+            updated_at = NOW()
+        FROM r
+        WHERE p.tracking_id = r.tracking_id
+          AND p.status = 'processing'
+        RETURNING p.driver_id, p.amount, p.status
+    ),
+    -- Failed payouts never reached the driver: move the amount back to pending
+    restored AS (
+        UPDATE drivers d
+        SET
+            pending_balance = d.pending_balance + f.amount,
+            paid_balance = d.paid_balance - f.amount,
+            updated_at = NOW()
+        FROM (
+            SELECT driver_id, SUM(amount) AS amount
+            FROM updated
+            WHERE status = 'failed'
+            GROUP BY driver_id
+        ) f
+        WHERE d.id = f.driver_id
+        RETURNING d.id
+    )
+    SELECT
+        COUNT(*) FILTER (WHERE u.status = 'completed')::INTEGER,
+        COUNT(*) FILTER (WHERE u.status = 'failed')::INTEGER
+    FROM updated u;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION reconcile_payouts IS 'Apply final IntaSend payout states and restore balances for failed payouts';
+
+-- 3. Grant permissions
+GRANT EXECUTE ON FUNCTION reconcile_payouts TO postgres;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Payouts stuck in processing for over an hour
+-- SELECT id, driver_id, amount, tracking_id, created_at FROM payouts
+-- WHERE status = 'processing' AND created_at < NOW() - INTERVAL '1 hour';
+
+-- ==============================================
+-- Rollback (if needed)
+-- ==============================================
+
+-- DROP FUNCTION IF EXISTS reconcile_payouts(JSONB);
+-- DROP INDEX IF EXISTS idx_payouts_status_created_at;
@@ -0,0 +1,45 @@
+-- ==============================================
+-- PaySwiftly Normalized Phone Migration
+-- ==============================================
+-- Adds drivers.phone_normalized: the driver's phone in E.164
+-- (+254XXXXXXXXX) as produced by app/phone.py, with a unique index.
+-- Login, driver lookup and batch payouts match on this column, so
+-- "0712 345 678", "254712345678" and "+254712345678" find the same driver.
+--
+-- Deploy order:
+-- 1. Run this migration
+-- 2. python scripts/backfill_phone_normalized.py  (fills existing drivers)
+-- 3. Deploy the app (new drivers get phone_normalized on insert)
+-- 4. Optionally run step 3 below to make the column required
+--
+-- Run after query_indexes_migration.sql.
+-- ==============================================
+
+-- 1. Column
+ALTER TABLE drivers ADD COLUMN IF NOT EXISTS phone_normalized VARCHAR(16);
+
+COMMENT ON COLUMN drivers.phone_normalized IS 'Phone in E.164 (+254XXXXXXXXX); lookup key for login and payouts';
+
+-- 2. Unique lookup index (NULLs are allowed until the backfill has run)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_drivers_phone_normalized
+    ON drivers(phone_normalized);
+
+-- 3. After the backfill reports no invalid or duplicate numbers:
+-- ALTER TABLE drivers ALTER COLUMN phone_normalized SET NOT NULL;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Drivers not yet backfilled
+-- SELECT id, name, phone FROM drivers WHERE phone_normalized IS NULL;
+
+-- Login lookups should use idx_drivers_phone_normalized
+-- EXPLAIN SELECT * FROM drivers WHERE phone_normalized = '+254712345678';
+
+-- ==============================================
+-- Rollback (if needed)
+-- ==============================================
+
+-- DROP INDEX IF EXISTS idx_drivers_phone_normalized;
+-- ALTER TABLE drivers DROP COLUMN IF EXISTS phone_normalized;
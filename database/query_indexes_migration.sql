@@ -0,0 +1,119 @@
+-- ==============================================
+-- PaySwiftly Query Indexes Migration
+-- ==============================================
+-- Replaces single-column indexes with composite and partial indexes
+-- shaped after the queries SupabaseManager (app/supabase_util.py)
+-- actually runs. Each index below names the method it serves.
+--
+-- Indexes whose leading column is covered by a new composite index are
+-- dropped, so writes do not maintain two copies of the same key.
+--
+-- scripts/check_indexes.py runs EXPLAIN (ANALYZE) for every query shape
+-- against a seeded local database and fails on any sequential scan.
+--
+-- Run after archive_migration.sql. Indexes on the partitioned
+-- transactions table are created on every partition.
+-- ==============================================
+
+-- 1. Transactions
+-- get_driver_transactions, query_transactions:
+--   WHERE driver_id = $1 AND created_at >= $2 ORDER BY created_at DESC LIMIT $3
+CREATE INDEX IF NOT EXISTS idx_transactions_driver_id_created_at
+    ON transactions(driver_id, created_at DESC);
+DROP INDEX IF EXISTS idx_transactions_driver_id;
+
+-- get_stale_pending_transactions (reconciler):
+--   WHERE status = 'pending' AND intasend_collection_id IS NOT NULL
+--     AND created_at >= $1 AND created_at < $2 ORDER BY created_at
+CREATE INDEX IF NOT EXISTS idx_transactions_pending_created_at
+    ON transactions(created_at)
+    WHERE status = 'pending' AND intasend_collection_id IS NOT NULL;
+
+-- get_transaction_by_collection_id (webhooks): WHERE intasend_collection_id = $1
+-- Most rows are looked up once, and rows without an ID are never looked up
+DROP INDEX IF EXISTS idx_transactions_intasend_collection_id;
+CREATE INDEX IF NOT EXISTS idx_transactions_intasend_collection_id
+    ON transactions(intasend_collection_id)
+    WHERE intasend_collection_id IS NOT NULL;
+
+-- get_transaction_by_checkout_id, update_transaction_status:
+--   WHERE checkout_request_id = $1
+DROP INDEX IF EXISTS idx_transactions_checkout_request_id;
+CREATE INDEX IF NOT EXISTS idx_transactions_checkout_request_id
+    ON transactions(checkout_request_id)
+    WHERE checkout_request_id IS NOT NULL;
+
+-- Not filtered on by any query; the status and created_at indexes cover
+-- the rest (idx_transactions_status_created_at, idx_transactions_created_at)
+DROP INDEX IF EXISTS idx_transactions_status;
+DROP INDEX IF EXISTS idx_transactions_collection_status;
+DROP INDEX IF EXISTS idx_transactions_payout_status;
+DROP INDEX IF EXISTS idx_transactions_intasend_tracking_id;
+
+-- 2. Payouts
+-- get_driver_payouts: WHERE driver_id = $1 ORDER BY created_at DESC LIMIT $2
+CREATE INDEX IF NOT EXISTS idx_payouts_driver_id_created_at
+    ON payouts(driver_id, created_at DESC);
+DROP INDEX IF EXISTS idx_payouts_driver_id;
+
+-- get_pending_payouts: WHERE status = 'pending' ORDER BY created_at DESC LIMIT $1
+CREATE INDEX IF NOT EXISTS idx_payouts_pending_created_at
+    ON payouts(created_at DESC)
+    WHERE status = 'pending';
+
+-- get_processing_payouts (payout reconciler):
+--   WHERE status = 'processing' AND tracking_id IS NOT NULL ORDER BY created_at LIMIT $1
+CREATE INDEX IF NOT EXISTS idx_payouts_processing_created_at
+    ON payouts(created_at)
+    WHERE status = 'processing' AND tracking_id IS NOT NULL;
+
+-- get_payout_by_tracking_id, reconcile_payouts(): WHERE tracking_id = $1
+-- Served by the UNIQUE constraint's index (payouts_tracking_id_key)
+DROP INDEX IF EXISTS idx_payouts_tracking_id;
+
+-- Leading column covered by idx_payouts_status_created_at
+DROP INDEX IF EXISTS idx_payouts_status;
+
+-- 3. Drivers
+-- get_driver_by_phone: WHERE phone = $1
+-- Served by the UNIQUE constraint's index (drivers_phone_key)
+DROP INDEX IF EXISTS idx_drivers_phone;
+
+-- Duplicate of the UNIQUE constraint's index (drivers_email_key)
+DROP INDEX IF EXISTS idx_drivers_email;
+
+-- Refresh planner statistics for the new indexes
+ANALYZE transactions;
+ANALYZE payouts;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Index sizes and how often each has been used since the last stats reset
+-- SELECT relname, indexrelname, idx_scan, pg_size_pretty(pg_relation_size(indexrelid)) AS size
+-- FROM pg_stat_user_indexes
+-- WHERE relname IN ('transactions', 'payouts') OR relname LIKE 'transactions_%'
+-- ORDER BY relname, indexrelname;
+
+-- Driver history should use idx_transactions_driver_id_created_at
+-- EXPLAIN SELECT * FROM transactions
+-- WHERE driver_id = 'driver-uuid-here' AND created_at >= NOW() - INTERVAL '90 days'
+-- ORDER BY created_at DESC LIMIT 50;
+
+-- ==============================================
+-- Rollback (if needed)
+-- ==============================================
+
+-- DROP INDEX IF EXISTS idx_transactions_driver_id_created_at;
+-- DROP INDEX IF EXISTS idx_transactions_pending_created_at;
+-- DROP INDEX IF EXISTS idx_payouts_driver_id_created_at;
+-- DROP INDEX IF EXISTS idx_payouts_pending_created_at;
+-- DROP INDEX IF EXISTS idx_payouts_processing_created_at;
+-- CREATE INDEX idx_transactions_driver_id ON transactions(driver_id);
+-- CREATE INDEX idx_transactions_status ON transactions(status);
+-- CREATE INDEX idx_payouts_driver_id ON payouts(driver_id);
+-- CREATE INDEX idx_payouts_status ON payouts(status);
+-- CREATE INDEX idx_payouts_tracking_id ON payouts(tracking_id);
+-- CREATE INDEX idx_drivers_phone ON drivers(phone);
+-- CREATE INDEX idx_drivers_email ON drivers(email);
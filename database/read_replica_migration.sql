@@ -0,0 +1,42 @@
+-- ==============================================
+-- PaySwiftly Read Replica Migration
+-- ==============================================
+-- Supports routing dashboard and status reads to a Supabase read replica
+-- (SUPABASE_REPLICA_URL, see app/read_routing.py):
+-- - replica_lag_seconds() reports how far the replica is behind the
+--   primary. The app calls it on the replica and reads from the primary
+--   while the lag is above REPLICA_MAX_LAG_SECONDS.
+--
+-- Run on the primary; the function replicates like any other object.
+-- ==============================================
+
+-- 1. Replica lag
+-- 0 on the primary, and on a replica that has replayed everything it
+-- received (an idle primary sends nothing, so the last replay time alone
+-- would overstate the lag)
+CREATE OR REPLACE FUNCTION replica_lag_seconds()
+RETURNS DOUBLE PRECISION AS $$
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+    END::DOUBLE PRECISION;
+$$ LANGUAGE sql STABLE;
+
+COMMENT ON FUNCTION replica_lag_seconds IS 'Seconds the replica is behind the primary (0 on the primary or when caught up)';
+
+-- 2. Grant permissions
+GRANT EXECUTE ON FUNCTION replica_lag_seconds TO postgres;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Run against the replica; should be close to 0
+-- SELECT replica_lag_seconds();
+
+-- ==============================================
+-- Rollback (if needed)
+-- ==============================================
+
+-- DROP FUNCTION IF EXISTS replica_lag_seconds();
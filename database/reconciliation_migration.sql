@@ -0,0 +1,20 @@
+-- ==============================================
+-- PaySwiftly Collection Reconciliation Migration
+-- ==============================================
+-- Supports the reconciliation worker (app/reconciler.py), which
+-- periodically looks for pending transactions whose IntaSend
+-- webhook never arrived:
+--
+--   SELECT * FROM transactions
+--   WHERE status = 'pending' AND created_at < <cutoff>
+--   ORDER BY created_at LIMIT <n>;
+-- ==============================================
+
+CREATE INDEX IF NOT EXISTS idx_transactions_status_created_at
+    ON transactions(status, created_at);
+
+-- ==============================================
+-- Rollback (if needed)
+-- ==============================================
+
+-- DROP INDEX IF EXISTS idx_transactions_status_created_at;
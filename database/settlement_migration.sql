@@ -0,0 +1,98 @@
+-- ==============================================
+-- PaySwiftly Collection Settlement Migration
+-- ==============================================
+-- settle_collection() applies a final IntaSend collection state in one
+-- database transaction (app/settlement.py, used by the webhook handlers
+-- and the reconciler):
+-- - Claims the transaction: it only changes while still 'pending', so a
+--   webhook and the reconciler racing settle it once
+-- - On completion, in the same transaction, records the platform fee,
+--   credits the driver's pending balance and marks the transaction as
+--   waiting for the batch payout
+-- A failure anywhere rolls the claim back, so the webhook retry or the
+-- next reconcile sweep settles the transaction again; the driver's credit
+-- is never lost between the claim and the booking.
+--
+-- Run after idempotency_migration.sql.
+-- ==============================================
+
+-- 1. Settle one collection; returns whether this call settled it
+CREATE OR REPLACE FUNCTION settle_collection(
+    p_transaction_id UUID,
+    p_created_at TIMESTAMPTZ,
+    p_completed BOOLEAN,
+    p_collection_id VARCHAR,
+    p_collection_response JSONB
+)
+RETURNS BOOLEAN AS $$
+DECLARE
+    tx transactions%ROWTYPE;
+BEGIN
+    -- created_at (when known) pins the update to one partition
+    IF p_completed THEN
+        UPDATE transactions
+        SET status = 'payout_pending',
+            collection_status = 'completed',
+            collection_completed_at = NOW(),
+            intasend_collection_id = COALESCE(p_collection_id, intasend_collection_id),
+            collection_response = COALESCE(p_collection_response, collection_response),
+            intasend_tracking_id = '',
+            payout_status = 'pending_batch',
+            payout_response = '{"note": "Added to pending balance for weekly payout"}'::JSONB,
+            updated_at = NOW()
+        WHERE id = p_transaction_id
+          AND (p_created_at IS NULL OR created_at = p_created_at)
+          AND status = 'pending'
+        RETURNING * INTO tx;
+    ELSE
+        UPDATE transactions
+        SET status = 'failed',
+            collection_status = 'failed',
+            intasend_collection_id = COALESCE(p_collection_id, intasend_collection_id),
+            collection_response = COALESCE(p_collection_response, collection_response),
+            updated_at = NOW()
+        WHERE id = p_transaction_id
+          AND (p_created_at IS NULL OR created_at = p_created_at)
+          AND status = 'pending'
+        RETURNING * INTO tx;
+    END IF;
+
+    IF NOT FOUND THEN
+        -- Already settled (or unknown)
+        RETURN FALSE;
+    END IF;
+
+    IF p_completed THEN
+        INSERT INTO platform_fees (
+            transaction_id, amount_cents, fee_type, percentage_applied,
+            fixed_amount_applied_cents, collected_at, created_at
+        ) VALUES (
+            tx.id, tx.platform_fee_cents, 'percentage', tx.fee_percentage,
+            tx.fee_fixed_cents, NOW(), NOW()
+        );
+
+        PERFORM add_to_pending_balance(tx.driver_id, tx.driver_amount_cents);
+    END IF;
+
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION settle_collection IS 'Claim a pending transaction and book its collection result (fee and driver credit) atomically';
+
+-- 2. Grant permissions
+GRANT EXECUTE ON FUNCTION settle_collection TO postgres;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Settling twice: the second call returns false and books nothing
+-- SELECT settle_collection('<pending transaction id>', NULL, true, 'TEST', NULL);
+-- SELECT settle_collection('<pending transaction id>', NULL, true, 'TEST', NULL);
+
+-- ==============================================
+-- Rollback (if needed)
+-- ==============================================
+
+-- DROP FUNCTION IF EXISTS settle_collection(UUID, TIMESTAMPTZ, BOOLEAN, VARCHAR, JSONB);
@@ -0,0 +1,94 @@
+-- ==============================================
+-- PaySwiftly Short Code Migration
+-- ==============================================
+-- Short payment links for QR codes: {BASE_PUBLIC_URL}/p/{code} instead
+-- of /pay/{uuid}?phone=...&t=..., so printed codes need a smaller QR
+-- version and scan faster (app/qr_utils.py, app/short_codes.py):
+-- - driver_short_codes maps a random 7-character base62 code to a driver
+-- - assign_driver_short_code() returns a driver's code, creating it on
+--   first use (codes never change once printed)
+-- - Existing drivers are given codes below
+--
+-- Run after driver_id_filter_migration.sql.
+-- ==============================================
+
+-- 1. Lookup table (the primary key is the /p/{code} lookup index)
+CREATE TABLE IF NOT EXISTS driver_short_codes (
+    code VARCHAR(16) PRIMARY KEY,
+    driver_id UUID NOT NULL UNIQUE REFERENCES drivers(id) ON DELETE CASCADE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE driver_short_codes IS 'Base62 short codes for driver payment links (/p/{code})';
+
+-- 2. Code assignment
+-- Codes are drawn from gen_random_uuid() bytes. A collision (1 in ~3.5e12
+-- per existing code) just draws again.
+CREATE OR REPLACE FUNCTION assign_driver_short_code(p_driver_id UUID, p_length INT DEFAULT 7)
+RETURNS TEXT AS $$
+DECLARE
+    alphabet CONSTANT TEXT := '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz';
+    random_bytes BYTEA;
+    new_code TEXT;
+    existing TEXT;
+BEGIN
+    SELECT code INTO existing FROM driver_short_codes WHERE driver_id = p_driver_id;
+    IF existing IS NOT NULL THEN
+        RETURN existing;
+    END IF;
+
+    LOOP
+        random_bytes := uuid_send(gen_random_uuid());
+        new_code := '';
+        FOR i IN 0..p_length - 1 LOOP
+            new_code := new_code || substr(alphabet, get_byte(random_bytes, i) % 62 + 1, 1);
+        END LOOP;
+
+        INSERT INTO driver_short_codes (code, driver_id)
+        VALUES (new_code, p_driver_id)
+        ON CONFLICT DO NOTHING;
+
+        IF FOUND THEN
+            RETURN new_code;
+        END IF;
+
+        -- Either the code was taken or another call assigned this driver first
+        SELECT code INTO existing FROM driver_short_codes WHERE driver_id = p_driver_id;
+        IF existing IS NOT NULL THEN
+            RETURN existing;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION assign_driver_short_code IS 'Short code for a driver, created on first call';
+
+-- 3. Codes for existing drivers
+SELECT assign_driver_short_code(id)
+FROM drivers d
+WHERE NOT EXISTS (SELECT 1 FROM driver_short_codes s WHERE s.driver_id = d.id);
+
+-- 4. RLS and permissions
+ALTER TABLE driver_short_codes ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow all operations on driver_short_codes" ON driver_short_codes FOR ALL USING (true);
+
+GRANT ALL ON driver_short_codes TO postgres;
+GRANT EXECUTE ON FUNCTION assign_driver_short_code TO postgres;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Every driver should have a code
+-- SELECT COUNT(*) FROM drivers d
+-- WHERE NOT EXISTS (SELECT 1 FROM driver_short_codes s WHERE s.driver_id = d.id);
+
+-- /p/{code} lookups should use driver_short_codes_pkey
+-- EXPLAIN SELECT driver_id FROM driver_short_codes WHERE code = 'abc1234';
+
+-- ==============================================
+-- Rollback (if needed)
+-- ==============================================
+
+-- DROP FUNCTION IF EXISTS assign_driver_short_code(UUID, INT);
+-- DROP TABLE IF EXISTS driver_short_codes;
@@ -0,0 +1,247 @@
+-- ==============================================
+-- PaySwiftly Stats Rollups Migration
+-- ==============================================
+-- Hourly and daily rollups of completed transactions so admin
+-- "today / this week / per hour" questions read a few rollup rows
+-- instead of scanning transactions:
+-- - stats_hourly / stats_daily: count, revenue, fees, distinct drivers
+--   per UTC bucket, sharded like admin_stats_shards
+-- - driver_activity_daily: one row per driver per active day, used to
+--   count each driver once per hour and per day
+-- - Maintained by the transaction trigger when a transaction completes
+-- - get_stats_timeseries() reads a range
+--
+-- A transaction completes when its collection completes (IntaSend flow)
+-- or its status becomes 'completed' (legacy flow). Lifetime admin stats
+-- now use the same condition; previously only the legacy status counted.
+--
+-- Run after admin_stats_shards_migration.sql.
+-- ==============================================
+
+-- 1. Rollup tables
+CREATE TABLE IF NOT EXISTS stats_hourly (
+    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    shard SMALLINT NOT NULL,
+    transactions BIGINT NOT NULL DEFAULT 0,
+    revenue_cents BIGINT NOT NULL DEFAULT 0,
+    platform_fees_cents BIGINT NOT NULL DEFAULT 0,
+    drivers INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, shard)
+);
+
+CREATE TABLE IF NOT EXISTS stats_daily (
+    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    shard SMALLINT NOT NULL,
+    transactions BIGINT NOT NULL DEFAULT 0,
+    revenue_cents BIGINT NOT NULL DEFAULT 0,
+    platform_fees_cents BIGINT NOT NULL DEFAULT 0,
+    drivers INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, shard)
+);
+
+CREATE TABLE IF NOT EXISTS driver_activity_daily (
+    driver_id UUID NOT NULL REFERENCES drivers(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    last_hour TIMESTAMP WITH TIME ZONE NOT NULL,
+    PRIMARY KEY (driver_id, day)
+);
+
+COMMENT ON TABLE stats_hourly IS 'Completed transactions per UTC hour; sum shards per bucket';
+COMMENT ON TABLE stats_daily IS 'Completed transactions per UTC day; sum shards per bucket';
+COMMENT ON TABLE driver_activity_daily IS 'Days on which a driver completed a transaction';
+
+-- 2. Completion condition shared by all stats
+CREATE OR REPLACE FUNCTION transaction_is_completed(status TEXT, collection_status TEXT)
+RETURNS BOOLEAN AS $$
+    SELECT COALESCE(status = 'completed', false) OR COALESCE(collection_status = 'completed', false);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- 3. Record one completed transaction in the rollups
+CREATE OR REPLACE FUNCTION record_stats_rollups(
+    driver_id_param UUID,
+    revenue_cents BIGINT,
+    platform_fee_cents BIGINT,
+    completed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+)
+RETURNS VOID AS $$
+DECLARE
+    hour_bucket TIMESTAMP WITH TIME ZONE := date_trunc('hour', completed_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+    day_bucket TIMESTAMP WITH TIME ZONE := date_trunc('day', completed_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+    target_shard SMALLINT := floor(random() * admin_stats_shard_count())::SMALLINT;
+    new_day BOOLEAN;
+    new_hour BOOLEAN := false;
+BEGIN
+    -- Is this the driver's first completion this day / this hour?
+    -- Completions arrive in time order, so last_hour only moves forward.
+    INSERT INTO driver_activity_daily AS a (driver_id, day, last_hour)
+    VALUES (driver_id_param, (day_bucket AT TIME ZONE 'UTC')::DATE, hour_bucket)
+    ON CONFLICT (driver_id, day) DO UPDATE
+        SET last_hour = EXCLUDED.last_hour
+        WHERE a.last_hour < EXCLUDED.last_hour
+    RETURNING (xmax = 0) INTO new_day;
+
+    IF FOUND THEN
+        new_hour := true;
+    ELSE
+        new_day := false;
+    END IF;
+
+    INSERT INTO stats_hourly (bucket, shard, transactions, revenue_cents, platform_fees_cents, drivers)
+    VALUES (hour_bucket, target_shard, 1, revenue_cents, platform_fee_cents, new_hour::INTEGER)
+    ON CONFLICT (bucket, shard) DO UPDATE SET
+        transactions = stats_hourly.transactions + 1,
+        revenue_cents = stats_hourly.revenue_cents + EXCLUDED.revenue_cents,
+        platform_fees_cents = stats_hourly.platform_fees_cents + EXCLUDED.platform_fees_cents,
+        drivers = stats_hourly.drivers + EXCLUDED.drivers;
+
+    INSERT INTO stats_daily (bucket, shard, transactions, revenue_cents, platform_fees_cents, drivers)
+    VALUES (day_bucket, target_shard, 1, revenue_cents, platform_fee_cents, new_day::INTEGER)
+    ON CONFLICT (bucket, shard) DO UPDATE SET
+        transactions = stats_daily.transactions + 1,
+        revenue_cents = stats_daily.revenue_cents + EXCLUDED.revenue_cents,
+        platform_fees_cents = stats_daily.platform_fees_cents + EXCLUDED.platform_fees_cents,
+        drivers = stats_daily.drivers + EXCLUDED.drivers;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 4. Transaction trigger: lifetime stats and rollups on completion
+CREATE OR REPLACE FUNCTION update_admin_stats_on_transaction()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF transaction_is_completed(NEW.status::TEXT, NEW.collection_status)
+       AND (TG_OP = 'INSERT' OR NOT transaction_is_completed(OLD.status::TEXT, OLD.collection_status)) THEN
+        PERFORM update_admin_stats(1, NEW.amount_paid_cents, NEW.platform_fee_cents);
+        PERFORM record_stats_rollups(NEW.driver_id, NEW.amount_paid_cents, NEW.platform_fee_cents);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 5. Range reads
+CREATE OR REPLACE FUNCTION get_stats_timeseries(
+    granularity TEXT,
+    start_at TIMESTAMP WITH TIME ZONE,
+    end_at TIMESTAMP WITH TIME ZONE
+)
+RETURNS TABLE(
+    bucket TIMESTAMP WITH TIME ZONE,
+    transactions BIGINT,
+    revenue_cents BIGINT,
+    platform_fees_cents BIGINT,
+    drivers BIGINT
+) AS $$
+BEGIN
+    IF granularity = 'hour' THEN
+        RETURN QUERY
+        SELECT h.bucket, SUM(h.transactions)::BIGINT, SUM(h.revenue_cents)::BIGINT,
+               SUM(h.platform_fees_cents)::BIGINT, SUM(h.drivers)::BIGINT
+        FROM stats_hourly h
+        WHERE h.bucket >= start_at AND h.bucket < end_at
+        GROUP BY h.bucket
+        ORDER BY h.bucket;
+    ELSIF granularity = 'day' THEN
+        RETURN QUERY
+        SELECT d.bucket, SUM(d.transactions)::BIGINT, SUM(d.revenue_cents)::BIGINT,
+               SUM(d.platform_fees_cents)::BIGINT, SUM(d.drivers)::BIGINT
+        FROM stats_daily d
+        WHERE d.bucket >= start_at AND d.bucket < end_at
+        GROUP BY d.bucket
+        ORDER BY d.bucket;
+    ELSE
+        RAISE EXCEPTION 'Unknown granularity: %', granularity;
+    END IF;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+COMMENT ON FUNCTION get_stats_timeseries IS 'Completed transaction rollups per hour or day in [start_at, end_at)';
+
+-- 6. Backfill from existing completed transactions (into shard 0)
+INSERT INTO driver_activity_daily (driver_id, day, last_hour)
+SELECT
+    driver_id,
+    (date_trunc('day', completed_at AT TIME ZONE 'UTC'))::DATE,
+    MAX(date_trunc('hour', completed_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')
+FROM (
+    SELECT driver_id, COALESCE(collection_completed_at, updated_at, created_at) AS completed_at
+    FROM transactions
+    WHERE transaction_is_completed(status::TEXT, collection_status)
+) t
+GROUP BY 1, 2
+ON CONFLICT (driver_id, day) DO NOTHING;
+
+INSERT INTO stats_hourly (bucket, shard, transactions, revenue_cents, platform_fees_cents, drivers)
+SELECT
+    date_trunc('hour', completed_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+    0,
+    COUNT(*),
+    SUM(amount_paid_cents),
+    SUM(platform_fee_cents),
+    COUNT(DISTINCT driver_id)
+FROM (
+    SELECT driver_id, amount_paid_cents, platform_fee_cents,
+           COALESCE(collection_completed_at, updated_at, created_at) AS completed_at
+    FROM transactions
+    WHERE transaction_is_completed(status::TEXT, collection_status)
+) t
+GROUP BY 1
+ON CONFLICT (bucket, shard) DO NOTHING;
+
+INSERT INTO stats_daily (bucket, shard, transactions, revenue_cents, platform_fees_cents, drivers)
+SELECT
+    date_trunc('day', completed_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+    0,
+    COUNT(*),
+    SUM(amount_paid_cents),
+    SUM(platform_fee_cents),
+    COUNT(DISTINCT driver_id)
+FROM (
+    SELECT driver_id, amount_paid_cents, platform_fee_cents,
+           COALESCE(collection_completed_at, updated_at, created_at) AS completed_at
+    FROM transactions
+    WHERE transaction_is_completed(status::TEXT, collection_status)
+) t
+GROUP BY 1
+ON CONFLICT (bucket, shard) DO NOTHING;
+
+-- 7. Recount lifetime totals with the new completion condition
+UPDATE admin_stats_shards s
+SET
+    total_transactions = CASE WHEN s.shard = 0 THEN t.total_transactions ELSE 0 END,
+    total_revenue_cents = CASE WHEN s.shard = 0 THEN t.total_revenue_cents ELSE 0 END,
+    total_platform_fees_cents = CASE WHEN s.shard = 0 THEN t.total_platform_fees_cents ELSE 0 END,
+    updated_at = NOW()
+FROM (
+    SELECT
+        COUNT(*) AS total_transactions,
+        COALESCE(SUM(amount_paid_cents), 0) AS total_revenue_cents,
+        COALESCE(SUM(platform_fee_cents), 0) AS total_platform_fees_cents
+    FROM transactions
+    WHERE transaction_is_completed(status::TEXT, collection_status)
+) t;
+
+-- 8. RLS and permissions
+ALTER TABLE stats_hourly ENABLE ROW LEVEL SECURITY;
+ALTER TABLE stats_daily ENABLE ROW LEVEL SECURITY;
+ALTER TABLE driver_activity_daily ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow all operations on stats_hourly" ON stats_hourly FOR ALL USING (true);
+CREATE POLICY "Allow all operations on stats_daily" ON stats_daily FOR ALL USING (true);
+CREATE POLICY "Allow all operations on driver_activity_daily" ON driver_activity_daily FOR ALL USING (true);
+
+GRANT ALL ON stats_hourly TO postgres;
+GRANT ALL ON stats_daily TO postgres;
+GRANT ALL ON driver_activity_daily TO postgres;
+GRANT EXECUTE ON FUNCTION record_stats_rollups TO postgres;
+GRANT EXECUTE ON FUNCTION get_stats_timeseries TO postgres;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Last 24 hours
+-- SELECT * FROM get_stats_timeseries('hour', NOW() - INTERVAL '24 hours', NOW());
+
+-- Rollups agree with transactions
+-- SELECT SUM(transactions), SUM(revenue_cents) FROM stats_daily;
+-- SELECT COUNT(*), SUM(amount_paid_cents) FROM transactions
+-- WHERE transaction_is_completed(status::TEXT, collection_status);
@@ -0,0 +1,221 @@
+-- ==============================================
+-- PaySwiftly Transactions Partitioning Migration
+-- ==============================================
+-- Turns transactions into a table partitioned by month on created_at:
+-- - One partition per UTC month (transactions_YYYY_MM) plus a default
+--   partition that should stay empty
+-- - create_transaction_partitions() creates upcoming months; the app
+--   calls it at startup and daily, and pg_cron runs it monthly if enabled
+-- - Indexes, triggers, RLS and the transaction_summary view are recreated
+--   on the partitioned table
+--
+-- Postgres cannot enforce a unique constraint on id alone across
+-- partitions, so the primary key becomes (id, created_at) and the foreign
+-- keys from payouts and platform_fees to transactions are dropped. The app
+-- only writes those rows for existing transactions, and archival deletes
+-- them together with their transactions.
+--
+-- Existing rows are copied inside a single transaction and the copy is
+-- verified before the old table is dropped. Expect the copy to take
+-- roughly as long as a full table rewrite; run it in a quiet period.
+--
+-- Run after driver_earnings_migration.sql.
+-- ==============================================
+
+BEGIN;
+
+-- 1. Partition management
+CREATE OR REPLACE FUNCTION create_transaction_partitions(
+    months_ahead INTEGER DEFAULT 3,
+    from_month DATE DEFAULT NULL
+)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', COALESCE(from_month, (NOW() AT TIME ZONE 'UTC')::DATE))::DATE;
+    last_month DATE := (date_trunc('month', NOW() AT TIME ZONE 'UTC') + make_interval(months => months_ahead))::DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := format('transactions_%s', to_char(month_start, 'YYYY_MM'));
+
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF transactions FOR VALUES FROM (%L) TO (%L)',
+                partition_name,
+                month_start::TIMESTAMP AT TIME ZONE 'UTC',
+                (month_start + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC'
+            );
+            EXECUTE format('ALTER TABLE %I ENABLE ROW LEVEL SECURITY', partition_name);
+            created := created + 1;
+        END IF;
+
+        month_start := (month_start + INTERVAL '1 month')::DATE;
+    END LOOP;
+
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION create_transaction_partitions IS 'Create monthly transactions partitions from from_month (default: this month) to months_ahead months ahead';
+
+-- 2. Detach the old table
+DROP VIEW IF EXISTS transaction_summary;
+
+ALTER TABLE payouts DROP CONSTRAINT IF EXISTS payouts_transaction_id_fkey;
+ALTER TABLE platform_fees DROP CONSTRAINT IF EXISTS platform_fees_transaction_id_fkey;
+
+ALTER TABLE transactions RENAME TO transactions_unpartitioned;
+ALTER TABLE transactions_unpartitioned RENAME CONSTRAINT transactions_pkey TO transactions_unpartitioned_pkey;
+
+DROP TRIGGER IF EXISTS update_transactions_updated_at ON transactions_unpartitioned;
+DROP TRIGGER IF EXISTS trigger_update_admin_stats ON transactions_unpartitioned;
+
+DROP INDEX IF EXISTS idx_transactions_driver_id;
+DROP INDEX IF EXISTS idx_transactions_status;
+DROP INDEX IF EXISTS idx_transactions_created_at;
+DROP INDEX IF EXISTS idx_transactions_checkout_request_id;
+DROP INDEX IF EXISTS idx_transactions_intasend_collection_id;
+DROP INDEX IF EXISTS idx_transactions_intasend_tracking_id;
+DROP INDEX IF EXISTS idx_transactions_collection_status;
+DROP INDEX IF EXISTS idx_transactions_payout_status;
+DROP INDEX IF EXISTS idx_transactions_status_created_at;
+
+-- The partition key cannot be NULL
+UPDATE transactions_unpartitioned
+SET created_at = COALESCE(updated_at, NOW())
+WHERE created_at IS NULL;
+
+-- 3. Partitioned table
+CREATE TABLE transactions (
+    LIKE transactions_unpartitioned
+    INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS
+) PARTITION BY RANGE (created_at);
+
+ALTER TABLE transactions ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE transactions ADD PRIMARY KEY (id, created_at);
+ALTER TABLE transactions
+    ADD CONSTRAINT transactions_driver_id_fkey
+    FOREIGN KEY (driver_id) REFERENCES drivers(id) ON DELETE CASCADE;
+
+CREATE TABLE transactions_default PARTITION OF transactions DEFAULT;
+
+SELECT create_transaction_partitions(
+    3,
+    (SELECT MIN(created_at) AT TIME ZONE 'UTC' FROM transactions_unpartitioned)::DATE
+);
+
+-- 4. Indexes (created on every partition)
+CREATE INDEX idx_transactions_driver_id ON transactions(driver_id);
+CREATE INDEX idx_transactions_status ON transactions(status);
+CREATE INDEX idx_transactions_created_at ON transactions(created_at);
+CREATE INDEX idx_transactions_checkout_request_id ON transactions(checkout_request_id);
+CREATE INDEX idx_transactions_intasend_collection_id ON transactions(intasend_collection_id);
+CREATE INDEX idx_transactions_intasend_tracking_id ON transactions(intasend_tracking_id);
+CREATE INDEX idx_transactions_collection_status ON transactions(collection_status);
+CREATE INDEX idx_transactions_payout_status ON transactions(payout_status);
+CREATE INDEX idx_transactions_status_created_at ON transactions(status, created_at);
+
+-- 5. Copy existing rows (generated columns are recomputed)
+DO $$
+DECLARE
+    column_list TEXT;
+    old_count BIGINT;
+    new_count BIGINT;
+BEGIN
+    SELECT string_agg(quote_ident(column_name), ', ' ORDER BY ordinal_position)
+    INTO column_list
+    FROM information_schema.columns
+    WHERE table_schema = 'public'
+      AND table_name = 'transactions_unpartitioned'
+      AND is_generated = 'NEVER';
+
+    EXECUTE format(
+        'INSERT INTO transactions (%s) SELECT %s FROM transactions_unpartitioned',
+        column_list, column_list
+    );
+
+    SELECT COUNT(*) INTO old_count FROM transactions_unpartitioned;
+    SELECT COUNT(*) INTO new_count FROM transactions;
+
+    IF old_count != new_count THEN
+        RAISE EXCEPTION 'Transaction copy mismatch: % rows before, % after', old_count, new_count;
+    END IF;
+END $$;
+
+DROP TABLE transactions_unpartitioned;
+
+-- 6. Triggers (cloned to every partition)
+CREATE TRIGGER update_transactions_updated_at BEFORE UPDATE ON transactions
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TRIGGER trigger_update_admin_stats
+    AFTER INSERT OR UPDATE ON transactions
+    FOR EACH ROW
+    EXECUTE FUNCTION update_admin_stats_on_transaction();
+
+-- 7. View
+CREATE OR REPLACE VIEW transaction_summary AS
+SELECT
+    t.id,
+    t.driver_id,
+    d.name as driver_name,
+    d.phone as driver_phone,
+    t.passenger_phone,
+    t.amount_paid_cents,
+    t.platform_fee_cents,
+    t.driver_amount_cents,
+    t.amount_paid,
+    t.platform_fee,
+    t.driver_amount,
+    t.status,
+    t.collection_status,
+    t.payout_status,
+    p.tracking_id as payout_tracking_id,
+    p.status as payout_detail_status,
+    t.created_at,
+    t.collection_completed_at,
+    t.payout_completed_at
+FROM transactions t
+LEFT JOIN drivers d ON t.driver_id = d.id
+LEFT JOIN payouts p ON t.id = p.transaction_id
+ORDER BY t.created_at DESC;
+
+-- 8. RLS and permissions
+ALTER TABLE transactions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE transactions_default ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow all operations on transactions" ON transactions FOR ALL USING (true);
+
+GRANT ALL ON transactions TO postgres;
+GRANT SELECT ON transaction_summary TO postgres;
+GRANT EXECUTE ON FUNCTION create_transaction_partitions TO postgres;
+
+-- 9. Monthly partition creation via pg_cron, when the extension is enabled
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule(
+            'create-transaction-partitions',
+            '0 0 1 * *',
+            'SELECT create_transaction_partitions(3)'
+        );
+    END IF;
+END $$;
+
+COMMIT;
+
+-- ==============================================
+-- Verification Queries
+-- ==============================================
+
+-- Partitions and row counts
+-- SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bounds, c.reltuples::BIGINT AS approx_rows
+-- FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+-- WHERE i.inhparent = 'transactions'::regclass ORDER BY c.relname;
+
+-- The default partition should be empty
+-- SELECT COUNT(*) FROM transactions_default;
+
+-- Pruning: only one partition should appear in the plan
+-- EXPLAIN SELECT * FROM transactions
+-- WHERE created_at >= date_trunc('month', NOW()) AND driver_id = 'driver-uuid-here';
@@ -4,7 +4,7 @@ import { useEffect, useState, use } from 'react'
 import { useRouter } from 'next/navigation'
 import Link from 'next/link'
 import { api } from '@/utils/api'
-import { Driver } from '@/types'
+import { Driver, DriverSummary } from '@/types'
 
 export default function DriverDashboard({ params }: { params: Promise<{ driver_id: string }> }) {
     const resolvedParams = use(params)
@@ -13,6 +13,7 @@ export default function DriverDashboard({ params }: { params: Promise<{ driver_i
 
     const [driver, setDriver] = useState<Driver | null>(null)
     const [transactions, setTransactions] = useState<any[]>([])
+    const [summary, setSummary] = useState<DriverSummary | null>(null)
     const [loading, setLoading] = useState(true)
     const [error, setError] = useState('')
     const [showHistory, setShowHistory] = useState(false)
@@ -20,12 +21,14 @@ export default function DriverDashboard({ params }: { params: Promise<{ driver_i
     useEffect(() => {
         const loadData = async () => {
             try {
-                const [driverData, transactionsData] = await Promise.all([
+                const [driverData, transactionsData, summaryData] = await Promise.all([
                     api.getDriver(driverId),
-                    api.getDriverTransactions(driverId)
+                    api.getDriverTransactions(driverId),
+                    api.getDriverSummary(driverId)
                 ])
                 setDriver(driverData)
                 setTransactions(transactionsData)
+                setSummary(summaryData)
             } catch (err: any) {
                 setError(err.message || 'Failed to load dashboard data')
             } finally {
@@ -39,8 +42,12 @@ export default function DriverDashboard({ params }: { params: Promise<{ driver_i
     useEffect(() => {
         const refreshInterval = setInterval(async () => {
             try {
-                const freshDriver = await api.getDriver(driverId)
+                const [freshDriver, freshSummary] = await Promise.all([
+                    api.getDriver(driverId),
+                    api.getDriverSummary(driverId)
+                ])
                 setDriver(freshDriver)
+                setSummary(freshSummary)
             } catch (err) {
                 console.error('Failed to refresh driver data:', err)
             }
@@ -190,10 +197,16 @@ export default function DriverDashboard({ params }: { params: Promise<{ driver_i
                             </div>
                             <div>
                                 <p className="text-3xl font-black text-white mb-1 drop-shadow-lg">
-                                    KES {driver.total_earnings ? parseFloat(driver.total_earnings.toString()).toFixed(2) : '0.00'}
+                                    KES {(summary ? summary.lifetime.earnings : driver.total_earnings || 0).toFixed(2)}
                                 </p>
                                 <p className="text-sm text-blue-100/90 font-medium mb-2">Total Earned</p>
-                                <p className="text-xs text-blue-200/70 font-semibold">All-time earnings</p>
+                                {summary ? (
+                                    <p className="text-xs text-blue-200/70 font-semibold">
+                                        Today KES {summary.today.earnings.toFixed(2)} ({summary.today.trips}) · This week KES {summary.this_week.earnings.toFixed(2)} ({summary.this_week.trips})
+                                    </p>
+                                ) : (
+                                    <p className="text-xs text-blue-200/70 font-semibold">All-time earnings</p>
+                                )}
                             </div>
                         </div>
                     </div>
@@ -480,7 +493,7 @@ export default function DriverDashboard({ params }: { params: Promise<{ driver_i
                         {/* Modal Footer */}
                         <div className="bg-gray-50 p-4 border-t border-gray-200">
                             <div className="flex items-center justify-between text-sm">
-                                <span className="text-gray-600">Total Transactions: <span className="font-bold text-gray-800">{transactions.length}</span></span>
+                                <span className="text-gray-600">{summary ? 'Completed Trips' : 'Total Transactions'}: <span className="font-bold text-gray-800">{summary ? summary.lifetime.trips : transactions.length}</span></span>
                                 <button
                                     onClick={() => setShowHistory(false)}
                                     className="px-4 py-2 bg-gradient-to-r from-blue-600 to-indigo-600 text-white rounded-xl font-semibold hover:shadow-lg transition-shadow"
@@ -19,13 +19,18 @@ export default function PaymentPage({ params }: { params: Promise<{ driver_id: s
     const [error, setError] = useState('');
     const [success, setSuccess] = useState<PaymentInitiateResponse | null>(null);
     const [pollStatus, setPollStatus] = useState<string>('pending');
+    // Signature from the scanned QR link (?t=...), checked by the API
+    const [qrToken] = useState<string | null>(
+        () => (typeof window === 'undefined' ? null : new URLSearchParams(window.location.search).get('t'))
+    );
 
     useEffect(() => {
-        fetchAPI<Driver>(`/api/driver/${driverId}`)
+        const query = qrToken ? `?t=${encodeURIComponent(qrToken)}` : '';
+        fetchAPI<Driver>(`/api/driver/${driverId}${query}`)
             .then(setDriver)
             .catch((err) => setError(err.message))
             .finally(() => setLoading(false));
-    }, [driverId]);
+    }, [driverId, qrToken]);
 
     // Poll for transaction status
     useEffect(() => {
@@ -63,7 +68,8 @@ export default function PaymentPage({ params }: { params: Promise<{ driver_id: s
                     amount: parseFloat(amount),
                     passenger_phone: phone,
                     passenger_email: 'guest@example.com', // Optional
-                    passenger_name: 'Guest Passenger'      // Optional
+                    passenger_name: 'Guest Passenger',     // Optional
+                    qr_token: qrToken
                 }),
             });
             setSuccess(response);
@@ -1,7 +1,16 @@
 import type { NextConfig } from "next";
 
+const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+
 const nextConfig: NextConfig = {
-  /* config options here */
+  // Short QR links (/p/{code}) and QR images are served by the API: /p/{code}
+  // redirects to /pay/[driver_id], and qr_code_url may point at /api/driver/{id}/qr.png
+  async rewrites() {
+    return [
+      { source: '/p/:code', destination: `${API_URL}/p/:code` },
+      { source: '/api/driver/:driver_id/qr.:format', destination: `${API_URL}/api/driver/:driver_id/qr.:format` },
+    ];
+  },
 };
 
 export default nextConfig;
@@ -7,9 +7,14 @@ export interface Driver {
     vehicle_type: string;
     vehicle_number: string;
     qr_code_url: string | null;
+    // Money is exact integer cents; the plain fields are KES for display
+    balance_cents: number;
+    total_earnings_cents: number;
     balance: number;
     total_earnings: number;
     // Batch payout system fields
+    pending_balance_cents: number;
+    paid_balance_cents: number;
     pending_balance: number;  // Earnings waiting for payout
     paid_balance: number;     // Total already paid out
     last_payout_date: string | null;  // When last batch payout occurred
@@ -21,6 +26,9 @@ export interface PaymentInitiateResponse {
     transaction_id: string;
     collection_id: string;
     message: string;
+    amount_cents: number;
+    platform_fee_cents: number;
+    driver_amount_cents: number;
     amount: number;
     platform_fee: number;
     driver_amount: number;
@@ -38,5 +46,23 @@ export interface TransactionStatusResponse {
     collection_status: string;
     payout_status: string;
     message?: string;
+    amount_paid_cents: number;
     amount_paid: number;
 }
+
+export interface EarningsPeriod {
+    trips: number;
+    earnings_cents: number;
+    earnings: number;
+}
+
+// Driver earnings from the per-driver daily rollups (Nairobi days, weeks start Monday)
+export interface DriverSummary {
+    driver_id: string;
+    as_of: string;
+    today: EarningsPeriod;
+    this_week: EarningsPeriod;
+    this_month: EarningsPeriod;
+    lifetime: EarningsPeriod;
+    last_trip_at: string | null;
+}
@@ -1,11 +1,18 @@
+import { DriverSummary } from '@/types';
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 
+// Returned by the API after a write and sent back on later requests, so reads
+// that follow our own writes are served from the primary, not a lagging replica
+const FRESHNESS_HEADER = 'X-Freshness-Token';
+let freshnessToken: string | null = null;
+
 export async function fetchAPI<T>(endpoint: string, options: RequestInit = {}): Promise<T> {
     const url = `${API_URL}${endpoint}`;
 
     const headers = {
         'Content-Type': 'application/json',
+        ...(freshnessToken ? { [FRESHNESS_HEADER]: freshnessToken } : {}),
         ...options.headers,
     };
 
@@ -14,6 +21,8 @@ export async function fetchAPI<T>(endpoint: string, options: RequestInit = {}):
         headers,
     });
 
+    freshnessToken = response.headers.get(FRESHNESS_HEADER) || freshnessToken;
+
     if (!response.ok) {
         const error = await response.json().catch(() => ({ detail: 'Network error' }));
         let errorMessage = error.detail || `Error ${response.status}`;
@@ -40,4 +49,5 @@ export const api = {
     }),
     getDriver: (driverId: string) => fetchAPI<any>(`/api/driver/${driverId}`),
     getDriverTransactions: (driverId: string) => fetchAPI<any[]>(`/api/driver/${driverId}/transactions`),
+    getDriverSummary: (driverId: string) => fetchAPI<DriverSummary>(`/api/driver/${driverId}/summary`),
 };
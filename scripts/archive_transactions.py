@@ -0,0 +1,50 @@
+"""
+Archive aged transactions, payouts and platform fees to Parquet.
+
+Moves rows older than ARCHIVE_AFTER_DAYS (default 90) into zstd-compressed
+Parquet files in the private 'archives' Storage bucket, one file per table
+per month, then deletes them from the database in batches. Safe to re-run.
+Schedule daily (e.g. a Render cron job).
+
+Needs database/archive_migration.sql and SUPABASE_SERVICE_ROLE_KEY.
+
+Usage:
+    python scripts/archive_transactions.py [--dry-run] [--after-days 90]
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Load environment variables explicitly from the root .env file
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+from app.supabase_util import SupabaseManager  # noqa: E402
+from app.archive import Archiver  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old rows to Parquet in Supabase Storage")
+    parser.add_argument('--dry-run', action='store_true', help="Only count rows that would be archived")
+    parser.add_argument('--after-days', type=int, default=None, help="Archive rows older than this (default ARCHIVE_AFTER_DAYS or 90)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if not os.environ.get("SUPABASE_SERVICE_ROLE_KEY"):
+        print("Error: SUPABASE_SERVICE_ROLE_KEY is required to write to the archives bucket.")
+        sys.exit(1)
+
+    archiver = Archiver(SupabaseManager(), archive_after_days=args.after_days)
+    summary = asyncio.run(archiver.run(dry_run=args.dry_run))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Backfill drivers.phone_normalized for drivers registered before it existed.
+
+Normalizes each driver's phone with app/phone.py and writes the E.164 form.
+Numbers that cannot be normalized, or that normalize to a number another
+driver already has, are reported and left NULL for manual follow-up.
+Safe to re-run: only rows with phone_normalized IS NULL are touched.
+
+Needs database/phone_normalized_migration.sql and SUPABASE_SERVICE_ROLE_KEY.
+
+Usage:
+    python scripts/backfill_phone_normalized.py [--dry-run]
+"""
+import os
+import sys
+import argparse
+
+from dotenv import load_dotenv
+from supabase import create_client, Client
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Load environment variables explicitly from the root .env file
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+from app.phone import normalize_phone  # noqa: E402
+
+PAGE_SIZE = 500
+
+
+def load_drivers(supabase: Client):
+    """Page through all drivers, returning (id, phone, phone_normalized) rows."""
+    drivers = []
+    offset = 0
+
+    while True:
+        result = (supabase.table('drivers')
+                  .select('id, phone, phone_normalized')
+                  .order('id')
+                  .range(offset, offset + PAGE_SIZE - 1)
+                  .execute())
+        drivers.extend(result.data)
+
+        if len(result.data) < PAGE_SIZE:
+            return drivers
+        offset += PAGE_SIZE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill drivers.phone_normalized")
+    parser.add_argument('--dry-run', action='store_true', help="Report what would change without writing")
+    args = parser.parse_args()
+
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        print("Error: SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set.")
+        sys.exit(1)
+
+    supabase: Client = create_client(url, key)
+    drivers = load_drivers(supabase)
+
+    # Numbers already claimed, including by drivers backfilled earlier in this run
+    taken = {d['phone_normalized']: d['id'] for d in drivers if d['phone_normalized']}
+    updated, invalid, duplicates = 0, [], []
+
+    for driver in drivers:
+        if driver['phone_normalized']:
+            continue
+
+        try:
+            phone_normalized = normalize_phone(driver['phone'])
+        except ValueError:
+            invalid.append(driver)
+            continue
+
+        if phone_normalized in taken:
+            duplicates.append((driver, taken[phone_normalized]))
+            continue
+
+        taken[phone_normalized] = driver['id']
+        if not args.dry_run:
+            (supabase.table('drivers')
+             .update({'phone_normalized': phone_normalized})
+             .eq('id', driver['id'])
+             .is_('phone_normalized', 'null')
+             .execute())
+        updated += 1
+
+    print(f"{'Would update' if args.dry_run else 'Updated'} {updated} of {len(drivers)} drivers")
+
+    for driver in invalid:
+        print(f"  invalid phone: driver {driver['id']} has {driver['phone']!r}")
+    for driver, other_id in duplicates:
+        print(f"  duplicate: driver {driver['id']} ({driver['phone']!r}) has the same number as driver {other_id}")
+
+    if invalid or duplicates:
+        print(f"{len(invalid) + len(duplicates)} drivers need manual follow-up")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark admin stats write throughput: single hot row vs sharded counters.
+
+Runs N concurrent writers against Postgres for a fixed duration at each
+concurrency level and prints commits/second for:
+- single: increment the admin_stats 'revenue' row (the old behaviour)
+- sharded: call update_admin_stats(), which picks a random shard
+
+Needs a database with admin_stats_shards_migration.sql applied. Do not point
+this at production: it writes to the stats tables while it runs (the rows are
+snapshotted first and restored afterwards, but live writes in between are lost).
+
+Usage:
+    DATABASE_URL=postgresql://postgres@localhost:5432/postgres \\
+        python scripts/bench_admin_stats.py [--duration 5] [--levels 1,2,4,8,16,32]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+import asyncpg
+from dotenv import load_dotenv
+
+# Load environment variables explicitly from the root .env file
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+STATEMENTS = {
+    "single": """
+        UPDATE admin_stats
+        SET total_transactions = total_transactions + 1,
+            total_revenue_cents = total_revenue_cents + 10000,
+            total_platform_fees_cents = total_platform_fees_cents + 300,
+            updated_at = NOW()
+        WHERE id = 'revenue'
+    """,
+    "sharded": "SELECT update_admin_stats(1, 10000, 300)",
+}
+
+COLUMNS = "total_transactions, total_revenue_cents, total_platform_fees_cents, updated_at"
+
+
+async def run_level(pool: asyncpg.Pool, statement: str, concurrency: int, duration: float) -> float:
+    """Run `concurrency` writers for `duration` seconds, return commits/second."""
+    deadline = time.perf_counter() + duration
+    counts = [0] * concurrency
+
+    async def writer(index: int):
+        async with pool.acquire() as conn:
+            while time.perf_counter() < deadline:
+                await conn.execute(statement)
+                counts[index] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(i) for i in range(concurrency)))
+    return sum(counts) / (time.perf_counter() - started)
+
+
+async def snapshot(pool: asyncpg.Pool):
+    """The counter rows the benchmark writes to, as they are now."""
+    revenue = await pool.fetchrow(f"SELECT {COLUMNS} FROM admin_stats WHERE id = 'revenue'")
+    shards = await pool.fetch(f"SELECT shard, {COLUMNS} FROM admin_stats_shards")
+    return revenue, shards
+
+
+async def restore(pool: asyncpg.Pool, saved):
+    """Put the counter rows back as snapshot() found them."""
+    revenue, shards = saved
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if revenue is not None:
+                await conn.execute("""
+                    UPDATE admin_stats SET total_transactions = $1, total_revenue_cents = $2,
+                        total_platform_fees_cents = $3, updated_at = $4
+                    WHERE id = 'revenue'
+                """, *revenue.values())
+            await conn.executemany("""
+                UPDATE admin_stats_shards SET total_transactions = $2, total_revenue_cents = $3,
+                    total_platform_fees_cents = $4, updated_at = $5
+                WHERE shard = $1
+            """, [tuple(shard.values()) for shard in shards])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark admin stats counter writes")
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds per concurrency level")
+    parser.add_argument('--levels', default="1,2,4,8,16,32", help="Comma-separated writer counts")
+    args = parser.parse_args()
+
+    dsn = os.environ.get("DATABASE_URL")
+    if not dsn:
+        print("Error: DATABASE_URL not found in environment variables.")
+        sys.exit(1)
+
+    levels = [int(level) for level in args.levels.split(',')]
+    pool = await asyncpg.create_pool(dsn, min_size=max(levels), max_size=max(levels))
+
+    saved = await snapshot(pool)
+    before = await pool.fetchval("SELECT total_transactions FROM get_admin_stats()")
+    try:
+        results = {}
+        for name, statement in STATEMENTS.items():
+            for level in levels:
+                results[(name, level)] = await run_level(pool, statement, level, args.duration)
+                print(f"{name:>8} writers={level:<3} {results[(name, level)]:>10.0f} commits/s")
+
+        print(f"\n{'writers':>8} {'single':>10} {'sharded':>10} {'speedup':>8}")
+        for level in levels:
+            single, sharded = results[("single", level)], results[("sharded", level)]
+            print(f"{level:>8} {single:>10.0f} {sharded:>10.0f} {sharded / single:>7.2f}x")
+
+        after = await pool.fetchval("SELECT total_transactions FROM get_admin_stats()")
+        print(f"\nSharded total_transactions added by the run: {after - before}")
+    finally:
+        await restore(pool, saved)
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,193 @@
+"""
+Benchmark monthly partitioning of transactions on a synthetic dataset.
+
+Builds two copies of a transactions-shaped table in a scratch schema
+(`bench`): one plain heap and one partitioned by month on created_at, with
+the same indexes. It loads the same synthetic rows into both and times the
+queries SupabaseManager runs:
+- single-row inserts into the current month
+- driver history (driver_id, last 90 days, newest 50)
+- one month's revenue
+- lookup by id within the recent window
+
+Do not point this at production: it creates and drops the `bench` schema.
+
+Usage:
+    DATABASE_URL=postgresql://postgres@localhost:5432/postgres \\
+        python scripts/bench_partitioning.py [--rows 2000000] [--months 24] [--drivers 5000]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from datetime import datetime, timedelta, timezone
+
+import asyncpg
+from dotenv import load_dotenv
+
+# Load environment variables explicitly from the root .env file
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+COLUMNS = """
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    driver_id UUID NOT NULL,
+    passenger_phone VARCHAR(20) NOT NULL,
+    amount_paid_cents BIGINT NOT NULL,
+    platform_fee_cents BIGINT NOT NULL,
+    driver_amount_cents BIGINT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+"""
+
+INDEXES = [
+    "CREATE INDEX ON {table}(driver_id)",
+    "CREATE INDEX ON {table}(created_at)",
+    "CREATE INDEX ON {table}(status, created_at)",
+]
+
+
+async def setup(conn: asyncpg.Connection, months: int):
+    await conn.execute("DROP SCHEMA IF EXISTS bench CASCADE; CREATE SCHEMA bench")
+    await conn.execute(f"CREATE TABLE bench.tx_heap ({COLUMNS}, PRIMARY KEY (id))")
+    await conn.execute(f"CREATE TABLE bench.tx_part ({COLUMNS}, PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)")
+
+    this_month = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    for offset in range(-months, 2):
+        start = _add_months(this_month, offset)
+        end = _add_months(this_month, offset + 1)
+        await conn.execute(
+            f"CREATE TABLE bench.tx_part_{start:%Y_%m} PARTITION OF bench.tx_part "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+
+    for table in ("bench.tx_heap", "bench.tx_part"):
+        for index in INDEXES:
+            await conn.execute(index.format(table=table))
+
+
+def _add_months(moment: datetime, months: int) -> datetime:
+    month = moment.month - 1 + months
+    return moment.replace(year=moment.year + month // 12, month=month % 12 + 1)
+
+
+async def load(conn: asyncpg.Connection, table: str, rows: int, months: int, drivers: int) -> float:
+    """Bulk-load synthetic rows spread over the last `months` months."""
+    started = time.perf_counter()
+    await conn.execute(f"""
+        INSERT INTO {table} (driver_id, passenger_phone, amount_paid_cents, platform_fee_cents,
+                             driver_amount_cents, status, created_at)
+        SELECT
+            ('00000000-0000-0000-0000-' || lpad((g % {drivers})::TEXT, 12, '0'))::UUID,
+            '2547' || lpad((g % 100000000)::TEXT, 8, '0'),
+            a, a * 3 / 100, a - a * 3 / 100,
+            (ARRAY['payout_pending', 'payout_completed', 'failed'])[1 + g % 3],
+            NOW() - random() * INTERVAL '{months * 30} days'
+        FROM generate_series(1, {rows}) g, LATERAL (SELECT (5000 + g % 200000)::BIGINT AS a) amount
+    """)
+    await conn.execute(f"ANALYZE {table}")
+    return time.perf_counter() - started
+
+
+async def timed(conn: asyncpg.Connection, query: str, args_list) -> list:
+    """Run a query once per args tuple, returning per-call latencies in ms."""
+    latencies = []
+    for args in args_list:
+        started = time.perf_counter()
+        await conn.fetch(query, *args)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def insert_rate(pool: asyncpg.Pool, table: str, count: int, concurrency: int, drivers: int) -> float:
+    """Single-row inserts per second into the current month."""
+    per_worker = count // concurrency
+
+    async def worker():
+        async with pool.acquire() as conn:
+            for _ in range(per_worker):
+                driver = f"00000000-0000-0000-0000-{random.randrange(drivers):012d}"
+                await conn.execute(
+                    f"INSERT INTO {table} (driver_id, passenger_phone, amount_paid_cents, "
+                    f"platform_fee_cents, driver_amount_cents) VALUES ($1, '254700000000', 10000, 300, 9700)",
+                    driver
+                )
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return per_worker * concurrency / (time.perf_counter() - started)
+
+
+def summarize(latencies: list) -> str:
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return f"p50 {statistics.median(latencies):8.2f} ms   p99 {p99:8.2f} ms"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark partitioned vs unpartitioned transactions")
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--drivers', type=int, default=5000)
+    parser.add_argument('--samples', type=int, default=200, help="Queries per measurement")
+    parser.add_argument('--keep', action='store_true', help="Keep the bench schema afterwards")
+    args = parser.parse_args()
+
+    dsn = os.environ.get("DATABASE_URL")
+    if not dsn:
+        print("Error: DATABASE_URL not found in environment variables.")
+        sys.exit(1)
+
+    pool = await asyncpg.create_pool(dsn, min_size=8, max_size=8)
+    now = datetime.now(timezone.utc)
+
+    try:
+        async with pool.acquire() as conn:
+            await setup(conn, args.months)
+            for table in ("bench.tx_heap", "bench.tx_part"):
+                seconds = await load(conn, table, args.rows, args.months, args.drivers)
+                print(f"Loaded {args.rows:,} rows into {table} in {seconds:.1f}s")
+
+            sample_ids = [row['id'] for row in await conn.fetch(
+                "SELECT id FROM bench.tx_heap WHERE created_at >= $1 ORDER BY random() LIMIT $2",
+                now - timedelta(days=35), args.samples
+            )]
+
+        drivers = [(f"00000000-0000-0000-0000-{random.randrange(args.drivers):012d}", now - timedelta(days=90))
+                   for _ in range(args.samples)]
+        months = [(_add_months(now.replace(day=1), -m), _add_months(now.replace(day=1), -m + 1))
+                  for m in (random.randrange(1, args.months) for _ in range(min(args.samples, 50)))]
+
+        for table in ("bench.tx_heap", "bench.tx_part"):
+            print(f"\n{table}")
+            print(f"  inserts/s (8 writers)  {await insert_rate(pool, table, 4000, 8, args.drivers):10.0f}")
+
+            async with pool.acquire() as conn:
+                history = await timed(conn, f"""
+                    SELECT * FROM {table}
+                    WHERE driver_id = $1::UUID AND created_at >= $2
+                    ORDER BY created_at DESC LIMIT 50
+                """, drivers)
+                print(f"  driver history         {summarize(history)}")
+
+                month_sum = await timed(conn, f"""
+                    SELECT COUNT(*), SUM(amount_paid_cents) FROM {table}
+                    WHERE created_at >= $1 AND created_at < $2
+                """, months)
+                print(f"  one month revenue      {summarize(month_sum)}")
+
+                lookups = await timed(conn, f"""
+                    SELECT * FROM {table} WHERE id = $1 AND created_at >= $2
+                """, [(tx_id, now - timedelta(days=35)) for tx_id in sample_ids])
+                print(f"  id lookup (recent)     {summarize(lookups)}")
+    finally:
+        if not args.keep:
+            async with pool.acquire() as conn:
+                await conn.execute("DROP SCHEMA IF EXISTS bench CASCADE")
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""
+Compare payment QR codes: full /pay/{uuid} URLs against short /p/{code} links.
+
+For each variant, prints the payload length, QR version, error correction
+level, module count, PNG size and median render time:
+- full URL, L: the previous generate_payment_qr output (error correction L)
+- full URL: the same URL through build_qr (strongest EC that fits)
+- short code: {BASE_PUBLIC_URL}/p/{code} through build_qr
+
+Runs offline; no database needed. Set QR_SIGNING_KEYS to include the
+signature in the full URL, as production does.
+
+Usage:
+    python scripts/bench_qr.py [--iterations 200]
+"""
+import os
+import sys
+import time
+import uuid
+import secrets
+import argparse
+import statistics
+from io import BytesIO
+
+import qrcode
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Load environment variables explicitly from the root .env file
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+from app.qr_utils import build_qr, payment_url  # noqa: E402
+from app.short_codes import BASE62_ALPHABET  # noqa: E402
+
+EC_NAMES = {
+    qrcode.constants.ERROR_CORRECT_L: 'L',
+    qrcode.constants.ERROR_CORRECT_M: 'M',
+    qrcode.constants.ERROR_CORRECT_Q: 'Q',
+    qrcode.constants.ERROR_CORRECT_H: 'H',
+}
+
+
+def legacy_qr(data: str) -> qrcode.QRCode:
+    """QR code as generate_payment_qr built it before short codes."""
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def render(qr: qrcode.QRCode) -> bytes:
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def measure(name: str, data: str, build, iterations: int):
+    """Encode and render data `iterations` times; print one summary row."""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        png = render(build(data))
+        timings.append((time.perf_counter() - started) * 1000)
+
+    qr = build(data)
+    modules = qr.modules_count
+    print(f"  {name:16} {len(data):5} {qr.version:4}   {EC_NAMES[qr.error_correction]}  "
+          f"{modules:3}x{modules:<3} {len(png):7} {statistics.median(timings):8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-URL and short-code payment QR codes")
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    driver_id = str(uuid.uuid4())
+    code = ''.join(secrets.choice(BASE62_ALPHABET) for _ in range(7))
+    full = payment_url(driver_id, '254712345678')
+    short = payment_url(driver_id, short_code=code)
+
+    print(f"full URL:   {full}")
+    print(f"short code: {short}\n")
+    print(f"  {'variant':16} {'chars':>5} {'ver':>4}  EC  modules {'PNG B':>7} {'ms (p50)':>8}")
+    measure("full URL, L", full, legacy_qr, args.iterations)
+    measure("full URL", full, build_qr, args.iterations)
+    measure("short code", short, build_qr, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Measure /api/register_driver latency (p50/p99) with simulated Supabase latency.
+
+The app runs in-process (no server needed) against a stand-in for the
+Supabase client (scripts/simulated_backends.py). Each database call and
+Storage upload blocks its calling thread for the given time, just as the
+real synchronous client does. The script reports latency percentiles and
+database writes per registration, so registration changes can be
+compared on the same footing.
+
+Bcrypt hashing and QR rendering are real, so absolute numbers depend on
+the machine.
+
+Usage:
+    python scripts/bench_registration.py [--requests 200] [--concurrency 4]
+        [--db-ms 25] [--upload-ms 80]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Load environment variables explicitly from the root .env file
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# Always the PostgREST manager, with no real database behind it
+os.environ.pop('DATABASE_URL', None)
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+os.environ.setdefault('SUPABASE_ANON_KEY', 'bench')
+
+import httpx  # noqa: E402
+
+from app import main as app_main  # noqa: E402
+from simulated_backends import SimulatedSupabase  # noqa: E402
+
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def run(requests: int, concurrency: int) -> list:
+    timings = []
+    numbers = iter(range(requests))
+    transport = httpx.ASGITransport(app=app_main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        async def worker():
+            for n in numbers:
+                started = time.perf_counter()
+                response = await client.post('/api/register_driver', json={
+                    'name': f'Bench Driver {n}',
+                    'phone': f'07{n:08d}',
+                    'email': f'bench{n}@example.com',
+                    'vehicle_type': 'boda',
+                    'vehicle_number': f'KBN {n:03d}X',
+                    'password': 'bench-password'
+                })
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise RuntimeError(f"Registration failed: {response.status_code} {response.text}")
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registration latency with simulated Supabase latency")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--db-ms', type=float, default=25, help="Latency of each database call")
+    parser.add_argument('--upload-ms', type=float, default=80, help="Latency of each Storage upload")
+    args = parser.parse_args()
+
+    simulated = SimulatedSupabase(args.db_ms / 1000, args.upload_ms / 1000)
+    app_main.supabase_manager.supabase = simulated
+
+    started = time.perf_counter()
+    timings = asyncio.run(run(args.requests, args.concurrency))
+    elapsed = time.perf_counter() - started
+
+    writes = {kind: count / args.requests for kind, count in simulated.writes.items()}
+    print(f"{args.requests} registrations, concurrency {args.concurrency}, "
+          f"db {args.db_ms:g} ms, upload {args.upload_ms:g} ms")
+    print(f"  p50 {statistics.median(timings):7.1f} ms   p99 {percentile(timings, 99):7.1f} ms   "
+          f"mean {statistics.mean(timings):7.1f} ms   {args.requests / elapsed:5.1f} req/s")
+    print(f"  per registration: {writes['insert']:.1f} insert, {writes['update']:.1f} update, "
+          f"{writes['upload']:.1f} upload")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Check that every SupabaseManager query shape is served by an index.
+
+Seeds synthetic drivers, transactions and payouts into a local Postgres
+that has all of database/*.sql applied, runs EXPLAIN (ANALYZE) for each
+query app/supabase_util.py sends through PostgREST, and exits non-zero if
+any plan contains a sequential scan.
+
+Everything runs inside one transaction that is rolled back, so the
+database is left as it was. Seeding skips triggers
+(session_replication_role), which needs a superuser: point this at a
+local or CI database, never production.
+
+When adding a query to SupabaseManager, add its shape to QUERY_SHAPES.
+
+Usage:
+    DATABASE_URL=postgresql://postgres@localhost:5432/postgres \\
+        python scripts/check_indexes.py [--drivers 2000] [--transactions 200000] [--verbose]
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import asyncpg
+from dotenv import load_dotenv
+
+# Load environment variables explicitly from the root .env file
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# Mirrors RECENT_TRANSACTION_DAYS / TRANSACTION_LOOKBACK_DAYS in app/supabase_util.py
+RECENT_DAYS = 35
+LOOKBACK_DAYS = 90
+
+# (SupabaseManager method, SQL, parameter names)
+# Parameters are filled from the seeded data by sample_params().
+QUERY_SHAPES = [
+    ("get_driver", "SELECT * FROM drivers WHERE id = $1", ["driver_id"]),
+    ("get_driver_by_phone", "SELECT * FROM drivers WHERE phone_normalized = $1", ["driver_phone"]),
+    ("_refresh_driver_filter", "SELECT id FROM drivers WHERE created_at >= $1", ["driver_filter_since"]),
+    ("get_drivers_for_payout", """
+        SELECT * FROM drivers WHERE pending_balance_cents >= $1
+        ORDER BY pending_balance_cents DESC
+    """, ["payout_threshold"]),
+    ("get_driver_transactions", """
+        SELECT * FROM transactions WHERE driver_id = $1 AND created_at >= $2
+        ORDER BY created_at DESC LIMIT 50
+    """, ["driver_id", "lookback"]),
+    ("get_all_transactions", """
+        SELECT * FROM transactions WHERE created_at >= $1
+        ORDER BY created_at DESC LIMIT 100
+    """, ["lookback"]),
+    ("get_transaction (recent)", """
+        SELECT * FROM transactions WHERE id = $1 AND created_at >= $2 LIMIT 1
+    """, ["transaction_id", "recent"]),
+    ("get_transaction (all partitions)", """
+        SELECT * FROM transactions WHERE id = $1 LIMIT 1
+    """, ["transaction_id"]),
+    ("get_transaction_by_collection_id", """
+        SELECT * FROM transactions WHERE intasend_collection_id = $1 AND created_at >= $2 LIMIT 1
+    """, ["collection_id", "recent"]),
+    ("get_transaction_by_checkout_id", """
+        SELECT * FROM transactions WHERE checkout_request_id = $1 AND created_at >= $2 LIMIT 1
+    """, ["checkout_request_id", "recent"]),
+    ("_update_transaction (pinned)", """
+        UPDATE transactions SET updated_at = NOW() WHERE id = $1 AND created_at = $2
+    """, ["transaction_id", "transaction_created_at"]),
+    ("get_stale_pending_transactions", """
+        SELECT * FROM transactions
+        WHERE status = 'pending' AND created_at >= $1 AND created_at < $2
+          AND intasend_collection_id IS NOT NULL
+        ORDER BY created_at LIMIT 100
+    """, ["lookback", "stale_cutoff"]),
+    ("iter_rows_in_range (archive, by driver)", """
+        SELECT * FROM transactions WHERE created_at >= $1 AND created_at < $2 AND driver_id = $3
+        ORDER BY created_at, id LIMIT 1000
+    """, ["month_start", "month_end", "driver_id"]),
+    ("get_driver_payouts", """
+        SELECT * FROM payouts WHERE driver_id = $1 ORDER BY created_at DESC LIMIT 50
+    """, ["driver_id"]),
+    ("get_pending_payouts", """
+        SELECT * FROM payouts WHERE status = 'pending' ORDER BY created_at DESC LIMIT 100
+    """, []),
+    ("get_processing_payouts", """
+        SELECT * FROM payouts WHERE status = 'processing' AND tracking_id IS NOT NULL
+        ORDER BY created_at LIMIT 500
+    """, []),
+    ("get_payout_by_tracking_id", "SELECT * FROM payouts WHERE tracking_id = $1", ["tracking_id"]),
+    ("update_payout_status", "UPDATE payouts SET updated_at = NOW() WHERE id = $1", ["payout_id"]),
+    ("get_oldest_created_at (payouts)", """
+        SELECT created_at FROM payouts ORDER BY created_at LIMIT 1
+    """, []),
+    ("iter_rows_in_range (archive, payouts)", """
+        SELECT * FROM payouts WHERE created_at >= $1 AND created_at < $2
+          AND status NOT IN ('pending', 'processing')
+        ORDER BY created_at, id LIMIT 1000
+    """, ["month_start", "month_end"]),
+    ("iter_rows_in_range (archive, platform_fees)", """
+        SELECT * FROM platform_fees WHERE created_at >= $1 AND created_at < $2
+        ORDER BY created_at, id LIMIT 1000
+    """, ["month_start", "month_end"]),
+]
+
+
+async def seed(conn: asyncpg.Connection, drivers: int, transactions: int, days: int):
+    """Insert synthetic rows spread over the last `days` days (inside the caller's transaction)."""
+    await conn.execute("SET LOCAL session_replication_role = replica")
+
+    oldest = datetime.now(timezone.utc) - timedelta(days=days)
+    if await conn.fetchval("SELECT to_regproc('create_transaction_partitions') IS NOT NULL"):
+        await conn.execute("SELECT create_transaction_partitions(3, $1::DATE)", oldest.date())
+
+    await conn.execute(f"""
+        INSERT INTO drivers (id, name, phone, phone_normalized, email, vehicle_type, vehicle_number,
+                             pending_balance_cents, created_at)
+        SELECT
+            ('00000000-0000-0000-0000-' || lpad(g::TEXT, 12, '0'))::UUID,
+            'Driver ' || g,
+            '07' || lpad(g::TEXT, 8, '0'),
+            '+2547' || lpad(g::TEXT, 8, '0'),
+            'driver' || g || '@example.com',
+            (ARRAY['boda', 'taxi', 'uber', 'bolt']::vehicle_type[])[1 + g % 4],
+            'KAA ' || g,
+            -- Most drivers sit below the KES 100 payout threshold
+            CASE WHEN g % 20 = 0 THEN 15000 ELSE (g % 10) * 500 END,
+            NOW() - (g::FLOAT / {drivers}) * INTERVAL '{days} days'
+        FROM generate_series(1, {drivers}) g
+    """)
+
+    await conn.execute(f"""
+        INSERT INTO transactions (driver_id, passenger_phone, status, checkout_request_id,
+                                  intasend_collection_id, collection_status, amount_paid_cents,
+                                  platform_fee_cents, driver_amount_cents, created_at)
+        SELECT
+            ('00000000-0000-0000-0000-' || lpad((1 + g % {drivers})::TEXT, 12, '0'))::UUID,
+            '2547' || lpad((g % 100000000)::TEXT, 8, '0'),
+            (CASE WHEN g % 50 = 0 THEN 'pending' WHEN g % 17 = 0 THEN 'failed' ELSE 'payout_completed' END)::transaction_status,
+            'ws_CO_' || g,
+            'COL' || g,
+            CASE WHEN g % 50 = 0 THEN 'pending' WHEN g % 17 = 0 THEN 'failed' ELSE 'completed' END,
+            a, a * 3 / 100, a - a * 3 / 100,
+            NOW() - (g::FLOAT / {transactions}) * INTERVAL '{days} days'
+        FROM generate_series(1, {transactions}) g, LATERAL (SELECT (5000 + g % 200000)::BIGINT AS a) amount
+    """)
+
+    await conn.execute(f"""
+        INSERT INTO payouts (transaction_id, driver_id, amount_cents, tracking_id, status, created_at)
+        SELECT
+            id, driver_id, driver_amount_cents, 'TRK' || row_number() OVER (),
+            CASE WHEN random() < 0.01 THEN 'processing' WHEN random() < 0.01 THEN 'pending' ELSE 'completed' END,
+            created_at
+        FROM transactions
+        WHERE status = 'payout_completed'
+    """)
+
+    await conn.execute("""
+        INSERT INTO platform_fees (transaction_id, amount_cents, created_at)
+        SELECT id, platform_fee_cents, created_at FROM transactions WHERE status = 'payout_completed'
+    """)
+
+    for table in ("drivers", "transactions", "payouts", "platform_fees"):
+        await conn.execute(f"ANALYZE {table}")
+
+
+async def sample_params(conn: asyncpg.Connection) -> dict:
+    """Pick realistic parameter values from the seeded data."""
+    now = datetime.now(timezone.utc)
+    tx = await conn.fetchrow("""
+        SELECT id, driver_id, created_at, intasend_collection_id, checkout_request_id
+        FROM transactions WHERE created_at >= $1 ORDER BY created_at LIMIT 1
+    """, now - timedelta(days=7))
+    payout = await conn.fetchrow("SELECT id, tracking_id FROM payouts WHERE tracking_id IS NOT NULL LIMIT 1")
+    phone = await conn.fetchval("SELECT phone_normalized FROM drivers WHERE id = $1", tx['driver_id'])
+    month_start = (now - timedelta(days=LOOKBACK_DAYS + 30)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    return {
+        "driver_id": tx['driver_id'],
+        "driver_phone": phone,
+        "payout_threshold": 10000,
+        "transaction_id": tx['id'],
+        "transaction_created_at": tx['created_at'],
+        "collection_id": tx['intasend_collection_id'],
+        "checkout_request_id": tx['checkout_request_id'],
+        "tracking_id": payout['tracking_id'],
+        "payout_id": payout['id'],
+        "recent": now - timedelta(days=RECENT_DAYS),
+        "lookback": now - timedelta(days=LOOKBACK_DAYS),
+        "stale_cutoff": now - timedelta(minutes=5),
+        "driver_filter_since": now - timedelta(minutes=2),
+        "month_start": month_start,
+        "month_end": (month_start + timedelta(days=32)).replace(day=1),
+    }
+
+
+def seq_scans(plan: dict, empty: set) -> list:
+    """
+    Relations read by a Seq Scan anywhere in a plan tree.
+
+    Empty relations (future month partitions, the default partition) are
+    skipped: the planner always seq scans them and doing so reads nothing.
+    """
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") not in empty:
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child, empty))
+    return found
+
+
+def scan_nodes(plan: dict) -> list:
+    """Short 'Node on relation using index' descriptions for --verbose."""
+    nodes = []
+    if "Relation Name" in plan:
+        node = f"{plan['Node Type']} on {plan['Relation Name']}"
+        if plan.get("Index Name"):
+            node += f" using {plan['Index Name']}"
+        nodes.append(node)
+    for child in plan.get("Plans", []):
+        nodes.extend(scan_nodes(child))
+    return nodes
+
+
+async def check(conn: asyncpg.Connection, params: dict, verbose: bool) -> list:
+    """EXPLAIN (ANALYZE) every query shape; return the names that used a sequential scan."""
+    failures = []
+    empty = {row['relname'] for row in await conn.fetch(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND relpages = 0"
+    )}
+
+    for name, sql, param_names in QUERY_SHAPES:
+        # EXPLAIN ANALYZE executes UPDATEs; undo them in a savepoint
+        savepoint = conn.transaction()
+        await savepoint.start()
+        try:
+            result = await conn.fetchval(
+                f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}",
+                *(params[p] for p in param_names)
+            )
+        finally:
+            await savepoint.rollback()
+        plan = json.loads(result)[0]
+
+        scans = seq_scans(plan["Plan"], empty)
+        status = "FAIL" if scans else "ok"
+        print(f"  {status:4}  {name:42} {plan['Execution Time']:8.2f} ms"
+              + (f"   seq scan on {', '.join(scans)}" if scans else ""))
+        if verbose:
+            for node in dict.fromkeys(scan_nodes(plan["Plan"])):
+                print(f"          {node}")
+        if scans:
+            failures.append(name)
+
+    return failures
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Fail if any SupabaseManager query shape does a sequential scan")
+    parser.add_argument('--drivers', type=int, default=2000)
+    parser.add_argument('--transactions', type=int, default=200_000)
+    parser.add_argument('--days', type=int, default=180, help="Spread seeded transactions over this many days")
+    parser.add_argument('--verbose', action='store_true', help="Print the scan nodes of every plan")
+    args = parser.parse_args()
+
+    dsn = os.environ.get("DATABASE_URL")
+    if not dsn:
+        print("Error: DATABASE_URL not found in environment variables.")
+        sys.exit(1)
+
+    conn = await asyncpg.connect(dsn)
+    try:
+        tx = conn.transaction()
+        await tx.start()
+        try:
+            print(f"Seeding {args.drivers:,} drivers and {args.transactions:,} transactions...")
+            await seed(conn, args.drivers, args.transactions, args.days)
+            params = await sample_params(conn)
+
+            print("\nQuery shapes:")
+            failures = await check(conn, params, args.verbose)
+        finally:
+            await tx.rollback()
+    finally:
+        await conn.close()
+
+    if failures:
+        print(f"\n{len(failures)} of {len(QUERY_SHAPES)} query shapes use a sequential scan")
+        sys.exit(1)
+
+    print(f"\nAll {len(QUERY_SHAPES)} query shapes use indexes")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
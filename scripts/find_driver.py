@@ -1,8 +1,13 @@
 import os
+import sys
 import asyncio
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.phone import normalize_phone  # noqa: E402
+
 # Load environment variables explicitly from the root .env file
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
@@ -17,7 +22,14 @@ supabase: Client = create_client(url, key)
 
 def get_driver_by_phone(phone_number: str):
     try:
-        response = supabase.table("drivers").select("*").eq("phone", phone_number).execute()
+        # Any format works: 0712..., 254712..., +254 712 ...
+        phone_normalized = normalize_phone(phone_number)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return None
+
+    try:
+        response = supabase.table("drivers").select("*").eq("phone_normalized", phone_normalized).execute()
         if response.data:
             return response.data[0]
         return None
@@ -26,7 +38,7 @@ def get_driver_by_phone(phone_number: str):
         return None
 
 if __name__ == "__main__":
-    PHONE = "254740915456"
+    PHONE = sys.argv[1] if len(sys.argv) > 1 else "254740915456"
     print(f"Searching for driver with phone: {PHONE}...")
     driver = get_driver_by_phone(PHONE)
     
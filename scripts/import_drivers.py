@@ -0,0 +1,67 @@
+"""
+Register a fleet's drivers from a CSV file.
+
+The CSV needs the columns name, phone, email, vehicle_type, vehicle_number
+and password. Rows are validated and inserted in batches, and each driver
+gets a QR code, the same way POST /api/admin/drivers/import does (see
+app/bulk_onboarding.py). Writes one report line per row: created, invalid,
+duplicate or failed, with the driver ID or the reason.
+
+Usage:
+    python scripts/import_drivers.py fleet.csv [--report import_report.csv]
+"""
+import os
+import sys
+import csv
+import time
+import asyncio
+import argparse
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Load environment variables explicitly from the root .env file
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+from app.pg_fast import create_supabase_manager  # noqa: E402
+from app.bulk_onboarding import import_drivers  # noqa: E402
+from app.models import DriverImportRow  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Register drivers from a CSV file")
+    parser.add_argument('csv_file', help="CSV with name, phone, email, vehicle_type, vehicle_number, password")
+    parser.add_argument('--report', default='import_report.csv', help="Where to write the per-row results")
+    args = parser.parse_args()
+
+    if not os.environ.get("SUPABASE_URL") or not os.environ.get("SUPABASE_ANON_KEY"):
+        print("Error: SUPABASE_URL and SUPABASE_ANON_KEY not found in environment variables.")
+        sys.exit(1)
+
+    with open(args.csv_file, encoding='utf-8-sig', newline='') as f:
+        text = f.read()
+
+    supabase_manager = create_supabase_manager()
+    started = time.perf_counter()
+    try:
+        report = await import_drivers(supabase_manager, text)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+    finally:
+        await supabase_manager.close()
+
+    with open(args.report, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(DriverImportRow.model_fields))
+        writer.writeheader()
+        for row in report.rows:
+            writer.writerow(row.model_dump())
+
+    print(f"{report.total} rows in {time.perf_counter() - started:.1f}s: {report.created} created, "
+          f"{report.invalid} invalid, {report.duplicate} duplicate, {report.failed} failed")
+    print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
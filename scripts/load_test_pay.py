@@ -0,0 +1,149 @@
+"""
+Load test /api/pay against the p99 budget, with simulated Supabase and IntaSend latency.
+
+The app runs in-process (no server needed), backed by the stand-ins in
+scripts/simulated_backends.py. --concurrency passengers pay at once,
+--requests payments in total. The script prints end-to-end and per-stage
+percentiles, taken from the Server-Timing header /api/pay returns.
+
+Budget: p99 of /api/pay minus IntaSend's own STK push time (which we
+cannot shorten) stays under PAY_P99_BUDGET_MS (150 ms by default) at 50
+concurrent payments, with 25 ms database calls and a 1 s STK push. The
+exit status is 1 when the budget is missed.
+
+Usage:
+    python scripts/load_test_pay.py [--requests 500] [--concurrency 50]
+        [--db-ms 25] [--stk-ms 1000] [--budget-ms 150]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+import tempfile
+from collections import defaultdict
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Load environment variables explicitly from the root .env file
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# Always the PostgREST manager, with no real database behind it; unsigned links
+os.environ.pop('DATABASE_URL', None)
+os.environ.pop('QR_SIGNATURE_REQUIRED', None)
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+os.environ.setdefault('SUPABASE_ANON_KEY', 'load-test')
+os.environ['BACKGROUND_JOB_DIR'] = tempfile.mkdtemp(prefix='pay-load-test-')
+# Every simulated payment goes to one driver from one address: no admission limits
+for kind in ('PHONE', 'DRIVER', 'IP'):
+    os.environ[f'ADMISSION_LIMIT_PER_{kind}'] = '0'
+
+import httpx  # noqa: E402
+
+from app import main as app_main  # noqa: E402
+from simulated_backends import SimulatedSupabase, SimulatedIntaSendSession  # noqa: E402
+
+# Per-request INFO logs would dominate the measurement
+logging.getLogger().setLevel(logging.WARNING)
+
+PAY_P99_BUDGET_MS = float(os.getenv('PAY_P99_BUDGET_MS', '150'))
+
+DRIVER_ID = '3f1c2b7e-8a4d-4c1e-9b2f-6d5e4a3b2c1d'
+
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def parse_server_timing(header: str) -> dict:
+    stages = {}
+    for entry in filter(None, (part.strip() for part in header.split(','))):
+        name, _, duration = entry.partition(';dur=')
+        stages[name] = float(duration)
+    return stages
+
+
+async def run(requests: int, concurrency: int) -> tuple:
+    totals = []
+    stages = defaultdict(list)
+    numbers = iter(range(requests))
+    transport = httpx.ASGITransport(app=app_main.app)
+
+    app_main.loop_monitor.start()
+    await app_main.collection_bookkeeping.start()
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url='http://load-test', timeout=60) as client:
+            async def passenger():
+                for n in numbers:
+                    started = time.perf_counter()
+                    response = await client.post('/api/pay', json={
+                        'driver_id': DRIVER_ID,
+                        'amount': 100 + n % 400,
+                        'passenger_phone': f'07{n % 10 ** 8:08d}'
+                    })
+                    totals.append((time.perf_counter() - started) * 1000)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"Payment failed: {response.status_code} {response.text}")
+                    for name, duration in parse_server_timing(response.headers.get('server-timing', '')).items():
+                        stages[name].append(duration)
+
+            await asyncio.gather(*(passenger() for _ in range(concurrency)))
+    finally:
+        await app_main.collection_bookkeeping.stop()
+        await app_main.loop_monitor.stop()
+    return totals, stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/pay with simulated backends")
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--db-ms', type=float, default=25, help="Latency of each database call")
+    parser.add_argument('--stk-ms', type=float, default=1000, help="Latency of the IntaSend STK push")
+    parser.add_argument('--budget-ms', type=float, default=PAY_P99_BUDGET_MS,
+                        help="p99 budget for /api/pay excluding the STK push")
+    args = parser.parse_args()
+
+    simulated = SimulatedSupabase(args.db_ms / 1000)
+    simulated.select_rows['drivers'] = [{
+        'id': DRIVER_ID, 'name': 'Load Test Driver', 'phone': '+254700000001', 'email': 'driver@example.com',
+        'vehicle_type': 'boda', 'vehicle_number': 'KLT 001A'
+    }]
+    app_main.supabase_manager.supabase = simulated
+    app_main.intasend_api.session = SimulatedIntaSendSession(args.stk_ms / 1000)
+
+    started = time.perf_counter()
+    totals, stages = asyncio.run(run(args.requests, args.concurrency))
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.requests} payments, concurrency {args.concurrency}, db {args.db_ms:g} ms, STK {args.stk_ms:g} ms: "
+          f"{args.requests / elapsed:.1f} req/s")
+    print(f"  {'':12} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)")
+    print(f"  {'end to end':12} {statistics.median(totals):8.1f} {percentile(totals, 95):8.1f} {percentile(totals, 99):8.1f}")
+    for name, durations in stages.items():
+        print(f"  {name:12} {statistics.median(durations):8.1f} {percentile(durations, 95):8.1f} "
+              f"{percentile(durations, 99):8.1f}")
+
+    # Our share of each request: everything except IntaSend's own response time
+    # (waiting for a free IntaSend connection counts against us)
+    overhead = [total - args.stk_ms for total in stages['total']]
+    p99 = percentile(overhead, 99)
+    print(f"  {'without STK':12} {statistics.median(overhead):8.1f} {percentile(overhead, 95):8.1f} {p99:8.1f}")
+    print(f"  collection IDs recorded: {simulated.writes['update']}")
+    loop = app_main.loop_monitor.status()
+    print(f"  event loop lag p50 {loop['lag_p50_ms']} ms, p99 {loop['lag_p99_ms']} ms, "
+          f"max {loop['lag_max_ms']} ms, {len(loop['stalls'])} stall(s)")
+
+    if p99 > args.budget_ms:
+        print(f"FAIL: p99 without STK {p99:.1f} ms > budget {args.budget_ms:g} ms")
+        sys.exit(1)
+    print(f"OK: p99 without STK {p99:.1f} ms <= budget {args.budget_ms:g} ms")
+
+
+if __name__ == "__main__":
+    main()
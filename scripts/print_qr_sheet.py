@@ -0,0 +1,89 @@
+"""
+Print QR sticker sheets for a fleet.
+
+Writes an A4 PDF with 12 stickers per page (QR code, driver name, vehicle
+number) for the given drivers, in the given order. Pages are rendered in
+a process pool and written as they complete (see app/print_sheets.py).
+
+Usage:
+    python scripts/print_qr_sheet.py <driver_id> [<driver_id> ...] [-o stickers.pdf]
+    python scripts/print_qr_sheet.py --file fleet_driver_ids.txt   # one ID per line
+    python scripts/print_qr_sheet.py --all
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Load environment variables explicitly from the root .env file
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+from app.pg_fast import create_supabase_manager  # noqa: E402
+from app.print_sheets import stream_pdf, driver_stickers, shutdown_pool  # noqa: E402
+
+PAGE_SIZE = 1000
+
+
+def all_driver_ids(supabase_manager) -> list:
+    """Every driver ID, oldest registration first."""
+    driver_ids = []
+    offset = 0
+    while True:
+        result = (supabase_manager.supabase.table('drivers')
+                  .select('id')
+                  .order('created_at')
+                  .order('id')
+                  .range(offset, offset + PAGE_SIZE - 1)
+                  .execute())
+        driver_ids.extend(row['id'] for row in result.data)
+        if len(result.data) < PAGE_SIZE:
+            return driver_ids
+        offset += PAGE_SIZE
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Print QR sticker sheets (PDF) for drivers")
+    parser.add_argument('driver_ids', nargs='*', help="Driver IDs, in sticker order")
+    parser.add_argument('--file', help="File with one driver ID per line")
+    parser.add_argument('--all', action='store_true', help="Every registered driver")
+    parser.add_argument('-o', '--output', default='qr_stickers.pdf')
+    args = parser.parse_args()
+
+    if not os.environ.get("SUPABASE_URL") or not os.environ.get("SUPABASE_ANON_KEY"):
+        print("Error: SUPABASE_URL and SUPABASE_ANON_KEY not found in environment variables.")
+        sys.exit(1)
+
+    supabase_manager = create_supabase_manager()
+    driver_ids = list(args.driver_ids)
+    if args.file:
+        with open(args.file) as f:
+            driver_ids.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    if args.all:
+        driver_ids.extend(all_driver_ids(supabase_manager))
+
+    if not driver_ids:
+        print("Error: no drivers given (pass IDs, --file or --all).")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    written = 0
+    try:
+        with open(args.output, 'wb') as f:
+            async for chunk in stream_pdf(driver_stickers(supabase_manager, driver_ids)):
+                f.write(chunk)
+                written += len(chunk)
+    finally:
+        shutdown_pool()
+        await supabase_manager.close()
+
+    print(f"Wrote {args.output} ({len(driver_ids)} drivers, {written / 1024:.0f} KB) "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
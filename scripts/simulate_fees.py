@@ -0,0 +1,80 @@
+"""
+Simulate a fee rule change over historical transactions.
+
+Loads completed transactions (amount and driver vehicle type), reprices them
+with the current rules and a candidate rule file using the vectorized fee
+engine, and prints the difference.
+
+Usage:
+    python scripts/simulate_fees.py candidate_rules.json [--days 90]
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+from dotenv import load_dotenv
+from supabase import create_client, Client
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.fees import FeeEngine  # noqa: E402
+
+# Load environment variables explicitly from the root .env file
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+PAGE_SIZE = 1000
+
+
+def load_transactions(supabase: Client, since: datetime):
+    """Page through completed collections, returning (amounts_cents, vehicle_types) arrays."""
+    amounts, vehicles = [], []
+    offset = 0
+
+    while True:
+        result = (supabase.table('transactions')
+                  .select('amount_paid_cents, drivers(vehicle_type)')
+                  .eq('collection_status', 'completed')
+                  .gte('created_at', since.isoformat())
+                  .order('created_at')
+                  .range(offset, offset + PAGE_SIZE - 1)
+                  .execute())
+
+        for row in result.data:
+            amounts.append(row['amount_paid_cents'])
+            vehicles.append((row.get('drivers') or {}).get('vehicle_type') or '*')
+
+        if len(result.data) < PAGE_SIZE:
+            break
+        offset += PAGE_SIZE
+
+    return np.asarray(amounts, dtype=np.int64), np.asarray(vehicles, dtype=object)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate fee rule changes over past transactions")
+    parser.add_argument('candidate', help="Path to candidate fee rules (JSON, same format as FEE_RULES)")
+    parser.add_argument('--days', type=int, default=90, help="How many days of history to reprice")
+    args = parser.parse_args()
+
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        print("Error: Supabase credentials not found in environment variables.")
+        sys.exit(1)
+
+    with open(args.candidate) as f:
+        candidate = FeeEngine.from_config(json.load(f))
+    current = FeeEngine.from_env()
+
+    supabase = create_client(url, key)
+    amounts, vehicles = load_transactions(supabase, datetime.utcnow() - timedelta(days=args.days))
+    print(f"Loaded {amounts.size} transactions from the last {args.days} days")
+
+    summary = current.simulate(candidate, amounts, vehicles)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
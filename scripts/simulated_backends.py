@@ -0,0 +1,102 @@
+"""
+Stand-ins for Supabase and IntaSend with fixed latency, for the
+in-process benchmarks (bench_registration.py, load_test_pay.py).
+
+Every call blocks its calling thread for the configured time, as the
+real synchronous clients do, and writes are counted. Query filters are
+ignored. A select returns the rows set in select_rows for its table
+(none by default).
+"""
+import os
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+
+class SimulatedQuery:
+    """A PostgREST query builder whose execute() takes db_seconds."""
+
+    def __init__(self, client, table: str):
+        self.client = client
+        self.table = table
+        self.payload = None
+        self.write = None
+
+    def insert(self, payload):
+        self.payload, self.write = payload, 'insert'
+        return self
+
+    def update(self, payload):
+        self.payload, self.write = payload, 'update'
+        return self
+
+    def __getattr__(self, name):
+        # select, eq, in_, order, not_, ...: no effect on the simulated result
+        return lambda *args, **kwargs: self
+
+    @property
+    def not_(self):
+        return self
+
+    def execute(self):
+        time.sleep(self.client.db_seconds)
+        if self.write:
+            self.client.writes[self.write] += 1
+        if self.write == 'insert':
+            rows = self.payload if isinstance(self.payload, list) else [self.payload]
+            return SimpleNamespace(data=[{'id': str(uuid.uuid4()), **row} for row in rows])
+        if self.write == 'update':
+            return SimpleNamespace(data=[self.payload])
+        return SimpleNamespace(data=list(self.client.select_rows.get(self.table, [])))
+
+
+class SimulatedBucket:
+    def __init__(self, client, bucket: str):
+        self.client = client
+        self.bucket = bucket
+
+    def upload(self, path, data, file_options=None):
+        time.sleep(self.client.upload_seconds)
+        self.client.writes['upload'] += 1
+
+    def get_public_url(self, path):
+        return f"{os.environ.get('SUPABASE_URL', 'http://localhost:54321')}/storage/v1/object/public/{self.bucket}/{path}"
+
+
+class SimulatedSupabase:
+    """Stand-in for supabase.Client."""
+
+    def __init__(self, db_seconds: float, upload_seconds: float = 0.0):
+        self.db_seconds = db_seconds
+        self.upload_seconds = upload_seconds
+        self.writes = {'insert': 0, 'update': 0, 'upload': 0}
+        self.select_rows: Dict[str, List[Dict[str, Any]]] = {}
+        self.storage = SimpleNamespace(from_=lambda bucket: SimulatedBucket(self, bucket))
+
+    def table(self, name: str) -> SimulatedQuery:
+        return SimulatedQuery(self, name)
+
+    def rpc(self, name: str, params=None):
+        query = SimulatedQuery(self, name)
+        query.execute = lambda: (time.sleep(self.db_seconds), SimpleNamespace(data=uuid.uuid4().hex[:7]))[1]
+        return query
+
+
+class SimulatedIntaSendSession:
+    """Stand-in for IntaSendAPI.session: every call takes api_seconds and succeeds."""
+
+    def __init__(self, api_seconds: float):
+        self.api_seconds = api_seconds
+        self.calls = 0
+
+    def _respond(self, body: Dict[str, Any]):
+        time.sleep(self.api_seconds)
+        self.calls += 1
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: body)
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        return self._respond({'id': uuid.uuid4().hex[:8].upper(), 'invoice': {'state': 'PENDING'}})
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        return self._respond({'invoice': {'state': 'PENDING'}})
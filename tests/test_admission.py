@@ -0,0 +1,85 @@
+"""Admission limits: the per-IP key is the address our proxy saw, and Retry-After is exactly when a request fits again."""
+
+import pytest
+
+from app import admission
+from app.admission import client_ip, SlidingWindowCounter, AdmissionController
+
+
+def test_spoofed_forwarded_entries_are_ignored():
+    # Client sent "X-Forwarded-For: 1.2.3.4"; Render appended the real address
+    assert client_ip('10.0.0.7', '1.2.3.4, 41.90.1.2', trusted_hops=1) == '41.90.1.2'
+    assert client_ip('10.0.0.7', '41.90.1.2', trusted_hops=1) == '41.90.1.2'
+
+
+def test_header_ignored_without_trusted_proxies():
+    assert client_ip('41.90.1.2', '1.2.3.4', trusted_hops=0) == '41.90.1.2'
+    assert client_ip('10.0.0.7', None, trusted_hops=1) == '10.0.0.7'
+
+
+
+@pytest.mark.parametrize('limit, previous, current, elapsed', [
+    (5, 0, 5, 0.1),     # at the limit inside the current window only
+    (5, 0, 7, 0.5),
+    (1, 0, 1, 0.0),
+    (3, 3, 3, 0.99),    # must wait into the next window
+    (5, 10, 0, 0.2),    # carryover: the previous window alone is over
+    (5, 6, 2, 0.4),
+    (5, 5, 4, 0.5),
+])
+def test_retry_after_is_when_one_more_event_fits(limit, previous, current, elapsed):
+    counter = SlidingWindowCounter('phone', limit, window_seconds=60)
+    for _ in range(previous):
+        counter.add('k', 60 * 10 + 1)
+    for _ in range(current):
+        counter.add('k', 60 * 11)
+    now = 60 * (11 + elapsed)
+
+    wait = counter.retry_after('k', now)
+
+    assert wait is not None and wait > 0
+    # The counter rolls forward with time, so probe the earlier instant first
+    assert counter.retry_after('k', now + wait - 0.01) is not None
+    assert counter.retry_after('k', now + wait + 0.01) is None
+
+
+def test_under_the_limit_needs_no_wait():
+    counter = SlidingWindowCounter('phone', 5, window_seconds=60)
+    for _ in range(4):
+        counter.add('k', 600)
+
+    assert counter.retry_after('k', 601) is None
+    assert counter.retry_after('other', 601) is None
+
+
+def test_key_idle_for_two_windows_starts_over():
+    counter = SlidingWindowCounter('phone', 5, window_seconds=60)
+    for _ in range(5):
+        counter.add('k', 600)
+
+    assert counter.retry_after('k', 610) is not None
+    assert counter.retry_after('k', 600 + 121) is None
+    for _ in range(4):
+        counter.add('k', 721)
+    assert counter.retry_after('k', 721) is None
+
+
+def test_rejected_payment_is_not_counted(monkeypatch):
+    controller = AdmissionController({'phone': 2, 'driver': 10, 'ip': 0}, window_seconds=60)
+    monkeypatch.setattr(admission.time, 'time', lambda: 6000.0)
+
+    assert controller.admit(phone='+254712345678', driver='d1', ip='41.90.1.2') is None
+    assert controller.admit(phone='+254712345678', driver='d1') is None
+    kind, wait = controller.admit(phone='+254712345678', driver='d1')
+
+    assert kind == 'phone' and wait == pytest.approx(60.0)
+    assert controller.counters['driver'].own_count('d1', 100) == 2
+    assert 'ip' not in controller.counters
+    # Another passenger paying the same driver is unaffected
+    assert controller.admit(phone='+254722000000', driver='d1') is None
+
+
+def test_retry_after_header_rounds_up_to_a_whole_second():
+    assert AdmissionController.retry_after_header(0.0) == '1'
+    assert AdmissionController.retry_after_header(1.2) == '2'
+    assert AdmissionController.retry_after_header(30.0) == '30'
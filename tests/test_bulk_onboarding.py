@@ -0,0 +1,39 @@
+"""Bulk onboarding finds duplicate emails whatever their case, in the file and in the database."""
+
+import asyncio
+
+from app.bulk_onboarding import parse_csv, _drop_registered
+
+HEADER = "name,phone,email,vehicle_type,vehicle_number,password\n"
+
+
+class FakeManager:
+    def __init__(self, emails):
+        self.emails = emails
+        self.queried = None
+
+    async def find_registered(self, phones_normalized, emails):
+        self.queried = emails
+        return set(), {email for email in emails if email in self.emails}
+
+
+def test_emails_differing_in_case_are_duplicates_within_the_file():
+    valid, rejected = parse_csv(
+        HEADER
+        + "Jane,0712345678,Jane@Fleet.co.ke,boda,KMEA 001A,secret123\n"
+        + "John,0722345678,jane@fleet.co.ke,boda,KMEA 002A,secret123\n"
+    )
+
+    assert [line for line, _ in valid] == [2]
+    assert rejected[0].status == 'duplicate'
+
+
+def test_email_registered_in_another_case_is_a_duplicate():
+    valid, _ = parse_csv(HEADER + "Jane,0712345678,Jane@Fleet.co.ke,boda,KMEA 001A,secret123\n")
+    manager = FakeManager({'jane@fleet.co.ke'})
+
+    new_rows, rejected = asyncio.run(_drop_registered(manager, valid))
+
+    assert manager.queried == ['jane@fleet.co.ke']
+    assert new_rows == []
+    assert rejected[0].error == "Email already registered"
@@ -0,0 +1,130 @@
+"""Journaled jobs survive failures and dead processes, and the journal stays bounded."""
+
+import os
+import json
+import asyncio
+import subprocess
+import sys
+
+from app import durable_queue
+from app.durable_queue import DurableQueue, _unfinished
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def write_journal(path, records):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def journal_lines(queue) -> int:
+    with open(queue._journal_path(os.getpid()), encoding='utf-8') as f:
+        return sum(1 for _ in f)
+
+
+def test_unfinished_jobs_of_a_dead_process_run_again(tmp_path):
+    orphan = tmp_path / f"jobs-{dead_pid()}.jsonl"
+    write_journal(orphan, [
+        {'job': {'id': 'a', 'submitted_at': 0, 'payload': {'n': 1}}},
+        {'job': {'id': 'b', 'submitted_at': 0, 'payload': {'n': 2}}},
+        {'done': 'a'}
+    ])
+    with open(orphan, 'a', encoding='utf-8') as f:
+        f.write('{"job": {"id": "c"')  # torn write from the crash
+    ran = []
+
+    async def handler(payload):
+        ran.append(payload['n'])
+
+    async def scenario():
+        queue = DurableQueue('jobs', handler, journal_dir=str(tmp_path), workers=1)
+        recovered = await queue.start()
+        await queue.stop()
+        return recovered
+
+    assert asyncio.run(scenario()) == 1
+    assert ran == [2]
+    assert not orphan.exists()
+
+
+def test_journal_of_a_live_process_is_left_alone(tmp_path):
+    live = tmp_path / f"jobs-{os.getppid()}.jsonl"
+    write_journal(live, [{'job': {'id': 'a', 'submitted_at': 0, 'payload': {}}}])
+    ran = []
+
+    async def handler(payload):
+        ran.append(payload)
+
+    async def scenario():
+        queue = DurableQueue('jobs', handler, journal_dir=str(tmp_path), workers=1)
+        recovered = await queue.start()
+        await queue.stop()
+        return recovered
+
+    assert asyncio.run(scenario()) == 0
+    assert ran == []
+    assert _unfinished(str(live))[0]['id'] == 'a'
+
+
+def test_failed_job_is_retried_then_the_journal_is_emptied(tmp_path, monkeypatch):
+    monkeypatch.setattr(durable_queue, 'BACKGROUND_JOB_BASE_DELAY_SECONDS', 0.01)
+    attempts = []
+
+    async def handler(payload):
+        attempts.append(payload)
+        if len(attempts) < 3:
+            raise RuntimeError('database unavailable')
+
+    async def scenario():
+        queue = DurableQueue('jobs', handler, journal_dir=str(tmp_path), workers=1, max_attempts=5)
+        await queue.start()
+        queue.submit({'n': 1})
+        await asyncio.wait_for(queue._idle.wait(), 5)
+        lines = journal_lines(queue)
+        await queue.stop()
+        return lines
+
+    assert asyncio.run(scenario()) == 0
+    assert len(attempts) == 3
+
+
+def test_parked_job_is_retried_and_the_journal_stays_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(durable_queue, 'BACKGROUND_JOB_BASE_DELAY_SECONDS', 0.01)
+    failing = {'stuck': 4}
+
+    async def handler(payload):
+        if payload['n'] == 'stuck' and failing['stuck'] > 0:
+            failing['stuck'] -= 1
+            raise RuntimeError('still failing')
+
+    async def scenario():
+        queue = DurableQueue(
+            'jobs', handler, journal_dir=str(tmp_path), workers=2,
+            max_attempts=2, parked_retry_seconds=0.05
+        )
+        await queue.start()
+        queue.submit({'n': 'stuck'})
+        while not queue._parked:
+            await asyncio.sleep(0.01)
+
+        # Other jobs keep completing while one is parked: only it stays in the journal
+        for n in range(20):
+            queue.submit({'n': n})
+        while len(queue._pending) > len(queue._parked):
+            await asyncio.sleep(0.01)
+        assert journal_lines(queue) <= 1
+
+        # The slow retries get it through eventually
+        while queue._pending:
+            await asyncio.sleep(0.01)
+        lines = journal_lines(queue)
+        await queue.stop()
+        return lines
+
+    assert asyncio.run(scenario()) == 0
+    assert failing['stuck'] == 0
@@ -0,0 +1,72 @@
+"""Pricing one payment and repricing a batch use the same bands and always agree."""
+
+import numpy as np
+import pytest
+
+from app.fees import FeeEngine
+
+RULES = [
+    {"vehicle_type": "boda", "min_amount": 0, "percentage": 2.5, "min_fee": 1},
+    {"vehicle_type": "boda", "min_amount": 500, "percentage": 2.0, "max_fee": 50},
+    {"vehicle_type": "taxi", "min_amount": 0, "percentage": 3.0, "fixed": 5},
+    {"vehicle_type": "taxi", "min_amount": 2000, "percentage": 1.75, "fixed": 5, "max_fee": 60},
+    {"min_amount": 0, "percentage": 3.0}
+]
+
+# Band edges (KES 500, 2000), floors and caps, amounts smaller than the fee, rounding ties
+AMOUNTS = [1, 2, 33, 99, 100, 101, 2000, 4000, 49999, 50000, 50001, 199999, 200000, 200001, 250000, 300000, 10 ** 9]
+VEHICLES = ["boda", "taxi", "matatu", None]
+
+
+def test_scalar_and_batch_agree_on_every_band():
+    engine = FeeEngine.from_config(RULES)
+    amounts = AMOUNTS * len(VEHICLES)
+    vehicles = [vehicle for vehicle in VEHICLES for _ in AMOUNTS]
+
+    batch = engine.price_batch(amounts, [vehicle or "*" for vehicle in vehicles])
+    scalar = [engine.calculate(amount, vehicle)["platform_fee_cents"] for amount, vehicle in zip(amounts, vehicles)]
+
+    assert batch.tolist() == scalar
+
+
+def test_scalar_and_batch_agree_on_random_amounts():
+    engine = FeeEngine.from_config(RULES)
+    rng = np.random.default_rng(7)
+    amounts = rng.integers(1, 1_000_000, size=5000)
+    vehicles = rng.choice(["boda", "taxi", "matatu"], size=5000)
+
+    batch = engine.price_batch(amounts, vehicles)
+
+    for amount, vehicle, fee in zip(amounts.tolist(), vehicles.tolist(), batch.tolist()):
+        assert engine.calculate(amount, vehicle)["platform_fee_cents"] == fee
+
+
+def test_band_floor_cap_and_fee_never_above_the_payment():
+    engine = FeeEngine.from_config(RULES)
+
+    # 2.5% of KES 10 is 25 cents, below the KES 1 floor
+    assert engine.calculate(1000, "boda")["platform_fee_cents"] == 100
+    # Floor, but never more than the payment itself
+    assert engine.calculate(40, "boda")["platform_fee_cents"] == 40
+    # KES 500 starts the 2% band
+    assert engine.calculate(50000, "boda")["fee_percentage"] == 2.0
+    assert engine.calculate(49999, "boda")["fee_percentage"] == 2.5
+    # 2% of KES 5000 is KES 100, capped at KES 50
+    assert engine.calculate(500000, "boda")["platform_fee_cents"] == 5000
+    # Unknown vehicle types use the default bands
+    assert engine.calculate(10000, "matatu") == engine.calculate(10000)
+
+    result = engine.calculate(10000, "taxi")
+    assert result["platform_fee_cents"] == 300 + 500
+    assert result["driver_amount_cents"] == 10000 - 800
+
+
+def test_invalid_band_tables_are_rejected():
+    with pytest.raises(ValueError):
+        FeeEngine.from_config([{"min_amount": 100, "percentage": 3.0}])
+    with pytest.raises(ValueError):
+        FeeEngine.from_config([{"min_amount": 0, "percentage": 3.0}, {"min_amount": 0, "percentage": 2.0}])
+    with pytest.raises(ValueError):
+        FeeEngine.from_config([{"vehicle_type": "boda", "min_amount": 0, "percentage": 3.0}])
+    with pytest.raises(ValueError):
+        FeeEngine.from_config([{"min_amount": 0, "percentage": 2.755}])
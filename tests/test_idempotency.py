@@ -0,0 +1,184 @@
+"""Each keyed payment runs once, on one worker or several; repeats get its response."""
+
+import time
+import asyncio
+
+import pytest
+
+from app import idempotency
+from app.idempotency import IdempotentRequests, IdempotencyConflict, IdempotencyInProgress
+
+
+class FakeStore:
+    """The idempotency_keys table and claim_idempotency_key() over a dict, with the SQL function's semantics."""
+
+    def __init__(self):
+        self.rows = {}
+        self.renewals = 0
+
+    async def claim_idempotency_key(self, key, request_hash, ttl_seconds, lock_seconds):
+        now = time.monotonic()
+        row = self.rows.get(key)
+        if row is None or row['expires_at'] < now or (row['response'] is None and row['locked_until'] < now):
+            self.rows[key] = {
+                'request_hash': request_hash, 'response': None,
+                'locked_until': now + lock_seconds, 'expires_at': now + ttl_seconds
+            }
+            return {'claimed': True}
+        return {'claimed': False, 'request_hash': row['request_hash'], 'response': row['response']}
+
+    async def renew_idempotency_key(self, key, lock_seconds):
+        row = self.rows.get(key)
+        if row is not None and row['response'] is None:
+            row['locked_until'] = time.monotonic() + lock_seconds
+            self.renewals += 1
+
+    async def complete_idempotency_key(self, key, response):
+        self.rows[key]['response'] = response
+
+    async def release_idempotency_key(self, key):
+        if key in self.rows and self.rows[key]['response'] is None:
+            del self.rows[key]
+
+
+class Payment:
+    """An execute() that counts its runs and can be slow or fail."""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.runs = 0
+
+    async def __call__(self):
+        self.runs += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('IntaSend unavailable')
+        return {'transaction_id': f"tx-{self.runs}"}
+
+
+def test_repeat_gets_the_stored_response():
+    requests = IdempotentRequests()
+    payment = Payment()
+
+    async def scenario():
+        first = await requests.run('key:a', 'fp', 60, payment)
+        second = await requests.run('key:a', 'fp', 60, payment)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first == ({'transaction_id': 'tx-1'}, False)
+    assert second == ({'transaction_id': 'tx-1'}, True)
+    assert payment.runs == 1
+
+
+def test_concurrent_repeats_wait_for_the_one_execution():
+    requests = IdempotentRequests()
+    payment = Payment(delay=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(requests.run('key:a', 'fp', 60, payment) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+
+    assert payment.runs == 1
+    assert {response['transaction_id'] for response, _ in results} == {'tx-1'}
+    assert [replayed for _, replayed in results].count(False) == 1
+
+
+def test_key_reused_for_another_payment_conflicts():
+    requests = IdempotentRequests()
+    payment = Payment(delay=0.05)
+
+    async def scenario():
+        running = asyncio.ensure_future(requests.run('key:a', 'fp-1', 60, payment))
+        await asyncio.sleep(0)
+        with pytest.raises(IdempotencyConflict):
+            await requests.run('key:a', 'fp-2', 60, payment)
+        await running
+        with pytest.raises(IdempotencyConflict):
+            await requests.run('key:a', 'fp-2', 60, payment)
+
+    asyncio.run(scenario())
+    assert payment.runs == 1
+
+
+def test_failed_request_releases_the_key():
+    store = FakeStore()
+    requests = IdempotentRequests(store)
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await requests.run('key:a', 'fp', 60, Payment(fail=True))
+        assert 'key:a' not in store.rows
+        return await requests.run('key:a', 'fp', 60, Payment())
+
+    assert asyncio.run(scenario()) == ({'transaction_id': 'tx-1'}, False)
+    assert store.rows['key:a']['response'] == {'transaction_id': 'tx-1'}
+
+
+def test_other_worker_waits_for_the_claim_then_replays(monkeypatch):
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_WAIT_SECONDS', 5)
+    store = FakeStore()
+    worker_a, worker_b = IdempotentRequests(store), IdempotentRequests(store)
+    payment = Payment(delay=0.3)
+
+    async def scenario():
+        first = asyncio.ensure_future(worker_a.run('key:a', 'fp', 60, payment))
+        await asyncio.sleep(0.05)
+        second = await worker_b.run('key:a', 'fp', 60, payment)
+        return await first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert payment.runs == 1
+    assert second == (first[0], True)
+
+
+def test_other_worker_gives_up_on_a_long_claim(monkeypatch):
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_WAIT_SECONDS', 0.2)
+    store = FakeStore()
+    worker_a, worker_b = IdempotentRequests(store), IdempotentRequests(store)
+
+    async def scenario():
+        first = asyncio.ensure_future(worker_a.run('key:a', 'fp', 60, Payment(delay=1.0)))
+        await asyncio.sleep(0.05)
+        with pytest.raises(IdempotencyInProgress):
+            await worker_b.run('key:a', 'fp', 60, Payment())
+        first.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_claim_is_renewed_while_a_slow_request_runs(monkeypatch):
+    # The STK push outlasts the lock several times over
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_LOCK_SECONDS', 0.1)
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_WAIT_SECONDS', 5)
+    store = FakeStore()
+    worker_a, worker_b = IdempotentRequests(store), IdempotentRequests(store)
+    payment = Payment(delay=0.5)
+
+    async def scenario():
+        first = asyncio.ensure_future(worker_a.run('key:a', 'fp', 60, payment))
+        await asyncio.sleep(0.3)
+        second = await worker_b.run('key:a', 'fp', 60, payment)
+        return await first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert payment.runs == 1
+    assert second == (first[0], True)
+    assert store.renewals >= 3
+
+
+def test_claim_of_a_dead_worker_is_taken_over_once_it_lapses(monkeypatch):
+    store = FakeStore()
+
+    async def scenario():
+        # Claimed, then the worker died without storing a response
+        await store.claim_idempotency_key('key:a', 'fp', 60, 0.05)
+        await asyncio.sleep(0.1)
+        return await IdempotentRequests(store).run('key:a', 'fp', 60, Payment())
+
+    assert asyncio.run(scenario()) == ({'transaction_id': 'tx-1'}, False)
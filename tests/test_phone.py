@@ -0,0 +1,45 @@
+"""Every way a Kenyan mobile number is typed maps to one E.164 key; anything else is rejected."""
+
+import pytest
+
+from app.phone import normalize_phone, to_mpesa_number
+
+
+@pytest.mark.parametrize('typed', [
+    '0712345678',
+    '712345678',
+    '254712345678',
+    '+254712345678',
+    '00254712345678',
+    '+254 712 345 678',
+    '0712-345-678',
+    '(0712) 345.678',
+    ' 0712 345 678 ',
+])
+def test_typed_forms_normalize_to_e164(typed):
+    assert normalize_phone(typed) == '+254712345678'
+
+
+def test_newer_1xx_ranges_are_mobile():
+    assert normalize_phone('0112345678') == '+254112345678'
+    assert normalize_phone('+254 110 000 000') == '+254110000000'
+
+
+@pytest.mark.parametrize('typed', [
+    '',
+    None,
+    '0812345678',       # not a mobile range
+    '071234567',        # one digit short
+    '07123456789',      # one digit long
+    '2547123456789',
+    '+255712345678',    # Tanzania
+    '0712345abc',
+    '254 0712 345 678',
+])
+def test_invalid_numbers_are_rejected(typed):
+    with pytest.raises(ValueError):
+        normalize_phone(typed)
+
+
+def test_mpesa_number_drops_the_plus():
+    assert to_mpesa_number('0712 345 678') == '254712345678'
@@ -0,0 +1,82 @@
+"""QR link tokens verify across key rotation, and forged or truncated tokens never do."""
+
+import pytest
+
+from app import qr_signing
+from app.qr_signing import sign_driver_id, verify_driver_token, payment_link_allowed, _load_keys
+
+DRIVER_ID = '3f1c2e8a-1111-4222-8333-444455556666'
+OTHER_DRIVER_ID = '9a8b7c6d-1111-4222-8333-444455556666'
+
+
+def use_keys(monkeypatch, spec):
+    current, keys = _load_keys(spec)
+    monkeypatch.setattr(qr_signing, '_current_version', current)
+    monkeypatch.setattr(qr_signing, '_keys', keys)
+
+
+def test_token_verifies_for_its_driver_only(monkeypatch):
+    use_keys(monkeypatch, 'v1:secret')
+    token = sign_driver_id(DRIVER_ID)
+
+    version, _, mac = token.partition('.')
+    assert version == 'v1' and len(mac) == 16
+    assert verify_driver_token(DRIVER_ID, token)
+    assert verify_driver_token(DRIVER_ID.upper(), token)
+    assert not verify_driver_token(OTHER_DRIVER_ID, token)
+
+
+def test_rotation_keeps_old_stickers_working_until_the_key_is_dropped(monkeypatch):
+    use_keys(monkeypatch, 'v1:old-secret')
+    old_token = sign_driver_id(DRIVER_ID)
+
+    use_keys(monkeypatch, 'v2:new-secret,v1:old-secret')
+    assert sign_driver_id(DRIVER_ID).startswith('v2.')
+    assert verify_driver_token(DRIVER_ID, old_token)
+
+    use_keys(monkeypatch, 'v2:new-secret')
+    assert not verify_driver_token(DRIVER_ID, old_token)
+
+
+def test_secret_change_under_the_same_version_invalidates_tokens(monkeypatch):
+    use_keys(monkeypatch, 'v1:secret')
+    token = sign_driver_id(DRIVER_ID)
+
+    use_keys(monkeypatch, 'v1:leaked-and-replaced')
+    assert not verify_driver_token(DRIVER_ID, token)
+
+
+def test_truncated_and_tampered_tokens_are_rejected(monkeypatch):
+    use_keys(monkeypatch, 'v1:secret')
+    token = sign_driver_id(DRIVER_ID)
+    version, _, mac = token.partition('.')
+    flipped = mac[:-1] + ('A' if mac[-1] != 'A' else 'B')
+
+    for forged in (token[:-1], token[:-8], f"{version}.", version, token + 'A',
+                   f"{version}.{flipped}", f"v9.{mac}", f".{mac}", ''):
+        assert not verify_driver_token(DRIVER_ID, forged), forged
+    assert not verify_driver_token('not-a-uuid', token)
+
+
+def test_missing_token_is_allowed_until_signatures_are_required(monkeypatch):
+    use_keys(monkeypatch, 'v1:secret')
+
+    monkeypatch.setattr(qr_signing, 'QR_SIGNATURE_REQUIRED', False)
+    assert payment_link_allowed(DRIVER_ID, None)
+    assert not payment_link_allowed(DRIVER_ID, 'v1.AAAAAAAAAAAAAAAA')
+
+    monkeypatch.setattr(qr_signing, 'QR_SIGNATURE_REQUIRED', True)
+    assert not payment_link_allowed(DRIVER_ID, None)
+    assert payment_link_allowed(DRIVER_ID, sign_driver_id(DRIVER_ID))
+
+
+def test_unsigned_deployment_issues_no_tokens(monkeypatch):
+    use_keys(monkeypatch, '')
+    assert sign_driver_id(DRIVER_ID) is None
+    assert not verify_driver_token(DRIVER_ID, 'v1.AAAAAAAAAAAAAAAA')
+
+
+@pytest.mark.parametrize('spec', ['secret-without-version', 'v1:', ':secret', 'v1.0:secret'])
+def test_malformed_key_config_is_rejected(spec):
+    with pytest.raises(ValueError):
+        _load_keys(spec)
@@ -0,0 +1,175 @@
+"""Collections and payouts are settled once, whichever of the webhook and the reconciler gets there first."""
+
+import asyncio
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from app.models import Transaction, TransactionStatus, Payout, PayoutStatus
+from app.settlement import settle_collection, settle_payout
+from app.supabase_util import SupabaseManager
+
+CREATED_AT = datetime(2026, 10, 1, 8, 30, tzinfo=timezone.utc)
+
+
+class FakeDatabase:
+    """The settle_collection() SQL function over in-memory rows (one database transaction per call)."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.fees = []
+        self.credits = []
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def settle_collection(self, params):
+        self.calls.append(params)
+        with self._lock:
+            for row in self.rows:
+                if (row['id'] == params['p_transaction_id']
+                        and params['p_created_at'] in (None, row['created_at'])
+                        and row['status'] == TransactionStatus.PENDING.value):
+                    break
+            else:
+                return False
+            if params['p_completed']:
+                row['status'] = TransactionStatus.PAYOUT_PENDING.value
+                self.fees.append((row['id'], row['platform_fee_cents']))
+                self.credits.append((row['driver_id'], row['driver_amount_cents']))
+            else:
+                row['status'] = TransactionStatus.FAILED.value
+            return True
+
+
+class FakeClient:
+    def __init__(self, database):
+        self.database = database
+
+    def rpc(self, name, params):
+        assert name == 'settle_collection'
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=self.database.settle_collection(params)))
+
+
+def make_manager(monkeypatch, database):
+    monkeypatch.setenv('SUPABASE_URL', 'http://localhost:54321')
+    monkeypatch.setenv('SUPABASE_ANON_KEY', 'test-key')
+    manager = SupabaseManager()
+    manager.supabase = FakeClient(database)
+    return manager
+
+
+def pending_row(transaction_id):
+    return {
+        'id': transaction_id, 'created_at': CREATED_AT.isoformat(), 'status': TransactionStatus.PENDING.value,
+        'driver_id': 'driver-1', 'platform_fee_cents': 50, 'driver_amount_cents': 9950
+    }
+
+
+def snapshot(transaction_id):
+    return Transaction(
+        id=transaction_id, driver_id='driver-1', passenger_phone='+254712345678',
+        amount_paid_cents=10000, platform_fee_cents=50, driver_amount_cents=9950,
+        created_at=CREATED_AT
+    )
+
+
+def test_concurrent_settlements_credit_once(monkeypatch):
+    database = FakeDatabase([pending_row('tx-1')])
+    manager = make_manager(monkeypatch, database)
+
+    # Both callers hold the same pending snapshot, as the webhook and the
+    # reconciler do when they race
+    async def settle_twice():
+        return await asyncio.gather(
+            settle_collection(manager, snapshot('tx-1'), 'COMPLETE', 'COLL-1'),
+            settle_collection(manager, snapshot('tx-1'), 'COMPLETE', 'COLL-1')
+        )
+
+    results = asyncio.run(settle_twice())
+
+    assert sorted(results) == [False, True]
+    assert database.fees == [('tx-1', 50)]
+    assert database.credits == [('driver-1', 9950)]
+    assert database.calls[0]['p_created_at'] == CREATED_AT.isoformat()
+
+
+def test_failed_after_completed_is_ignored(monkeypatch):
+    database = FakeDatabase([pending_row('tx-2')])
+    manager = make_manager(monkeypatch, database)
+
+    assert asyncio.run(settle_collection(manager, snapshot('tx-2'), 'COMPLETE', 'COLL-2')) is True
+    assert asyncio.run(settle_collection(manager, snapshot('tx-2'), 'FAILED', 'COLL-2')) is False
+    assert database.rows[0]['status'] == TransactionStatus.PAYOUT_PENDING.value
+    assert len(database.credits) == 1
+
+
+def test_failed_collection_books_nothing(monkeypatch):
+    database = FakeDatabase([pending_row('tx-3')])
+    manager = make_manager(monkeypatch, database)
+
+    assert asyncio.run(settle_collection(manager, snapshot('tx-3'), 'CANCELLED', 'COLL-3')) is True
+    assert database.calls[0]['p_completed'] is False
+    assert database.rows[0]['status'] == TransactionStatus.FAILED.value
+    assert database.fees == [] and database.credits == []
+
+
+def test_non_final_state_does_not_touch_the_database(monkeypatch):
+    database = FakeDatabase([pending_row('tx-4')])
+    manager = make_manager(monkeypatch, database)
+
+    assert asyncio.run(settle_collection(manager, snapshot('tx-4'), 'PROCESSING', 'COLL-4')) is False
+    assert database.calls == []
+
+
+class FakePayoutManager:
+    """Records reconcile_payouts calls; payouts are settled once, like the SQL function does."""
+
+    def __init__(self):
+        self.results = []
+        self.transaction_updates = []
+        self.settled = set()
+
+    async def apply_payout_results(self, results):
+        self.results.extend(results)
+        counts = {"completed": 0, "failed": 0}
+        for result in results:
+            if result['tracking_id'] not in self.settled:
+                self.settled.add(result['tracking_id'])
+                counts[result['status']] += 1
+        return counts
+
+    async def update_transaction_payout(self, transaction_id, **kwargs):
+        assert transaction_id is not None
+        self.transaction_updates.append((transaction_id, kwargs['payout_status']))
+
+
+def payout(transaction_id=None):
+    return Payout(
+        id='payout-1', driver_id='driver-1', transaction_id=transaction_id,
+        amount_cents=50000, tracking_id='TRK-1', status=PayoutStatus.PROCESSING
+    )
+
+
+def test_failed_batch_payout_webhook_restores_balance_without_a_transaction():
+    manager = FakePayoutManager()
+
+    assert asyncio.run(settle_payout(manager, payout(), 'FAILED', {'state': 'FAILED'})) is True
+    # reconcile_payouts is what returns the amount to the pending balance
+    assert manager.results[0]['status'] == 'failed'
+    assert manager.results[0]['tracking_id'] == 'TRK-1'
+    assert manager.transaction_updates == []
+
+
+def test_payout_webhook_after_the_reconciler_changes_nothing():
+    manager = FakePayoutManager()
+    manager.settled.add('TRK-1')
+
+    assert asyncio.run(settle_payout(manager, payout('tx-9'), 'COMPLETE')) is False
+    assert manager.transaction_updates == []
+
+
+def test_completed_payout_updates_its_transaction():
+    manager = FakePayoutManager()
+
+    assert asyncio.run(settle_payout(manager, payout('tx-9'), 'Completed')) is True
+    assert manager.transaction_updates == [('tx-9', 'completed')]
@@ -0,0 +1,123 @@
+"""Short codes round-trip: driver -> code -> driver, through the cache and the database."""
+
+import os
+import asyncio
+from types import SimpleNamespace
+
+from app.short_codes import BASE62_ALPHABET, ShortCodeCache, is_short_code
+from app.supabase_util import SupabaseManager
+
+DRIVER_IDS = [f"3f1c2e8a-1111-4222-8333-44445555{n:04d}" for n in range(3)]
+
+
+def sql_code(length=7):
+    """A code drawn like assign_driver_short_code() does (random bytes mod 62)."""
+    return ''.join(BASE62_ALPHABET[byte % 62] for byte in os.urandom(length))
+
+
+class Query:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        return Query([row for row in self.rows if row[column] == value])
+
+    def in_(self, column, values):
+        return Query([row for row in self.rows if row[column] in values])
+
+    def execute(self):
+        return SimpleNamespace(data=[dict(row) for row in self.rows])
+
+
+class FakeDatabase:
+    """driver_short_codes and assign_driver_short_code(); counts queries."""
+
+    def __init__(self):
+        self.rows = []
+        self.queries = 0
+
+    def table(self, name):
+        assert name == 'driver_short_codes'
+        self.queries += 1
+        return Query(self.rows)
+
+    def rpc(self, name, params):
+        assert name == 'assign_driver_short_code'
+        self.queries += 1
+        driver_id = params['p_driver_id']
+        row = next((row for row in self.rows if row['driver_id'] == driver_id), None)
+        if row is None:
+            row = {'code': sql_code(), 'driver_id': driver_id}
+            self.rows.append(row)
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=row['code']))
+
+
+def make_manager(monkeypatch, database):
+    monkeypatch.setenv('SUPABASE_URL', 'http://localhost:54321')
+    monkeypatch.setenv('SUPABASE_ANON_KEY', 'test-key')
+    manager = SupabaseManager()
+    manager.supabase = database
+    return manager
+
+
+def test_codes_drawn_like_the_migration_are_valid():
+    for _ in range(1000):
+        assert is_short_code(sql_code())
+    for code in ('abc', 'x' * 17, 'abc-def', 'abc_def1', 'ab cd12', 'äbcdefg', ''):
+        assert not is_short_code(code)
+
+
+def test_driver_to_code_to_driver(monkeypatch):
+    database = FakeDatabase()
+    worker = make_manager(monkeypatch, database)
+
+    async def scenario():
+        codes = [await worker.assign_short_code(driver_id) for driver_id in DRIVER_IDS]
+        # Assigned once; repeats and lookups come from the cache
+        queries = database.queries
+        assert [await worker.assign_short_code(driver_id) for driver_id in DRIVER_IDS] == codes
+        assert [await worker.resolve_short_code(code) for code in codes] == DRIVER_IDS
+        assert database.queries == queries
+
+        # Another worker reads both directions from the table
+        other = make_manager(monkeypatch, database)
+        assert [await other.resolve_short_code(code) for code in codes] == DRIVER_IDS
+        fresh = make_manager(monkeypatch, database)
+        assert await fresh.get_short_codes(DRIVER_IDS) == dict(zip(DRIVER_IDS, codes))
+
+    asyncio.run(scenario())
+
+
+def test_unknown_code_is_remembered_until_it_is_assigned(monkeypatch):
+    database = FakeDatabase()
+    worker = make_manager(monkeypatch, database)
+
+    async def scenario():
+        code = sql_code()
+        assert await worker.resolve_short_code(code) is None
+        queries = database.queries
+        assert await worker.resolve_short_code(code) is None
+        assert database.queries == queries
+
+        # Assigned by another worker
+        database.rows.append({'code': code, 'driver_id': DRIVER_IDS[0]})
+        assert await worker.assign_short_code(DRIVER_IDS[0]) == code
+        assert await worker.resolve_short_code(code) == DRIVER_IDS[0]
+
+    asyncio.run(scenario())
+
+
+def test_cache_evicts_both_directions_together():
+    cache = ShortCodeCache(max_size=2)
+    cache.put('aaaaaaa', 'driver-a')
+    cache.put('bbbbbbb', 'driver-b')
+    cache.get('aaaaaaa')
+    cache.put('ccccccc', 'driver-c')
+
+    assert len(cache) == 2
+    assert cache.get('bbbbbbb') is None and cache.code_for('driver-b') is None
+    assert cache.get('aaaaaaa') == 'driver-a' and cache.code_for('driver-a') == 'aaaaaaa'
+    assert cache.code_for('driver-c') == 'ccccccc'